@@ -2,25 +2,48 @@
 This module contains the database related classes.
 """
 
+import gzip
 import logging
 import os
+import threading
 from enum import Enum
-from typing import Type
+from typing import Callable, Optional, Type
 
 from arango.client import ArangoClient
 from arango.collection import EdgeCollection, VertexCollection, StandardCollection
 from arango.database import Database, StandardDatabase
 from arango.graph import Graph
+from arango.http import DefaultHTTPClient
+from arango.response import Response
 from pydantic import BaseModel
+from requests import Session
 
+from branch_store import ensure_branch_collections
 from gagm_base.asset_model import AssetModel
 from gagm_base.edge_model import EdgeModel
 from gagm_base.node_model import NodeModel
 from gagm_base.tag_model import AssetTag
 from gagm_base.tag_edge import TagEdge
+from index_manager import (
+    MANAGED_INDEX_PREFIX,
+    IndexSyncReport,
+    get_index_definitions,
+    list_indexes,
+    sync_indexes,
+)
+from instrumentation import span
+from migrations import run_migrations
+from notes_store import NOTES_COLLECTION
+from project_context import DEFAULT_PROJECT, get_current_project, record_arango_request
+from read_routing import ReadReplica, ReadRouter
+from revision_store import ensure_revision_collection
+from search_manager import ensure_search_view
 
 logger = logging.getLogger("uvicorn")
 
+# The graph in the database of every project, the AQL queries traverse it by name
+GRAPH_NAME = "gagm"
+
 
 class SchemaStrictnessEnum(str, Enum):
     """
@@ -51,48 +74,387 @@ class ArangoCollectionSchema(BaseModel):
     message: str = "The provided data doesn't passed the schema validation."
 
 
+class ArangoClientConfig(BaseModel):
+    """
+    Configuration of the HTTP connections to ArangoDB.
+    The pool size is per host and per worker process.
+    """
+
+    hosts: list[str]
+    # Hosts of the read-only queries, see read_routing.py
+    read_hosts: list[str] = []
+    # Seconds a read replica may lag behind the leader
+    read_max_staleness: float = 5.0
+    replication_check_interval: float = 1.0
+    user: str
+    password: str
+    pool_size: int = 32
+    pool_timeout: Optional[float] = 30.0
+    keep_alive: bool = True
+    retries: int = 3
+    retry_backoff: float = 0.2
+    request_timeout: float = 60.0
+    request_compression: bool = False
+    response_compression: bool = False
+    compression_threshold: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "ArangoClientConfig":
+        """
+        Read the configuration from the environment.
+        GRAPH_DB_HOSTS takes a comma separated list of coordinator URLs,
+        requests are distributed between them round-robin.
+        GRAPH_DB_READ_HOSTS takes the URLs of the read replicas in the same format.
+
+        Returns:
+            ArangoClientConfig: The configuration.
+        """
+        hosts = os.environ.get("GRAPH_DB_HOSTS")
+        if not hosts:
+            hosts = "http://{}:{}".format(
+                os.environ.get("GRAPH_DB_HOST", "127.0.0.1"),
+                os.environ.get("GRAPH_DB_PORT", 8529),
+            )
+        pool_timeout = os.environ.get("GRAPH_DB_POOL_TIMEOUT", "30")
+        return cls(
+            hosts=[host.strip() for host in hosts.split(",") if host.strip()],
+            read_hosts=[
+                host.strip()
+                for host in os.environ.get("GRAPH_DB_READ_HOSTS", "").split(",")
+                if host.strip()
+            ],
+            read_max_staleness=float(os.environ.get("GRAPH_DB_READ_MAX_STALENESS", 5.0)),
+            replication_check_interval=float(
+                os.environ.get("GRAPH_DB_REPLICATION_CHECK_INTERVAL", 1.0)
+            ),
+            user=os.environ.get("GRAPH_DB_USER", "root"),
+            password=os.environ.get("GRAPH_DB_PASS", "secret"),
+            pool_size=int(os.environ.get("GRAPH_DB_POOL_SIZE", 32)),
+            pool_timeout=float(pool_timeout) if pool_timeout != "none" else None,
+            keep_alive=os.environ.get("GRAPH_DB_KEEP_ALIVE", "true") == "true",
+            retries=int(os.environ.get("GRAPH_DB_RETRIES", 3)),
+            retry_backoff=float(os.environ.get("GRAPH_DB_RETRY_BACKOFF", 0.2)),
+            request_timeout=float(os.environ.get("GRAPH_DB_TIMEOUT", 60)),
+            request_compression=os.environ.get("GRAPH_DB_REQUEST_COMPRESSION") == "true",
+            response_compression=os.environ.get("GRAPH_DB_RESPONSE_COMPRESSION") == "true",
+            compression_threshold=int(
+                os.environ.get("GRAPH_DB_COMPRESSION_THRESHOLD", 1024)
+            ),
+        )
+
+
+class PooledHTTPClient(DefaultHTTPClient):
+    """
+    HTTP client of the ArangoDB connections.
+
+    Extends the default client of python-arango with keep-alive control,
+    optional request and response compression and usage statistics of the
+    connection pools. Retries with backoff and the pool sizing are handled by
+    the default client (urllib3).
+    """
+
+    def __init__(self, config: ArangoClientConfig, allow_dirty_read: bool = False):
+        super().__init__(
+            request_timeout=config.request_timeout,
+            retry_attempts=config.retries,
+            backoff_factor=config.retry_backoff,
+            pool_connections=len(config.hosts),
+            pool_maxsize=config.pool_size,
+            pool_timeout=config.pool_timeout,
+        )
+        self._config = config
+        self._allow_dirty_read = allow_dirty_read
+        self._sessions: list[Session] = []
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.requests_in_flight = 0
+        self.bytes_sent = 0
+
+    def create_session(self, host: str) -> Session:
+        session = super().create_session(host)
+        if not self._config.keep_alive:
+            session.headers["Connection"] = "close"
+        session.headers["Accept-Encoding"] = (
+            "gzip, deflate" if self._config.response_compression else "identity"
+        )
+        if self._allow_dirty_read:
+            # Followers only answer reads that accept data that may not be up to date
+            session.headers["X-Arango-Allow-Dirty-Read"] = "true"
+        self._sessions.append(session)
+        return session
+
+    def send_request(
+        self,
+        session: Session,
+        method: str,
+        url: str,
+        headers=None,
+        params=None,
+        data=None,
+        auth=None,
+    ) -> Response:
+        if (
+            self._config.request_compression
+            and isinstance(data, str)
+            and len(data) >= self._config.compression_threshold
+        ):
+            data = gzip.compress(data.encode("utf-8"), compresslevel=1)
+            headers = dict(headers or {})
+            headers["Content-Encoding"] = "gzip"
+        bytes_sent = len(data) if isinstance(data, (str, bytes)) else 0
+        with self._lock:
+            self.requests_sent += 1
+            self.requests_in_flight += 1
+            self.bytes_sent += bytes_sent
+        record_arango_request(bytes_sent)
+        try:
+            with span("arango.http", method=method, path=url.split("/_api/", 1)[-1]):
+                return super().send_request(
+                    session, method, url, headers, params, data, auth  # type: ignore
+                )
+        finally:
+            with self._lock:
+                self.requests_in_flight -= 1
+
+    def pool_stats(self) -> dict:
+        """
+        Usage of the connection pools.
+
+        Returns:
+            dict: Connections per host and request counters.
+        """
+        hosts = []
+        for session in self._sessions:
+            for adapter in set(session.adapters.values()):
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None or pool.pool is None:
+                        continue
+                    hosts.append(
+                        {
+                            "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                            "in_use": pool.pool.maxsize - pool.pool.qsize(),
+                            "idle": sum(
+                                1 for conn in list(pool.pool.queue) if conn is not None
+                            ),
+                            "max_size": pool.pool.maxsize,
+                            "connections_opened": pool.num_connections,
+                            "requests": pool.num_requests,
+                        }
+                    )
+        return {
+            "hosts": hosts,
+            "requests_sent": self.requests_sent,
+            "requests_in_flight": self.requests_in_flight,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+def create_arango_client(
+    config: ArangoClientConfig, http_client: Optional[PooledHTTPClient] = None
+) -> ArangoClient:
+    """
+    Create an ArangoDB client with pooled connections.
+    Should only be called by ArangoDB, all other code shares its client.
+
+    Args:
+        config (ArangoClientConfig): The configuration of the connections.
+        http_client (PooledHTTPClient, optional): The HTTP client. Defaults to a new one.
+
+    Returns:
+        ArangoClient: The client.
+    """
+    return ArangoClient(
+        hosts=config.hosts,
+        host_resolver="roundrobin",
+        http_client=http_client or PooledHTTPClient(config),
+        request_timeout=config.request_timeout,
+    )
+
+
+def create_read_router(
+    config: ArangoClientConfig, leader: Callable[[], Database]
+) -> ReadRouter:
+    """
+    Create the router of the reads to the read hosts, see read_routing.py.
+    Every read host gets its own client, so a cursor stays on its host,
+    the clients share one HTTP client with the pools of the read hosts.
+
+    Args:
+        config (ArangoClientConfig): The configuration of the connections.
+        leader (Callable[[], Database]): Returns the database of the heartbeat on the leader.
+
+    Returns:
+        ReadRouter: The router.
+    """
+    http_client = PooledHTTPClient(
+        config.model_copy(update={"hosts": config.read_hosts}), allow_dirty_read=True
+    )
+    replicas = [
+        ReadReplica(
+            host,
+            create_arango_client(config.model_copy(update={"hosts": [host]}), http_client),
+            config.user,
+            config.password,
+        )
+        for host in config.read_hosts
+    ]
+    return ReadRouter(
+        replicas,
+        leader,
+        DEFAULT_PROJECT,
+        config.read_max_staleness,
+        config.replication_check_interval,
+    )
+
+
 class ArangoDB(object):
     """
     Represents the database.
+
+    Every project has its own database named after it, with the graph `GRAPH_NAME`,
+    see project_context.py. The databases are opened on first use and share the
+    connections of the one client. The methods work in the project of the request.
     """
 
     _instance = None
 
     client: ArangoClient
+    http_client: PooledHTTPClient
+    config: ArangoClientConfig
+    sys_db: StandardDatabase
+    # None without read hosts, all reads go to the leader then
+    read_router: Optional[ReadRouter] = None
+    # The database and the graph of the default project
     gagm_db: Database
     gagm_graph: Graph
+    # Index changes of the last syncs by project and collection
+    index_reports: dict[str, dict[str, IndexSyncReport]] = {}
+    _databases: dict[str, Database] = {}
+    _graphs: dict[str, Graph] = {}
+    _databases_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
             logger.info("Creating the object ArangoConnector")
-            config = {
-                "host": os.environ.get("GRAPH_DB_HOST", "127.0.0.1"),
-                "port": os.environ.get("GRAPH_DB_PORT", 8529),
-                "user": os.environ.get("GRAPH_DB_USER", "root"),
-                "password": os.environ.get("GRAPH_DB_PASS", "secret"),
-            }
-            logger.info(config)
+            config = ArangoClientConfig.from_env()
+            logger.info(config.model_dump(exclude={"password"}))
             cls._instance = super(ArangoDB, cls).__new__(cls)
-            cls.client = ArangoClient(hosts=f"http://{config['host']}:{config['port']}")
-            sys_db: StandardDatabase = cls.client.db(
+            cls.config = config
+            cls.http_client = PooledHTTPClient(config)
+            cls.client = create_arango_client(config, cls.http_client)
+            cls.sys_db = cls.client.db(
                 name="_system",
-                username=config["user"],
-                password=config["password"],
+                username=config.user,
+                password=config.password,
                 verify=True,
             )
+            cls.gagm_db = cls._instance.database(DEFAULT_PROJECT)
+            cls.gagm_graph = cls._instance.graph(DEFAULT_PROJECT)
+            if config.read_hosts:
+                cls.read_router = create_read_router(
+                    config, lambda: cls._instance.database(DEFAULT_PROJECT)  # type: ignore
+                )
+        return cls._instance
+
+    def database(self, project: Optional[str] = None) -> Database:
+        """
+        Get the database of a project, it's created with its graph on first use.
 
-            if not sys_db.has_database("gagm"):
-                sys_db.create_database("gagm")
+        Args:
+            project (str, optional): The project. Defaults to the project of the request.
 
-            cls.gagm_db = cls.client.db(
-                name="gagm", username=config["user"], password=config["password"]
-            )
+        Returns:
+            Database: The database.
+        """
+        project = project or get_current_project()
+        database = self._databases.get(project)
+        if database is None:
+            with self._databases_lock:
+                if project not in self._databases:
+                    self._open_database(project)
+            database = self._databases[project]
+        return database
+
+    def graph(self, project: Optional[str] = None) -> Graph:
+        """
+        Get the graph of a project.
 
-            if not cls.gagm_db.has_graph("gagm"):
-                cls.gagm_db.create_graph("gagm")
+        Args:
+            project (str, optional): The project. Defaults to the project of the request.
 
-            cls.gagm_graph = cls.gagm_db.graph("gagm")
-        return cls._instance
+        Returns:
+            Graph: The graph.
+        """
+        project = project or get_current_project()
+        if project not in self._graphs:
+            self.database(project)
+        return self._graphs[project]
+
+    def read_database(self, project: Optional[str] = None) -> Database:
+        """
+        Get the database of a project for a read-only query: on a read replica if one is
+        within the staleness and replicated the writes of the session, otherwise on the leader.
+
+        Args:
+            project (str, optional): The project. Defaults to the project of the request.
+
+        Returns:
+            Database: The database.
+        """
+        # The database and the graph are created on the leader
+        database = self.database(project)
+        if self.read_router is None:
+            return database
+        replica = self.read_router.select()
+        if replica is None:
+            return database
+        return replica.database(project or get_current_project())
+
+    @classmethod
+    def _open_database(cls, project: str) -> None:
+        if not cls.sys_db.has_database(project):
+            logger.info("Creating the database of project %s", project)
+            cls.sys_db.create_database(project)
+        # Uses the sessions of the client, no new connections are opened
+        database = cls.client.db(
+            name=project, username=cls.config.user, password=cls.config.password
+        )
+        if not database.has_graph(GRAPH_NAME):
+            database.create_graph(GRAPH_NAME)
+        cls._graphs[project] = database.graph(GRAPH_NAME)
+        cls._databases[project] = database
+
+    @classmethod
+    def open_projects(cls) -> list[str]:
+        return sorted(cls._databases)
+
+    @classmethod
+    def reset_connections(cls) -> None:
+        """
+        Close the pooled HTTP connections of the client.
+        Used after forking, so the processes don't share the inherited sockets.
+        The sessions open new connections on the next request.
+        """
+        if cls._instance is not None:
+            cls.client.close()
+            if cls.read_router is not None:
+                cls.read_router.close()
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """
+        Usage of the connection pools of the client.
+
+        Returns:
+            dict: The statistics, empty if the client wasn't created yet.
+        """
+        if cls._instance is None:
+            return {}
+        stats = {**cls.http_client.pool_stats(), "databases": cls.open_projects()}
+        if cls.read_router is not None:
+            stats["reads"] = cls.read_router.stats()
+        return stats
 
     def create_or_update_vertex_collections(
         self, models: dict[str, Type[NodeModel]]
@@ -109,13 +471,13 @@ class ArangoDB(object):
                 rule=model.model_json_schema(),
                 level=str(SchemaStrictnessEnum.NONE.value),
             )
-            if not self.gagm_db.has_collection(model_name):
-                self.gagm_graph.create_vertex_collection(name=model_name)
-                self.gagm_graph.vertex_collection(model_name).configure(
+            if not self.database().has_collection(model_name):
+                self.graph().create_vertex_collection(name=model_name)
+                self.graph().vertex_collection(model_name).configure(
                     schema=schema.model_dump()
                 )
             else:
-                self.gagm_graph.vertex_collection(model_name).configure(
+                self.graph().vertex_collection(model_name).configure(
                     schema=schema.model_dump()
                 )
 
@@ -124,7 +486,7 @@ class ArangoDB(object):
     ) -> None:
         for model in models.values():
             model_name: str = model.__name__
-            if not self.gagm_db.has_collection(model_name):
+            if not self.database().has_collection(model_name):
                 self.update_edge_collection(model_name, model)
             else:
                 self.create_edge_collection(model_name, model)
@@ -136,20 +498,20 @@ class ArangoDB(object):
             rule=edge_model.model_json_schema(),
             level=str(SchemaStrictnessEnum.NONE.value),
         )
-        self.gagm_graph.delete_edge_definition(name)
-        self.gagm_graph.create_edge_definition(
+        self.graph().delete_edge_definition(name)
+        self.graph().create_edge_definition(
             edge_collection=name,
             from_vertex_collections=edge_model.origin_type,
             to_vertex_collections=edge_model.target_type,
         )
-        self.gagm_graph.edge_collection(name).configure(schema=schema.model_dump())
+        self.graph().edge_collection(name).configure(schema=schema.model_dump())
 
     def create_edge_collection(self, name: str, edge_model: Type[EdgeModel]) -> None:
         name = edge_model.__name__
-        if self.gagm_db.has_collection(name):
+        if self.database().has_collection(name):
             return
 
-        self.gagm_db.create_collection(name, edge=True)
+        self.database().create_collection(name, edge=True)
 
 
     def create_tag_edge_collection(self, node_model_names: list[str]) -> None:
@@ -159,11 +521,11 @@ class ArangoDB(object):
         Args:
             node_model_names (list[str]): The node model names.
         """
-        if not self.gagm_db.has_collection("TagEdge"):
-            self.gagm_db.create_collection("TagEdge", edge=True)
+        if not self.database().has_collection("TagEdge"):
+            self.database().create_collection("TagEdge", edge=True)
 
-        self.gagm_graph.delete_edge_definition("TagEdge")
-        self.gagm_graph.create_edge_definition(
+        self.graph().delete_edge_definition("TagEdge")
+        self.graph().create_edge_definition(
             edge_collection="TagEdge",
             from_vertex_collections=["AssetTag"],
             to_vertex_collections=node_model_names,
@@ -187,14 +549,14 @@ class ArangoDB(object):
         schema = ArangoCollectionSchema(
             rule=model.model_json_schema(), level=str(validation_strictness.value)
         )
-        if not self.gagm_db.has_collection(model_name):
+        if not self.database().has_collection(model_name):
             logger.info("Collection %s was not present, creating it...", model_name)
             if issubclass(model, EdgeModel):
                 if len(model.origin_type) == 0 and len(model.target_type) == 0:
                     logger.info(
                         "No edge definitions found, creating normal edge collection..."
                     )
-                    self.gagm_graph.create_edge_definition(
+                    self.graph().create_edge_definition(
                         edge_collection=model_name,
                         from_vertex_collections=[],
                         to_vertex_collections=[],
@@ -203,7 +565,7 @@ class ArangoDB(object):
                     logger.info(
                         "Partial edge definitions found, creating partially restricted edge collection..."
                     )
-                    self.gagm_graph.create_edge_definition(
+                    self.graph().create_edge_definition(
                         edge_collection=model_name,
                         from_vertex_collections=model.origin_type,
                         to_vertex_collections=model.target_type,
@@ -212,32 +574,80 @@ class ArangoDB(object):
                     logger.info(
                         "Edge definitions found, creating restricted edge collection..."
                     )
-                    self.gagm_graph.create_edge_definition(
+                    self.graph().create_edge_definition(
                         edge_collection=model_name,
                         from_vertex_collections=model.origin_type,
                         to_vertex_collections=model.target_type,
                     )
-                self.gagm_graph.edge_collection(model_name).configure(
+                self.graph().edge_collection(model_name).configure(
                     schema=schema.model_dump()
                 )
             else:
                 logger.info(
                     "No edge definitions found, creating normal vertex collection..."
                 )
-                self.gagm_graph.create_vertex_collection(name=model_name)
-                self.gagm_graph.vertex_collection(model_name).configure(
+                self.graph().create_vertex_collection(name=model_name)
+                self.graph().vertex_collection(model_name).configure(
                     schema=schema.model_dump()
                 )
-            return
+        else:
+            logger.info("Collection %s was present, updating schema...", model_name)
+            self.database().collection(model_name).configure(schema=schema.model_dump())
+            if issubclass(model, EdgeModel):
+                self.graph().create_edge_definition(
+                    edge_collection=model_name,
+                    from_vertex_collections=model.origin_type,
+                    to_vertex_collections=model.target_type,
+                )
+        self.sync_indexes(model)
 
-        logger.info("Collection %s was present, updating schema...", model_name)
-        self.gagm_db.collection(model_name).configure(schema=schema.model_dump())
-        if issubclass(model, EdgeModel):
-            self.gagm_graph.create_edge_definition(
-                edge_collection=model_name,
-                from_vertex_collections=model.origin_type,
-                to_vertex_collections=model.target_type,
-            )
+    def sync_indexes(self, model: Type[AssetModel]) -> IndexSyncReport:
+        """
+        Create the indexes declared by a model and drop the managed indexes
+        it doesn't declare anymore.
+
+        Args:
+            model (Type[AssetModel]): The model, its collection must exist.
+
+        Returns:
+            IndexSyncReport: The changes.
+        """
+        report = sync_indexes(
+            self.database().collection(model.__name__), get_index_definitions(model)
+        )
+        self.index_reports.setdefault(get_current_project(), {})[model.__name__] = report
+        return report
+
+    def get_index_stats(self, collection_names: list[str]) -> dict[str, list[dict]]:
+        """
+        Get the indexes of collections with their build progress and figures.
+
+        Args:
+            collection_names (list[str]): Names of the collections.
+
+        Returns:
+            dict[str, list[dict]]: The indexes by collection.
+        """
+        stats: dict[str, list[dict]] = {}
+        for name in collection_names:
+            if not self.database().has_collection(name):
+                continue
+            stats[name] = [
+                {
+                    "name": index.get("name"),
+                    "type": index.get("type"),
+                    "fields": index.get("fields"),
+                    "unique": index.get("unique", False),
+                    "sparse": index.get("sparse", False),
+                    "managed": str(index.get("name", "")).startswith(MANAGED_INDEX_PREFIX),
+                    # Only present while the index is built
+                    "progress": index.get("progress"),
+                    "selectivity": index.get("selectivityEstimate"),
+                    "figures": index.get("figures", {}),
+                }
+                for index in list_indexes(self.database().collection(name), with_stats=True)
+            ]
+        return stats
 
     def get_collection(self, model: Type[AssetModel]) -> StandardCollection:
         """
@@ -250,10 +660,10 @@ class ArangoDB(object):
             EdgeCollection | VertexCollection: The collection.
         """
         model_name: str = model.__name__
-        if not self.gagm_db.has_collection(model_name):
+        if not self.database().has_collection(model_name):
             self.create_collection(model)
 
-        return self.gagm_db.collection(model_name)
+        return self.database().collection(model_name)
 
     def init_collections(self, models: dict[str, dict[str, Type[AssetModel]]]) -> None:
         """
@@ -265,11 +675,19 @@ class ArangoDB(object):
         """
         self.create_or_update_vertex_collections(models["node"])  # type: ignore
         self.create_or_update_edge_collections(models["edge"])  # type: ignore
+        for model in [*models["node"].values(), *models["edge"].values()]:
+            self.sync_indexes(model)
 
         node_names: list[str] = list(models.get("node").keys())
 
         self.create_collection(AssetTag)
         self.create_tag_edge_collection(node_names)
+        if not self.database().has_collection(NOTES_COLLECTION):
+            self.database().create_collection(NOTES_COLLECTION)
+        ensure_revision_collection(self.database())
+        ensure_branch_collections(self.database())
+        run_migrations(self.database(), models)
+        ensure_search_view(self.database(), models["node"])
         # self.create_edge_collection("TagEdge", TagEdge)
         # self.gagm_graph.create_edge_definition(
         #     edge_collection="TagEdge",
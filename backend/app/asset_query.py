@@ -0,0 +1,322 @@
+"""
+asset_query.py
+
+This module contains the query language of the assets of a type.
+
+A query filters the assets on their attributes, including the attributes of
+nested models (`starting_point.x`), sorts and pages them. It is validated
+against the model: the paths must exist and the values must be valid for the
+type of the field. It is compiled to a single AQL query, the paths and values
+are passed as bind variables, so the same filters can use the indexes
+declared by the model.
+
+Paging is keyset based: the cursor holds the sort values of the last asset of
+the page, the next page starts after them. The sort always ends with `_key`,
+so the order is total and pages neither skip nor repeat assets.
+"""
+
+import base64
+import hashlib
+import json
+import types
+from enum import Enum
+from typing import Any, Callable, Optional, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+from gagm_base.asset_model import AssetModel
+
+MAX_QUERY_LIMIT = 1000
+
+
+class InvalidQueryError(Exception):
+    """
+    Raised when a query doesn't match the model.
+    """
+
+    pass
+
+
+class FilterOperatorEnum(str, Enum):
+    """
+    Operators of the field filters.
+    """
+
+    EQ = "eq"
+    NE = "ne"
+    LT = "lt"
+    LTE = "lte"
+    GT = "gt"
+    GTE = "gte"
+    IN = "in"
+    NOT_IN = "not_in"
+    BETWEEN = "between"
+    PREFIX = "prefix"
+    CONTAINS = "contains"
+    EXISTS = "exists"
+
+
+class SortOrderEnum(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+
+class FieldFilter(BaseModel):
+    """
+    A condition on a field.
+
+    - `in`/`not_in` take a list of values, `between` a list of the lower and upper bound (inclusive).
+    - `prefix` and `contains` match strings, `contains` also matches an element of a list.
+    - `exists` takes a boolean, false matches missing and null values.
+    """
+
+    field: str = Field(description="Path of the field, nested fields are separated by dots.")
+    op: FilterOperatorEnum = FilterOperatorEnum.EQ
+    value: Any = None
+
+
+class SortField(BaseModel):
+    field: str
+    order: SortOrderEnum = SortOrderEnum.ASC
+
+
+class AssetQuery(BaseModel):
+    """
+    Query of the assets of a type. The filters are combined with AND.
+    """
+
+    where: list[FieldFilter] = []
+    sort: list[SortField] = []
+    limit: int = Field(default=100, ge=1, le=MAX_QUERY_LIMIT)
+    cursor: Optional[str] = Field(
+        default=None, description="The `next_cursor` of the previous page."
+    )
+
+
+class AssetPage(BaseModel):
+    items: list[dict]
+    next_cursor: Optional[str] = None
+
+
+_COMPARISONS = {
+    FilterOperatorEnum.EQ: "==",
+    FilterOperatorEnum.NE: "!=",
+    FilterOperatorEnum.LT: "<",
+    FilterOperatorEnum.LTE: "<=",
+    FilterOperatorEnum.GT: ">",
+    FilterOperatorEnum.GTE: ">=",
+}
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def resolve_path(model: Type[BaseModel], path: str) -> tuple[list[str], Any]:
+    """
+    Resolve a dotted path of field names (or aliases) to the stored attribute path.
+
+    Args:
+        model (Type[BaseModel]): The model.
+        path (str): The path, e.g. `starting_point.x`.
+
+    Raises:
+        InvalidQueryError: If a part of the path is not a field.
+
+    Returns:
+        tuple[list[str], Any]: The stored attribute names and the annotation of the field.
+    """
+    attributes: list[str] = []
+    annotation: Any = model
+    for part in path.split("."):
+        current = _unwrap_optional(annotation)
+        if not (isinstance(current, type) and issubclass(current, BaseModel)):
+            raise InvalidQueryError(f"Field {path} doesn't exist in {model.__name__}.")
+        for name, field in current.model_fields.items():
+            if part in (name, field.alias):
+                attributes.append(field.alias or name)
+                annotation = field.annotation
+                break
+        else:
+            raise InvalidQueryError(f"Field {path} doesn't exist in {model.__name__}.")
+    return attributes, annotation
+
+
+def _stored_value(annotation: Any, value: Any, path: str) -> Any:
+    """
+    Validate a value for a field and convert it to the stored representation.
+    """
+    adapter: TypeAdapter = TypeAdapter(annotation)
+    try:
+        return adapter.dump_python(adapter.validate_python(value), mode="json", by_alias=True)
+    except ValidationError as error:
+        raise InvalidQueryError(f"Invalid value for {path}: {error.errors()[0]['msg']}") from error
+
+
+def _is_string(annotation: Any) -> bool:
+    return _unwrap_optional(annotation) is str
+
+
+def _element_type(annotation: Any) -> Optional[Any]:
+    annotation = _unwrap_optional(annotation)
+    if get_origin(annotation) in (list, set, tuple, frozenset) and get_args(annotation):
+        return get_args(annotation)[0]
+    return None
+
+
+def encode_cursor(values: list, sort_digest: str) -> str:
+    raw = json.dumps({"s": sort_digest, "v": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort_digest: str) -> list:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        values, digest = decoded["v"], decoded["s"]
+    except (ValueError, KeyError, TypeError) as error:
+        raise InvalidQueryError("Invalid cursor.") from error
+    if digest != sort_digest:
+        raise InvalidQueryError("The cursor belongs to a query with another sort.")
+    return values
+
+
+class CompiledQuery(BaseModel):
+    query: str
+    bind_vars: dict[str, Any]
+    # Attribute paths of the sort fields, used to build the cursor of the next page
+    sort_paths: list[list[str]]
+    sort_digest: str
+    limit: int
+
+    def next_cursor(self, last_document: dict) -> str:
+        values = []
+        for path in self.sort_paths:
+            value: Any = last_document
+            for attribute in path:
+                value = value.get(attribute) if isinstance(value, dict) else None
+            values.append(value)
+        return encode_cursor(values, self.sort_digest)
+
+
+def compile_filters(
+    model: Type[AssetModel], where: list[FieldFilter], bind: Callable[[Any], str]
+) -> list[str]:
+    """
+    Compile field filters to AQL conditions on `doc`.
+
+    Args:
+        model (Type[AssetModel]): The model of the assets.
+        where (list[FieldFilter]): The filters.
+        bind (Callable[[Any], str]): Adds a bind variable and returns its reference.
+
+    Raises:
+        InvalidQueryError: If a filter doesn't match the model.
+
+    Returns:
+        list[str]: The conditions.
+    """
+    filters: list[str] = []
+    for condition in where:
+        attributes, annotation = resolve_path(model, condition.field)
+        attribute = f"doc.{bind(attributes)}"
+        value = condition.value
+        op = condition.op
+        if op in _COMPARISONS:
+            filters.append(f"{attribute} {_COMPARISONS[op]} {bind(_stored_value(annotation, value, condition.field))}")
+        elif op in (FilterOperatorEnum.IN, FilterOperatorEnum.NOT_IN):
+            if not isinstance(value, list):
+                raise InvalidQueryError(f"{op.value} on {condition.field} takes a list of values.")
+            values = [_stored_value(annotation, item, condition.field) for item in value]
+            filters.append(f"{attribute} {'IN' if op == FilterOperatorEnum.IN else 'NOT IN'} {bind(values)}")
+        elif op == FilterOperatorEnum.BETWEEN:
+            if not isinstance(value, list) or len(value) != 2:
+                raise InvalidQueryError(f"between on {condition.field} takes a lower and an upper bound.")
+            lower, upper = (_stored_value(annotation, bound, condition.field) for bound in value)
+            filters.append(f"{attribute} >= {bind(lower)} AND {attribute} <= {bind(upper)}")
+        elif op == FilterOperatorEnum.PREFIX:
+            if not _is_string(annotation):
+                raise InvalidQueryError(f"prefix only matches string fields, {condition.field} isn't one.")
+            filters.append(f"STARTS_WITH({attribute}, {bind(str(value))})")
+        elif op == FilterOperatorEnum.CONTAINS:
+            element_type = _element_type(annotation)
+            if element_type is not None:
+                filters.append(f"{bind(_stored_value(element_type, value, condition.field))} IN {attribute}")
+            elif _is_string(annotation):
+                filters.append(f"CONTAINS({attribute}, {bind(str(value))})")
+            else:
+                raise InvalidQueryError(f"contains only matches strings and lists, {condition.field} is neither.")
+        elif op == FilterOperatorEnum.EXISTS:
+            filters.append(f"{attribute} {'!=' if value in (None, True) else '=='} null")
+    return filters
+
+
+def compile_query(model: Type[AssetModel], query: AssetQuery) -> CompiledQuery:
+    """
+    Compile a query of the assets of a model to AQL.
+    One more document than the limit is fetched to know if there is a next page.
+
+    Args:
+        model (Type[AssetModel]): The model of the assets.
+        query (AssetQuery): The query.
+
+    Raises:
+        InvalidQueryError: If the query doesn't match the model.
+
+    Returns:
+        CompiledQuery: The AQL query and its bind variables.
+    """
+    bind_vars: dict[str, Any] = {"@collection": model.__name__, "limit": query.limit + 1}
+
+    def bind(value: Any) -> str:
+        name = f"v{len(bind_vars)}"
+        bind_vars[name] = value
+        return f"@{name}"
+
+    filters: list[str] = compile_filters(model, query.where, bind)
+
+    sort_paths: list[list[str]] = []
+    sort_orders: list[str] = []
+    for sort_field in query.sort:
+        attributes, _ = resolve_path(model, sort_field.field)
+        sort_paths.append(attributes)
+        sort_orders.append(sort_field.order.value.upper())
+    if ["_key"] not in sort_paths:
+        sort_paths.append(["_key"])
+        sort_orders.append("ASC")
+    sort_digest = hashlib.sha1(json.dumps([sort_paths, sort_orders]).encode("utf-8")).hexdigest()[:12]
+    sort_attributes = [f"doc.{bind(path)}" for path in sort_paths]
+
+    if query.cursor is not None:
+        # (a, b) after (x, y): a > x OR (a == x AND b > y), with < for descending fields
+        last_values = decode_cursor(query.cursor, sort_digest)
+        if len(last_values) != len(sort_paths):
+            raise InvalidQueryError("Invalid cursor.")
+        bound_values = [bind(value) for value in last_values]
+        alternatives = []
+        for index, (attribute, order) in enumerate(zip(sort_attributes, sort_orders)):
+            equal = [
+                f"{sort_attributes[previous]} == {bound_values[previous]}"
+                for previous in range(index)
+            ]
+            after = f"{attribute} {'>' if order == 'ASC' else '<'} {bound_values[index]}"
+            alternatives.append("(" + " AND ".join([*equal, after]) + ")")
+        filters.append("(" + " OR ".join(alternatives) + ")")
+
+    lines = ["FOR doc IN @@collection"]
+    lines.extend(f"    FILTER {condition}" for condition in filters)
+    lines.append(
+        "    SORT " + ", ".join(f"{attribute} {order}" for attribute, order in zip(sort_attributes, sort_orders))
+    )
+    lines.append("    LIMIT @limit")
+    lines.append("    RETURN doc")
+    return CompiledQuery(
+        query="\n".join(lines),
+        bind_vars=bind_vars,
+        sort_paths=sort_paths,
+        sort_digest=sort_digest,
+        limit=query.limit,
+    )
@@ -0,0 +1,292 @@
+"""
+attachment_store.py
+
+This module contains the storage of the binary attachments of the assets.
+
+The files are stored on local disk under `ATTACHMENTS_DIRECTORY`, addressed
+by the SHA-256 of their content (`blobs/ab/abcdef...`), so a file attached
+to several assets or uploaded several times is stored once. Uploads are
+streamed to a temporary file in the same directory and hashed on the fly,
+at most `ATTACHMENT_CHUNK_SIZE` bytes are held in memory whatever the size
+of the file. The finished file is renamed to its address, or dropped if a
+blob with the same content exists. Blobs are never changed once stored.
+
+The asset documents reference their attachments by name in their
+`gagm_attachments` attribute, with the digest, size and media type of the
+content. The references aren't part of the models and aren't versioned.
+
+Blobs that no asset references (the asset or the attachment was removed)
+are deleted by the garbage collection. Blobs written or uploaded again in
+the last `ATTACHMENT_GC_GRACE_SECONDS` are kept: their reference may not be
+written yet. Old revisions of the assets may reference collected blobs.
+"""
+
+import hashlib
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterable, Iterator, Optional
+
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+ATTACHMENTS_DIRECTORY = Path(os.environ.get("ATTACHMENTS_DIRECTORY", "attachments"))
+ATTACHMENTS_FIELD = "gagm_attachments"
+# Bytes of an upload or a download held in memory at once
+ATTACHMENT_CHUNK_SIZE = int(os.environ.get("ATTACHMENT_CHUNK_SIZE", 1024 * 1024))
+# 0 for no limit
+ATTACHMENT_MAX_SIZE = int(os.environ.get("ATTACHMENT_MAX_SIZE", 0))
+ATTACHMENT_GC_GRACE_SECONDS = int(os.environ.get("ATTACHMENT_GC_GRACE_SECONDS", 3600))
+ATTACHMENT_NAME_PATTERN = r"^[A-Za-z0-9_\-][A-Za-z0-9_\-.]{0,127}$"
+
+_DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+# Sets or replaces the reference of an attachment of @key in @@collection
+ATTACHMENT_SET_QUERY = f"""
+    FOR doc IN @@collection
+        FILTER doc._key == @key
+        UPDATE doc WITH {{{ATTACHMENTS_FIELD}: {{[@name]: @attachment}}}} IN @@collection
+            OPTIONS {{mergeObjects: true}}
+        RETURN VALUES(NEW.{ATTACHMENTS_FIELD})
+"""
+
+# Removes the reference of an attachment, returns the removed reference
+ATTACHMENT_REMOVE_QUERY = f"""
+    FOR doc IN @@collection
+        FILTER doc._key == @key AND HAS(doc.{ATTACHMENTS_FIELD}, @name)
+        UPDATE doc WITH {{{ATTACHMENTS_FIELD}: {{[@name]: null}}}} IN @@collection
+            OPTIONS {{mergeObjects: true, keepNull: false}}
+        RETURN OLD.{ATTACHMENTS_FIELD}[@name]
+"""
+
+# The digests referenced by the documents of @@collection
+ATTACHMENT_DIGESTS_QUERY = f"""
+    FOR doc IN @@collection
+        FILTER doc.{ATTACHMENTS_FIELD} != null
+        FOR attachment IN VALUES(doc.{ATTACHMENTS_FIELD})
+            RETURN DISTINCT attachment.digest
+"""
+
+
+class AttachmentTooLargeError(Exception):
+    """
+    Raised when an upload is larger than `ATTACHMENT_MAX_SIZE`.
+    """
+
+    pass
+
+
+class DigestMismatchError(Exception):
+    """
+    Raised when the content of an upload doesn't have the digest the client sent.
+    """
+
+    pass
+
+
+class Attachment(BaseModel):
+    name: str
+    # SHA-256 of the content, hex
+    digest: str
+    size: int
+    media_type: str = "application/octet-stream"
+    uploaded: Optional[str] = None
+
+
+class StoredBlob(BaseModel):
+    digest: str
+    size: int
+    # False if a blob with the same content was already stored
+    created: bool
+
+
+class AttachmentCollectionReport(BaseModel):
+    blobs: int = 0
+    referenced: int = 0
+    removed: int = 0
+    removed_bytes: int = 0
+    # Unreferenced blobs younger than the grace period
+    kept_recent: int = 0
+    # Temporary files of aborted uploads
+    removed_temporary: int = 0
+    seconds: float = 0.0
+
+
+def is_digest(value: str) -> bool:
+    return _DIGEST_PATTERN.fullmatch(value) is not None
+
+
+class BlobUpload(object):
+    """
+    A blob being uploaded, written to a temporary file and hashed chunk by chunk.
+    The methods are blocking, the async routes call them in the thread pool.
+    """
+
+    def __init__(self, store: "AttachmentStore", expected_digest: Optional[str] = None) -> None:
+        self._store = store
+        self._expected_digest = expected_digest
+        self._hash = hashlib.sha256()
+        self.size = 0
+        store.temporary_directory.mkdir(parents=True, exist_ok=True)
+        self.path = store.temporary_directory / f"{uuid.uuid4().hex}.part"
+        self._file = open(self.path, "xb")
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Append a chunk to the blob.
+
+        Raises:
+            AttachmentTooLargeError: If the blob gets larger than `ATTACHMENT_MAX_SIZE`.
+        """
+        self.size += len(chunk)
+        if ATTACHMENT_MAX_SIZE and self.size > ATTACHMENT_MAX_SIZE:
+            raise AttachmentTooLargeError(f"Attachments are limited to {ATTACHMENT_MAX_SIZE} bytes.")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> StoredBlob:
+        """
+        Store the uploaded blob at its address, the temporary file is removed.
+
+        Raises:
+            DigestMismatchError: If the content doesn't have the expected digest.
+
+        Returns:
+            StoredBlob: The digest and size of the blob.
+        """
+        self._file.close()
+        digest = self._hash.hexdigest()
+        if self._expected_digest is not None and digest != self._expected_digest:
+            self.abort()
+            raise DigestMismatchError(f"The content has the digest {digest}.")
+        path = self._store.blob_path(digest)
+        if path.exists():
+            # Same content, the upload is dropped and the blob is kept away from the collection
+            os.utime(path)
+            self.path.unlink()
+            return StoredBlob(digest=digest, size=self.size, created=False)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.path, path)
+        return StoredBlob(digest=digest, size=self.size, created=True)
+
+    def abort(self) -> None:
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class AttachmentStore(object):
+    """
+    AttachmentStore class. This class is a singleton.
+    It stores the content of the attachments by digest.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AttachmentStore, cls).__new__(cls)
+        return cls._instance
+
+    @property
+    def blob_directory(self) -> Path:
+        return ATTACHMENTS_DIRECTORY / "blobs"
+
+    @property
+    def temporary_directory(self) -> Path:
+        # On the same file system as the blobs, they are moved in place without copying
+        return ATTACHMENTS_DIRECTORY / "tmp"
+
+    def blob_path(self, digest: str) -> Path:
+        """
+        Get the path of the blob with a digest.
+
+        Raises:
+            ValueError: If the digest isn't a hex SHA-256.
+        """
+        if not is_digest(digest):
+            raise ValueError(f'Invalid digest "{digest}"')
+        return self.blob_directory / digest[:2] / digest
+
+    def begin_upload(self, expected_digest: Optional[str] = None) -> BlobUpload:
+        return BlobUpload(self, expected_digest)
+
+    async def receive(
+        self, chunks: AsyncIterable[bytes], expected_digest: Optional[str] = None
+    ) -> StoredBlob:
+        """
+        Store a blob from a stream, e.g. the body of a request. The chunks are gathered
+        up to `ATTACHMENT_CHUNK_SIZE` bytes and written in the thread pool.
+
+        Args:
+            chunks (AsyncIterable[bytes]): The content.
+            expected_digest (str, optional): Digest the content must have.
+
+        Raises:
+            AttachmentTooLargeError: If the content is larger than `ATTACHMENT_MAX_SIZE`.
+            DigestMismatchError: If the content doesn't have the expected digest.
+
+        Returns:
+            StoredBlob: The digest and size of the blob.
+        """
+        upload = await run_in_threadpool(self.begin_upload, expected_digest)
+        try:
+            buffer = bytearray()
+            async for chunk in chunks:
+                buffer += chunk
+                if len(buffer) >= ATTACHMENT_CHUNK_SIZE:
+                    await run_in_threadpool(upload.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_in_threadpool(upload.write, bytes(buffer))
+            return await run_in_threadpool(upload.commit)
+        except BaseException:
+            await run_in_threadpool(upload.abort)
+            raise
+
+    def _blobs(self) -> Iterator[Path]:
+        if not self.blob_directory.exists():
+            return
+        for prefix in os.scandir(self.blob_directory):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if is_digest(entry.name):
+                        yield Path(entry.path)
+
+    def collect_garbage(self, referenced: set[str], dry_run: bool = False) -> AttachmentCollectionReport:
+        """
+        Remove the blobs that aren't referenced and the temporary files of aborted uploads.
+        Files changed in the last `ATTACHMENT_GC_GRACE_SECONDS` are kept.
+
+        Args:
+            referenced (set[str]): The digests referenced by the assets.
+            dry_run (bool, optional): Only count what would be removed.
+
+        Returns:
+            AttachmentCollectionReport: What was removed.
+        """
+        start = time.perf_counter()
+        report = AttachmentCollectionReport()
+        cutoff = time.time() - ATTACHMENT_GC_GRACE_SECONDS
+        for path in self._blobs():
+            report.blobs += 1
+            if path.name in referenced:
+                report.referenced += 1
+                continue
+            stat = path.stat()
+            if stat.st_mtime > cutoff:
+                report.kept_recent += 1
+                continue
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            report.removed += 1
+            report.removed_bytes += stat.st_size
+        if self.temporary_directory.exists():
+            for entry in os.scandir(self.temporary_directory):
+                if entry.stat().st_mtime <= cutoff:
+                    if not dry_run:
+                        Path(entry.path).unlink(missing_ok=True)
+                    report.removed_temporary += 1
+        report.seconds = time.perf_counter() - start
+        return report
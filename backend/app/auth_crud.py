@@ -2,6 +2,7 @@ import logging
 import hashlib
 from typing import Optional
 
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
 from auth_models import User, APIKey
@@ -9,12 +10,23 @@ from auth_schemas import APIKeyUpdate, UserCreate, APIKeyCreate
 
 logger = logging.getLogger("uvicorn")
 
+# Statements of the authentication, built once and cached by the SQLAlchemy compiled cache
+USER_BY_ID = select(User).where(User.id == bindparam("user_id")).limit(1)
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
+USER_BY_KEY_HASH = (
+    select(User)
+    .join(APIKey, APIKey.user_id == User.id)
+    .where(APIKey.key_hash == bindparam("key_hash"))
+    .limit(1)
+)
+
+
 def get_user(db: Session, user_id: int) -> User:
-    return db.query(User).filter(User.id == user_id).first()
+    return db.scalars(USER_BY_ID, {"user_id": user_id}).first()
 
 
 def get_user_by_email(db: Session, email: str) -> User:
-    return db.query(User).filter(User.email == email).first()
+    return db.scalars(USER_BY_EMAIL, {"email": email}).first()
 
 
 def check_password(db: Session, email: str, password_hash: str) -> bool:
@@ -47,15 +59,8 @@ def get_key(db: Session, key_id: int):
 
 
 def check_key(db: Session, key_str: str) -> Optional[User]:
-    key = (
-        db.query(APIKey)
-        .filter_by(key_hash=hashlib.sha512(key_str.encode()).hexdigest())
-        .first()
-    )
-    logger.info(key_str)
-    logger.info(hashlib.sha512(key_str.encode()).hexdigest())
-    logger.info(key)
-    return None if not key else db.query(User).filter_by(id=key.user_id).first()
+    key_hash = hashlib.sha512(key_str.encode()).hexdigest()
+    return db.scalars(USER_BY_KEY_HASH, {"key_hash": key_hash}).first()
 
 
 def create_key(db: Session, key: APIKeyCreate) -> APIKey:
@@ -8,8 +8,9 @@ from fastapi.security import APIKeyHeader
 from sqlalchemy.orm import Session
 
 import auth_crud
-from rel_db import SessionLocal
+from rel_db import get_db
 from auth_models import User
+from instrumentation import span
 
 logger = logging.getLogger("uvicorn")
 
@@ -27,22 +28,13 @@ frontend_user_id_header = APIKeyHeader(name="X-FRONTEND-USER-ID", auto_error=Fal
 api_key_header = APIKeyHeader(name="X-API-KEY", auto_error=False, scheme_name="API key")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 def authenticate_api_key(
     db: Session = Depends(get_db), key: str = Security(api_key_header)
 ) -> Optional[User]:
     if not key:
         return
-    owner_of_key = auth_crud.check_key(
-        db, key
-    )
+    with span("auth.api_key"):
+        owner_of_key = auth_crud.check_key(db, key)
     # logger.info(f"{owner_of_key=}")
     # logger.info(f"{key=}")
     return owner_of_key
@@ -54,11 +46,11 @@ def check_frontend_key(
     user_id: str = Security(frontend_user_id_header),
 ) -> Optional[User]:
     # logger.info(f"{user_id=}\n{frontend_secret=}\n{frontend_key=}")
-    if not (frontend_secret and user_id):
+    # The secret is checked first, requests with a wrong secret never reach the database
+    if not (frontend_secret and user_id) or frontend_secret != frontend_key:
         return
-    user: User = db.query(User).filter_by(id=user_id).first()
-    key_check = frontend_secret == frontend_key
-    return user if key_check else None
+    with span("auth.frontend"):
+        return auth_crud.get_user(db, user_id)
 
 
 def authenticate_user(
@@ -90,3 +82,28 @@ def authenticate_user(
     user: User = api_key_result or frontend_auth_result
     # logger.info(f"Authenticated {str(user.email)}")
     return str(user.email)
+
+
+def authenticate_admin(
+    api_key_result: User = Depends(authenticate_api_key),
+    frontend_auth_result: User = Depends(check_frontend_key),
+) -> str:
+    """
+    Provides authentication for the administrative endpoints.
+    Same as `authenticate_user`, but the user also has to be an admin.
+
+    Args:
+        api_key_result (User, optional): API key based authentication.
+        frontend_auth_result (User, optional): Frontend secret based authentication.
+
+    Raises:
+        HTTPException: 401 if authentication fails, 403 if the user is not an admin.
+
+    Returns:
+        str: Email of the authenticated admin
+    """
+    email = authenticate_user(api_key_result, frontend_auth_result)
+    user: User = api_key_result or frontend_auth_result
+    if not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin rights required")
+    return email
@@ -0,0 +1,186 @@
+"""
+batch_writes.py
+
+This module contains the validation of batches of writes.
+
+A batch is a list of creates, updates, deletes and tag changes of assets,
+e.g. an NPC with its whole dialogue tree. Every operation is validated
+before anything is written, the DataManager then runs the batch in a single
+stream transaction: either every write is committed or none is.
+"""
+
+import os
+from enum import Enum
+from typing import Callable, Optional, Type
+
+from pydantic import BaseModel, Field, ValidationError
+
+from gagm_base.asset_model import AssetModel
+from gagm_base.edge_model import EdgeModel
+from gagm_base.node_model import NodeModel
+from model_manager import ModelNotFoundError
+
+MAX_BATCH_OPERATIONS = 1000
+BATCH_LOCK_TIMEOUT_SECONDS = int(os.environ.get("BATCH_LOCK_TIMEOUT_SECONDS", 10))
+
+
+class InvalidBatchError(Exception):
+    """
+    Raised when operations of a batch are invalid, nothing was written.
+    """
+
+    def __init__(self, errors: list[dict]):
+        super().__init__(f"{len(errors)} invalid operations")
+        self.errors = errors
+
+
+class BatchConflictError(Exception):
+    """
+    Raised when an operation of a batch conflicts with the stored data, the batch was rolled back.
+    """
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index
+
+
+class BatchOperationEnum(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    TAG = "tag"
+    UNTAG = "untag"
+
+
+class BatchOperation(BaseModel):
+    """
+    A write of a batch.
+
+    - `create` and `update` take the type and the whole asset as `data`, the key
+      can be given in `data` or as `key`.
+    - `update` takes the `_rev` (ETag) the asset must still have as `rev`, optionally.
+    - `delete` takes the type and the key.
+    - `tag` and `untag` take the type, the key and the tag. Tags are created if
+      they don't exist, tagging twice or untagging an untagged asset is no error.
+    """
+
+    op: BatchOperationEnum
+    type: str
+    key: Optional[str] = None
+    data: Optional[dict] = None
+    tag: Optional[str] = None
+    rev: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=MAX_BATCH_OPERATIONS)
+
+
+class PreparedWrite(BaseModel):
+    """
+    A validated operation of a batch.
+    """
+
+    index: int
+    op: BatchOperationEnum
+    model: Type[AssetModel]
+    asset_id: str
+    asset: Optional[AssetModel] = None
+    tag: Optional[str] = None
+    rev: Optional[str] = None
+
+
+class BatchWriteResult(BaseModel):
+    index: int
+    op: BatchOperationEnum
+    asset_id: str
+    # The new revision of the asset, None for tag changes
+    revision: Optional[int] = None
+
+
+class BatchResult(BaseModel):
+    results: list[BatchWriteResult]
+
+
+def validate_edge(asset: EdgeModel) -> None:
+    """
+    Check the origin and target of an edge against the types allowed by its model.
+
+    Raises:
+        ValueError: If the origin or target is missing or has a type the model doesn't allow.
+    """
+    edge_type = type(asset)
+    if asset.origin_id is None or asset.target_id is None:
+        raise ValueError("Edge must have both from_id and to_id set.")
+    if asset.origin_id.split("/")[0] not in edge_type.origin_type:
+        raise ValueError(f"Edge origin type must be one of {edge_type.origin_type}")
+    if asset.target_id.split("/")[0] not in edge_type.target_type:
+        raise ValueError(f"Edge target type must be one of {edge_type.target_type}")
+
+
+def prepare_batch(
+    batch: BatchRequest, get_model: Callable[[str], Type[AssetModel]]
+) -> list[PreparedWrite]:
+    """
+    Validate every operation of a batch.
+
+    Args:
+        batch (BatchRequest): The batch.
+        get_model (Callable[[str], Type[AssetModel]]): Returns the model of a type,
+            raises ModelNotFoundError if the type doesn't exist.
+
+    Raises:
+        InvalidBatchError: With the errors of every invalid operation.
+
+    Returns:
+        list[PreparedWrite]: The validated operations, in the order of the batch.
+    """
+    prepared: list[PreparedWrite] = []
+    errors: list[dict] = []
+    for index, operation in enumerate(batch.operations):
+        try:
+            model = get_model(operation.type)
+        except ModelNotFoundError:
+            errors.append({"index": index, "detail": f"User type {operation.type} does not exist."})
+            continue
+        try:
+            asset: Optional[AssetModel] = None
+            key = operation.key
+            if operation.op in (BatchOperationEnum.CREATE, BatchOperationEnum.UPDATE):
+                if operation.data is None:
+                    raise ValueError(f"{operation.op.value} takes the asset as data.")
+                data = dict(operation.data)
+                if key is not None:
+                    data.pop("db_key", None)
+                    data["_key"] = key
+                asset = model(**data)
+                key = asset.db_key
+                if isinstance(asset, EdgeModel):
+                    validate_edge(asset)
+            elif operation.op in (BatchOperationEnum.TAG, BatchOperationEnum.UNTAG):
+                if not operation.tag:
+                    raise ValueError(f"{operation.op.value} takes a tag.")
+                if not issubclass(model, NodeModel):
+                    raise ValueError("Only nodes can be tagged.")
+            if not key:
+                raise ValueError(f"{operation.op.value} takes the key of the asset.")
+        except ValidationError as error:
+            errors.append({"index": index, "detail": error.errors()})
+            continue
+        except (TypeError, ValueError) as error:
+            errors.append({"index": index, "detail": str(error)})
+            continue
+        prepared.append(
+            PreparedWrite(
+                index=index,
+                op=operation.op,
+                model=model,
+                asset_id=f"{model.__name__}/{key}",
+                asset=asset,
+                tag=operation.tag,
+                rev=operation.rev,
+            )
+        )
+    if errors:
+        raise InvalidBatchError(errors)
+    return prepared
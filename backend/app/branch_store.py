@@ -0,0 +1,384 @@
+"""
+branch_store.py
+
+This module contains the storage of the content branches of the graph.
+
+A branch is a copy-on-write view of the graph, e.g. to prototype changes to
+a region without touching the shared graph. It only stores the assets it
+changed: the `BranchOverlay` collection holds one document per branch and
+changed asset with the whole changed document, or null if the branch
+deleted the asset. Reads in a branch resolve through the overlay, then the
+main graph, so creating a branch only inserts its document in `Branches`
+whatever the size of the graph.
+
+An overlay entry keeps the `_rev` the main document had when the branch
+first changed the asset (`base_rev`, null if the asset didn't exist). The
+diff and the merge compare it to the current main document: a change of the
+branch conflicts if main changed the asset since. Merges are written in one
+stream transaction like the batches (see batch_writes.py) and record the
+revisions of the merged assets, the writes in a branch aren't versioned.
+
+Branches only hold the assets and their edges: tags, notes, attachments and
+the revision history belong to main.
+"""
+
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Optional
+
+from arango.database import Database
+from pydantic import BaseModel, Field
+
+from attachment_store import ATTACHMENTS_FIELD
+from index_manager import IndexDefinition, IndexSyncReport, sync_indexes
+from revision_store import REVISION_FIELD
+from trusted_reads import SCHEMA_HASH_FIELD
+
+BRANCHES_COLLECTION = "Branches"
+OVERLAY_COLLECTION = "BranchOverlay"
+BRANCH_NAME_PATTERN = r"^[A-Za-z0-9_\-]{1,64}$"
+# Header selecting the branch of the data endpoints
+BRANCH_HEADER = "X-GAGM-BRANCH"
+
+OVERLAY_INDEXES = [
+    IndexDefinition(type="persistent", fields=["branch", "type"]),
+]
+
+# Attributes of the stored documents that aren't part of the content of the assets
+_INTERNAL_ATTRIBUTES = {"_id", "_key", "_rev", REVISION_FIELD, SCHEMA_HASH_FIELD, ATTACHMENTS_FIELD}
+
+# The branch of the current request, None for main
+current_branch: ContextVar[Optional[str]] = ContextVar("current_branch", default=None)
+
+# The overlay entry of an asset and its main document
+BRANCH_RESOLVE_QUERY = f"""
+    RETURN {{
+        entry: DOCUMENT(CONCAT("{OVERLAY_COLLECTION}/", @entry_key)),
+        main: DOCUMENT(@asset_id)
+    }}
+"""
+
+# The overlay entries of a branch, of one type or of every type if @type is null
+BRANCH_OVERLAY_QUERY = f"""
+    FOR entry IN {OVERLAY_COLLECTION}
+        FILTER entry.branch == @branch AND (@type == null OR entry.type == @type)
+        RETURN entry
+"""
+
+# The overlay entries of a branch with the current main documents of their assets
+BRANCH_CHANGES_QUERY = f"""
+    FOR entry IN {OVERLAY_COLLECTION}
+        FILTER entry.branch == @branch
+        SORT entry.asset_id
+        RETURN {{entry: entry, main: DOCUMENT(entry.asset_id)}}
+"""
+
+BRANCH_CLEAR_QUERY = f"""
+    FOR entry IN {OVERLAY_COLLECTION}
+        FILTER entry.branch == @branch
+        REMOVE entry IN {OVERLAY_COLLECTION}
+        COLLECT WITH COUNT INTO removed
+        RETURN removed
+"""
+
+# The branches with their number of changed assets, or only the branch @name
+BRANCH_LIST_QUERY = f"""
+    FOR branch IN {BRANCHES_COLLECTION}
+        FILTER @name == null OR branch._key == @name
+        SORT branch._key
+        LET changes = LENGTH(
+            FOR entry IN {OVERLAY_COLLECTION}
+                FILTER entry.branch == branch._key
+                RETURN 1
+        )
+        RETURN MERGE(branch, {{changes: changes}})
+"""
+
+# Edges connected to a vertex in a branch, without the tag edges: the edges of main the branch
+# didn't move or delete and the edges the branch created or moved to the vertex.
+# The keys of the entries are built like `overlay_key`.
+BRANCH_CONNECTED_EDGES_QUERY = f"""
+    LET main_edges = (
+        FOR v, e IN 1..1 ANY @node_id
+            GRAPH 'gagm'
+            FILTER PARSE_IDENTIFIER(e._id).collection != "TagEdge"
+            RETURN e._id
+    )
+    LET branch_edges = (
+        FOR entry IN {OVERLAY_COLLECTION}
+            FILTER entry.branch == @branch AND entry.document != null
+            FILTER entry.document._from == @node_id OR entry.document._to == @node_id
+            RETURN entry.asset_id
+    )
+    FOR edge_id IN UNION_DISTINCT(main_edges, branch_edges)
+        LET entry = DOCUMENT({OVERLAY_COLLECTION}, CONCAT(@branch, ":", SUBSTITUTE(edge_id, "/", ":")))
+        FILTER entry == null
+            OR (entry.document != null AND @node_id IN [entry.document._from, entry.document._to])
+        RETURN edge_id
+"""
+
+
+class BranchNotFoundError(Exception):
+    """
+    Raised when a branch doesn't exist.
+    """
+
+    pass
+
+
+class BranchExistsError(Exception):
+    """
+    Raised when a branch is created with the name of an existing branch.
+    """
+
+    pass
+
+
+class MergeConflictError(Exception):
+    """
+    Raised when a merge has conflicts and should fail on them, nothing was merged.
+    """
+
+    def __init__(self, diff: "BranchDiff"):
+        super().__init__(f"{diff.conflicts} changes of branch {diff.branch} conflict with main")
+        self.diff = diff
+
+
+class BranchOperationEnum(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class MergeStrategyEnum(str, Enum):
+    """
+    What a merge does with the conflicting changes.
+
+    - fail: Nothing is merged if a change conflicts.
+    - main: The conflicting changes are dropped, main keeps its version.
+    - branch: The conflicting changes overwrite main.
+    """
+
+    FAIL = "fail"
+    MAIN = "main"
+    BRANCH = "branch"
+
+
+class BranchInput(BaseModel):
+    name: str = Field(pattern=BRANCH_NAME_PATTERN)
+    description: str = ""
+
+
+class Branch(BaseModel):
+    name: str
+    description: str = ""
+    created: str
+    # Last merge into main
+    merged: Optional[str] = None
+    # Number of changed assets
+    changes: int = 0
+
+
+class BranchChange(BaseModel):
+    """
+    A change of a branch compared to main.
+    """
+
+    asset_id: str
+    type: str
+    operation: BranchOperationEnum
+    # Why the change conflicts with main, None if it doesn't
+    conflict: Optional[str] = None
+    # `_rev` of the main document when the branch first changed the asset
+    base_rev: Optional[str] = None
+    # `_rev` of the current main document
+    main_rev: Optional[str] = None
+    # JSON Patch of the top level attributes from the current main document
+    patch: list[dict] = []
+
+
+class BranchDiff(BaseModel):
+    branch: str
+    changes: list[BranchChange] = []
+    conflicts: int = 0
+
+
+class MergeReport(BaseModel):
+    branch: str
+    strategy: MergeStrategyEnum
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    # Conflicting changes dropped by the `main` strategy
+    skipped: list[BranchChange] = []
+    # Conflicting changes written by the `branch` strategy
+    overwritten: list[BranchChange] = []
+    seconds: float = 0.0
+
+
+def get_current_branch() -> Optional[str]:
+    return current_branch.get()
+
+
+def branch_from_document(document: dict) -> Branch:
+    return Branch(
+        name=document["_key"],
+        description=document.get("description") or "",
+        created=document["created"],
+        merged=document.get("merged"),
+        changes=document.get("changes", 0),
+    )
+
+
+def overlay_key(branch: str, asset_id: str) -> str:
+    """
+    Key of the overlay entry of an asset in a branch, `/` isn't allowed in keys.
+    """
+    return f"{branch}:{asset_id.replace('/', ':')}"
+
+
+def overlay_entry(
+    branch: str, asset_id: str, document: Optional[dict], base_rev: Optional[str]
+) -> dict:
+    """
+    Build the overlay entry of an asset.
+
+    Args:
+        branch (str): Name of the branch.
+        asset_id (str): ID of the asset.
+        document (dict, optional): The document in the branch, None if the branch deleted the asset.
+        base_rev (str, optional): `_rev` of the main document when the branch first changed it.
+
+    Returns:
+        dict: The entry.
+    """
+    if document is not None:
+        # The writes in a branch aren't versioned
+        document = {name: value for name, value in document.items() if name not in ("_rev", REVISION_FIELD)}
+        document["_id"] = asset_id
+    return {
+        "_key": overlay_key(branch, asset_id),
+        "branch": branch,
+        "asset_id": asset_id,
+        "type": asset_id.split("/", 1)[0],
+        "document": document,
+        "base_rev": base_rev,
+    }
+
+
+def resolve_entry(entry: dict) -> Optional[dict]:
+    """
+    The document of an asset in a branch, with the `_rev` of its entry as the ETag.
+
+    Returns:
+        Optional[dict]: The document, None if the branch deleted the asset.
+    """
+    if entry["document"] is None:
+        return None
+    return {**entry["document"], "_rev": entry["_rev"]}
+
+
+def resolve_documents(main_documents: list[dict], entries: list[dict]) -> list[dict]:
+    """
+    Apply the overlay entries of a branch to main documents.
+
+    Args:
+        main_documents (list[dict]): The documents in main.
+        entries (list[dict]): The overlay entries of the same assets (e.g. of a type).
+
+    Returns:
+        list[dict]: The documents in the branch, in the order of main, created ones last.
+    """
+    overlay = {entry["asset_id"]: entry for entry in entries}
+    documents = []
+    for document in main_documents:
+        entry = overlay.pop(document["_id"], None)
+        if entry is None:
+            documents.append(document)
+        elif entry["document"] is not None:
+            documents.append(resolve_entry(entry))
+    documents.extend(resolve_entry(entry) for entry in overlay.values() if entry["document"] is not None)
+    return documents
+
+
+def operation_of(entry: dict) -> BranchOperationEnum:
+    if entry["document"] is None:
+        return BranchOperationEnum.DELETE
+    if entry["base_rev"] is None:
+        return BranchOperationEnum.CREATE
+    return BranchOperationEnum.UPDATE
+
+
+def top_level_patch(source: Optional[dict], target: Optional[dict]) -> list[dict]:
+    """
+    JSON Patch of the top level attributes of the content of two documents.
+    """
+    source = {name: value for name, value in (source or {}).items() if name not in _INTERNAL_ATTRIBUTES}
+    target = {name: value for name, value in (target or {}).items() if name not in _INTERNAL_ATTRIBUTES}
+    patch: list[dict[str, Any]] = []
+    for name in sorted(source.keys() - target.keys()):
+        patch.append({"op": "remove", "path": f"/{_escape(name)}"})
+    for name in sorted(target):
+        if name not in source:
+            patch.append({"op": "add", "path": f"/{_escape(name)}", "value": target[name]})
+        elif source[name] != target[name]:
+            patch.append({"op": "replace", "path": f"/{_escape(name)}", "value": target[name]})
+    return patch
+
+
+def _escape(name: str) -> str:
+    return name.replace("~", "~0").replace("/", "~1")
+
+
+def classify_change(entry: dict, main: Optional[dict]) -> Optional[BranchChange]:
+    """
+    Compare a change of a branch to the current main document of the asset.
+
+    - A created asset conflicts if main created it too.
+    - An updated or deleted asset conflicts if main changed or deleted it since
+      the branch first changed it. Deleting an asset main deleted too is no change.
+
+    Args:
+        entry (dict): The overlay entry.
+        main (dict, optional): The main document, None if the asset doesn't exist in main.
+
+    Returns:
+        Optional[BranchChange]: The change, None if the branch doesn't change main.
+    """
+    operation = operation_of(entry)
+    main_rev = main["_rev"] if main else None
+    conflict = None
+    if operation == BranchOperationEnum.CREATE:
+        if main is not None:
+            conflict = "Created in main too."
+    elif main is None:
+        if operation == BranchOperationEnum.DELETE:
+            return None
+        conflict = "Deleted in main."
+    elif main_rev != entry["base_rev"]:
+        conflict = "Changed in main."
+    return BranchChange(
+        asset_id=entry["asset_id"],
+        type=entry["type"],
+        operation=operation,
+        conflict=conflict,
+        base_rev=entry["base_rev"],
+        main_rev=main_rev,
+        patch=top_level_patch(main, entry["document"]),
+    )
+
+
+def ensure_branch_collections(db: Database) -> IndexSyncReport:
+    """
+    Create the collections of the branches and the indexes of the overlay.
+
+    Args:
+        db (Database): The database.
+
+    Returns:
+        IndexSyncReport: The changes of the indexes.
+    """
+    for name in (BRANCHES_COLLECTION, OVERLAY_COLLECTION):
+        if not db.has_collection(name):
+            db.create_collection(name)
+    return sync_indexes(db.collection(OVERLAY_COLLECTION), OVERLAY_INDEXES)
@@ -0,0 +1,154 @@
+"""
+bulk_deletes.py
+
+This module contains the selection of the assets of a bulk delete.
+
+A bulk delete removes the assets matching a selection: a list of IDs, a
+type, a tag, filters on the fields of a type, or a combination of them
+(the conditions are combined with AND). The DataManager removes the selected
+assets with one AQL query per collection, then the edges connected to the
+removed vertices with one query per edge collection (including the tags),
+their notes and appends the deletions to the revisions, all in one stream
+transaction.
+"""
+
+from typing import Any, Callable, Optional, Type
+
+from pydantic import BaseModel
+
+from asset_query import FieldFilter, compile_filters
+from gagm_base.asset_model import AssetModel
+from gagm_base.node_model import NodeModel
+from model_manager import ModelNotFoundError
+
+# Rows fetched per batch of the cursors of a bulk delete
+BULK_DELETE_BATCH_SIZE = 10000
+
+
+class InvalidBulkDeleteError(Exception):
+    """
+    Raised when the selection of a bulk delete is invalid, nothing was deleted.
+    """
+
+    pass
+
+
+class BulkDeleteRequest(BaseModel):
+    """
+    The selection of a bulk delete, at least one of `ids`, `type` and `tag`.
+
+    - `ids` deletes the assets with these IDs (*Type/Key*), missing ones are skipped.
+    - `type` deletes the assets of a type, `where` filters them like the queries of the type.
+    - `tag` deletes the tagged nodes.
+    - `dry_run` counts what would be deleted and rolls back.
+    """
+
+    ids: Optional[list[str]] = None
+    type: Optional[str] = None
+    where: list[FieldFilter] = []
+    tag: Optional[str] = None
+    dry_run: bool = False
+
+
+class BulkDeleteReport(BaseModel):
+    # Selected assets that were deleted, by collection
+    assets: dict[str, int] = {}
+    # Edges connected to the deleted vertices, by collection
+    edges: dict[str, int] = {}
+    notes: int = 0
+    dry_run: bool = False
+    seconds: float = 0.0
+
+
+class RemovalQuery(BaseModel):
+    """
+    The query removing the selected assets of a collection, it returns their IDs.
+    """
+
+    model: Type[AssetModel]
+    query: str
+    bind_vars: dict[str, Any]
+
+
+def compile_removals(
+    request: BulkDeleteRequest,
+    get_model: Callable[[str], Type[AssetModel]],
+    node_models: list[Type[AssetModel]],
+    tag_id: Optional[str] = None,
+) -> list[RemovalQuery]:
+    """
+    Compile the selection of a bulk delete to one removal query per collection.
+
+    Args:
+        request (BulkDeleteRequest): The selection.
+        get_model (Callable[[str], Type[AssetModel]]): Returns the model of a type,
+            raises ModelNotFoundError if the type doesn't exist.
+        node_models (list[Type[AssetModel]]): The models of the nodes, searched for tagged assets.
+        tag_id (str, optional): The ID of the `AssetTag` of `request.tag`.
+
+    Raises:
+        InvalidBulkDeleteError: If the selection is empty or names an unknown type or an invalid ID.
+        InvalidQueryError: If a filter doesn't match the model of the type.
+
+    Returns:
+        list[RemovalQuery]: The queries.
+    """
+    if request.ids is None and request.type is None and request.tag is None:
+        raise InvalidBulkDeleteError("Select the assets by ids, type or tag.")
+    if request.where and request.type is None:
+        raise InvalidBulkDeleteError("where filters the assets of a type, it takes the type.")
+
+    keys_by_type: Optional[dict[str, list[str]]] = None
+    if request.ids is not None:
+        keys_by_type = {}
+        for asset_id in request.ids:
+            type_name, _, key = asset_id.partition("/")
+            if not key:
+                raise InvalidBulkDeleteError(f"Invalid asset ID {asset_id}")
+            keys_by_type.setdefault(type_name, []).append(key)
+
+    try:
+        if request.type is not None:
+            models = [get_model(request.type)]
+        elif keys_by_type is not None:
+            models = [get_model(type_name) for type_name in keys_by_type]
+        else:
+            models = list(node_models)
+    except ModelNotFoundError as error:
+        raise InvalidBulkDeleteError(str(error)) from error
+    if request.tag is not None and request.type is not None and not issubclass(models[0], NodeModel):
+        raise InvalidBulkDeleteError("Only nodes can be tagged.")
+
+    removals: list[RemovalQuery] = []
+    for model in models:
+        if keys_by_type is not None and model.__name__ not in keys_by_type:
+            continue
+        bind_vars: dict[str, Any] = {"@collection": model.__name__}
+
+        def bind(value: Any) -> str:
+            name = f"v{len(bind_vars)}"
+            bind_vars[name] = value
+            return f"@{name}"
+
+        if keys_by_type is not None:
+            lines = ["FOR doc IN @@collection", f"    FILTER doc._key IN {bind(keys_by_type[model.__name__])}"]
+            if request.tag is not None:
+                lines.append(
+                    "    FILTER LENGTH((FOR edge IN TagEdge FILTER edge._to == doc._id"
+                    f" AND edge._from == {bind(tag_id)} LIMIT 1 RETURN 1)) > 0"
+                )
+        elif request.tag is not None:
+            # The edges of the tag are few compared to the collection, start from them
+            lines = [
+                f"FOR edge IN TagEdge FILTER edge._from == {bind(tag_id)}",
+                f"    FILTER STARTS_WITH(edge._to, {bind(model.__name__ + '/')})",
+                "    FOR doc IN @@collection",
+                "        FILTER doc._id == edge._to",
+            ]
+        else:
+            lines = ["FOR doc IN @@collection"]
+        lines.extend(f"    FILTER {condition}" for condition in compile_filters(model, request.where, bind))
+        lines.append("    REMOVE doc IN @@collection")
+        lines.append("    RETURN OLD._id")
+        removals.append(RemovalQuery(model=model, query="\n".join(lines), bind_vars=bind_vars))
+    return removals
@@ -0,0 +1,232 @@
+"""
+bundle_exporter.py
+
+This module contains the BundleExporter class.
+
+The bundle of the whole graph is kept in `EXPORT_DIRECTORY`, the workers
+share it through the file. A rebuild is incremental if the models didn't
+change since the last bundle: the assets with revisions since its watermark
+are read again and applied to the last bundle with `update_bundle`, the
+collections aren't read. The strings of removed values stay in the bundle
+until the next full rebuild. The watermark is the time of the database when the assets were
+read, the revisions are looked up `EXPORT_CHANGE_OVERLAP_SECONDS` before it
+because a write can commit after its timestamp, reading an asset again is
+harmless. New bundles replace the file atomically, clients that mapped the
+previous one keep reading it.
+
+Assets written without revisions (e.g. imported into the database) and tags
+aren't in the change history, a full rebuild picks them up.
+
+Every project has its own bundle, the bundles of the projects other than the
+default project are in their subdirectory of `EXPORT_DIRECTORY`.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from data_manager import DataManager
+from export_bundle import BundleReader, BundleStats, InvalidBundleError, build_bundle, update_bundle
+from instrumentation import span
+from model_manager import ModelManager
+from project_context import DEFAULT_PROJECT, get_current_project
+from trusted_reads import schema_hash, serialize_document
+
+logger = logging.getLogger("uvicorn")
+
+EXPORT_DIRECTORY = Path(os.environ.get("EXPORT_DIRECTORY", "exports"))
+EXPORT_BUNDLE_NAME = "graph.gagm"
+EXPORT_CHANGE_OVERLAP_SECONDS = int(os.environ.get("EXPORT_CHANGE_OVERLAP_SECONDS", 60))
+# With more changed assets reading the collections is faster than merging
+EXPORT_INCREMENTAL_MAX_CHANGES = int(os.environ.get("EXPORT_INCREMENTAL_MAX_CHANGES", 100000))
+
+
+class ExportReport(BaseModel):
+    incremental: bool = False
+    # Assets read again by an incremental rebuild
+    changed: int = 0
+    stats: BundleStats = BundleStats()
+    seconds: float = 0.0
+
+
+class BundleExporter(object):
+    """
+    BundleExporter class. This class is a singleton.
+    It builds the export bundles of the graph.
+    """
+
+    _instance = None
+
+    def __init__(self) -> None:
+        self._data_manager = DataManager()
+        self._model_manager = ModelManager()
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(BundleExporter, cls).__new__(cls)
+            # One rebuild at a time per worker
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    @property
+    def path(self) -> Path:
+        project = get_current_project()
+        if project == DEFAULT_PROJECT:
+            return EXPORT_DIRECTORY / EXPORT_BUNDLE_NAME
+        return EXPORT_DIRECTORY / project / EXPORT_BUNDLE_NAME
+
+    def models_hash(self) -> str:
+        """
+        Get the hash of the loaded models, a bundle of other models can't be rebuilt incrementally.
+        """
+        digest = hashlib.sha256()
+        for kind, models in sorted(self._model_manager.get_all_models().items()):
+            for name in sorted(models):
+                digest.update(f"{kind}:{name}:{schema_hash(models[name])};".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _split(self, assets: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+        node_models = self._model_manager.get_node_models()
+        nodes: dict[str, Any] = {}
+        edges: dict[str, Any] = {}
+        for type_name, rows in assets.items():
+            (nodes if type_name in node_models else edges)[type_name] = rows
+        return nodes, edges
+
+    def build_subgraph(self, nodes: list[dict], edges: list[dict]) -> tuple[bytes, BundleStats]:
+        """
+        Build the bundle of a subgraph, e.g. a filtered graph. It isn't stored.
+
+        Args:
+            nodes (list[dict]): The serialized nodes.
+            edges (list[dict]): The serialized edges, edges to nodes outside of the subgraph
+                are left out.
+
+        Returns:
+            tuple[bytes, BundleStats]: The bundle and its statistics.
+        """
+        watermark = self._data_manager.get_database_time()
+        by_type: dict[str, dict[str, list[dict]]] = {"nodes": {}, "edges": {}}
+        for part, assets in (("nodes", nodes), ("edges", edges)):
+            for asset in assets:
+                by_type[part].setdefault(asset["db_id"].split("/", 1)[0], []).append(asset)
+        with span("bundle.build", nodes=len(nodes), edges=len(edges)):
+            return build_bundle(
+                by_type["nodes"], by_type["edges"], int(watermark.timestamp() * 1000), self.models_hash()
+            )
+
+    def rebuild(self, full: bool = False) -> ExportReport:
+        """
+        Rebuild the bundle of the whole graph, incrementally if possible.
+        Blocking, runs in the database thread pool.
+
+        Args:
+            full (bool, optional): Read every collection even if the last bundle could be updated.
+
+        Returns:
+            ExportReport: What was rebuilt.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            report = None if full else self._rebuild_incrementally()
+            if report is None:
+                report = self._rebuild_fully()
+            report.seconds = time.perf_counter() - start
+            logger.info(
+                "Rebuilt the export bundle (%s) with %d nodes and %d edges in %.1f s",
+                "incremental" if report.incremental else "full",
+                report.stats.nodes,
+                report.stats.edges,
+                report.seconds,
+            )
+            return report
+
+    def ensure_bundle(self) -> Path:
+        """
+        Get the path of the bundle of the whole graph, it's built if there is none yet.
+        """
+        if not self.path.exists():
+            self.rebuild(full=True)
+        return self.path
+
+    def _rebuild_fully(self) -> ExportReport:
+        watermark = self._data_manager.get_database_time()
+        nodes = {
+            name: self._data_manager.get_serialized_assets_by_type(model)
+            for name, model in self._model_manager.get_node_models().items()
+        }
+        edges = {
+            name: self._data_manager.get_serialized_assets_by_type(model)
+            for name, model in self._model_manager.get_edge_models().items()
+        }
+        return ExportReport(
+            incremental=False, stats=self._write(nodes, edges, int(watermark.timestamp() * 1000))
+        )
+
+    def _rebuild_incrementally(self) -> Optional[ExportReport]:
+        """
+        Merge the changes since the last bundle into it.
+
+        Returns:
+            Optional[ExportReport]: The report, None if the bundle has to be rebuilt fully.
+        """
+        models_hash = self.models_hash()
+        watermark = self._data_manager.get_database_time()
+        try:
+            reader = BundleReader.open(self.path)
+        except (FileNotFoundError, InvalidBundleError):
+            return None
+        with reader:
+            if reader.models_hash != models_hash:
+                logger.info("The models changed since the last export bundle, rebuilding it fully")
+                return None
+            since = datetime.fromtimestamp(reader.watermark_ms / 1000, timezone.utc) - timedelta(
+                seconds=EXPORT_CHANGE_OVERLAP_SECONDS
+            )
+            changed = [
+                asset_id
+                for asset_id in self._data_manager.get_changed_asset_ids(since)
+                if self._model_manager.is_model_present(asset_id.split("/", 1)[0])
+            ]
+            if len(changed) > EXPORT_INCREMENTAL_MAX_CHANGES:
+                return None
+            changes: dict[str, dict[str, Optional[dict]]] = {}
+            for asset_id, document in self._data_manager.get_documents(changed).items():
+                type_name = asset_id.split("/", 1)[0]
+                row = None
+                if document is not None:
+                    try:
+                        row = serialize_document(self._model_manager.get_model(type_name), document)
+                    except ValidationError as error:
+                        logger.warning("Skipping %s in the export bundle: %s", asset_id, error)
+                changes.setdefault(type_name, {})[asset_id] = row
+            nodes, edges = self._split(changes)
+            with span("bundle.update", changed=len(changed)):
+                bundle, stats = update_bundle(
+                    reader, nodes, edges, int(watermark.timestamp() * 1000), models_hash
+                )
+        self._store(bundle)
+        return ExportReport(incremental=True, changed=len(changed), stats=stats)
+
+    def _write(
+        self, nodes: dict[str, list[dict]], edges: dict[str, list[dict]], watermark: int
+    ) -> BundleStats:
+        with span(
+            "bundle.build", nodes=sum(map(len, nodes.values())), edges=sum(map(len, edges.values()))
+        ):
+            bundle, stats = build_bundle(nodes, edges, watermark, self.models_hash())
+        self._store(bundle)
+        return stats
+
+    def _store(self, bundle: bytes) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f"{EXPORT_BUNDLE_NAME}.{os.getpid()}.tmp")
+        temporary.write_bytes(bundle)
+        os.replace(temporary, self.path)
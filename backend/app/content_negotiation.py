@@ -0,0 +1,235 @@
+"""
+content_negotiation.py
+
+This module contains the content negotiation of the responses.
+
+Responses are encoded as JSON or, if the client prefers it in its `Accept`
+header, as MessagePack: the default response class of the app renders its
+content in the media type the middleware negotiated for the request.
+Responses with an explicit response class (e.g. `JSONResponse`) keep their
+media type.
+
+The middleware compresses complete responses of compressible media types
+with the encoding the client prefers in its `Accept-Encoding` header (zstd,
+brotli or gzip, in this order of preference for equal weights). Responses
+smaller than `COMPRESSION_MIN_SIZE` aren't worth the time and are sent as
+they are, streamed responses (e.g. ranges of notes) too. Large bodies are
+compressed in the thread pool so they don't block the event loop. Strong
+ETags of compressed responses are weakened, the representation changed but
+the content didn't.
+"""
+
+import gzip
+import logging
+import os
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+import brotli
+import msgpack
+import zstandard
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from instrumentation import Counter, span
+
+logger = logging.getLogger("uvicorn")
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+COMPRESSIBLE_MEDIA_TYPES = (JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, "text/")
+
+# Smaller bodies are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+# Larger bodies are compressed in the thread pool
+COMPRESSION_THREAD_SIZE = int(os.environ.get("COMPRESSION_THREAD_SIZE", 256 * 1024))
+# Enabled encodings, in the order of preference of the server
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if encoding.strip()
+]
+# Fast levels, the responses are compressed on every request
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.environ.get("ZSTD_LEVEL", 3))
+
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+    "br": lambda body: brotli.compress(body, quality=BROTLI_QUALITY),
+    "zstd": lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body),
+}
+
+RESPONSE_BYTES = Counter(
+    "gagm_response_bytes_total",
+    "Bytes of the response bodies before compression, by media type and encoding.",
+    ("media_type", "encoding"),
+)
+RESPONSE_WIRE_BYTES = Counter(
+    "gagm_response_wire_bytes_total",
+    "Bytes of the response bodies sent, by media type and encoding.",
+    ("media_type", "encoding"),
+)
+
+_response_media_type: ContextVar[str] = ContextVar("response_media_type", default=JSON_MEDIA_TYPE)
+
+
+def _parse_accept(header: str) -> dict[str, float]:
+    """
+    Get the weights of the values of an Accept or Accept-Encoding header.
+    """
+    weights: dict[str, float] = {}
+    for item in header.split(","):
+        value, _, parameters = item.strip().partition(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        weight = 1.0
+        for parameter in parameters.split(";"):
+            name, _, number = parameter.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(number)
+                except ValueError:
+                    weight = 0.0
+        weights[value] = max(weight, weights.get(value, 0.0))
+    return weights
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Choose the compression of a response.
+
+    Args:
+        accept_encoding (str, optional): The Accept-Encoding header of the request.
+
+    Returns:
+        Optional[str]: The encoding, None to send the body uncompressed.
+    """
+    if not accept_encoding:
+        return None
+    weights = _parse_accept(accept_encoding)
+    best: Optional[str] = None
+    best_weight = 0.0
+    for encoding in COMPRESSION_ENCODINGS:
+        if encoding not in COMPRESSORS:
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def choose_media_type(accept: Optional[str]) -> str:
+    """
+    Choose the encoding of the content of a response, JSON unless MessagePack is preferred.
+
+    Args:
+        accept (str, optional): The Accept header of the request.
+
+    Returns:
+        str: The media type.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    weights = _parse_accept(accept)
+    msgpack_weight = max(weights.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    json_weight = max(weights.get(JSON_MEDIA_TYPE, 0.0), weights.get("application/*", 0.0), weights.get("*/*", 0.0))
+    return MSGPACK_MEDIA_TYPE if msgpack_weight > json_weight else JSON_MEDIA_TYPE
+
+
+class NegotiatedResponse(JSONResponse):
+    """
+    Default response class of the app, renders the content as JSON or
+    MessagePack depending on the negotiated media type of the request.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if _response_media_type.get() == MSGPACK_MEDIA_TYPE:
+            self.media_type = MSGPACK_MEDIA_TYPE
+            with span("msgpack.encode"):
+                return msgpack.packb(content, use_bin_type=True)
+        return super().render(content)
+
+
+def _is_compressible(content_type: str) -> bool:
+    return any(content_type.startswith(media_type) for media_type in COMPRESSIBLE_MEDIA_TYPES)
+
+
+class ContentNegotiationMiddleware:
+    """
+    ASGI middleware that negotiates the media type and compresses the responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        token = _response_media_type.set(choose_media_type(request_headers.get("accept")))
+        start_message: Optional[dict] = None
+
+        async def negotiated_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows if the response is complete
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                # E.g. a zero-copy send, the body isn't known
+                if start_message is not None:
+                    start, start_message = start_message, None
+                    await send(start)
+                await send(message)
+                return
+            start, start_message = start_message, None
+            if message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+            start, body = await self._encode(start, message.get("body", b""), encoding)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        try:
+            await self.app(scope, receive, negotiated_send)
+        finally:
+            _response_media_type.reset(token)
+
+    async def _encode(self, start: dict, body: bytes, encoding: Optional[str]) -> tuple[dict, bytes]:
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        if not _is_compressible(content_type):
+            return start, body
+        headers.add_vary_header("Accept")
+        headers.add_vary_header("Accept-Encoding")
+        if (
+            encoding is None
+            or len(body) < COMPRESSION_MIN_SIZE
+            or "content-encoding" in headers
+            or start["status"] in (204, 304)
+        ):
+            RESPONSE_BYTES.inc(content_type, "identity", amount=len(body))
+            RESPONSE_WIRE_BYTES.inc(content_type, "identity", amount=len(body))
+            return {**start, "headers": headers.raw}, body
+
+        compress = COMPRESSORS[encoding]
+        with span("compress", encoding=encoding, size=len(body)):
+            if len(body) >= COMPRESSION_THREAD_SIZE:
+                compressed = await run_in_threadpool(compress, body)
+            else:
+                compressed = compress(body)
+        RESPONSE_BYTES.inc(content_type, encoding, amount=len(body))
+        RESPONSE_WIRE_BYTES.inc(content_type, encoding, amount=len(compressed))
+        headers["content-encoding"] = encoding
+        headers["content-length"] = str(len(compressed))
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+        return {**start, "headers": headers.raw}, compressed
@@ -5,25 +5,389 @@ This module contains the DataManager class.
 """
 
 import logging
-from typing import Deque, List, Type
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Type
 
 import base64
 
-from arango.client import ArangoClient
 from arango.database import Database
-from arango.aql import AQL
+from arango.graph import Graph
+from arango.exceptions import (
+    AQLQueryExecuteError,
+    DocumentDeleteError,
+    DocumentInsertError,
+    DocumentReplaceError,
+    DocumentRevisionError,
+)
+from pydantic import BaseModel
 
 from arango_connector import ArangoDB
+from attachment_store import (
+    ATTACHMENT_DIGESTS_QUERY,
+    ATTACHMENT_REMOVE_QUERY,
+    ATTACHMENT_SET_QUERY,
+    ATTACHMENTS_FIELD,
+    Attachment,
+    AttachmentCollectionReport,
+    AttachmentStore,
+)
+from exceptions.data_exceptions import (
+    AssetNotFoundError,
+    PreconditionFailedError,
+    UniqueConstraintViolatedException,
+    WriteConflictError,
+)
+from asset_query import AssetPage, AssetQuery, compile_query
+from batch_writes import (
+    BATCH_LOCK_TIMEOUT_SECONDS,
+    BatchConflictError,
+    BatchOperationEnum,
+    BatchResult,
+    BatchWriteResult,
+    PreparedWrite,
+    validate_edge,
+)
+from branch_store import (
+    BRANCH_CHANGES_QUERY,
+    BRANCH_CLEAR_QUERY,
+    BRANCH_CONNECTED_EDGES_QUERY,
+    BRANCH_LIST_QUERY,
+    BRANCH_OVERLAY_QUERY,
+    BRANCH_RESOLVE_QUERY,
+    BRANCHES_COLLECTION,
+    OVERLAY_COLLECTION,
+    Branch,
+    BranchChange,
+    BranchDiff,
+    BranchExistsError,
+    BranchInput,
+    BranchNotFoundError,
+    MergeConflictError,
+    MergeReport,
+    MergeStrategyEnum,
+    branch_from_document,
+    classify_change,
+    get_current_branch,
+    overlay_entry,
+    overlay_key,
+    resolve_documents,
+    resolve_entry,
+)
+from bulk_deletes import (
+    BULK_DELETE_BATCH_SIZE,
+    BulkDeleteReport,
+    BulkDeleteRequest,
+    compile_removals,
+)
 from gagm_base.asset_model import AssetModel
 from gagm_base.edge_model import EdgeModel
 
+from instrumentation import span
 from model_manager import ModelManager
+from notes_store import (
+    NOTES_COLLECTION,
+    StoredNotes,
+    decode_notes,
+    notes_document,
+    notes_etag,
+    notes_key,
+)
+from partial_updates import merge, validate_merge
+from project_context import list_projects, use_project
+from query_gateway import QueryGateway, register_query
+from read_routing import records_write
+from revision_store import (
+    REVISION_CHAIN_QUERY,
+    REVISION_CHANGES_QUERY,
+    REVISION_COMPACT_QUERY,
+    REVISION_COMPACTION_CANDIDATES_QUERY,
+    REVISION_CREATE_QUERY,
+    REVISION_DELETE_QUERY,
+    REVISION_FIELD,
+    REVISION_LIST_QUERY,
+    REVISION_SET_SNAPSHOT_QUERY,
+    REVISION_SNAPSHOT_INTERVAL,
+    REVISION_UPDATE_QUERY,
+    REVISIONS_AT_QUERY,
+    REVISIONS_COLLECTION,
+    AssetRevision,
+    CompactionReport,
+    RevisionInfo,
+    RevisionOperationEnum,
+    format_timestamp,
+    rebuild,
+    rebuild_chain,
+    retention_policy,
+)
+from search_manager import (
+    NOTES_PATH,
+    SearchHit,
+    SearchResults,
+    compile_search,
+    highlight,
+    searchable_fields,
+    tokenize,
+)
+from trusted_reads import parse_document, serialize_document, tag_document
 
 logger = logging.getLogger("uvicorn")
 
 
 MODEL_MANAGER = ModelManager()
 
+# ArangoDB error numbers of writes that conflict with the stored data
+WRITE_CONFLICT = 1200
+UNIQUE_CONSTRAINT_VIOLATED = 1210
+# Reads and merges of a partial update before it gives up on concurrent writes
+PATCH_MAX_ATTEMPTS = 3
+
+
+class StoredRevision(BaseModel):
+    """
+    The revision of a stored document.
+    """
+
+    # `_rev` of the document, used as ETag
+    rev: str
+    # Number of the revision in the history, None if the document was written without history
+    revision: Optional[int] = None
+
+
+class StoredAsset(StoredRevision):
+    """
+    An asset with the revision of its stored document.
+    """
+
+    asset: AssetModel
+
+    @classmethod
+    def from_document(cls, asset_type: Type[AssetModel], document: dict) -> "StoredAsset":
+        return cls(
+            asset=parse_document(asset_type, document),
+            rev=document["_rev"],
+            revision=document.get(REVISION_FIELD),
+        )
+
+
+register_query(
+    "connected_nodes",
+    """
+    FOR v IN 1..1 ANY @node_id
+        GRAPH 'gagm'
+        RETURN {node: v, type: PARSE_IDENTIFIER(v._id).collection}
+    """,
+    "Neighbours of an asset in both directions, tags included.",
+    read_only=True,
+)
+register_query(
+    "incident_edges",
+    """
+    FOR v, e IN 1..1 ANY @node_id
+        GRAPH 'gagm'
+        FILTER PARSE_IDENTIFIER(e._id).collection != "TagEdge"
+        RETURN DISTINCT e._id
+    """,
+    "IDs of the edges connected to an asset, without the tag edges.",
+)
+register_query(
+    "assets_by_type",
+    "FOR doc IN @@collection RETURN doc",
+    "Every document of a collection.",
+    read_only=True,
+)
+register_query(
+    "connection",
+    """
+    FOR v, e IN 1..1 OUTBOUND @origin_id
+        GRAPH 'gagm'
+        FILTER e._to == @target_id
+        LIMIT 1
+        RETURN {edge: e, type: PARSE_IDENTIFIER(e._id).collection}
+    """,
+    "The edge from one asset to another.",
+)
+register_query(
+    "edges_between_nodes",
+    """
+    FOR node_id IN @node_ids
+        FOR v, e IN 1..1 OUTBOUND node_id
+            GRAPH 'gagm'
+            FILTER e._to IN @node_ids
+            LET c = PARSE_IDENTIFIER(e._id).collection
+            FILTER c != "TagEdge"
+            RETURN DISTINCT {edge: e, type: c}
+    """,
+    "Edges between the nodes of a set, without the tag edges.",
+    read_only=True,
+)
+register_query(
+    "tagged_assets",
+    """
+    FOR tag_id IN @tag_ids
+        FOR v IN 1..1 OUTBOUND tag_id TagEdge
+            RETURN DISTINCT v
+    """,
+    "Assets tagged with any of the tags.",
+    read_only=True,
+)
+register_query(
+    "tags_of_asset",
+    "FOR e IN TagEdge FILTER e._to == @asset_id RETURN e.tag_name",
+    "Names of the tags of an asset.",
+)
+register_query(
+    "tag_names",
+    "FOR tag IN AssetTag RETURN tag.name",
+    "Names of every tag.",
+    read_only=True,
+)
+register_query(
+    "asset_query",
+    "",
+    "Queries of the assets of a type compiled from the query language.",
+    dynamic=True,
+    read_only=True,
+)
+register_query(
+    "notes_etag",
+    "RETURN DOCUMENT(@notes_id).etag",
+    "ETag of the notes of an asset, without their content.",
+)
+register_query(
+    "attachments_of_asset",
+    f"RETURN VALUES(DOCUMENT(@asset_id).{ATTACHMENTS_FIELD} || {{}})",
+    "References of the attachments of an asset.",
+)
+register_query("attachment_set", ATTACHMENT_SET_QUERY, "Set the reference of an attachment of an asset.")
+register_query("attachment_remove", ATTACHMENT_REMOVE_QUERY, "Remove the reference of an attachment.")
+register_query(
+    "attachment_digests",
+    ATTACHMENT_DIGESTS_QUERY,
+    "Digests of the attachments referenced by the assets of a collection.",
+    batch_size=10000,
+)
+register_query(
+    "search",
+    "",
+    "Full-text searches over the string fields and notes of the assets.",
+    dynamic=True,
+    read_only=True,
+)
+register_query("revision_create", REVISION_CREATE_QUERY, "Insert assets of a type and their first revisions.")
+register_query(
+    "revision_update",
+    REVISION_UPDATE_QUERY,
+    "Update an asset and append the patch of the change to its revisions.",
+)
+register_query(
+    "revision_delete",
+    REVISION_DELETE_QUERY,
+    "Append the deletion of assets to their revisions.",
+    batch_size=10000,
+)
+register_query(
+    "bulk_delete",
+    "",
+    "Remove the selected assets of a collection.",
+    dynamic=True,
+    batch_size=BULK_DELETE_BATCH_SIZE,
+)
+register_query(
+    "bulk_delete_edges",
+    """
+    FOR edge IN @@collection
+        FILTER edge._from IN @ids OR edge._to IN @ids
+        REMOVE edge IN @@collection
+        RETURN OLD._id
+    """,
+    "Remove the edges of an edge collection connected to removed vertices.",
+    batch_size=BULK_DELETE_BATCH_SIZE,
+)
+register_query(
+    "bulk_delete_notes",
+    f"""
+    FOR notes IN {NOTES_COLLECTION}
+        FILTER notes._key IN @keys
+        REMOVE notes IN {NOTES_COLLECTION}
+        COLLECT WITH COUNT INTO removed
+        RETURN removed
+    """,
+    "Remove the notes of removed assets.",
+)
+register_query(
+    "tag_asset",
+    """
+    INSERT {_key: @tag_key, name: @tag_name} INTO AssetTag OPTIONS {overwriteMode: "ignore"}
+    INSERT {_key: @edge_key, _from: CONCAT("AssetTag/", @tag_key), _to: @asset_id, tag_name: @tag_name}
+        INTO TagEdge OPTIONS {overwriteMode: "ignore"}
+    """,
+    "Tag an asset, the tag is created if it doesn't exist.",
+)
+register_query(
+    "untag_asset",
+    "REMOVE {_key: @edge_key} IN TagEdge OPTIONS {ignoreErrors: true}",
+    "Remove a tag from an asset.",
+)
+register_query(
+    "revision_list", REVISION_LIST_QUERY, "Revisions of an asset, newest first, without their content."
+)
+register_query(
+    "revision_chain",
+    REVISION_CHAIN_QUERY,
+    "The snapshot and patches needed to rebuild a revision of an asset.",
+)
+register_query(
+    "revisions_at",
+    REVISIONS_AT_QUERY,
+    "The revision chains of every asset that existed at a point in time.",
+    batch_size=200,
+)
+register_query(
+    "revision_compaction_candidates",
+    REVISION_COMPACTION_CANDIDATES_QUERY,
+    "The oldest revision to keep of the assets with revisions outside of the retention policy.",
+)
+register_query(
+    "revision_changes",
+    REVISION_CHANGES_QUERY,
+    "IDs of the assets with revisions since a point in time.",
+    batch_size=10000,
+)
+register_query(
+    "documents_by_ids",
+    "FOR asset_id IN @asset_ids RETURN {asset_id: asset_id, document: DOCUMENT(asset_id)}",
+    "The stored documents of assets by ID, null for missing ones.",
+    batch_size=10000,
+)
+register_query("database_time", "RETURN DATE_NOW()", "Time of the database, milliseconds since the epoch.")
+register_query(
+    "branch_resolve",
+    BRANCH_RESOLVE_QUERY,
+    "The overlay entry of an asset in a branch and its main document.",
+)
+register_query(
+    "branch_overlay",
+    BRANCH_OVERLAY_QUERY,
+    "The overlay entries of a branch, of one type or of every type.",
+    batch_size=10000,
+)
+register_query(
+    "branch_changes",
+    BRANCH_CHANGES_QUERY,
+    "The overlay entries of a branch with the current main documents of their assets.",
+    batch_size=10000,
+)
+register_query(
+    "branch_connected_edges",
+    BRANCH_CONNECTED_EDGES_QUERY,
+    "IDs of the edges connected to a vertex in a branch, without the tag edges.",
+)
+register_query("branch_clear", BRANCH_CLEAR_QUERY, "Remove the overlay entries of a branch.")
+register_query("branch_list", BRANCH_LIST_QUERY, "The branches with their number of changed assets.")
+register_query("revision_compact", REVISION_COMPACT_QUERY, "Remove the revisions of an asset before a revision.")
+register_query("revision_set_snapshot", REVISION_SET_SNAPSHOT_QUERY, "Turn a revision into a snapshot.")
+
 
 class DataManager(object):
     """
@@ -33,15 +397,10 @@ class DataManager(object):
 
     _instance = None
 
-    _arango_client: ArangoClient
-    _db: Database
-    _aql: AQL
+    _queries: QueryGateway
 
     def __init__(self) -> None:
-        self._arango_client = ArangoClient(hosts="http://arango:8529")
-        self._db = ArangoDB().gagm_db
-        self._aql = self._db.aql
-        self._graph = ArangoDB().gagm_graph
+        self._queries = QueryGateway()
 
     def __new__(cls):
         if cls._instance is None:
@@ -49,6 +408,15 @@ class DataManager(object):
             cls._instance = super(DataManager, cls).__new__(cls)
         return cls._instance
 
+    @property
+    def _db(self) -> Database:
+        # The database of the project of the request
+        return ArangoDB().database()
+
+    @property
+    def _graph(self) -> Graph:
+        return ArangoDB().graph()
+
     def get_asset(
         self, asset_key: str, asset_type: Type[AssetModel]
     ) -> AssetModel | None:
@@ -61,13 +429,35 @@ class DataManager(object):
         Returns:
             dict: Properties of the asset.
         """
+        stored = self.get_stored_asset(asset_key, asset_type)
+        return stored.asset if stored else None
+
+    def get_stored_asset(
+        self, asset_key: str, asset_type: Type[AssetModel]
+    ) -> Optional[StoredAsset]:
+        """
+        Get an asset with the `_rev` of its document.
+        In a branch the asset is resolved through the overlay of the branch.
+
+        Args:
+            asset_key (str): The key of the asset.
+            asset_type (Type[AssetModel]): The type of the asset.
+
+        Returns:
+            Optional[StoredAsset]: The asset, None if it doesn't exist.
+        """
         type_name = str(asset_type.__name__)
-        data = self._db.document(document=f"{type_name}/{asset_key}")  # type: ignore
+        branch = get_current_branch()
+        if branch is not None:
+            data = self._resolve_in_branch(branch, f"{type_name}/{asset_key}")
+        else:
+            data = self._db.document(document=f"{type_name}/{asset_key}")  # type: ignore
         if not data:
             return None
-        return asset_type.model_validate(obj=dict(data))
+        with span("pydantic.validate", model=type_name):
+            return StoredAsset.from_document(asset_type, dict(data))  # type: ignore
 
-    def get_connected_nodes(self, asset_id: str) -> List[AssetModel]:
+    def get_connected_nodes(self, asset_id: str) -> List[dict]:
         """
         Get all assets that are connected with the given asset.
 
@@ -75,29 +465,21 @@ class DataManager(object):
             asset_id (str): The ID of the asset.
 
         Returns:
-            List[AssetModel]: The connected nodes, not including the original node.
-        """
-
-        CONNECTED_NODES_QUERY = """
-            FOR v, e IN 1..1 ANY @node_id
-                GRAPH 'gagm'
-                LET c = REGEX_SPLIT(v._id, "/")[0]
-                RETURN {node: v, type: c}
+            List[dict]: The serialized connected nodes (by alias), not including the original node.
         """
-
         found_nodes = []
-        cursor = self._aql.execute(
-            CONNECTED_NODES_QUERY, bind_vars={"node_id": asset_id}
-        )
-        for document in cursor:
-            data: dict = document["node"]
-            if not data:
-                continue
-            doc_type: str = document["type"]
-            validated_model = MODEL_MANAGER.get_model(doc_type).model_validate(
-                data, from_attributes=True
-            )
-            found_nodes.append(validated_model)
+        rows = self._queries.execute("connected_nodes", {"node_id": asset_id})
+        with span("pydantic.serialize", documents=len(rows)):
+            for document in rows:
+                data: dict = document["node"]
+                if not data:
+                    continue
+                doc_type: str = document["type"]
+                found_nodes.append(
+                    serialize_document(
+                        MODEL_MANAGER.get_model(doc_type), data, by_alias=True
+                    )
+                )
 
         return found_nodes
 
@@ -111,12 +493,120 @@ class DataManager(object):
         Returns:
             List[AssetModel]: The assets.
         """
-        data: Deque[dict] = self._db.collection(asset_type.__name__).all() or Deque()
+        data: List[dict] = self._documents_by_type(asset_type)
 
-        parsed_data: List[AssetModel] = [asset_type(**asset) for asset in data]
+        with span("pydantic.validate", model=asset_type.__name__, documents=len(data)):
+            parsed_data: List[AssetModel] = [
+                parse_document(asset_type, asset) for asset in data  # type: ignore
+            ]
 
         return parsed_data
 
+    def get_serialized_assets_by_type(
+        self, asset_type: Type[AssetModel], by_alias: bool = False
+    ) -> List[dict]:
+        """
+        Get all assets with the specified type in their serialized form.
+        Used by the read endpoints, which only serialize the assets, so documents
+        written with the current schema of the model are not validated again.
+
+        Args:
+            asset_type (Type[AssetModel]): The type of the queried assets.
+            by_alias (bool, optional): Use the field aliases as keys. Defaults to False.
+
+        Returns:
+            List[dict]: The serialized assets.
+        """
+        data: List[dict] = self._documents_by_type(asset_type)
+
+        with span("pydantic.serialize", model=asset_type.__name__, documents=len(data)):
+            return [serialize_document(asset_type, asset, by_alias) for asset in data]
+
+    def _documents_by_type(self, asset_type: Type[AssetModel]) -> List[dict]:
+        """
+        The documents of a type, in a branch resolved through its overlay.
+        """
+        data: List[dict] = self._queries.execute(
+            "assets_by_type", {"@collection": asset_type.__name__}
+        )
+        branch = get_current_branch()
+        if branch is not None:
+            data = resolve_documents(data, self._branch_overlay(branch, asset_type.__name__))
+        return data
+
+    def query_assets(self, asset_type: Type[AssetModel], query: AssetQuery) -> AssetPage:
+        """
+        Get a page of the assets of a type matching a query.
+
+        Args:
+            asset_type (Type[AssetModel]): The type of the queried assets.
+            query (AssetQuery): The query.
+
+        Raises:
+            InvalidQueryError: If the query doesn't match the model.
+
+        Returns:
+            AssetPage: The serialized assets and the cursor of the next page.
+        """
+        compiled = compile_query(asset_type, query)
+        rows = self._queries.execute("asset_query", compiled.bind_vars, query=compiled.query)
+        next_cursor = None
+        if len(rows) > compiled.limit:
+            rows = rows[: compiled.limit]
+            next_cursor = compiled.next_cursor(rows[-1])
+        with span("pydantic.serialize", model=asset_type.__name__, documents=len(rows)):
+            items = [serialize_document(asset_type, row) for row in rows]
+        return AssetPage(items=items, next_cursor=next_cursor)
+
+    def search(
+        self, text: str, asset_types: list[Type[AssetModel]], limit: int, fuzzy: bool = True
+    ) -> SearchResults:
+        """
+        Search the string fields and notes of the assets.
+
+        Args:
+            text (str): The search, every word of it has to match.
+            asset_types (list[Type[AssetModel]]): The types to search in.
+            limit (int): Maximum number of hits.
+            fuzzy (bool, optional): Also match words with one typo. Defaults to True.
+
+        Returns:
+            SearchResults: The hits, best first.
+        """
+        tokens = tokenize(text)
+        paths = sorted({path for model in asset_types for path in searchable_fields(model)})
+        if not tokens or not paths:
+            return SearchResults(hits=[], tokens=tokens)
+        query, bind_vars = compile_search(
+            tokens, paths, [model.__name__ for model in asset_types], limit, fuzzy
+        )
+        rows = self._queries.execute("search", bind_vars, query=query)
+        hits: dict[str, SearchHit] = {}
+        with span("pydantic.serialize", documents=len(rows)):
+            for row in rows:
+                document: Optional[dict] = row["doc"]
+                if document is None:
+                    # Notes of a deleted asset
+                    continue
+                if row["notes"] is not None:
+                    highlights = highlight(row["notes"], [NOTES_PATH], tokens)
+                    highlights = {"notes": value for value in highlights.values()}
+                else:
+                    highlights = highlight(document, paths, tokens)
+                if document["_id"] in hits:
+                    # Matched in the fields and the notes, the better hit came first
+                    hits[document["_id"]].highlights.update(highlights)
+                    continue
+                asset_type = document["_id"].split("/")[0]
+                hits[document["_id"]] = SearchHit(
+                    id=document["_id"],
+                    type=asset_type,
+                    score=row["score"],
+                    highlights=highlights,
+                    asset=serialize_document(MODEL_MANAGER.get_model(asset_type), document),
+                )
+        return SearchResults(hits=list(hits.values()), tokens=tokens)
+
     def get_connection(self, origin_id: str, target_id: str) -> EdgeModel | None:
         """
         Get the connection between two assets.
@@ -126,32 +616,16 @@ class DataManager(object):
             target_id (str): The ID of the target asset.
 
         Returns:
-            dict: The connection.
-        """
-        GET_EDGES_QUERY = """
-            FOR v, e IN 1..3 OUTBOUND @node_id
-                GRAPH 'gagm'
-                LET c = REGEX_SPLIT(e._id, "/")[0]
-                FILTER e._to IN @other_node_ids
-                RETURN {edge: e, type: c}
+            EdgeModel | None: The connection, None if the assets are not connected.
         """
-        edges = self._aql.execute(
-            GET_EDGES_QUERY, bind_vars={"origin_id": origin_id, "target_id": target_id}
-        ).batch()["edges"]
-        for edge in edges:
-            logger.info(edge)
-
-        edge = self._graph.traverse(
-            origin_id, direction="outbound", strategy="bfs", max_depth=1
+        rows = self._queries.execute(
+            "connection", {"origin_id": origin_id, "target_id": target_id}
         )
-        if not edge:
+        if not rows:
             return None
-        edge_type = edge["_id"].split("/")[0]
-        return MODEL_MANAGER.get_model(edge_type).model_validate(
-            edge, from_attributes=True
-        )
+        return parse_document(MODEL_MANAGER.get_model(rows[0]["type"]), rows[0]["edge"])  # type: ignore
 
-    def get_edges_between_nodes(self, node_ids: list[str]) -> set[EdgeModel]:
+    def get_edges_between_nodes(self, node_ids: list[str]) -> dict[str, dict]:
         """
         Get all edges between a set of nodes.
 
@@ -159,128 +633,993 @@ class DataManager(object):
             node_ids (set[str]): Node ids
 
         Returns:
-            dict: _description_
-        """
-        GET_EDGES_QUERY = """
-            FOR v, e IN 1..1 ANY @node_id
-                GRAPH 'gagm'
-                LET c = REGEX_SPLIT(e._id, "/")[0]
-                FILTER e._to IN @other_node_ids OR e._from IN @other_node_ids
-                FILTER c != "TagEdge"
-                RETURN {edge: e, type: c}
-        """
-
-        logger.info("GETTING EDGES BETWEEN NODES")
-        edges_between_selected_nodes = []
-        for node_id in node_ids:
-            others = node_ids.copy()
-            others.remove(node_id)
-            edges = self._aql.execute(
-                GET_EDGES_QUERY,
-                bind_vars={"node_id": node_id, "other_node_ids": others},
-            ).batch()
-            for edge in edges:
-                edge_data = edge.get("edge")
-                edge_type = edge.get("type")
-                parsed_edge = MODEL_MANAGER.get_model(edge_type).model_validate(
-                    edge_data, from_attributes=True
+            dict[str, dict]: The serialized edges by their IDs.
+        """
+        # Every edge is outbound from one of its nodes, so one direction finds all of them
+        rows = self._queries.execute("edges_between_nodes", {"node_ids": node_ids})
+        branch = get_current_branch()
+        if branch is not None:
+            rows = self._resolve_edges_in_branch(branch, rows, set(node_ids))
+        edges_between_selected_nodes: dict[str, dict] = {}
+        with span("pydantic.serialize", documents=len(rows)):
+            for row in rows:
+                edge_data = row["edge"]
+                edges_between_selected_nodes[edge_data["_id"]] = serialize_document(
+                    MODEL_MANAGER.get_model(row["type"]), edge_data
                 )
-                edges_between_selected_nodes.append(parsed_edge)
-
-        return set(edges_between_selected_nodes)
-
-    def get_assets_by_tags(self, tags: list[str]) -> set[AssetModel]:
-        tagged_assets: set[AssetModel] = set()
-        for tag in tags:
-            safe_tag_name = base64.urlsafe_b64encode(tag.encode("utf-8")).decode("utf-8")
-            tagged_nodes = self._graph.traverse(
-                direction="outbound",
-                start_vertex=f"AssetTag/{safe_tag_name}",
-                max_depth=1,
-                strategy="bfs",
+
+        return edges_between_selected_nodes
+
+    def get_assets_by_tags(self, tags: list[str]) -> dict[str, dict]:
+        """
+        Get all assets tagged with any of the given tags.
+
+        Args:
+            tags (list[str]): The tags.
+
+        Returns:
+            dict[str, dict]: The serialized assets by their IDs.
+        """
+        tag_ids = [
+            f"AssetTag/{base64.urlsafe_b64encode(tag.encode('utf-8')).decode('utf-8')}"
+            for tag in tags
+        ]
+        rows = self._queries.execute("tagged_assets", {"tag_ids": tag_ids})
+        branch = get_current_branch()
+        if branch is not None:
+            # The tags belong to main, only the tagged assets are resolved
+            tagged_ids = {node["_id"] for node in rows}
+            rows = resolve_documents(
+                rows, [entry for entry in self._branch_overlay(branch) if entry["asset_id"] in tagged_ids]
             )
-            for node in tagged_nodes.get("vertices"):
-                node_type = node["_id"].split("/")[0]
-                if node_type == "AssetTag":
-                    continue
-                parsed_node = MODEL_MANAGER.get_model(node_type).model_validate(
-                    node, from_attributes=True
+        tagged_assets: dict[str, dict] = {}
+        with span("pydantic.serialize", documents=len(rows)):
+            for node in rows:
+                tagged_assets[node["_id"]] = serialize_document(
+                    MODEL_MANAGER.get_model(node["_id"].split("/")[0]), node
                 )
-                tagged_assets.add(parsed_node)
         return tagged_assets
 
-    def add_asset(self, asset: AssetModel) -> AssetModel:
+    @records_write
+    def add_asset(self, asset: AssetModel, db: Optional[Database] = None) -> StoredAsset:
+        """
+        Create an asset, its first revision is recorded with it.
+        Relies on the unique key of the collection, the asset isn't looked up first.
+        In a branch the asset is only created in the overlay of the branch.
+
+        Args:
+            asset (AssetModel): The asset.
+            db (Database, optional): Database to write to (e.g. a transaction).
+                Defaults to the gagm database.
+
+        Raises:
+            ValueError: If the asset is an edge between types its model doesn't connect.
+            UniqueConstraintViolatedException: If an asset with the key exists.
+            WriteConflictError: If the asset is created concurrently.
+
+        Returns:
+            StoredAsset: The created asset.
+        """
         asset_type: Type = type(asset)
         if issubclass(asset_type, EdgeModel):
-            edge_type = MODEL_MANAGER.get_model(asset_type.__name__)
-            origin_type: str = asset.origin_id.split("/")[0]
-            target_type: str = asset.target_id.split("/")[0]
-            if asset.origin_id is None or asset.target_id is None:
-                raise ValueError("Edge must have both from_id and to_id set.")
-            if origin_type not in edge_type.origin_type:
-                raise ValueError(
-                    f"Edge origin type must be one of {edge_type.origin_type}"
-                )
-            if target_type not in edge_type.target_type:
-                raise ValueError(
-                    f"Edge target type must be one of {edge_type.target_type}"
-                )
-        logger.info(asset.model_dump(by_alias=True))
-        result = dict(
-            self._db.collection(asset_type.__name__).insert(
-                document=asset.model_dump(by_alias=True),
-                return_new=True,
-                overwrite=False,
-                keep_none=True,
+            validate_edge(asset)
+        branch = get_current_branch()
+        if branch is not None and db is None:
+            document = tag_document(asset_type, asset.model_dump(by_alias=True))
+            written = self._write_in_branch(
+                branch, f"{asset_type.__name__}/{asset.db_key}", lambda current: document, must_exist=False
             )
+            return StoredAsset.from_document(asset_type, written)  # type: ignore
+        try:
+            documents = self._create_documents(asset_type, [asset], db)
+        except AQLQueryExecuteError as error:
+            if error.error_code == UNIQUE_CONSTRAINT_VIOLATED:
+                raise UniqueConstraintViolatedException(
+                    f"Asset {asset_type.__name__}/{asset.db_key} already exists."
+                ) from error
+            if error.error_code == WRITE_CONFLICT:
+                raise WriteConflictError(str(error)) from error
+            raise
+        return StoredAsset.from_document(asset_type, documents[0])
+
+    def _create_documents(
+        self, asset_type: Type[AssetModel], assets: list[AssetModel], db: Optional[Database] = None
+    ) -> list[dict]:
+        """
+        Insert assets of a type with a single query.
+
+        Returns:
+            list[dict]: The stored documents.
+        """
+        return self._queries.execute(
+            "revision_create",
+            {
+                "@collection": asset_type.__name__,
+                "type_name": asset_type.__name__,
+                "documents": [
+                    tag_document(asset_type, asset.model_dump(by_alias=True)) for asset in assets
+                ],
+            },
+            db=db,
         )
-        return asset_type(**result["new"])
 
-    def update_asset(self, asset: AssetModel) -> AssetModel:
+    @records_write
+    def update_asset(
+        self, asset: AssetModel, rev: Optional[str] = None, db: Optional[Database] = None
+    ) -> StoredAsset:
         """
         Update an existing asset.
 
+        The change is recorded as a revision of the asset. With `rev` the
+        update only succeeds if the document wasn't changed since it was read.
+        In a branch the asset is only updated in the overlay of the branch.
+
         Args:
-            asset (AssetModel):
+            asset (AssetModel): The asset with its new values.
+            rev (str, optional): The `_rev` the document must have.
+            db (Database, optional): Database to write to (e.g. a transaction).
+                Defaults to the gagm database.
+
+        Raises:
+            AssetNotFoundError: If the asset doesn't exist.
+            PreconditionFailedError: If the document doesn't have the `rev`.
+            WriteConflictError: If the asset was written concurrently.
 
         Returns:
-            AssetModel: _description_
+            StoredAsset: The updated asset.
         """
         asset_type: Type = type(asset)
-        logger.info(asset)
-        logger.info(asset.model_dump(by_alias=True))
-        # data = self._db.collection(asset_type).insert(
-        #     document=asset.model_dump(by_alias=True),
-        #     return_new=True,
-        #     overwrite_mode="update",
-        #     keep_none=True,
-        # )
-        result = self._db.collection(asset_type.__name__).update(
-            document=asset.model_dump(by_alias=True), return_new=True
+        branch = get_current_branch()
+        if branch is not None and db is None:
+            document = tag_document(asset_type, asset.model_dump(by_alias=True))
+            # Like the update query, attributes that aren't part of the model are kept
+            written = self._write_in_branch(
+                branch,
+                f"{asset_type.__name__}/{asset.db_key}",
+                lambda current: {**current, **document},  # type: ignore
+                must_exist=True,
+                rev=rev,
+            )
+            return StoredAsset.from_document(asset_type, written)  # type: ignore
+        try:
+            rows = self._queries.execute(
+                "revision_update",
+                {
+                    "@collection": asset_type.__name__,
+                    "key": asset.db_key,
+                    "rev": rev,
+                    "document": tag_document(asset_type, asset.model_dump(by_alias=True)),
+                    "merge_objects": False,
+                    "snapshot_interval": REVISION_SNAPSHOT_INTERVAL,
+                },
+                db=db,
+            )
+        except AQLQueryExecuteError as error:
+            if error.error_code != WRITE_CONFLICT:
+                raise
+            if rev is not None:
+                raise PreconditionFailedError(
+                    f"Asset {asset_type.__name__}/{asset.db_key} changed since revision {rev}."
+                ) from error
+            raise WriteConflictError(str(error)) from error
+        if not rows:
+            raise AssetNotFoundError(f"Asset {asset_type.__name__}/{asset.db_key} doesn't exist.")
+        return StoredAsset.from_document(asset_type, rows[0])
+
+    @records_write
+    def patch_asset(
+        self,
+        asset_type: Type[AssetModel],
+        asset_key: str,
+        changes: dict,
+        rev: Optional[str] = None,
+    ) -> StoredRevision:
+        """
+        Merge changed fields into an existing asset, see partial_updates.py.
+
+        The merge is validated against the stored document and written with
+        the `_rev` of that document, if the asset is written in between the
+        merge is validated again against the new document. In a branch the
+        changes are merged into the document of the branch.
+
+        Args:
+            asset_type (Type[AssetModel]): The type of the asset.
+            asset_key (str): The key of the asset.
+            changes (dict): The changes returned by `partial_updates.parse_changes`.
+            rev (str, optional): The `_rev` the document must have.
+
+        Raises:
+            AssetNotFoundError: If the asset doesn't exist.
+            ValidationError: If the merged asset is invalid.
+            InvalidPatchError: If a required field is set to null.
+            ValueError: If an edge is moved between types its model doesn't connect.
+            PreconditionFailedError: If the document doesn't have the `rev`.
+            WriteConflictError: If the asset kept being written concurrently.
+
+        Returns:
+            StoredRevision: The revision of the updated document.
+        """
+        type_name = asset_type.__name__
+        branch = get_current_branch()
+        if branch is not None:
+
+            def merged(current: Optional[dict]) -> dict:
+                self._validate_patch(asset_type, current, changes)  # type: ignore
+                return merge(current, tag_document(asset_type, dict(changes)))  # type: ignore
+
+            written = self._write_in_branch(
+                branch, f"{type_name}/{asset_key}", merged, must_exist=True, rev=rev
+            )
+            return StoredRevision(rev=written["_rev"])  # type: ignore
+        for _ in range(PATCH_MAX_ATTEMPTS):
+            document = self._db.document(document=f"{type_name}/{asset_key}")  # type: ignore
+            if not document:
+                raise AssetNotFoundError(f"Asset {type_name}/{asset_key} doesn't exist.")
+            if rev is not None and document["_rev"] != rev:  # type: ignore
+                raise PreconditionFailedError(f"Asset {type_name}/{asset_key} changed since revision {rev}.")
+            self._validate_patch(asset_type, document, changes)  # type: ignore
+            try:
+                rows = self._queries.execute(
+                    "revision_update",
+                    {
+                        "@collection": type_name,
+                        "key": asset_key,
+                        "rev": document["_rev"],  # type: ignore
+                        "document": tag_document(asset_type, dict(changes)),
+                        "merge_objects": True,
+                        "snapshot_interval": REVISION_SNAPSHOT_INTERVAL,
+                    },
+                )
+            except AQLQueryExecuteError as error:
+                if error.error_code != WRITE_CONFLICT:
+                    raise
+                if rev is not None:
+                    raise PreconditionFailedError(
+                        f"Asset {type_name}/{asset_key} changed since revision {rev}."
+                    ) from error
+                continue
+            if not rows:
+                raise AssetNotFoundError(f"Asset {type_name}/{asset_key} doesn't exist.")
+            return StoredRevision(rev=rows[0]["_rev"], revision=rows[0].get(REVISION_FIELD))
+        raise WriteConflictError(
+            f"Asset {type_name}/{asset_key} was written concurrently {PATCH_MAX_ATTEMPTS} times."
         )
-        return asset_type(**result["new"])
+
+    def _validate_patch(self, asset_type: Type[AssetModel], document: dict, changes: dict) -> None:
+        with span("pydantic.validate", model=asset_type.__name__, fields=len(changes)):
+            asset = validate_merge(asset_type, document, changes)
+        if issubclass(asset_type, EdgeModel) and ("_from" in changes or "_to" in changes):
+            validate_edge(asset)  # type: ignore
 
     def delete_asset_by_id(self, asset_id: str):
         asset_key = asset_id.split("/")[1]
         asset_type = MODEL_MANAGER.get_model(asset_id.split("/")[0])
         self.delete_asset(asset_key, asset_type)
 
-    def delete_asset(self, asset_key: str, asset_type: Type[AssetModel]) -> bool:
+    @records_write
+    def delete_asset(
+        self, asset_key: str, asset_type: Type[AssetModel], db: Optional[Database] = None
+    ) -> Optional[int]:
         """
         Delete an asset from the database.
+        The edges connected to the asset are deleted with it, their deletions are
+        recorded as revisions in the same transaction.
 
         Args:
             asset_key (str): The key of the asset.
             asset_type (Type[AssetModel]): The type of the asset.
+            db (Database, optional): Database to write to (e.g. a transaction).
+                Defaults to a new transaction on the gagm database.
 
         Returns:
-            bool: True if the asset was deleted, False otherwise.
+            Optional[int]: The revision of the deletion, None if the asset didn't exist.
+                0 in a branch, the deletions in branches aren't versioned.
         """
         type_name = asset_type.__name__
-        logger.info(f"Deleting object {asset_key} in {type_name} collection")
-        result = self._graph.delete_vertex(f"{type_name}/{asset_key}", ignore_missing=True)
+        logger.debug("Deleting object %s in %s collection", asset_key, type_name)
+        asset_id = f"{type_name}/{asset_key}"
+        branch = get_current_branch()
+        if branch is not None and db is None:
+            return self._delete_in_branch(branch, asset_type, asset_id)
+        if db is None:
+            transaction = self._db.begin_transaction(
+                write=sorted(
+                    {type_name, NOTES_COLLECTION, REVISIONS_COLLECTION}
+                    | set(self._incident_edge_collections({type_name}))
+                ),
+                lock_timeout=BATCH_LOCK_TIMEOUT_SECONDS,
+            )
+            try:
+                revision = self.delete_asset(asset_key, asset_type, db=transaction)
+                transaction.commit_transaction()
+            except Exception:
+                transaction.abort_transaction()
+                raise
+            return revision
+        # Read before the delete, the graph removes the edges with the vertex
+        edge_ids = self._queries.execute("incident_edges", {"node_id": asset_id}, db=db)
+        if not db.graph(self._graph.name).delete_vertex(asset_id, ignore_missing=True):
+            return None
+        db.collection(NOTES_COLLECTION).delete(notes_key(asset_id), ignore_missing=True, silent=True)
+        return self._queries.execute("revision_delete", {"asset_ids": [asset_id, *edge_ids]}, db=db)[0]
+
+    def _incident_edge_collections(self, vertex_collections: set[str]) -> list[str]:
+        """
+        The edge collections that can reference vertices of the collections.
+        """
+        return sorted(
+            definition["edge_collection"]
+            for definition in self._graph.edge_definitions()
+            if vertex_collections
+            & set(definition["from_vertex_collections"] + definition["to_vertex_collections"])
+        )
+
+    @records_write
+    def bulk_delete(self, request: BulkDeleteRequest) -> BulkDeleteReport:
+        """
+        Delete the assets of a selection in one stream transaction, see bulk_deletes.py.
+        Edges connected to the deleted vertices and their notes are deleted with them,
+        the deletions of the assets and the edges are recorded as revisions.
+
+        Args:
+            request (BulkDeleteRequest): The selection.
+
+        Raises:
+            InvalidBulkDeleteError: If the selection is invalid.
+            InvalidQueryError: If a filter doesn't match the model of the type.
+
+        Returns:
+            BulkDeleteReport: The numbers of deleted documents, nothing was deleted on a dry run.
+        """
+        start = time.perf_counter()
+        tag_id = None
+        if request.tag is not None:
+            tag_id = f"AssetTag/{base64.urlsafe_b64encode(request.tag.encode('utf-8')).decode('utf-8')}"
+        removals = compile_removals(
+            request,
+            MODEL_MANAGER.get_model,
+            list(MODEL_MANAGER.get_node_models().values()),
+            tag_id,
+        )
+        vertex_collections = {
+            removal.model.__name__ for removal in removals if not issubclass(removal.model, EdgeModel)
+        }
+        # Only the edge collections that can reference the deleted vertices
+        edge_collections = self._incident_edge_collections(vertex_collections)
+        collections = {removal.model.__name__ for removal in removals} | set(edge_collections)
+        report = BulkDeleteReport(dry_run=request.dry_run)
+        transaction = self._db.begin_transaction(
+            write=sorted(collections | {NOTES_COLLECTION, REVISIONS_COLLECTION}),
+            lock_timeout=BATCH_LOCK_TIMEOUT_SECONDS,
+        )
+        try:
+            with span("arango.bulk_delete", collections=len(collections)):
+                removed_ids: list[str] = []
+                removed_vertices: list[str] = []
+                for removal in removals:
+                    ids = self._queries.execute(
+                        "bulk_delete", removal.bind_vars, db=transaction, query=removal.query
+                    )
+                    report.assets[removal.model.__name__] = len(ids)
+                    removed_ids.extend(ids)
+                    if not issubclass(removal.model, EdgeModel):
+                        removed_vertices.extend(ids)
+                if removed_vertices:
+                    for edge_collection in edge_collections:
+                        edge_ids = self._queries.execute(
+                            "bulk_delete_edges",
+                            {"@collection": edge_collection, "ids": removed_vertices},
+                            db=transaction,
+                        )
+                        report.edges[edge_collection] = len(edge_ids)
+                        # Tags aren't versioned, the other edges get their notes and revisions removed
+                        if edge_collection != "TagEdge":
+                            removed_ids.extend(edge_ids)
+                if removed_ids:
+                    removed = self._queries.execute(
+                        "bulk_delete_notes",
+                        {"keys": [notes_key(asset_id) for asset_id in removed_ids]},
+                        db=transaction,
+                    )
+                    report.notes = removed[0] if removed else 0
+                    self._queries.execute("revision_delete", {"asset_ids": removed_ids}, db=transaction)
+            if request.dry_run:
+                transaction.abort_transaction()
+            else:
+                transaction.commit_transaction()
+        except Exception:
+            transaction.abort_transaction()
+            raise
+        report.seconds = time.perf_counter() - start
+        logger.info(
+            "Bulk delete%s removed %d assets and %d edges in %.1f s",
+            " (dry run)" if request.dry_run else "",
+            sum(report.assets.values()),
+            sum(report.edges.values()),
+            report.seconds,
+        )
+        return report
+
+    @records_write
+    def apply_batch(self, writes: List[PreparedWrite]) -> BatchResult:
+        """
+        Run the validated writes of a batch in one stream transaction.
+        Consecutive creates of the same type are inserted with a single query.
+
+        Args:
+            writes (List[PreparedWrite]): The validated writes, in order.
+
+        Raises:
+            BatchConflictError: If a write conflicts with the stored data,
+                e.g. a created asset exists. Nothing was written.
+
+        Returns:
+            BatchResult: The new revisions of the written assets.
+        """
+        transaction = self._db.begin_transaction(
+            write=sorted(self._batch_collections(writes)), lock_timeout=BATCH_LOCK_TIMEOUT_SECONDS
+        )
+        try:
+            with span("arango.batch", writes=len(writes)):
+                results = self._apply_writes(writes, transaction)
+            transaction.commit_transaction()
+        except Exception:
+            transaction.abort_transaction()
+            raise
+        return BatchResult(results=results)
+
+    def _batch_collections(self, writes: List[PreparedWrite]) -> set[str]:
+        """
+        The collections a transaction needs to lock for writes.
+        """
+        collections = {write.model.__name__ for write in writes} | {REVISIONS_COLLECTION}
+        if any(write.op == BatchOperationEnum.DELETE for write in writes):
+            # Deleting a vertex deletes its edges and notes
+            collections |= {NOTES_COLLECTION, "TagEdge"} | {
+                definition["edge_collection"] for definition in self._graph.edge_definitions()
+            }
+        if any(write.op in (BatchOperationEnum.TAG, BatchOperationEnum.UNTAG) for write in writes):
+            collections |= {"AssetTag", "TagEdge"}
+        return collections
+
+    def _apply_writes(self, writes: List[PreparedWrite], db: Database) -> List[BatchWriteResult]:
+        results: List[BatchWriteResult] = []
+        index = 0
+        while index < len(writes):
+            write = writes[index]
+            if write.op == BatchOperationEnum.CREATE:
+                group = [write]
+                while (
+                    index + len(group) < len(writes)
+                    and writes[index + len(group)].op == BatchOperationEnum.CREATE
+                    and writes[index + len(group)].model is write.model
+                ):
+                    group.append(writes[index + len(group)])
+                results.extend(self._apply_creates(group, db))
+                index += len(group)
+                continue
+            results.append(self._apply_write(write, db))
+            index += 1
+        return results
+
+    def _apply_creates(self, writes: List[PreparedWrite], db: Database) -> List[BatchWriteResult]:
+        try:
+            documents = self._create_documents(
+                writes[0].model, [write.asset for write in writes], db  # type: ignore
+            )
+        except AQLQueryExecuteError as error:
+            if error.error_code in (WRITE_CONFLICT, UNIQUE_CONSTRAINT_VIOLATED):
+                raise BatchConflictError(
+                    writes[0].index, f"One of the created {writes[0].model.__name__} assets already exists."
+                ) from error
+            raise
+        return [
+            BatchWriteResult(
+                index=write.index,
+                op=write.op,
+                asset_id=write.asset_id,
+                revision=document[REVISION_FIELD],
+            )
+            for write, document in zip(writes, documents)
+        ]
+
+    def _apply_write(self, write: PreparedWrite, db: Database) -> BatchWriteResult:
+        result = BatchWriteResult(index=write.index, op=write.op, asset_id=write.asset_id)
+        if write.op == BatchOperationEnum.UPDATE:
+            try:
+                result.revision = self.update_asset(write.asset, write.rev, db).revision  # type: ignore
+            except (AssetNotFoundError, PreconditionFailedError, WriteConflictError) as error:
+                raise BatchConflictError(write.index, str(error)) from error
+        elif write.op == BatchOperationEnum.DELETE:
+            result.revision = self.delete_asset(write.asset_id.split("/", 1)[1], write.model, db)
+            if result.revision is None:
+                raise BatchConflictError(write.index, f"Asset {write.asset_id} doesn't exist.")
+        else:
+            tag_key = base64.urlsafe_b64encode(write.tag.encode("utf-8")).decode("utf-8")  # type: ignore
+            self._queries.execute(
+                "tag_asset" if write.op == BatchOperationEnum.TAG else "untag_asset",
+                {
+                    "tag_key": tag_key,
+                    "tag_name": write.tag,
+                    "asset_id": write.asset_id,
+                    "edge_key": base64.urlsafe_b64encode(
+                        f"{write.tag}-{write.asset_id}".encode("utf-8")
+                    ).decode("utf-8"),
+                },
+                db=db,
+            )
         return result
 
+    def create_branch(self, branch: BranchInput) -> Branch:
+        """
+        Create a branch of the graph. Only the document of the branch is written,
+        the branch stores the assets once it changes them.
+
+        Args:
+            branch (BranchInput): The name and description of the branch.
+
+        Raises:
+            BranchExistsError: If a branch with the name exists.
+
+        Returns:
+            Branch: The branch.
+        """
+        document = {
+            "_key": branch.name,
+            "description": branch.description,
+            "created": format_timestamp(datetime.now(timezone.utc)),
+            "merged": None,
+        }
+        try:
+            self._db.collection(BRANCHES_COLLECTION).insert(document)
+        except DocumentInsertError as error:
+            if error.error_code == UNIQUE_CONSTRAINT_VIOLATED:
+                raise BranchExistsError(f"Branch {branch.name} already exists.") from error
+            raise
+        return branch_from_document(document)
+
+    def list_branches(self) -> List[Branch]:
+        rows = self._queries.execute("branch_list", {"name": None})
+        return [branch_from_document(row) for row in rows]
+
+    def get_branch(self, name: str) -> Branch:
+        """
+        Get a branch with its number of changed assets.
+
+        Raises:
+            BranchNotFoundError: If the branch doesn't exist.
+        """
+        rows = self._queries.execute("branch_list", {"name": name})
+        if not rows:
+            raise BranchNotFoundError(f"Branch {name} doesn't exist.")
+        return branch_from_document(rows[0])
+
+    def has_branch(self, name: str) -> bool:
+        return bool(self._db.collection(BRANCHES_COLLECTION).has(name))
+
+    def delete_branch(self, name: str) -> int:
+        """
+        Delete a branch and its changes, main is left untouched.
+
+        Raises:
+            BranchNotFoundError: If the branch doesn't exist.
+
+        Returns:
+            int: The number of changed assets that were dropped.
+        """
+        if not self._db.collection(BRANCHES_COLLECTION).delete(name, ignore_missing=True):
+            raise BranchNotFoundError(f"Branch {name} doesn't exist.")
+        removed = self._queries.execute("branch_clear", {"branch": name})
+        return removed[0] if removed else 0
+
+    def diff_branch(self, name: str) -> BranchDiff:
+        """
+        Compare the changes of a branch to the current main graph.
+
+        Args:
+            name (str): Name of the branch.
+
+        Raises:
+            BranchNotFoundError: If the branch doesn't exist.
+
+        Returns:
+            BranchDiff: The changes and their conflicts with main.
+        """
+        return self._diff_branch(name)[0]
+
+    def _diff_branch(self, name: str) -> tuple[BranchDiff, list[tuple[BranchChange, dict, Optional[dict]]]]:
+        """
+        The diff of a branch, and each change with its overlay entry and main document.
+        """
+        if not self.has_branch(name):
+            raise BranchNotFoundError(f"Branch {name} doesn't exist.")
+        diff = BranchDiff(branch=name)
+        changes = []
+        for row in self._queries.execute("branch_changes", {"branch": name}):
+            change = classify_change(row["entry"], row["main"])
+            if change is None:
+                continue
+            diff.changes.append(change)
+            diff.conflicts += change.conflict is not None
+            changes.append((change, row["entry"], row["main"]))
+        return diff, changes
+
+    @records_write
+    def merge_branch(self, name: str, strategy: MergeStrategyEnum = MergeStrategyEnum.FAIL) -> MergeReport:
+        """
+        Merge the changes of a branch into main in one stream transaction.
+        The merged assets get revisions like other writes, the branch is empty afterwards.
+
+        The writes check that main didn't change the assets since the diff:
+        creations are inserted, updates are written with the `_rev` of the main
+        document. The new vertices are written before the edges and the deleted
+        edges are deleted before the vertices.
+
+        Args:
+            name (str): Name of the branch.
+            strategy (MergeStrategyEnum, optional): What to do with the conflicting changes.
+                Defaults to failing.
+
+        Raises:
+            BranchNotFoundError: If the branch doesn't exist.
+            MergeConflictError: If changes conflict and the strategy is `fail`. Nothing was merged.
+            BatchConflictError: If main was written during the merge. Nothing was merged.
+
+        Returns:
+            MergeReport: The merged changes.
+        """
+        start = time.perf_counter()
+        diff, changes = self._diff_branch(name)
+        if diff.conflicts and strategy == MergeStrategyEnum.FAIL:
+            raise MergeConflictError(diff)
+        report = MergeReport(branch=name, strategy=strategy)
+        writes: List[PreparedWrite] = []
+        for change, entry, main in changes:
+            if change.conflict is not None:
+                if strategy == MergeStrategyEnum.MAIN:
+                    report.skipped.append(change)
+                    continue
+                report.overwritten.append(change)
+            model = MODEL_MANAGER.get_model(change.type)
+            if entry["document"] is None:
+                op = BatchOperationEnum.DELETE
+            elif main is None:
+                op = BatchOperationEnum.CREATE
+            else:
+                op = BatchOperationEnum.UPDATE
+            writes.append(
+                PreparedWrite(
+                    index=0,
+                    op=op,
+                    model=model,
+                    asset_id=change.asset_id,
+                    asset=parse_document(model, entry["document"]) if entry["document"] else None,
+                    # The base of the branch, or the main version a conflicting change overwrites
+                    rev=main["_rev"] if op == BatchOperationEnum.UPDATE else None,  # type: ignore
+                )
+            )
+
+        def order(write: PreparedWrite) -> tuple[int, str]:
+            is_edge = issubclass(write.model, EdgeModel)
+            if write.op == BatchOperationEnum.CREATE:
+                return (1 if is_edge else 0, write.asset_id)
+            if write.op == BatchOperationEnum.UPDATE:
+                return (2, write.asset_id)
+            return (3 if is_edge else 4, write.asset_id)
+
+        writes.sort(key=order)
+        for index, write in enumerate(writes):
+            write.index = index
+        collections = self._batch_collections(writes) | {BRANCHES_COLLECTION, OVERLAY_COLLECTION}
+        transaction = self._db.begin_transaction(
+            write=sorted(collections), lock_timeout=BATCH_LOCK_TIMEOUT_SECONDS
+        )
+        try:
+            with span("arango.merge", writes=len(writes)):
+                self._apply_writes(writes, transaction)
+                self._queries.execute("branch_clear", {"branch": name}, db=transaction)
+                transaction.collection(BRANCHES_COLLECTION).update(
+                    {"_key": name, "merged": format_timestamp(datetime.now(timezone.utc))}
+                )
+            transaction.commit_transaction()
+        except Exception:
+            transaction.abort_transaction()
+            raise
+        report.created = sum(write.op == BatchOperationEnum.CREATE for write in writes)
+        report.updated = sum(write.op == BatchOperationEnum.UPDATE for write in writes)
+        report.deleted = sum(write.op == BatchOperationEnum.DELETE for write in writes)
+        report.seconds = time.perf_counter() - start
+        logger.info(
+            "Merged branch %s: %d created, %d updated, %d deleted, %d skipped in %.1f s",
+            name,
+            report.created,
+            report.updated,
+            report.deleted,
+            len(report.skipped),
+            report.seconds,
+        )
+        return report
+
+    def _branch_overlay(self, branch: str, type_name: Optional[str] = None) -> List[dict]:
+        return self._queries.execute("branch_overlay", {"branch": branch, "type": type_name})
+
+    def _resolve_in_branch(self, branch: str, asset_id: str) -> Optional[dict]:
+        """
+        The document of an asset in a branch, None if it doesn't exist there.
+        """
+        row = self._queries.execute(
+            "branch_resolve", {"entry_key": overlay_key(branch, asset_id), "asset_id": asset_id}
+        )[0]
+        if row["entry"] is not None:
+            return resolve_entry(row["entry"])
+        return row["main"]
+
+    def _resolve_edges_in_branch(self, branch: str, rows: List[dict], node_ids: set[str]) -> List[dict]:
+        """
+        Apply the overlay of a branch to the rows of the `edges_between_nodes` query.
+        """
+        overlay = {
+            entry["asset_id"]: entry
+            for entry in self._branch_overlay(branch)
+            if entry["type"] in MODEL_MANAGER.get_edge_models()
+        }
+        resolved = [row for row in rows if row["edge"]["_id"] not in overlay]
+        for entry in overlay.values():
+            document = resolve_entry(entry)
+            if document is not None and document["_from"] in node_ids and document["_to"] in node_ids:
+                resolved.append({"edge": document, "type": entry["type"]})
+        return resolved
+
+    def _write_in_branch(
+        self,
+        branch: str,
+        asset_id: str,
+        change: Callable[[Optional[dict]], Optional[dict]],
+        must_exist: bool,
+        rev: Optional[str] = None,
+    ) -> Optional[dict]:
+        """
+        Write the overlay entry of an asset in a branch.
+
+        The first write of an asset in the branch inserts its entry, the next ones
+        replace it with the `_rev` of the entry that was read, so concurrent writes
+        of the same asset fail instead of overwriting each other.
+
+        Args:
+            branch (str): Name of the branch.
+            asset_id (str): ID of the asset.
+            change (Callable): Gets the document in the branch, None if it doesn't exist,
+                and returns the new one, None to delete the asset.
+            must_exist (bool): If the asset must exist in the branch, or must not.
+            rev (str, optional): The `_rev` the document in the branch must have.
+
+        Raises:
+            AssetNotFoundError: If the asset must exist and doesn't.
+            UniqueConstraintViolatedException: If the asset mustn't exist and does.
+            PreconditionFailedError: If the document doesn't have the `rev`.
+            WriteConflictError: If the asset was written concurrently.
+
+        Returns:
+            Optional[dict]: The new document with the `_rev` of its entry.
+        """
+        row = self._queries.execute(
+            "branch_resolve", {"entry_key": overlay_key(branch, asset_id), "asset_id": asset_id}
+        )[0]
+        entry, main = row["entry"], row["main"]
+        current = resolve_entry(entry) if entry is not None else main
+        if must_exist and current is None:
+            raise AssetNotFoundError(f"Asset {asset_id} doesn't exist in branch {branch}.")
+        if not must_exist and current is not None:
+            raise UniqueConstraintViolatedException(f"Asset {asset_id} already exists in branch {branch}.")
+        if rev is not None and current["_rev"] != rev:  # type: ignore
+            raise PreconditionFailedError(f"Asset {asset_id} changed since revision {rev}.")
+        document = change(current)
+        base_rev = entry["base_rev"] if entry is not None else (main["_rev"] if main else None)
+        overlay = self._db.collection(OVERLAY_COLLECTION)
+        try:
+            if document is None and base_rev is None:
+                # Created in the branch, nothing is left to overlay
+                overlay.delete(entry, check_rev=True)
+                return None
+            written = overlay_entry(branch, asset_id, document, base_rev)
+            if entry is None:
+                metadata = overlay.insert(written)
+            else:
+                metadata = overlay.replace({**written, "_rev": entry["_rev"]}, check_rev=True)
+        except (
+            DocumentInsertError, DocumentReplaceError, DocumentDeleteError, DocumentRevisionError
+        ) as error:
+            if isinstance(error, DocumentInsertError) and error.error_code != UNIQUE_CONSTRAINT_VIOLATED:
+                raise
+            if rev is not None:
+                raise PreconditionFailedError(f"Asset {asset_id} changed since revision {rev}.") from error
+            raise WriteConflictError(
+                f"Asset {asset_id} was written concurrently in branch {branch}."
+            ) from error
+        return resolve_entry({**written, "_rev": metadata["_rev"]})  # type: ignore
+
+    def _delete_in_branch(self, branch: str, asset_type: Type[AssetModel], asset_id: str) -> Optional[int]:
+        """
+        Delete an asset in a branch, the edges of a vertex are deleted with it.
+        """
+        try:
+            self._write_in_branch(branch, asset_id, lambda current: None, must_exist=True)
+        except AssetNotFoundError:
+            return None
+        if not issubclass(asset_type, EdgeModel):
+            edge_ids = self._queries.execute(
+                "branch_connected_edges", {"branch": branch, "node_id": asset_id}
+            )
+            for edge_id in edge_ids:
+                try:
+                    self._write_in_branch(branch, edge_id, lambda current: None, must_exist=True)
+                except AssetNotFoundError:
+                    # Deleted concurrently
+                    continue
+        return 0
+
+    def list_asset_revisions(
+        self, asset_id: str, limit: int = 20, before: Optional[int] = None
+    ) -> List[RevisionInfo]:
+        """
+        List the revisions of an asset, newest first.
+
+        Args:
+            asset_id (str): ID of the asset.
+            limit (int, optional): Maximum number of revisions. Defaults to 20.
+            before (int, optional): Only revisions before this one, to page through the history.
+
+        Returns:
+            List[RevisionInfo]: The revisions, without their content.
+        """
+        rows = self._queries.execute(
+            "revision_list", {"asset_id": asset_id, "limit": limit, "before": before}
+        )
+        return [RevisionInfo(**row) for row in rows]
+
+    def get_asset_revision(
+        self,
+        asset_id: str,
+        revision: Optional[int] = None,
+        at: Optional[datetime] = None,
+    ) -> Optional[AssetRevision]:
+        """
+        Read a revision of an asset, by its number or the one that was current at
+        a point in time. Only the closest snapshot and the patches after it are read.
+
+        Args:
+            asset_id (str): ID of the asset.
+            revision (int, optional): The revision, the latest one if neither it nor `at` is given.
+            at (datetime, optional): The point in time.
+
+        Returns:
+            Optional[AssetRevision]: The revision, None if it doesn't exist or was compacted.
+        """
+        rows = self._queries.execute(
+            "revision_chain",
+            {
+                "asset_id": asset_id,
+                "revision": revision,
+                "timestamp": format_timestamp(at) if at is not None else None,
+            },
+        )
+        chain = rows[0] if rows else None
+        if not chain or chain["target"] is None:
+            return None
+        if revision is not None and chain["target"]["revision"] != revision:
+            return None
+        result = AssetRevision(**chain["target"])
+        if result.operation != RevisionOperationEnum.DELETE:
+            if chain["snapshot"] is None:
+                return None
+            result.document = rebuild(chain["snapshot"], chain["patches"])
+        return result
+
+    def get_documents_at(self, at: datetime) -> dict[str, dict]:
+        """
+        Rebuild every asset that existed at a point in time.
+
+        Args:
+            at (datetime): The point in time.
+
+        Returns:
+            dict[str, dict]: The stored documents by asset ID.
+        """
+        rows = self._queries.execute(
+            "revisions_at",
+            {"timestamp": format_timestamp(at), "chain_length": REVISION_SNAPSHOT_INTERVAL + 1},
+        )
+        documents: dict[str, dict] = {}
+        for row in rows:
+            document = rebuild_chain(row["chain"])
+            if document is None:
+                logger.warning("No snapshot of %s before %s, it is skipped", row["asset_id"], at)
+                continue
+            documents[row["asset_id"]] = document
+        return documents
+
+    def compact_revisions(
+        self, before: Optional[datetime] = None, keep: Optional[int] = None
+    ) -> CompactionReport:
+        """
+        Drop the revisions outside of the retention policy. The latest revision
+        of an asset is always kept, the oldest kept revision becomes a snapshot.
+
+        Args:
+            before (datetime, optional): Drop the revisions older than this.
+                Defaults to REVISION_RETENTION_DAYS ago.
+            keep (int, optional): Revisions to keep per asset. Defaults to REVISION_MAX_PER_ASSET.
+
+        Returns:
+            CompactionReport: The number of compacted assets and removed revisions.
+        """
+        start = time.perf_counter()
+        report = CompactionReport()
+        timestamp, keep = retention_policy(before, keep)
+        if timestamp is None and keep <= 0:
+            return report
+        candidates = self._queries.execute(
+            "revision_compaction_candidates", {"before": timestamp, "keep": keep}
+        )
+        for candidate in candidates:
+            asset_id, cutoff = candidate["asset_id"], candidate["cutoff"]
+            kept = self.get_asset_revision(asset_id, cutoff)
+            if kept is None:
+                continue
+            if kept.document is not None:
+                self._queries.execute(
+                    "revision_set_snapshot",
+                    {"asset_id": asset_id, "revision": cutoff, "snapshot": kept.document},
+                )
+            removed = self._queries.execute(
+                "revision_compact", {"asset_id": asset_id, "cutoff": cutoff}
+            )
+            report.assets += 1
+            report.removed += removed[0] if removed else 0
+        report.seconds = time.perf_counter() - start
+        logger.info(
+            "Compacted the revisions of %d assets, removed %d revisions in %.1f s",
+            report.assets,
+            report.removed,
+            report.seconds,
+        )
+        return report
+
+    def get_changed_asset_ids(self, since: datetime) -> List[str]:
+        """
+        Get the IDs of the assets written since a point in time, from their revisions.
+
+        Args:
+            since (datetime): The point in time.
+
+        Returns:
+            List[str]: The IDs of the created, updated and deleted assets.
+        """
+        return self._queries.execute("revision_changes", {"since": format_timestamp(since)})
+
+    def get_documents(self, asset_ids: List[str]) -> dict[str, Optional[dict]]:
+        """
+        Get the stored documents of assets.
+
+        Args:
+            asset_ids (List[str]): The IDs of the assets, their collections must exist.
+
+        Returns:
+            dict[str, Optional[dict]]: The documents by asset ID, None for missing assets.
+        """
+        rows = self._queries.execute("documents_by_ids", {"asset_ids": asset_ids})
+        return {row["asset_id"]: row["document"] for row in rows}
+
+    def get_database_time(self) -> datetime:
+        """
+        Get the time of the database, the timestamps of the revisions are taken from its clock.
+
+        Returns:
+            datetime: The time, in UTC.
+        """
+        milliseconds: int = self._queries.execute("database_time")[0]
+        return datetime.fromtimestamp(milliseconds / 1000, timezone.utc)
+
     def is_asset_present(self, asset_id: str) -> bool:
         """
         Checks if an asset is present in the database.
@@ -292,13 +1631,10 @@ class DataManager(object):
         Returns:
             bool: True if the asset is present in the database.
         """
-        type_name = asset_id.split("/")[0]
-        logger.debug(
-            f"Checking object {asset_id.split('/')[1]} in {type_name} collection"
-        )
+        logger.debug("Checking object %s", asset_id)
         return bool(self._db.has_document(f"{asset_id}")) or False  # type: ignore
 
-    def get_asset_notes(self, asset_id: str) -> str:
+    def get_asset_notes(self, asset_id: str) -> StoredNotes:
         """
         Get the notes of an asset.
 
@@ -306,21 +1642,141 @@ class DataManager(object):
             asset_id (str): ID of the asset (prefixed with type).
 
         Returns:
-            str: The notes.
+            StoredNotes: The notes and their ETag, empty if the asset has no notes.
+        """
+        with span("arango.notes", asset_id=asset_id):
+            document = self._db.collection(NOTES_COLLECTION).get(notes_key(asset_id))
+        return decode_notes(document)  # type: ignore
+
+    def get_asset_notes_etag(self, asset_id: str) -> str:
+        """
+        Get the ETag of the notes of an asset without loading them.
+
+        Args:
+            asset_id (str): ID of the asset (prefixed with type).
+
+        Returns:
+            str: The ETag.
         """
-        return self._db.document(f"{asset_id}").get("notes") or ""  # type: ignore
+        rows = self._queries.execute(
+            "notes_etag", {"notes_id": f"{NOTES_COLLECTION}/{notes_key(asset_id)}"}
+        )
+        return rows[0] if rows and rows[0] else notes_etag("")
 
-    def set_asset_notes(self, asset_id: str, notes: str) -> str:
+    @records_write
+    def set_asset_notes(self, asset_id: str, notes: str) -> StoredNotes:
         """
-        Set notes of an asset.
+        Set notes of an asset. Empty notes are removed.
 
         Args:
-            asset_type (str): Type of the asset.
-            asset_key (str): Key of the asset.
+            asset_id (str): ID of the asset (prefixed with type).
             notes (str): The notes.
+
+        Returns:
+            StoredNotes: The stored notes and their ETag.
+        """
+        collection = self._db.collection(NOTES_COLLECTION)
+        if not notes:
+            collection.delete(notes_key(asset_id), ignore_missing=True, silent=True)
+            return StoredNotes(etag=notes_etag(""))
+        document = notes_document(asset_id, notes)
+        collection.insert(document, overwrite_mode="replace", silent=True)
+        return StoredNotes(content=notes, etag=document["etag"])
+
+    def get_attachments(self, asset_id: str) -> List[Attachment]:
+        """
+        Get the references of the attachments of an asset.
+
+        Args:
+            asset_id (str): ID of the asset (prefixed with type).
+
+        Returns:
+            List[Attachment]: The attachments, sorted by name.
+        """
+        rows = self._queries.execute("attachments_of_asset", {"asset_id": asset_id})
+        attachments = [Attachment.model_validate(row) for row in (rows[0] if rows else [])]
+        return sorted(attachments, key=lambda attachment: attachment.name)
+
+    def get_attachment(self, asset_id: str, name: str) -> Optional[Attachment]:
+        attachments = self.get_attachments(asset_id)
+        return next((attachment for attachment in attachments if attachment.name == name), None)
+
+    @records_write
+    def set_attachment(self, asset_id: str, attachment: Attachment) -> List[Attachment]:
+        """
+        Reference a stored blob as an attachment of an asset, an attachment with the name is replaced.
+
+        Args:
+            asset_id (str): ID of the asset (prefixed with type).
+            attachment (Attachment): The attachment.
+
+        Raises:
+            AssetNotFoundError: If the asset doesn't exist.
+
+        Returns:
+            List[Attachment]: The attachments of the asset.
         """
-        self._db.update_document({"_id": f"{asset_id}", "notes": notes})
-        return self.get_asset_notes(asset_id)
+        type_name, asset_key = asset_id.split("/", 1)
+        rows = self._queries.execute(
+            "attachment_set",
+            {
+                "@collection": type_name,
+                "key": asset_key,
+                "name": attachment.name,
+                "attachment": attachment.model_dump(),
+            },
+        )
+        if not rows:
+            raise AssetNotFoundError(f"Asset {asset_id} doesn't exist.")
+        return sorted((Attachment.model_validate(row) for row in rows[0]), key=lambda row: row.name)
+
+    @records_write
+    def remove_attachment(self, asset_id: str, name: str) -> Optional[Attachment]:
+        """
+        Remove the reference of an attachment, its blob is removed by the garbage collection.
+
+        Args:
+            asset_id (str): ID of the asset (prefixed with type).
+            name (str): Name of the attachment.
+
+        Returns:
+            Optional[Attachment]: The removed attachment, None if the asset didn't have it.
+        """
+        type_name, asset_key = asset_id.split("/", 1)
+        rows = self._queries.execute(
+            "attachment_remove", {"@collection": type_name, "key": asset_key, "name": name}
+        )
+        return Attachment.model_validate(rows[0]) if rows else None
+
+    def collect_attachments(self, dry_run: bool = False) -> AttachmentCollectionReport:
+        """
+        Remove the blobs of the attachments that no asset references, see attachment_store.py.
+        The projects share the blobs, the references of every project are collected.
+
+        Args:
+            dry_run (bool, optional): Only count what would be removed.
+
+        Returns:
+            AttachmentCollectionReport: What was removed.
+        """
+        referenced: set[str] = set()
+        for project in list_projects():
+            with use_project(project):
+                for models in MODEL_MANAGER.get_all_models().values():
+                    for type_name in models:
+                        referenced.update(
+                            self._queries.execute("attachment_digests", {"@collection": type_name})
+                        )
+        report = AttachmentStore().collect_garbage(referenced, dry_run)
+        logger.info(
+            "Collected the attachments: %d blobs, %d referenced, %d removed (%d bytes)%s",
+            report.blobs,
+            report.referenced,
+            report.removed,
+            report.removed_bytes,
+            " (dry run)" if dry_run else "",
+        )
+        return report
 
     def get_tags_for_node(self, asset_id: str) -> List[str]:
         """
@@ -332,13 +1788,7 @@ class DataManager(object):
         Returns:
             List[str]: List of tags.
         """
-        cursor = self._graph.edges("TagEdge", asset_id, direction="inbound")
-
-        tags = []
-        for edge in cursor["edges"]:
-            tags.append(edge["tag_name"])
-
-        return tags
+        return self._queries.execute("tags_of_asset", {"asset_id": asset_id})
 
     def get_tags(self) -> List[str]:
         """
@@ -347,16 +1797,16 @@ class DataManager(object):
         Returns:
             List[str]: List of tags.
         """
-        tags: list[str] = [tag["name"] for tag in self._db.collection("AssetTag").all()]
-        logger.info(tags)
-        return tags
+        return self._queries.execute("tag_names")
 
+    @records_write
     def create_tag(self, tag_name: str):
         safe_tag_name = base64.urlsafe_b64encode(tag_name.encode("utf-8")).decode("utf-8")
         return self._db.insert_document(
             "AssetTag", {"name": tag_name, "_key": safe_tag_name}
         )
 
+    @records_write
     def toggle_tag(self, tag_name: str, asset_id: str) -> bool:
         """
         Toggle a tag on an asset.
@@ -383,6 +1833,7 @@ class DataManager(object):
         )
         return True
 
+    @records_write
     def delete_tag(self, tag_name: str):
         """
         Delete a tag and all of it's connections.
@@ -0,0 +1,97 @@
+"""
+db_executor.py
+
+This module contains the executor of the blocking database calls.
+
+The python-arango client and the SQLAlchemy sessions are synchronous. Calling
+them from an `async def` route blocks the event loop of the worker, so every
+other request of the worker waits for the query. The async routes hand their
+database work to a bounded pool of threads instead.
+"""
+
+import functools
+import logging
+import os
+from contextvars import copy_context
+from typing import Callable, Optional, TypeVar
+
+import anyio
+import anyio.to_thread
+
+logger = logging.getLogger("uvicorn")
+
+T = TypeVar("T")
+
+# Threads reserved for the DataManager (ArangoDB) calls
+DB_THREADS = int(os.environ.get("DB_THREADS", 16))
+# Threads of the default pool, used by FastAPI for the sync routes and dependencies (auth, Postgres)
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", 40))
+
+_db_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_db_limiter() -> anyio.CapacityLimiter:
+    """
+    Get the limiter of the database threads.
+    It has to be created inside the event loop, so it is created on first use.
+
+    Returns:
+        anyio.CapacityLimiter: The limiter.
+    """
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(DB_THREADS)
+    return _db_limiter
+
+
+def configure_default_threadpool() -> None:
+    """
+    Sets the size of the default thread pool.
+    Should be called from the startup event of the application.
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    logger.info(
+        "Thread pools configured: %d database threads, %d default threads",
+        DB_THREADS,
+        THREADPOOL_SIZE,
+    )
+
+
+async def run_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking database call in the database thread pool.
+    Context variables of the request are visible inside the call.
+
+    Args:
+        func (Callable[..., T]): The blocking function.
+        *args: Positional arguments of the function.
+        **kwargs: Keyword arguments of the function.
+
+    Returns:
+        T: The result of the function.
+    """
+    call = functools.partial(copy_context().run, func, *args, **kwargs)
+    return await anyio.to_thread.run_sync(call, limiter=_get_db_limiter())
+
+
+def db_stats() -> dict:
+    """
+    Usage of the thread pools.
+
+    Returns:
+        dict: Busy and total threads of the pools.
+    """
+    default_limiter = anyio.to_thread.current_default_thread_limiter()
+    db_limiter = _get_db_limiter()
+    return {
+        "db_threads": {
+            "busy": db_limiter.borrowed_tokens,
+            "total": db_limiter.total_tokens,
+            "waiting": db_limiter.statistics().tasks_waiting,
+        },
+        "default_threads": {
+            "busy": default_limiter.borrowed_tokens,
+            "total": default_limiter.total_tokens,
+            "waiting": default_limiter.statistics().tasks_waiting,
+        },
+    }
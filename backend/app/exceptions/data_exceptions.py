@@ -1,2 +1,22 @@
 class UniqueConstraintViolatedException(Exception):
     pass
+
+
+class AssetNotFoundError(Exception):
+    pass
+
+
+class WriteConflictError(Exception):
+    pass
+
+
+class PreconditionFailedError(Exception):
+    pass
+
+
+class InvalidPatchError(Exception):
+    """
+    Raised when a partial update would make the asset invalid.
+    """
+
+    pass
@@ -0,0 +1,776 @@
+"""
+export_bundle.py
+
+This module contains the binary export bundle of the graph for the game.
+
+A bundle is laid out so a client can `mmap` it and read it in place, without
+parsing. Every number is little endian and every section starts at a
+multiple of 8 bytes:
+
+    header       64 bytes, see HEADER
+    directory    one 48 bytes entry per section, see ENTRY
+    sections     the data of the entries
+
+The header holds the number of sections, the offset of the directory, the
+number of nodes and edges, the watermark of the change history the bundle
+was built from (milliseconds since the epoch) and the string ID of the hash
+of the models. A directory entry holds the kind and the data type of a
+section, the string IDs of its table and name, a count, a base, and the
+offset and length of its data.
+
+- `STRINGS` is the string table: `count + 1` uint64 offsets followed by the
+  UTF-8 bytes, string `i` is `bytes[offsets[i]:offsets[i + 1]]`. Every
+  string of the bundle (type names, column names, keys, values) is stored
+  once and referenced by its ID.
+- `TABLE` is an asset type, without data. `count` is its number of rows,
+  `flags` tells nodes from edges and `base` is the index of the first node
+  of a node table in the global node numbering, the node tables follow each
+  other in the order of the directory. The rows of node tables are sorted by
+  key, a key is found with a binary search.
+- `COLUMN` is a column of a table, `count` values of its data type. Every
+  table has a `_key` string column, edge tables have `_from` and `_to`
+  uint32 columns of global node indexes. Nested objects are flattened into
+  columns named by their path (`starting_point.x`) under a `STRUCT` column
+  without data, values that don't fit a column type (lists, mixed types)
+  are stored as JSON strings.
+- `NULLS` is the bitmap of the null values of the column with the same
+  table and name, bit `i % 8` of byte `i // 8` is set if row `i` is null.
+  Columns without nulls have no bitmap.
+- `ADJACENCY` is the compressed sparse row index of an edge table:
+  `node count + 1` uint64 offsets, the outgoing edges of node `n` are the
+  rows `offsets[n]` to `offsets[n + 1]` of the edge table, its rows are
+  sorted by origin. Their targets are the `_to` column.
+
+Edges whose origin or target isn't in the bundle are left out.
+
+`update_bundle` applies changed assets to a bundle without decoding the
+tables that didn't change: it continues the string table, so the strings
+of removed values stay in the bundle until the next `build_bundle`.
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from enum import IntEnum
+from itertools import accumulate
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+
+from pydantic import BaseModel
+
+MAGIC = b"GAGMBNDL"
+BUNDLE_VERSION = 1
+BUNDLE_MEDIA_TYPE = "application/vnd.gagm.bundle"
+
+# magic, version, section count, directory offset, nodes, edges, watermark, models hash, flags
+HEADER = struct.Struct("<8sIIQQQqII8x")
+# kind, data type, table, name, flags, count, base, offset, length
+ENTRY = struct.Struct("<HHIIIQQQQ")
+ALIGNMENT = 8
+NO_STRING = 0xFFFFFFFF
+
+KEY_COLUMN = "_key"
+FROM_COLUMN = "_from"
+TO_COLUMN = "_to"
+# Fields of the serialized assets that are stored as the columns above
+ID_FIELDS = ("db_id", "db_key", "origin_id", "target_id")
+
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+
+class SectionKind(IntEnum):
+    STRINGS = 1
+    TABLE = 2
+    COLUMN = 3
+    NULLS = 4
+    ADJACENCY = 5
+
+
+class DataType(IntEnum):
+    NONE = 0
+    BOOL = 1
+    INT64 = 2
+    FLOAT64 = 3
+    STRING = 4
+    JSON = 5
+    UINT32 = 6
+    UINT64 = 7
+    STRUCT = 8
+
+
+class TableFlag(IntEnum):
+    NODE = 1
+    EDGE = 2
+
+
+# array type codes of the data types stored as numbers
+TYPE_CODES = {
+    DataType.BOOL: "B",
+    DataType.INT64: "q",
+    DataType.FLOAT64: "d",
+    DataType.STRING: "I",
+    DataType.JSON: "I",
+    DataType.UINT32: "I",
+    DataType.UINT64: "Q",
+}
+
+
+class InvalidBundleError(Exception):
+    """
+    Raised when a file isn't a bundle, is truncated or has an unsupported version.
+    """
+
+    pass
+
+
+class BundleStats(BaseModel):
+    # Time of the change history the assets were read at, milliseconds since the epoch
+    watermark: int = 0
+    nodes: int = 0
+    edges: int = 0
+    # Edges whose origin or target isn't in the bundle
+    dropped_edges: int = 0
+    strings: int = 0
+    bytes: int = 0
+
+
+def _typed(values: Iterable, type_code: str) -> bytes:
+    data = array(type_code, values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _null_bitmap(values: list[Any]) -> bytes:
+    bitmap = bytearray((len(values) + 7) // 8)
+    for row, value in enumerate(values):
+        if value is None:
+            bitmap[row >> 3] |= 1 << (row & 7)
+    return bytes(bitmap)
+
+
+class _StringTable:
+    def __init__(self, strings: Optional[list[str]] = None) -> None:
+        # The strings of an existing bundle keep their IDs, they are all distinct
+        self.ids: dict[str, int] = {value: string_id for string_id, value in enumerate(strings or [])}
+        self.strings: list[bytes] = [value.encode("utf-8") for value in strings or []]
+
+    def add(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value.encode("utf-8"))
+        return string_id
+
+    def add_all(self, values: list[Optional[str]]) -> list[int]:
+        ids = self.ids
+        string_ids: list[int] = []
+        for value in values:
+            if value is None:
+                string_ids.append(NO_STRING)
+                continue
+            string_id = ids.get(value)
+            if string_id is None:
+                string_id = ids[value] = len(self.strings)
+                self.strings.append(value.encode("utf-8"))
+            string_ids.append(string_id)
+        return string_ids
+
+    def encode(self) -> bytes:
+        offsets = accumulate(map(len, self.strings), initial=0)
+        return _typed(offsets, "Q") + b"".join(self.strings)
+
+
+def _column_type(values: list[Any]) -> DataType:
+    """
+    Get the data type of a column from its values, JSON if they don't fit a column type.
+    """
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds:
+        return DataType.STRING
+    if kinds == {bool}:
+        return DataType.BOOL
+    if kinds == {int}:
+        if all(INT64_MIN <= value <= INT64_MAX for value in values if value is not None):
+            return DataType.INT64
+        return DataType.JSON
+    if kinds <= {int, float}:
+        return DataType.FLOAT64
+    if kinds == {str}:
+        return DataType.STRING
+    if kinds == {dict} and not any(
+        "." in key for value in values if value is not None for key in value
+    ):
+        return DataType.STRUCT
+    return DataType.JSON
+
+
+class _BundleWriter:
+    def __init__(self, strings: Optional[list[str]] = None) -> None:
+        self.strings = _StringTable(strings)
+        self.entries: list[tuple] = []
+        self.sections: list[bytes] = []
+
+    def section(
+        self,
+        kind: SectionKind,
+        data: bytes = b"",
+        dtype: DataType = DataType.NONE,
+        table: Optional[str] = None,
+        name: Optional[str] = None,
+        flags: int = 0,
+        count: int = 0,
+        base: int = 0,
+    ) -> None:
+        self.entries.append(
+            (
+                kind,
+                dtype,
+                NO_STRING if table is None else self.strings.add(table),
+                NO_STRING if name is None else self.strings.add(name),
+                flags,
+                count,
+                base,
+            )
+        )
+        self.sections.append(data)
+
+    def columns(self, table: str, prefix: str, rows: list[Optional[dict]]) -> None:
+        """
+        Write the columns of the fields of rows, nested objects are flattened.
+        """
+        field_names = sorted({field for row in rows if row is not None for field in row})
+        for field in field_names:
+            if not prefix and field in ID_FIELDS:
+                continue
+            values = [None if row is None else row.get(field) for row in rows]
+            name = prefix + field
+            dtype = _column_type(values)
+            has_nulls = None in values
+            if dtype == DataType.STRUCT:
+                data = b""
+            elif dtype in (DataType.BOOL, DataType.INT64, DataType.FLOAT64):
+                numbers = [value or 0 for value in values] if has_nulls else values
+                data = _typed(numbers, TYPE_CODES[dtype])
+            elif dtype == DataType.STRING:
+                data = _typed(self.strings.add_all(values), "I")
+            else:
+                data = _typed(
+                    self.strings.add_all(
+                        [None if value is None else _JSON_ENCODER.encode(value) for value in values]
+                    ),
+                    "I",
+                )
+            self.section(SectionKind.COLUMN, data, dtype, table, name, count=len(values))
+            if has_nulls:
+                self.section(
+                    SectionKind.NULLS, _null_bitmap(values), DataType.NONE, table, name, count=len(values)
+                )
+            if dtype == DataType.STRUCT:
+                self.columns(table, name + ".", values)
+
+    def node_table(self, table: str, rows: list[dict], base: int) -> None:
+        """
+        Write a node table, its rows sorted by key.
+        """
+        self.section(SectionKind.TABLE, table=table, flags=TableFlag.NODE, count=len(rows), base=base)
+        self.section(
+            SectionKind.COLUMN,
+            _typed(self.strings.add_all([row["db_key"] for row in rows]), "I"),
+            DataType.STRING,
+            table,
+            KEY_COLUMN,
+            count=len(rows),
+        )
+        self.columns(table, "", rows)
+
+    def edge_table(self, table: str, rows: list[dict], node_indexes: dict[str, int]) -> int:
+        """
+        Write an edge table and its adjacency, the edges to unknown nodes are left out.
+
+        Returns:
+            int: The number of written edges.
+        """
+        connected: list[tuple[int, int, dict]] = []
+        for row in rows:
+            origin = node_indexes.get(row["origin_id"])
+            target = node_indexes.get(row["target_id"])
+            if origin is not None and target is not None:
+                connected.append((origin, target, row))
+        connected.sort(key=lambda edge: (edge[0], edge[1], edge[2]["db_key"]))
+        rows = [row for _, _, row in connected]
+        self.section(SectionKind.TABLE, table=table, flags=TableFlag.EDGE, count=len(rows))
+        self.section(
+            SectionKind.COLUMN,
+            _typed(self.strings.add_all([row["db_key"] for row in rows]), "I"),
+            DataType.STRING,
+            table,
+            KEY_COLUMN,
+            count=len(rows),
+        )
+        for column, position in ((FROM_COLUMN, 0), (TO_COLUMN, 1)):
+            self.section(
+                SectionKind.COLUMN,
+                _typed([edge[position] for edge in connected], "I"),
+                DataType.UINT32,
+                table,
+                column,
+                count=len(rows),
+            )
+        counts = [0] * len(node_indexes)
+        for origin, _, _ in connected:
+            counts[origin] += 1
+        offsets = list(accumulate(counts, initial=0))
+        self.section(SectionKind.ADJACENCY, _typed(offsets, "Q"), DataType.UINT64, table, count=len(offsets))
+        self.columns(table, "", rows)
+        return len(rows)
+
+    def copy_table(self, reader: "BundleReader", table: str, base: int = 0) -> None:
+        """
+        Copy the sections of a table from the bundle whose string table the writer continues.
+        """
+        table_id = self.strings.ids[table]
+        for kind, dtype, entry_table, name, flags, count, entry_base, offset, length in reader._entries:
+            if entry_table != table_id or kind == SectionKind.STRINGS:
+                continue
+            if kind == SectionKind.TABLE:
+                entry_base = base
+            self.entries.append((kind, dtype, entry_table, name, flags, count, entry_base))
+            self.sections.append(reader._view[offset : offset + length].tobytes())
+
+    def encode(self, nodes: int, edges: int, watermark_ms: int, models_hash: str) -> bytes:
+        models_hash_id = self.strings.add(models_hash)
+        # The string table is written last, every string is known by then
+        self.entries.append(
+            (SectionKind.STRINGS, DataType.NONE, NO_STRING, NO_STRING, 0, len(self.strings.strings), 0)
+        )
+        self.sections.append(self.strings.encode())
+
+        directory_offset = HEADER.size
+        offset = directory_offset + ENTRY.size * len(self.entries)
+        directory = bytearray()
+        body = bytearray()
+        for entry, data in zip(self.entries, self.sections):
+            padding = -offset % ALIGNMENT
+            body += b"\0" * padding
+            offset += padding
+            directory += ENTRY.pack(*entry, offset, len(data))
+            body += data
+            offset += len(data)
+        header = HEADER.pack(
+            MAGIC,
+            BUNDLE_VERSION,
+            len(self.entries),
+            directory_offset,
+            nodes,
+            edges,
+            watermark_ms,
+            models_hash_id,
+            0,
+        )
+        return bytes(header + directory + body)
+
+
+def _node_indexes(node_keys: dict[str, list[str]]) -> dict[str, int]:
+    node_indexes: dict[str, int] = {}
+    for type_name in sorted(node_keys):
+        for key in node_keys[type_name]:
+            node_indexes[f"{type_name}/{key}"] = len(node_indexes)
+    return node_indexes
+
+
+def build_bundle(
+    nodes: dict[str, list[dict]],
+    edges: dict[str, list[dict]],
+    watermark_ms: int = 0,
+    models_hash: str = "",
+) -> tuple[bytes, BundleStats]:
+    """
+    Compile serialized assets into a bundle.
+
+    Args:
+        nodes (dict[str, list[dict]]): The serialized nodes by type.
+        edges (dict[str, list[dict]]): The serialized edges by type.
+        watermark_ms (int, optional): Time of the change history the assets were read at,
+            milliseconds since the epoch. Defaults to 0.
+        models_hash (str, optional): Hash of the models the assets were serialized with.
+
+    Returns:
+        tuple[bytes, BundleStats]: The bundle and its statistics.
+    """
+    writer = _BundleWriter()
+    stats = BundleStats(watermark=watermark_ms)
+    node_rows = {type_name: sorted(rows, key=lambda row: row["db_key"]) for type_name, rows in nodes.items()}
+    node_indexes = _node_indexes(
+        {type_name: [row["db_key"] for row in rows] for type_name, rows in node_rows.items()}
+    )
+    base = 0
+    for type_name in sorted(node_rows):
+        writer.node_table(type_name, node_rows[type_name], base)
+        base += len(node_rows[type_name])
+    stats.nodes = len(node_indexes)
+
+    for type_name in sorted(edges):
+        written = writer.edge_table(type_name, edges[type_name], node_indexes)
+        stats.edges += written
+        stats.dropped_edges += len(edges[type_name]) - written
+
+    bundle = writer.encode(stats.nodes, stats.edges, watermark_ms, models_hash)
+    stats.strings = len(writer.strings.strings)
+    stats.bytes = len(bundle)
+    return bundle, stats
+
+
+def read_watermark(path: Union[str, Path]) -> int:
+    """
+    Read the watermark of a bundle from its header, without mapping the file.
+
+    Args:
+        path (Union[str, Path]): The path of the bundle.
+
+    Raises:
+        InvalidBundleError: If the file isn't a bundle.
+
+    Returns:
+        int: The watermark, milliseconds since the epoch.
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size or header[: len(MAGIC)] != MAGIC:
+        raise InvalidBundleError("The file isn't a bundle.")
+    return HEADER.unpack(header)[6]
+
+
+class BundleTable(BaseModel):
+    name: str
+    flags: TableFlag
+    rows: int
+    # Global index of the first node of a node table
+    base: int = 0
+    # Name and data type of the columns, in the order of the directory
+    columns: dict[str, DataType] = {}
+
+
+class BundleReader(object):
+    """
+    Reads a bundle in place, from bytes or a memory mapped file.
+    The columns are returned as memoryviews of the bundle, nothing is copied
+    on little endian machines.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview, mmap.mmap]) -> None:
+        self._data = data
+        self._view = memoryview(data)
+        self._strings: Optional[list[str]] = None
+        self._node_ids: Optional[list[str]] = None
+        if len(self._view) < HEADER.size:
+            raise InvalidBundleError("The file is too short to be a bundle.")
+        (
+            magic,
+            version,
+            section_count,
+            directory_offset,
+            self.node_count,
+            self.edge_count,
+            self.watermark_ms,
+            models_hash_id,
+            _,
+        ) = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise InvalidBundleError("The file isn't a bundle.")
+        if version != BUNDLE_VERSION:
+            raise InvalidBundleError(f"Unsupported bundle version {version}.")
+        if directory_offset + ENTRY.size * section_count > len(self._view):
+            raise InvalidBundleError("The bundle is truncated.")
+        self._entries = [
+            ENTRY.unpack_from(self._view, directory_offset + ENTRY.size * index)
+            for index in range(section_count)
+        ]
+        # A file cut short, e.g. by an interrupted download, would be read past its end
+        if any(entry[7] + entry[8] > len(self._view) for entry in self._entries):
+            raise InvalidBundleError("The bundle is truncated.")
+        strings = next((entry for entry in self._entries if entry[0] == SectionKind.STRINGS), None)
+        if strings is None:
+            raise InvalidBundleError("The bundle has no string table.")
+        self._string_offsets = self._array(strings[7], strings[5] + 1, "Q")
+        self._string_data = strings[7] + 8 * (strings[5] + 1)
+        self.models_hash = self.string(models_hash_id)
+
+        self.tables: dict[str, BundleTable] = {}
+        self._sections: dict[tuple[int, str, str], tuple] = {}
+        for entry in self._entries:
+            kind, dtype, table_id, name_id, flags, count, base, _, _ = entry
+            if kind == SectionKind.TABLE:
+                table = self.string(table_id)
+                self.tables[table] = BundleTable(name=table, flags=TableFlag(flags), rows=count, base=base)
+            elif kind in (SectionKind.COLUMN, SectionKind.NULLS, SectionKind.ADJACENCY):
+                table = self.string(table_id)
+                name = "" if name_id == NO_STRING else self.string(name_id)
+                self._sections[(kind, table, name)] = entry
+                if kind == SectionKind.COLUMN:
+                    self.tables[table].columns[name] = DataType(dtype)
+        self._node_tables = sorted(
+            (table for table in self.tables.values() if table.flags == TableFlag.NODE),
+            key=lambda table: table.base,
+        )
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "BundleReader":
+        """
+        Memory map a bundle file.
+
+        Args:
+            path (Union[str, Path]): The path of the bundle.
+
+        Returns:
+            BundleReader: The reader, close it to unmap the file.
+        """
+        with open(path, "rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self) -> None:
+        """
+        Release the bundle, the columns returned by the reader must not be used anymore.
+        """
+        if isinstance(self._string_offsets, memoryview):
+            self._string_offsets.release()
+        self._view.release()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self) -> "BundleReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _array(self, offset: int, count: int, type_code: str) -> Union[memoryview, array]:
+        size = array(type_code).itemsize * count
+        if sys.byteorder == "big":
+            values = array(type_code, self._view[offset : offset + size].tobytes())
+            values.byteswap()
+            return values
+        return self._view[offset : offset + size].cast(type_code)
+
+    def string(self, string_id: int) -> str:
+        """
+        Get a string of the string table.
+        """
+        start = self._string_data + self._string_offsets[string_id]
+        end = self._string_data + self._string_offsets[string_id + 1]
+        return str(self._view[start:end], "utf-8")
+
+    def strings(self) -> list[str]:
+        """
+        Decode the whole string table, the result is kept.
+        """
+        if self._strings is None:
+            offsets = self._string_offsets.tolist()
+            data = self._view[self._string_data : self._string_data + offsets[-1]].tobytes()
+            self._strings = [str(data[offsets[i] : offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def column(self, table: str, name: str) -> Union[memoryview, array]:
+        """
+        Get the values of a column, string and JSON columns hold string IDs.
+
+        Raises:
+            KeyError: If the table has no such column, or it's a STRUCT column.
+        """
+        _, dtype, _, _, _, count, _, offset, _ = self._sections[(SectionKind.COLUMN, table, name)]
+        return self._array(offset, count, TYPE_CODES[DataType(dtype)])
+
+    def nulls(self, table: str, name: str) -> Optional[memoryview]:
+        """
+        Get the null bitmap of a column, None if it has no null values.
+        """
+        entry = self._sections.get((SectionKind.NULLS, table, name))
+        if entry is None:
+            return None
+        return self._view[entry[7] : entry[7] + entry[8]]
+
+    def adjacency(self, table: str) -> Union[memoryview, array]:
+        """
+        Get the offsets of the outgoing edges of every node in an edge table.
+        """
+        entry = self._sections[(SectionKind.ADJACENCY, table, "")]
+        return self._array(entry[7], entry[5], "Q")
+
+    def node_id(self, index: int) -> str:
+        """
+        Get the ID (*Type/Key*) of a node from its global index.
+        """
+        for table in self._node_tables:
+            if index < table.base + table.rows:
+                return f"{table.name}/{self.string(self.column(table.name, KEY_COLUMN)[index - table.base])}"
+        raise IndexError(index)
+
+    def node_ids(self) -> list[str]:
+        """
+        Get the IDs of every node, by global index. The result is kept.
+        """
+        if self._node_ids is None:
+            strings = self.strings()
+            self._node_ids = [
+                f"{table.name}/{strings[key]}"
+                for table in self._node_tables
+                for key in self.column(table.name, KEY_COLUMN).tolist()
+            ]
+        return self._node_ids
+
+    def find(self, table: str, key: str) -> Optional[int]:
+        """
+        Find the row of a node by its key.
+
+        Returns:
+            Optional[int]: The row in the table, None if there is no such node.
+        """
+        keys = self.column(table, KEY_COLUMN)
+        low, high = 0, len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.string(keys[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(keys) and self.string(keys[low]) == key:
+            return low
+        return None
+
+    def _values(self, table: str, name: str, dtype: DataType, rows: int) -> list[Any]:
+        if dtype == DataType.STRUCT:
+            values: list[Any] = [{} for _ in range(rows)]
+            prefix = name + "."
+            for child, child_type in self.tables[table].columns.items():
+                if child.startswith(prefix) and "." not in child[len(prefix) :]:
+                    for row, value in enumerate(self._values(table, child, child_type, rows)):
+                        values[row][child[len(prefix) :]] = value
+        else:
+            column = self.column(table, name).tolist()
+            strings = self.strings()
+            if dtype == DataType.BOOL:
+                values = [bool(value) for value in column]
+            elif dtype == DataType.STRING:
+                values = [None if value == NO_STRING else strings[value] for value in column]
+            elif dtype == DataType.JSON:
+                values = [None if value == NO_STRING else json.loads(strings[value]) for value in column]
+            else:
+                values = column
+        bitmap = self.nulls(table, name)
+        if bitmap is not None:
+            for row in range(rows):
+                if bitmap[row >> 3] & (1 << (row & 7)):
+                    values[row] = None
+        return values
+
+    def rows(self, table: str) -> list[dict]:
+        """
+        Decode the rows of a table into serialized assets, with their IDs.
+        Used by the incremental updates, clients read the columns.
+
+        Args:
+            table (str): The name of the table.
+
+        Returns:
+            list[dict]: The assets.
+        """
+        info = self.tables[table]
+        strings = self.strings()
+        keys = [strings[value] for value in self.column(table, KEY_COLUMN).tolist()]
+        rows: list[dict] = [{"db_id": f"{table}/{key}", "db_key": key} for key in keys]
+        if info.flags == TableFlag.EDGE:
+            node_ids = self.node_ids()
+            for field, column in (("origin_id", FROM_COLUMN), ("target_id", TO_COLUMN)):
+                for row, index in zip(rows, self.column(table, column).tolist()):
+                    row[field] = node_ids[index]
+        for name, dtype in info.columns.items():
+            if name in (KEY_COLUMN, FROM_COLUMN, TO_COLUMN) or "." in name:
+                continue
+            for row, value in zip(rows, self._values(table, name, dtype, info.rows)):
+                row[name] = value
+        return rows
+
+
+def _apply_changes(reader: BundleReader, table: str, changes: dict[str, Optional[dict]]) -> list[dict]:
+    rows = {row["db_id"]: row for row in reader.rows(table)} if table in reader.tables else {}
+    for asset_id, row in changes.items():
+        if row is None:
+            rows.pop(asset_id, None)
+        else:
+            rows[asset_id] = row
+    return list(rows.values())
+
+
+def update_bundle(
+    reader: BundleReader,
+    nodes: dict[str, dict[str, Optional[dict]]],
+    edges: dict[str, dict[str, Optional[dict]]],
+    watermark_ms: int = 0,
+    models_hash: str = "",
+) -> tuple[bytes, BundleStats]:
+    """
+    Apply changed assets to a bundle. The tables without changes are copied, the edge tables
+    are all written again if nodes were added or removed since the node numbering changed.
+
+    Args:
+        reader (BundleReader): The bundle.
+        nodes (dict[str, dict[str, Optional[dict]]]): The changed serialized nodes by type and ID,
+            None for the removed ones.
+        edges (dict[str, dict[str, Optional[dict]]]): The changed serialized edges by type and ID,
+            None for the removed ones.
+        watermark_ms (int, optional): Time of the change history the changes were read at,
+            milliseconds since the epoch. Defaults to 0.
+        models_hash (str, optional): Hash of the models the assets were serialized with.
+
+    Returns:
+        tuple[bytes, BundleStats]: The updated bundle and its statistics.
+    """
+    strings = reader.strings()
+    writer = _BundleWriter(strings)
+    stats = BundleStats(watermark=watermark_ms)
+    node_tables = {name for name, table in reader.tables.items() if table.flags == TableFlag.NODE}
+    edge_tables = {name for name, table in reader.tables.items() if table.flags == TableFlag.EDGE}
+
+    node_rows: dict[str, list[dict]] = {}
+    node_keys: dict[str, list[str]] = {}
+    renumbered = False
+    for type_name in node_tables | set(nodes):
+        previous_keys = []
+        if type_name in node_tables:
+            previous_keys = [strings[value] for value in reader.column(type_name, KEY_COLUMN).tolist()]
+        if type_name in nodes:
+            rows = sorted(_apply_changes(reader, type_name, nodes[type_name]), key=lambda row: row["db_key"])
+            node_rows[type_name] = rows
+            node_keys[type_name] = [row["db_key"] for row in rows]
+            renumbered = renumbered or node_keys[type_name] != previous_keys
+        else:
+            node_keys[type_name] = previous_keys
+    node_indexes = _node_indexes(node_keys)
+    base = 0
+    for type_name in sorted(node_keys):
+        if type_name in node_rows:
+            writer.node_table(type_name, node_rows[type_name], base)
+        else:
+            writer.copy_table(reader, type_name, base)
+        base += len(node_keys[type_name])
+    stats.nodes = len(node_indexes)
+
+    for type_name in sorted(edge_tables | set(edges)):
+        if type_name in edges or renumbered:
+            rows = _apply_changes(reader, type_name, edges.get(type_name, {}))
+            written = writer.edge_table(type_name, rows, node_indexes)
+            stats.edges += written
+            stats.dropped_edges += len(rows) - written
+        else:
+            writer.copy_table(reader, type_name)
+            stats.edges += reader.tables[type_name].rows
+
+    bundle = writer.encode(stats.nodes, stats.edges, watermark_ms, models_hash)
+    stats.strings = len(writer.strings.strings)
+    stats.bytes = len(bundle)
+    return bundle, stats
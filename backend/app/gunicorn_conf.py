@@ -0,0 +1,91 @@
+"""
+gunicorn_conf.py
+
+Configuration of the pre-fork production server.
+
+The application is imported once in the master process (`preload_app`): the
+models are loaded, the collections are initialized and the typed routes are
+built before the workers are forked, so the workers share the loaded model
+registry copy-on-write instead of repeating the startup work.
+
+Environment variables:
+    APP_PORT: Port of the server.
+    WORKERS: Number of workers, "auto" uses one worker per available core.
+    WORKER_TIMEOUT: Seconds a busy worker may be silent before it is restarted.
+    GRACEFUL_TIMEOUT: Seconds workers get to finish their requests on restart.
+    MAX_REQUESTS: Restart a worker after this many requests (0 disables it).
+"""
+
+import logging
+import os
+import time
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def available_cpus() -> int:
+    """
+    Count the CPU cores the server may use.
+    Respects the CPU quota of the container (cgroup v2) and the CPU affinity.
+
+    Returns:
+        int: Number of usable cores.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+_workers = os.environ.get("WORKERS", "auto")
+
+bind = f"0.0.0.0:{os.environ.get('APP_PORT', 8000)}"
+workers = available_cpus() if _workers == "auto" else int(_workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.environ.get("MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+_start_time = time.perf_counter()
+
+
+def when_ready(server):
+    logger.info(
+        "Application preloaded in %.2f s, starting %d workers",
+        time.perf_counter() - _start_time,
+        server.cfg.workers,
+    )
+
+
+def post_fork(server, worker):
+    """
+    Drops the connections inherited from the master process,
+    the workers open their own connections on first use.
+    """
+    from arango_connector import ArangoDB
+    from rel_db import engine
+
+    ArangoDB.reset_connections()
+    engine.dispose(close=False)
+
+
+def on_reload(server):
+    """
+    Reloads the models in the master process on SIGHUP,
+    the new workers are forked with the reloaded model registry
+    while the old workers finish their requests.
+    """
+    from arango_connector import ArangoDB
+    from model_manager import ModelManager
+
+    model_manager = ModelManager()
+    model_manager.reload_models()
+    ArangoDB().init_collections(model_manager.get_all_models())
+    logger.info("Models reloaded in the master process")
@@ -0,0 +1,231 @@
+"""
+index_manager.py
+
+This module contains the management of the indexes declared by the models.
+
+Models declare indexes in their `Config` or in the metadata of a field:
+
+    class Enemy(NodeModel):
+        enemy_type: str = Field(json_schema_extra={"index": "persistent"})
+        spawn: Position = Field(json_schema_extra={"index": {"type": "persistent", "fields": ["x", "y"]}})
+
+        class Config:
+            indexes = [{"type": "ttl", "fields": ["expires_at"], "expireAfter": 0}]
+
+The definitions use the attributes of the index API of ArangoDB. The fields
+of a field level index are relative to the field (the field itself if none
+are given). Indexes created by the backend are named `gagm_*`, the name
+contains a digest of the definition, so a changed definition creates a new
+index and the old one is dropped. Other indexes are never touched.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from enum import Enum
+from typing import Any, Optional, Type
+
+from arango.collection import StandardCollection
+from arango.exceptions import IndexCreateError, IndexListError
+from arango.request import Request
+from arango.response import Response
+from pydantic import BaseModel
+
+from gagm_base.asset_model import AssetModel
+
+logger = logging.getLogger("uvicorn")
+
+MANAGED_INDEX_PREFIX = "gagm_"
+
+
+class IndexTypeEnum(str, Enum):
+    """
+    Index types that can be declared by the models.
+    `hash` is an alias of `persistent` since ArangoDB 3.9,
+    `fulltext` is deprecated in favor of `inverted`.
+    """
+
+    PERSISTENT = "persistent"
+    HASH = "hash"
+    TTL = "ttl"
+    GEO = "geo"
+    FULLTEXT = "fulltext"
+    INVERTED = "inverted"
+
+
+class InvalidIndexDefinitionError(Exception):
+    """
+    Raised when a model declares an invalid index.
+    """
+
+    pass
+
+
+class IndexDefinition(BaseModel):
+    """
+    An index declared by a model. Type specific attributes
+    (e.g. `expireAfter`, `geoJson`, `storedValues`) are passed to ArangoDB as they are.
+    """
+
+    type: IndexTypeEnum
+    fields: list[Any]
+    unique: Optional[bool] = None
+    sparse: Optional[bool] = None
+
+    class Config:
+        extra = "allow"
+        frozen = True
+
+    def body(self) -> dict:
+        """
+        The definition as body of the index API, without name.
+        """
+        return self.model_dump(mode="json", exclude_none=True)
+
+    @property
+    def name(self) -> str:
+        body = self.body()
+        digest = hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+        fields = "_".join(
+            field if isinstance(field, str) else str(field.get("name")) for field in self.fields
+        ).replace(".", "-")
+        return f"{MANAGED_INDEX_PREFIX}{self.type.value}_{fields[:96]}_{digest}"
+
+
+class IndexSyncReport(BaseModel):
+    """
+    Result of the synchronization of the indexes of a collection.
+    """
+
+    collection: str
+    created: list[str] = []
+    dropped: list[str] = []
+    unchanged: list[str] = []
+    seconds: float = 0.0
+
+
+def _field_definitions(name: str, declaration: Any) -> list[dict]:
+    if isinstance(declaration, list):
+        return [definition for item in declaration for definition in _field_definitions(name, item)]
+    if isinstance(declaration, str):
+        return [{"type": declaration, "fields": [name]}]
+    if isinstance(declaration, dict):
+        definition = dict(declaration)
+        definition["fields"] = [f"{name}.{field}" for field in definition.get("fields", [])] or [name]
+        return [definition]
+    raise InvalidIndexDefinitionError(f"Invalid index declaration of field {name}: {declaration}")
+
+
+def get_index_definitions(model: Type[AssetModel]) -> list[IndexDefinition]:
+    """
+    Collect the indexes declared by a model in its `Config` and field metadata.
+
+    Args:
+        model (Type[AssetModel]): The model.
+
+    Raises:
+        InvalidIndexDefinitionError: If a declaration is invalid.
+
+    Returns:
+        list[IndexDefinition]: The declared indexes, without duplicates.
+    """
+    declarations: list[dict] = list(model.model_config.get("indexes", []))  # type: ignore
+    for field_name, field in model.model_fields.items():
+        extra = field.json_schema_extra
+        if isinstance(extra, dict) and "index" in extra:
+            declarations.extend(_field_definitions(field.alias or field_name, extra["index"]))
+
+    definitions: dict[str, IndexDefinition] = {}
+    for declaration in declarations:
+        try:
+            definition = IndexDefinition.model_validate(declaration)
+        except ValueError as error:
+            raise InvalidIndexDefinitionError(
+                f"Invalid index of model {model.__name__}: {declaration}"
+            ) from error
+        definitions[definition.name] = definition
+    return list(definitions.values())
+
+
+def list_indexes(collection: StandardCollection, with_stats: bool = False) -> list[dict]:
+    """
+    List the indexes of a collection, including the ones that are still built.
+    The formatter of python-arango drops the build progress and the figures,
+    so the index API is called directly.
+
+    Args:
+        collection (StandardCollection): The collection.
+        with_stats (bool, optional): Include the memory and cache figures. Defaults to False.
+
+    Returns:
+        list[dict]: The indexes as returned by ArangoDB.
+    """
+    request = Request(
+        method="get",
+        endpoint="/_api/index",
+        params={
+            "collection": collection.name,
+            "withHidden": True,
+            "withStats": with_stats,
+        },
+    )
+
+    def response_handler(resp: Response) -> list[dict]:
+        if not resp.is_success:
+            raise IndexListError(resp, request)
+        return resp.body["indexes"]
+
+    return collection._execute(request, response_handler)  # type: ignore
+
+
+def sync_indexes(
+    collection: StandardCollection, definitions: list[IndexDefinition]
+) -> IndexSyncReport:
+    """
+    Create the missing declared indexes of a collection and drop the managed
+    indexes that are not declared anymore. Safe to run concurrently and repeatedly.
+
+    Args:
+        collection (StandardCollection): The collection.
+        definitions (list[IndexDefinition]): The declared indexes.
+
+    Raises:
+        IndexCreateError: If an index can't be created, e.g. a unique index on duplicates.
+
+    Returns:
+        IndexSyncReport: The changes.
+    """
+    start = time.perf_counter()
+    report = IndexSyncReport(collection=collection.name)
+    existing = {index.get("name"): index for index in collection.indexes()}  # type: ignore
+    declared = {definition.name: definition for definition in definitions}
+
+    for name, definition in declared.items():
+        if name in existing:
+            report.unchanged.append(name)
+            continue
+        index_start = time.perf_counter()
+        try:
+            collection._add_index(  # type: ignore
+                {**definition.body(), "name": name, "inBackground": True}
+            )
+        except IndexCreateError as error:
+            logger.error("Creating index %s on %s failed: %s", name, collection.name, error)
+            raise
+        logger.info(
+            "Created index %s on %s in %.1f s",
+            name,
+            collection.name,
+            time.perf_counter() - index_start,
+        )
+        report.created.append(name)
+
+    for name, index in existing.items():
+        if name and name.startswith(MANAGED_INDEX_PREFIX) and name not in declared:
+            collection.delete_index(index["id"], ignore_missing=True)
+            logger.info("Dropped index %s of %s", name, collection.name)
+            report.dropped.append(name)
+
+    report.seconds = time.perf_counter() - start
+    return report
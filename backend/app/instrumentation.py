@@ -0,0 +1,358 @@
+"""
+instrumentation.py
+
+This module contains the request instrumentation of the backend.
+
+Every request gets a trace in a context variable. Code on the hot paths opens
+timing spans (`with span("arango.aql"): ...`), a span is added to the trace of
+the current request and observed by the metrics. The spans of a request are
+returned in the `Server-Timing` header and slow requests are logged with their
+spans. The metrics are exposed in the Prometheus text format, the sampling
+profiler collects the stacks of all threads of the worker on demand.
+
+The spans only cost a clock read and a list append, so the instrumentation
+is meant to stay enabled in production.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger("uvicorn")
+
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION", "true") == "true"
+# Requests slower than this are logged with their spans
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0))
+# Spans kept per request, further spans are only counted
+MAX_SPANS_PER_REQUEST = 256
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """
+    A Prometheus counter with labels.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    A Prometheus histogram with labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, values in self._values.items():
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, values):
+                    cumulative += count
+                    bucket_labels = _labels(self.labelnames + ("le",), labels + (str(bound),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                infinity_labels = _labels(self.labelnames + ("le",), labels + ("+Inf",))
+                lines.append(f"{self.name}_bucket{infinity_labels} {values[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {values[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+REGISTRY: list[Counter | Histogram] = []
+
+REQUESTS = Counter(
+    "gagm_http_requests_total", "Handled requests.", ("method", "route", "status")
+)
+REQUEST_DURATION = Histogram(
+    "gagm_http_request_duration_seconds", "Duration of the requests.", ("method", "route")
+)
+SPAN_DURATION = Histogram(
+    "gagm_span_duration_seconds", "Duration of the instrumented operations.", ("span",)
+)
+AQL_EXECUTION = Histogram(
+    "gagm_arango_query_execution_seconds",
+    "Server-side execution time of the AQL queries.",
+    ("query",),
+)
+AQL_ROWS = Counter("gagm_arango_query_rows_total", "Rows returned by the AQL queries.", ("query",))
+PROJECT_REQUESTS = Counter("gagm_project_requests_total", "Handled requests per project.", ("project",))
+PROJECT_QUERY_SECONDS = Counter(
+    "gagm_project_query_seconds_total",
+    "Server-side execution time of the AQL queries per project.",
+    ("project",),
+)
+
+
+def render_metrics() -> str:
+    """
+    Render every metric in the Prometheus text format.
+
+    Returns:
+        str: The metrics.
+    """
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """
+    The spans of a request.
+    """
+
+    __slots__ = ("start", "spans", "dropped")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # (name, offset from the start, duration, attributes)
+        self.spans: list[tuple[str, float, float, dict]] = []
+        self.dropped = 0
+
+    def add(self, name: str, start: float, duration: float, attributes: dict) -> None:
+        if len(self.spans) < MAX_SPANS_PER_REQUEST:
+            self.spans.append((name, start - self.start, duration, attributes))
+        else:
+            self.dropped += 1
+
+    def totals(self) -> dict[str, tuple[int, float]]:
+        """
+        Number of spans and their total duration by span name.
+        """
+        totals: dict[str, tuple[int, float]] = {}
+        for name, _, duration, _ in self.spans:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + duration)
+        return totals
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f'{name};dur={total * 1000:.2f};desc="{count}"'
+            for name, (count, total) in self.totals().items()
+        )
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("gagm_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict]:
+    """
+    Time an operation. The span is added to the trace of the current request.
+    The yielded attributes can be extended inside the block, e.g. with the
+    number of returned rows.
+
+    Args:
+        name (str): Name of the operation, used as metric label, keep it static.
+        **attributes: Details of the operation, only kept in the trace.
+
+    Yields:
+        dict: The attributes of the span.
+    """
+    if not INSTRUMENTATION_ENABLED:
+        yield attributes
+        return
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_DURATION.observe(duration, name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, start, duration, attributes)
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware that traces every HTTP request.
+    The route label is the path template of the matched route, so the number
+    of label values stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[dict] = None
+
+    def _route_path(self, scope: dict) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None or endpoint not in self._route_paths:
+            # Typed routes are added at runtime, so the map is rebuilt on misses
+            self._route_paths = {
+                getattr(route, "endpoint", None): getattr(route, "path", "")
+                for route in scope["app"].routes
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not INSTRUMENTATION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if trace.spans:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            duration = time.perf_counter() - trace.start
+            route = self._route_path(scope)
+            REQUESTS.inc(scope["method"], route, str(status_code))
+            REQUEST_DURATION.observe(duration, scope["method"], route)
+            if duration >= SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    "Slow request %s %s (%d) took %.3f s, spans: %s%s",
+                    scope["method"],
+                    route,
+                    status_code,
+                    duration,
+                    ", ".join(
+                        f"{name} {count}x {total * 1000:.1f} ms"
+                        for name, (count, total) in trace.totals().items()
+                    ),
+                    f" ({trace.dropped} not kept)" if trace.dropped else "",
+                )
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the worker. Samples the stacks of every thread
+    (except its own) at a fixed interval, only one profile runs at a time.
+    """
+
+    _lock = threading.Lock()
+
+    @classmethod
+    def is_running(cls) -> bool:
+        return cls._lock.locked()
+
+    @classmethod
+    def profile(cls, seconds: float, interval: float) -> StackCounter:
+        """
+        Collect stack samples. Blocking, run it in a thread.
+
+        Args:
+            seconds (float): Duration of the profile.
+            interval (float): Time between the samples.
+
+        Raises:
+            RuntimeError: If a profile is already running.
+
+        Returns:
+            Counter: Number of samples by collapsed stack (root first, `;` separated).
+        """
+        if not cls._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            own_thread = threading.get_ident()
+            stacks: StackCounter = StackCounter()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stacks[";".join(reversed(names))] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            cls._lock.release()
+
+    @staticmethod
+    def collapsed(stacks: StackCounter) -> str:
+        """
+        Format the samples as collapsed stacks, the input of flamegraph tools.
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+    @staticmethod
+    def top(stacks: StackCounter, limit: int = 50) -> str:
+        """
+        Format the samples as a table of the frames on the top of the stacks.
+        """
+        total = sum(stacks.values()) or 1
+        leaves: StackCounter = StackCounter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        lines = [f"{'samples':>8} {'share':>7}  frame"]
+        for frame, count in leaves.most_common(limit):
+            lines.append(f"{count:8d} {count / total:7.1%}  {frame}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,92 @@
+"""
+json_patch.py
+
+This module contains the JSON Patch (RFC 6902) helpers of the revision history.
+
+Only the `add`, `remove` and `replace` operations are applied, the
+revisions never contain `move`, `copy` or `test`. Patches are applied to a
+copy, the given document is never modified.
+"""
+
+import copy
+from typing import Any
+
+
+class InvalidPatchError(Exception):
+    """
+    Raised when a patch can't be applied to a document.
+    """
+
+    pass
+
+
+def _parse_pointer(pointer: str) -> list[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise InvalidPatchError(f"Invalid JSON pointer {pointer}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+
+def _container(document: Any, parts: list[str], pointer: str) -> Any:
+    value = document
+    for part in parts:
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            raise InvalidPatchError(f"Path {pointer} doesn't exist.")
+    return value
+
+
+def apply(document: dict, patch: list[dict]) -> dict:
+    """
+    Apply a patch to a copy of a document.
+
+    Args:
+        document (dict): The document.
+        patch (list[dict]): The operations.
+
+    Raises:
+        InvalidPatchError: If an operation is unsupported or its path doesn't exist.
+
+    Returns:
+        dict: The patched document.
+    """
+    result = copy.deepcopy(document)
+    for operation in patch:
+        op = operation.get("op")
+        pointer = operation.get("path", "")
+        parts = _parse_pointer(pointer)
+        if not parts:
+            if op not in ("add", "replace"):
+                raise InvalidPatchError(f"Can't {op} the whole document.")
+            result = copy.deepcopy(operation["value"])
+            continue
+        parent = _container(result, parts[:-1], pointer)
+        last = parts[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last) if last.isdigit() else -1
+            if not 0 <= index <= len(parent) or (op != "add" and index == len(parent)):
+                raise InvalidPatchError(f"Path {pointer} doesn't exist.")
+            if op == "add":
+                parent.insert(index, copy.deepcopy(operation["value"]))
+            elif op == "replace":
+                parent[index] = copy.deepcopy(operation["value"])
+            elif op == "remove":
+                del parent[index]
+            else:
+                raise InvalidPatchError(f"Unsupported operation {op}")
+        elif isinstance(parent, dict):
+            if op in ("replace", "remove") and last not in parent:
+                raise InvalidPatchError(f"Path {pointer} doesn't exist.")
+            if op in ("add", "replace"):
+                parent[last] = copy.deepcopy(operation["value"])
+            elif op == "remove":
+                del parent[last]
+            else:
+                raise InvalidPatchError(f"Unsupported operation {op}")
+        else:
+            raise InvalidPatchError(f"Path {pointer} doesn't exist.")
+    return result
@@ -11,40 +11,64 @@ from pathlib import Path
 
 from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-
+from fastapi.responses import PlainTextResponse, RedirectResponse
+
+from arango_connector import ArangoClientConfig, ArangoDB
+from content_negotiation import ContentNegotiationMiddleware, NegotiatedResponse
+from db_executor import configure_default_threadpool, db_stats
+from instrumentation import INSTRUMENTATION_ENABLED, InstrumentationMiddleware, render_metrics
+from project_context import ProjectMiddleware
+from read_routing import LAST_WRITE_HEADER, ReadYourWritesMiddleware
+from rel_db import pool_stats as rel_db_pool_stats
 from responses.health_check import HealthCheck
-from routers import data, models, authentication
+from routers import admin, attachments, branches, data, export, models, authentication
 
 logger = logging.getLogger("uvicorn")
 logger.propagate = False
 
 
-app: FastAPI = FastAPI(title="Game Asset Graph Manager - Backend")
+app: FastAPI = FastAPI(
+    title="Game Asset Graph Manager - Backend", default_response_class=NegotiatedResponse
+)
 app.include_router(authentication.router, tags=["authentication"], prefix="/authentication")
 app.include_router(models.router, tags=["models"], prefix="/models")
 app.include_router(data.router, tags=["data"], prefix="/data")
+app.include_router(admin.router, tags=["admin"], prefix="/admin")
+app.include_router(export.router, tags=["export"], prefix="/export")
+app.include_router(attachments.router, tags=["attachments"], prefix="/attachments")
+app.include_router(branches.router, tags=["branches"], prefix="/branches")
 
 # origins = ["*"]
 
+# Only needed when reads can go to a replica
+app.add_middleware(ReadYourWritesMiddleware, enabled=bool(ArangoClientConfig.from_env().read_hosts))
+app.add_middleware(ProjectMiddleware, activate=models.MODEL_MANAGER.load_project)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", LAST_WRITE_HEADER],
 )
+app.add_middleware(ContentNegotiationMiddleware)
+app.add_middleware(InstrumentationMiddleware)
 
 
 START_TIME = datetime.now()
 
 
+@app.on_event("startup")
+async def configure_thread_pools():
+    configure_default_threadpool()
+
+
 class EndpointFilter(logging.Filter):
     """
     Filter to exclude specific endpoints from logging.
     """
 
-    _exclude_endpoints: list[str] = ["/health"]
+    _exclude_endpoints: list[str] = ["/health", "/metrics"]
 
     def filter(self, record: logging.LogRecord) -> bool:
         return any(
@@ -80,6 +104,38 @@ async def health_check() -> HealthCheck:
     )
 
 
+@app.get(
+    "/health/pools",
+    tags=["health_check"],
+    summary="Get the usage of the connection and thread pools",
+)
+async def pool_usage() -> dict:
+    """
+    Endpoint to inspect the saturation of the pools of the worker.
+
+    Returns:
+        dict: Usage of the pools.
+    """
+    return {"arango": ArangoDB.pool_stats(), "postgres": rel_db_pool_stats(), **db_stats()}
+
+
+@app.get(
+    "/metrics",
+    tags=["health_check"],
+    summary="Get the metrics of the worker in the Prometheus format",
+    response_class=PlainTextResponse,
+    include_in_schema=INSTRUMENTATION_ENABLED,
+)
+async def metrics() -> PlainTextResponse:
+    """
+    Endpoint for Prometheus scraping. Every worker process has its own metrics.
+
+    Returns:
+        PlainTextResponse: The metrics.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """
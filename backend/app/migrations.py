@@ -0,0 +1,129 @@
+"""
+migrations.py
+
+This module contains the data migrations of the graph database.
+
+A migration is registered with a unique, ordered ID and runs once per
+database, the applied migrations are recorded in the `GagmMigrations`
+collection. Migrations run on startup after the collections were created,
+they have to be idempotent, a crash can interrupt them before they are
+recorded.
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Type
+
+from arango.database import Database
+
+from gagm_base.asset_model import AssetModel
+from notes_store import NOTES_COLLECTION
+from revision_store import REVISION_FIELD, REVISIONS_COLLECTION
+
+logger = logging.getLogger("uvicorn")
+
+MIGRATIONS_COLLECTION = "GagmMigrations"
+
+MigrationFunction = Callable[[Database, dict[str, dict[str, Type[AssetModel]]]], None]
+
+_MIGRATIONS: dict[str, tuple[str, MigrationFunction]] = {}
+
+
+def migration(migration_id: str, description: str) -> Callable[[MigrationFunction], MigrationFunction]:
+    """
+    Register a migration. The function gets the database and the loaded models.
+
+    Args:
+        migration_id (str): Unique ID, migrations run in the order of their IDs.
+        description (str): What the migration does.
+    """
+
+    def register(function: MigrationFunction) -> MigrationFunction:
+        if migration_id in _MIGRATIONS:
+            raise ValueError(f"Migration {migration_id} is already registered.")
+        _MIGRATIONS[migration_id] = (description, function)
+        return function
+
+    return register
+
+
+def run_migrations(db: Database, models: dict[str, dict[str, Type[AssetModel]]]) -> list[str]:
+    """
+    Run the migrations that weren't applied to the database yet.
+
+    Args:
+        db (Database): The database.
+        models (dict[str, dict[str, Type[AssetModel]]]): The loaded models.
+
+    Returns:
+        list[str]: IDs of the applied migrations.
+    """
+    if not db.has_collection(MIGRATIONS_COLLECTION):
+        db.create_collection(MIGRATIONS_COLLECTION)
+    records = db.collection(MIGRATIONS_COLLECTION)
+    applied = []
+    for migration_id in sorted(_MIGRATIONS):
+        if records.has(migration_id):
+            continue
+        description, function = _MIGRATIONS[migration_id]
+        logger.info("Running migration %s: %s", migration_id, description)
+        start = time.perf_counter()
+        function(db, models)
+        seconds = time.perf_counter() - start
+        records.insert(
+            {
+                "_key": migration_id,
+                "description": description,
+                "applied_at": datetime.now().isoformat(),
+                "seconds": seconds,
+            },
+            overwrite_mode="ignore",
+        )
+        logger.info("Migration %s done in %.1f s", migration_id, seconds)
+        applied.append(migration_id)
+    return applied
+
+
+@migration("0001_notes_out_of_line", "Move the notes of the assets to the AssetNotes collection.")
+def move_notes_out_of_line(db: Database, models: dict[str, dict[str, Type[AssetModel]]]) -> None:
+    # The notes are moved as they are, they are compressed on their next write
+    query = """
+        FOR doc IN @@collection
+            FILTER HAS(doc, "notes")
+            LET content = doc.notes
+            UPDATE doc WITH {notes: null} IN @@collection OPTIONS {keepNull: false}
+            FILTER IS_STRING(content) AND content != ""
+            INSERT {
+                _key: SUBSTITUTE(doc._id, "/", ":"),
+                asset_id: doc._id,
+                etag: SHA1(content),
+                encoding: "identity",
+                content: content
+            } INTO @@notes OPTIONS {overwriteMode: "ignore"}
+    """
+    for name in [*models["node"], *models["edge"]]:
+        if db.has_collection(name):
+            db.aql.execute(query, bind_vars={"@collection": name, "@notes": NOTES_COLLECTION})
+
+
+@migration("0002_initial_revisions", "Record the current state of the assets as their first revision.")
+def record_initial_revisions(db: Database, models: dict[str, dict[str, Type[AssetModel]]]) -> None:
+    # The history before the revisions were recorded is unknown, it starts now
+    query = f"""
+        FOR doc IN @@collection
+            FILTER doc.{REVISION_FIELD} == null
+            UPDATE doc WITH {{{REVISION_FIELD}: 1}} IN @@collection
+            LET updated = NEW
+            INSERT {{
+                asset_id: doc._id,
+                revision: 1,
+                timestamp: DATE_ISO8601(DATE_NOW()),
+                operation: "create",
+                snapshot: UNSET(updated, "_rev"),
+                patch: null
+            }} INTO {REVISIONS_COLLECTION} OPTIONS {{ignoreErrors: true}}
+    """
+    for name in [*models["node"], *models["edge"]]:
+        if db.has_collection(name):
+            db.aql.execute(query, bind_vars={"@collection": name})
@@ -2,10 +2,17 @@
 model_manager.py
 
 This file contains the ModelLoader class which is responsible for loading all models.
+
+Every project has its own model set (see project_context.py): the models of the
+default project are in `models/`, the models of the other projects in their
+directory in `PROJECTS_DIRECTORY`, imported as the package `gagm_projects.<project>`.
 """
 
 import logging
 import os
+import sys
+import threading
+import types
 from copy import deepcopy
 from datetime import datetime
 from enum import Enum
@@ -17,6 +24,14 @@ from pydantic import create_model
 from pydantic.fields import FieldInfo
 
 from arango_connector import ArangoDB
+from project_context import (
+    DEFAULT_PROJECT,
+    PROJECTS_DIRECTORY,
+    ProjectNotFoundError,
+    get_current_project,
+    project_exists,
+    use_project,
+)
 
 from gagm_base.asset_model import AssetModel
 from gagm_base.edge_model import EdgeModel
@@ -25,6 +40,9 @@ from gagm_base.node_model import NodeModel
 
 logger = logging.getLogger("uvicorn")
 
+# Parent package of the models of the projects
+PROJECTS_PACKAGE = "gagm_projects"
+
 
 class NoModelsFoundError(Exception):
     """
@@ -42,24 +60,36 @@ class ModelNotFoundError(Exception):
     pass
 
 
+class ProjectModels(object):
+    """
+    The model set of a project.
+    """
+
+    def __init__(self, project: str, directory: Path, package: str):
+        self.project = project
+        self.directory = directory
+        self.package = package
+        self.models: dict[str, dict[str, Type[AssetModel]]] = {"node": {}, "edge": {}}
+        self.optional_models: dict[str, Type[AssetModel]] = {}
+        self.last_reload = datetime.now()
+
+
 class ModelManager(object):
     """
     The ModelLoader class is responsible for loading all models.
+    The methods work with the model set of the project of the request.
     """
 
     _instance = None
-    _models_loaded = False
 
-    _models: dict[str, dict[str, Type[AssetModel]]] = {"node": {}, "edge": {}}
-    _all_optional_models: dict[str, Type[AssetModel]] = {}
+    _model_sets: dict[str, ProjectModels] = {}
+    _lock = threading.RLock()
     models_directory_path: Path = Path(__file__).parent.resolve() / "models"
-    last_reload: datetime
 
     def __init__(self, db: ArangoDB = ArangoDB()):
-        if not self._models_loaded:
-            self.load_models()
-            db.init_collections(self._models)
-            self._models_loaded = True
+        # The other projects are loaded by their first request
+        if DEFAULT_PROJECT not in self._model_sets:
+            self.load_project(DEFAULT_PROJECT, db)
 
     def __new__(cls):
         if cls._instance is None:
@@ -68,25 +98,103 @@ class ModelManager(object):
 
         return cls._instance
 
-    def reload_models(self):
+    @property
+    def _models(self) -> dict[str, dict[str, Type[AssetModel]]]:
+        return self._project_models().models
+
+    @property
+    def _all_optional_models(self) -> dict[str, Type[AssetModel]]:
+        return self._project_models().optional_models
+
+    @property
+    def last_reload(self) -> datetime:
+        return self._project_models().last_reload
+
+    def _project_models(self) -> ProjectModels:
+        project_models = self._model_sets.get(get_current_project())
+        if project_models is None:
+            project_models = self.load_project(get_current_project())
+        return project_models
+
+    def load_project(self, project: str, db: Optional[ArangoDB] = None) -> ProjectModels:
         """
-        Reload all models.
+        Load the models of a project and initialize the collections of its database.
+        Only the first call of a project in the process loads it.
+
+        Args:
+            project (str): The project.
+            db (ArangoDB, optional): The database connector. Defaults to the shared one.
+
+        Raises:
+            ProjectNotFoundError: If the project doesn't exist.
+
+        Returns:
+            ProjectModels: The model set of the project.
         """
-        self._models = {"node": {}, "edge": {}}
-        self.load_models()
+        with self._lock:
+            if project not in self._model_sets:
+                if not project_exists(project):
+                    raise ProjectNotFoundError(f"Project not found: {project}")
+                if project == DEFAULT_PROJECT:
+                    project_models = ProjectModels(project, self.models_directory_path, "models")
+                else:
+                    project_models = ProjectModels(
+                        project, PROJECTS_DIRECTORY / project, f"{PROJECTS_PACKAGE}.{project}"
+                    )
+                with use_project(project):
+                    self.load_models(project_models.directory, project_models)
+                    (db or ArangoDB()).init_collections(project_models.models)
+                self._model_sets[project] = project_models
+                logger.info("Loaded project %s", project)
+            return self._model_sets[project]
+
+    def loaded_projects(self) -> list[str]:
+        return sorted(self._model_sets)
 
-    def load_models(self, model_path: Path = models_directory_path):
+    def count_models(self, project: str) -> int:
+        """
+        Count the loaded models of a project.
+
+        Returns:
+            int: The number of node and edge models, 0 if the project isn't loaded.
+        """
+        project_models = self._model_sets.get(project)
+        if project_models is None:
+            return 0
+        return sum(len(models) for models in project_models.models.values())
+
+    def reload_models(self):
+        """
+        Reload all models of the project.
+        """
+        project_models = self._project_models()
+        project_models.models = {"node": {}, "edge": {}}
+        self.load_models(project_models.directory, project_models)
+
+    def load_models(
+        self,
+        model_path: Path = models_directory_path,
+        project_models: Optional[ProjectModels] = None,
+    ):
         """
         Load all models from the specified directory.
 
         Args:
             model_path (Path): The path to the directory containing the models.
+            project_models (ProjectModels, optional): The model set to load the models into.
+                Defaults to the model set of the project.
         """
+        project_models = project_models or self._project_models()
+        if project_models.package.startswith(f"{PROJECTS_PACKAGE}.") and PROJECTS_PACKAGE not in sys.modules:
+            # The directories of the projects are its subpackages, so the models can import each other
+            package = types.ModuleType(PROJECTS_PACKAGE)
+            package.__path__ = [str(PROJECTS_DIRECTORY)]
+            sys.modules[PROJECTS_PACKAGE] = package
         for file_path in model_path.glob("*.py"):
             if str(file_path).endswith("__init__.py"):
                 continue
             logger.info("Checking %s", file_path)
-            module = import_module(f"models.{file_path.stem}")
+            module = import_module(f"{project_models.package}.{file_path.stem}")
             for attribute_name in dir(module):
                 attribute = getattr(module, attribute_name)
 
@@ -97,11 +205,11 @@ class ModelManager(object):
                 ):
                     model_name: str = attribute.__name__
                     if issubclass(attribute, NodeModel):
-                        self._models["node"][model_name] = attribute
+                        project_models.models["node"][model_name] = attribute
                         # self._node_type_models[model_name] = attribute
                         logger.debug("Loaded node model %s", model_name)
                     elif issubclass(attribute, EdgeModel):
-                        self._models["edge"][model_name] = attribute
+                        project_models.models["edge"][model_name] = attribute
                         # self._edge_type_models[model_name] = attribute
                         logger.debug("Loaded edge model %s", model_name)
                     else:
@@ -110,22 +218,23 @@ class ModelManager(object):
                             model_name,
                         )
                         continue
-                    self._all_optional_models[model_name] = self._make_partial_model(
+                    project_models.optional_models[model_name] = self._make_partial_model(
                         attribute
                     )
                 else:
                     continue
-        if len(self._models["node"]) + len(self._models["edge"]) == 0:
+        if len(project_models.models["node"]) + len(project_models.models["edge"]) == 0:
             logger.warning("No models found.")
 
         logger.info(
-            "Loaded %d node models and %d edge models",
-            len(self._models["node"]),
-            len(self._models["edge"]),
+            "Loaded %d node models and %d edge models of project %s",
+            len(project_models.models["node"]),
+            len(project_models.models["edge"]),
+            project_models.project,
         )
-        logger.info("Loaded models: %s", self._models)
-        logger.info("Partial models: %s", self._all_optional_models)
-        self.last_reload = datetime.now()
+        logger.info("Loaded models: %s", project_models.models)
+        logger.info("Partial models: %s", project_models.optional_models)
+        project_models.last_reload = datetime.now()
 
     def remove_model(self, model_name: str) -> None:
         """
@@ -137,7 +246,7 @@ class ModelManager(object):
         if self.is_model_present(model_name):
             for models_of_type in self._models.values():
                 if model_name in models_of_type:
-                    os.remove(f"models/{model_name}.py")
+                    os.remove(self._project_models().directory / f"{model_name}.py")
                     del models_of_type[model_name]
                     return
         raise ModelNotFoundError(f"Model not found: {model_name}")
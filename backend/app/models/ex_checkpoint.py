@@ -1,9 +1,13 @@
+from pydantic import Field
+
 from gagm_base.node_model import NodeModel
 from .ex_location import Location
 
 
 class Checkpoint(NodeModel):
-    location: Location
+    location: Location = Field(
+        json_schema_extra={"index": {"type": "persistent", "fields": ["x", "y"]}}
+    )
     activation_radius: float
 
     class Config:
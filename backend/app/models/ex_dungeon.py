@@ -1,10 +1,10 @@
 from gagm_base.node_model import NodeModel
-from pydantic import field_validator
+from pydantic import Field, field_validator
 from .ex_location import Location
 
 
 class Dungeon(NodeModel):
-    name: str
+    name: str = Field(json_schema_extra={"index": "persistent"})
     max_players: int = 1
     starting_point: Location
     description: str
@@ -1,10 +1,15 @@
+from pydantic import Field
+
 from gagm_base.node_model import NodeModel
 from .ex_position import Position
 
 
 class Enemy(NodeModel):
-    enemy_type: str
-    spawn: Position = Position(x=0.0, y=0.0, z=0.0, yaw=45.0, pitch=45.0)
+    enemy_type: str = Field(json_schema_extra={"index": "persistent"})
+    spawn: Position = Field(
+        default=Position(x=0.0, y=0.0, z=0.0, yaw=45.0, pitch=45.0),
+        json_schema_extra={"index": {"type": "persistent", "fields": ["x", "y"]}},
+    )
 
     class Config:
         """
@@ -1,9 +1,11 @@
+from pydantic import Field
+
 from gagm_base.node_model import NodeModel
 from .ex_position import Position
 
 
 class NPC(NodeModel):
-    npc_name: str
+    npc_name: str = Field(json_schema_extra={"index": "persistent"})
     pos: Position = Position(x=0.0, y=0.0, z=0.0, yaw=45.0, pitch=45.0)
 
     class Config:
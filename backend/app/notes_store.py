@@ -0,0 +1,126 @@
+"""
+notes_store.py
+
+This module contains the storage format of the notes of the assets.
+
+The markdown notes are stored out of line in the `AssetNotes` collection, one
+document per asset keyed by its ID, so loading assets and traversing the graph
+never transfers them. The notes document carries the ETag (SHA-1 of the
+notes) of the content, so conditional reads don't need the content. Notes
+above a threshold can be stored gzip compressed, compressed notes are not
+indexed by the search.
+"""
+
+import base64
+import gzip
+import hashlib
+import os
+import re
+from typing import Optional
+
+from pydantic import BaseModel
+
+NOTES_COLLECTION = "AssetNotes"
+# none or gzip
+NOTES_COMPRESSION = os.environ.get("NOTES_COMPRESSION", "none")
+NOTES_COMPRESSION_THRESHOLD = int(os.environ.get("NOTES_COMPRESSION_THRESHOLD", 4096))
+
+
+class RangeNotSatisfiableError(Exception):
+    """
+    Raised when a requested byte range is outside of the notes.
+    """
+
+    pass
+
+
+class StoredNotes(BaseModel):
+    content: str = ""
+    etag: str
+
+
+def notes_key(asset_id: str) -> str:
+    """
+    Key of the notes document of an asset, `/` isn't allowed in keys.
+    """
+    return asset_id.replace("/", ":")
+
+
+def notes_etag(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def notes_document(asset_id: str, content: str) -> dict:
+    """
+    Build the stored document of the notes of an asset.
+
+    Args:
+        asset_id (str): ID of the asset.
+        content (str): The markdown notes.
+
+    Returns:
+        dict: The document.
+    """
+    encoded = content.encode("utf-8")
+    document = {
+        "_key": notes_key(asset_id),
+        "asset_id": asset_id,
+        "etag": hashlib.sha1(encoded).hexdigest(),
+    }
+    if NOTES_COMPRESSION == "gzip" and len(encoded) >= NOTES_COMPRESSION_THRESHOLD:
+        document["encoding"] = "gzip"
+        document["blob"] = base64.b64encode(gzip.compress(encoded, compresslevel=6)).decode("ascii")
+    else:
+        document["encoding"] = "identity"
+        document["content"] = content
+    return document
+
+
+def decode_notes(document: Optional[dict]) -> StoredNotes:
+    """
+    Read the notes from their stored document.
+
+    Args:
+        document (dict, optional): The stored document, None if the asset has no notes.
+
+    Returns:
+        StoredNotes: The notes and their ETag.
+    """
+    if not document:
+        return StoredNotes(etag=notes_etag(""))
+    if document.get("encoding") == "gzip":
+        content = gzip.decompress(base64.b64decode(document["blob"])).decode("utf-8")
+    else:
+        content = document.get("content") or ""
+    return StoredNotes(content=content, etag=document["etag"])
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single `Range: bytes=...` header.
+
+    Args:
+        header (str): The header value.
+        size (int): Size of the content in bytes.
+
+    Raises:
+        RangeNotSatisfiableError: If the range starts after the end of the content.
+
+    Returns:
+        Optional[tuple[int, int]]: First and last byte (inclusive), None if the
+            header isn't a single byte range, the whole content is returned then.
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        # Suffix range, the last n bytes
+        length = int(match.group(2))
+        if length == 0:
+            raise RangeNotSatisfiableError(header)
+        return max(0, size - length), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiableError(header)
+    return start, min(end, size - 1)
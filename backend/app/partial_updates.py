@@ -0,0 +1,108 @@
+"""
+partial_updates.py
+
+This module contains the validation of partial updates (PATCH) of assets.
+
+A partial update only holds the fields that changed. It is validated with
+the partial model of the asset type (every field optional), the unset
+fields are dropped, nested objects keep only their set fields too. The
+DataManager merges the changes into the stored document with the
+`mergeObjects` and `keepNull` semantics of an ArangoDB update: nested
+objects are merged, other values (including lists) are replaced and null
+sets a field to null.
+
+The whole merged document is validated with the model of the asset type,
+so field validators and the validators of the model that check several
+fields together see the stored values of the unchanged fields.
+"""
+
+import types
+from typing import Any, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from exceptions.data_exceptions import InvalidPatchError
+
+# Attributes that identify the document, they can't be changed by a partial update
+IMMUTABLE_FIELDS = ("_key", "_id", "_rev")
+
+
+def _accepts_none(annotation: Any) -> bool:
+    if annotation is None or annotation is type(None) or annotation is Any:
+        return True
+    return get_origin(annotation) in (Union, types.UnionType) and type(None) in get_args(annotation)
+
+
+def parse_changes(partial_model: Type[BaseModel], data: dict) -> dict:
+    """
+    Validate the body of a partial update.
+
+    Args:
+        partial_model (Type[BaseModel]): The partial model of the asset type.
+        data (dict): The changed fields, by name or alias.
+
+    Raises:
+        ValidationError: If a field is invalid.
+        InvalidPatchError: If the key or ID is changed.
+
+    Returns:
+        dict: The changes as they are stored, by alias.
+    """
+    changes = partial_model.model_validate(data).model_dump(by_alias=True, exclude_unset=True)
+    immutable = [name for name in IMMUTABLE_FIELDS if name in changes]
+    if immutable:
+        raise InvalidPatchError(f"{', '.join(immutable)} can't be changed.")
+    return changes
+
+
+def merge(document: dict, changes: dict, keep_null: bool = True) -> dict:
+    """
+    Merge changes into a document like an ArangoDB update with `mergeObjects`.
+
+    Args:
+        document (dict): The stored document.
+        changes (dict): The changes.
+        keep_null (bool, optional): Store nulls instead of removing the attributes. Defaults to True.
+
+    Returns:
+        dict: A merged copy of the document.
+    """
+    merged = dict(document)
+    for attribute, value in changes.items():
+        if value is None and not keep_null:
+            merged.pop(attribute, None)
+        elif isinstance(value, dict) and isinstance(merged.get(attribute), dict):
+            merged[attribute] = merge(merged[attribute], value, keep_null)
+        else:
+            merged[attribute] = value
+    return merged
+
+
+def validate_merge(model: Type[BaseModel], document: dict, changes: dict) -> BaseModel:
+    """
+    Validate the result of merging changes into a stored document.
+
+    Args:
+        model (Type[BaseModel]): The model of the asset type.
+        document (dict): The stored document.
+        changes (dict): The changes returned by `parse_changes`.
+
+    Raises:
+        ValidationError: If the merged document is invalid.
+        InvalidPatchError: If a required field is set to null.
+
+    Returns:
+        BaseModel: The merged asset.
+    """
+    merged = merge(document, changes)
+    fields = {field.alias or name: field for name, field in model.model_fields.items()}
+    nulls = [
+        attribute
+        for attribute in changes
+        if merged[attribute] is None
+        and attribute in fields
+        and not _accepts_none(fields[attribute].annotation)
+    ]
+    if nulls:
+        raise InvalidPatchError(f"{', '.join(nulls)} can't be null.")
+    return model.model_validate(merged)
@@ -0,0 +1,239 @@
+"""
+project_context.py
+
+This module contains the routing of the requests to the projects.
+
+One deployment serves several projects (e.g. games). Every project has its
+own database holding its own `gagm` graph and its own model set, a request
+selects its project with the `X-GAGM-PROJECT` header. Requests without the
+header use the default project, whose database is the `gagm` database of
+single-project deployments. The databases of all projects are opened on the
+one client of `ArangoDB`, so the projects share its connection pools.
+
+A project exists if it's the default project or if `PROJECTS_DIRECTORY` has
+a directory of its models, e.g. `projects/dungeon_crawler/*.py`. Its
+database, graph and collections are created by its first request in a
+worker. Unknown projects are rejected, a header can't create databases.
+
+The usage of the projects (requests, ArangoDB requests and AQL execution
+time) is counted per worker and shown by the `/admin/projects` endpoint.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from db_executor import run_db
+from instrumentation import PROJECT_QUERY_SECONDS, PROJECT_REQUESTS
+
+logger = logging.getLogger("uvicorn")
+
+DEFAULT_PROJECT = os.environ.get("DEFAULT_PROJECT", "gagm")
+PROJECTS_DIRECTORY = Path(
+    os.environ.get("PROJECTS_DIRECTORY", Path(__file__).parent.resolve() / "projects")
+)
+# Header selecting the project of a request
+PROJECT_HEADER = "X-GAGM-PROJECT"
+# A valid database name of ArangoDB and a valid name of the package of the models
+PROJECT_ID_PATTERN = r"^[a-z][a-z0-9_]{0,63}$"
+
+_PROJECT_ID = re.compile(PROJECT_ID_PATTERN)
+
+# The project of the current request
+current_project: ContextVar[str] = ContextVar("current_project", default=DEFAULT_PROJECT)
+
+
+class ProjectNotFoundError(Exception):
+    """
+    Raised when a project doesn't exist.
+    """
+
+    pass
+
+
+class ProjectUsage(BaseModel):
+    """
+    Resource usage of a project in a worker.
+    """
+
+    requests: int = 0
+    # Responses with a 5xx status
+    errors: int = 0
+    request_seconds: float = 0.0
+    arango_requests: int = 0
+    arango_bytes_sent: int = 0
+    aql_queries: int = 0
+    # Server-side execution time of the AQL queries
+    aql_seconds: float = 0.0
+
+
+class ProjectReport(BaseModel):
+    project: str
+    # The models and the database of the project are loaded in this worker
+    active: bool = False
+    models: int = 0
+    usage: ProjectUsage = ProjectUsage()
+    # Documents and bytes (documents and indexes) of the collections, only if requested
+    documents: Optional[int] = None
+    size: Optional[int] = None
+
+
+_usage: dict[str, ProjectUsage] = {}
+_usage_lock = threading.Lock()
+
+
+def get_current_project() -> str:
+    return current_project.get()
+
+
+@contextmanager
+def use_project(project: str) -> Iterator[None]:
+    """
+    Run a block in a project, e.g. a job of every project outside of a request.
+
+    Args:
+        project (str): The project.
+    """
+    token = current_project.set(project)
+    try:
+        yield
+    finally:
+        current_project.reset(token)
+
+
+def is_project_id(value: str) -> bool:
+    return _PROJECT_ID.match(value) is not None
+
+
+def project_exists(project: str) -> bool:
+    return project == DEFAULT_PROJECT or (
+        is_project_id(project) and (PROJECTS_DIRECTORY / project).is_dir()
+    )
+
+
+def list_projects() -> list[str]:
+    """
+    Get the existing projects.
+
+    Returns:
+        list[str]: The default project first, then the projects of `PROJECTS_DIRECTORY` by name.
+    """
+    projects = [DEFAULT_PROJECT]
+    if PROJECTS_DIRECTORY.is_dir():
+        projects.extend(
+            sorted(
+                path.name
+                for path in PROJECTS_DIRECTORY.iterdir()
+                if path.is_dir() and is_project_id(path.name) and path.name != DEFAULT_PROJECT
+            )
+        )
+    return projects
+
+
+def _project_usage(project: str) -> ProjectUsage:
+    usage = _usage.get(project)
+    if usage is None:
+        usage = _usage[project] = ProjectUsage()
+    return usage
+
+
+def record_request(project: str, seconds: float, status_code: int) -> None:
+    PROJECT_REQUESTS.inc(project)
+    with _usage_lock:
+        usage = _project_usage(project)
+        usage.requests += 1
+        usage.errors += status_code >= 500
+        usage.request_seconds += seconds
+
+
+def record_arango_request(bytes_sent: int) -> None:
+    """
+    Count a request to ArangoDB in the current project.
+    """
+    with _usage_lock:
+        usage = _project_usage(get_current_project())
+        usage.arango_requests += 1
+        usage.arango_bytes_sent += bytes_sent
+
+
+def record_query(server_seconds: float) -> None:
+    """
+    Count an AQL execution in the current project.
+    """
+    project = get_current_project()
+    PROJECT_QUERY_SECONDS.inc(project, amount=server_seconds)
+    with _usage_lock:
+        usage = _project_usage(project)
+        usage.aql_queries += 1
+        usage.aql_seconds += server_seconds
+
+
+def get_usage() -> dict[str, ProjectUsage]:
+    with _usage_lock:
+        return {project: usage.model_copy() for project, usage in _usage.items()}
+
+
+class ProjectMiddleware:
+    """
+    ASGI middleware that selects the project of every HTTP request and counts its usage.
+    The first request of a project in the worker activates it (loads its models and opens
+    its database) in the database thread pool.
+    """
+
+    def __init__(self, app, activate: Callable[[str], Any]):
+        self.app = app
+        self._activate = activate
+        self._active: set[str] = set()
+
+    def _header(self, scope: dict) -> Optional[str]:
+        name = PROJECT_HEADER.lower().encode("latin-1")
+        for key, value in scope["headers"]:
+            if key == name:
+                return value.decode("latin-1").strip()
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        project = self._header(scope) or DEFAULT_PROJECT
+        if project not in self._active:
+            if not is_project_id(project):
+                response = JSONResponse(
+                    status_code=400, content={"detail": f"Invalid project id: {project}"}
+                )
+                await response(scope, receive, send)
+                return
+            if not project_exists(project):
+                response = JSONResponse(
+                    status_code=404, content={"detail": f"Project not found: {project}"}
+                )
+                await response(scope, receive, send)
+                return
+            await run_db(self._activate, project)
+            self._active.add(project)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = current_project.set(project)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_project.reset(token)
+            record_request(project, time.perf_counter() - start, status_code)
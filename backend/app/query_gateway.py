@@ -0,0 +1,346 @@
+"""
+query_gateway.py
+
+This module contains the gateway of the AQL queries.
+
+Every AQL query of the backend is registered once with a name and its
+execution options (batch size, memory limit, maximum runtime) and executed
+through the gateway. The gateway records the execution statistics of the
+cursors per query and captures the `EXPLAIN` plan of slow executions into a
+ring buffer, which can be inspected through the admin endpoints.
+
+Queries that are compiled at runtime (e.g. from a filter of the client) are
+registered once as `dynamic` and executed with their text, their statistics
+are aggregated under the registered name.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+from typing import Any, Deque, Optional
+
+from arango.database import Database
+from arango.exceptions import AQLQueryExplainError
+from pydantic import BaseModel
+
+from arango_connector import ArangoDB
+from instrumentation import AQL_EXECUTION, AQL_ROWS, span
+from project_context import record_query
+
+logger = logging.getLogger("uvicorn")
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("AQL_BATCH_SIZE", 1000))
+# Bytes, 0 uses the limit of the server
+DEFAULT_MEMORY_LIMIT = int(os.environ.get("AQL_MEMORY_LIMIT", 0))
+# Seconds, 0 disables the limit
+DEFAULT_MAX_RUNTIME = float(os.environ.get("AQL_MAX_RUNTIME", 0))
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", 0.5))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 100))
+# Minimum time between two explains of the same query
+EXPLAIN_COOLDOWN_SECONDS = float(os.environ.get("EXPLAIN_COOLDOWN_SECONDS", 60))
+
+
+class QueryNotRegisteredError(Exception):
+    """
+    Raised when an unknown query is executed.
+    """
+
+    pass
+
+
+class NamedQuery(BaseModel):
+    """
+    A registered AQL query and its execution options.
+    """
+
+    name: str
+    query: str
+    description: str = ""
+    batch_size: int = DEFAULT_BATCH_SIZE
+    memory_limit: int = DEFAULT_MEMORY_LIMIT
+    max_runtime: float = DEFAULT_MAX_RUNTIME
+    profile: bool = False
+    # The text is passed on execution
+    dynamic: bool = False
+    # May run on a read replica, see read_routing.py
+    read_only: bool = False
+
+    class Config:
+        frozen = True
+
+
+class QueryStats(BaseModel):
+    """
+    Aggregated execution statistics of a query.
+    """
+
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    server_seconds: float = 0.0
+    rows: int = 0
+    scanned_full: int = 0
+    scanned_index: int = 0
+    filtered: int = 0
+    peak_memory_usage: int = 0
+    slow: int = 0
+
+
+class SlowQuery(BaseModel):
+    """
+    A slow execution of a query and its plan.
+    """
+
+    name: str
+    timestamp: datetime
+    seconds: float
+    bind_vars: dict[str, Any]
+    statistics: dict[str, Any]
+    profile: Optional[dict[str, Any]] = None
+    full_scans: list[str] = []
+    indexes: list[dict[str, Any]] = []
+    estimated_cost: Optional[float] = None
+    rules: list[str] = []
+    warnings: list[dict[str, Any]] = []
+    plan: Optional[dict[str, Any]] = None
+
+
+_QUERIES: dict[str, NamedQuery] = {}
+
+
+def register_query(name: str, query: str, description: str = "", **options: Any) -> NamedQuery:
+    """
+    Register a named query.
+
+    Args:
+        name (str): Unique name of the query, used in the statistics and metrics.
+        query (str): The AQL query, values are passed as bind variables.
+        description (str, optional): What the query is for.
+        **options: Execution options of `NamedQuery`.
+
+    Returns:
+        NamedQuery: The registered query.
+    """
+    if name in _QUERIES and _QUERIES[name].query != query:
+        raise ValueError(f"Query {name} is already registered with a different text.")
+    _QUERIES[name] = NamedQuery(name=name, query=query, description=description, **options)
+    return _QUERIES[name]
+
+
+def get_registered_queries() -> dict[str, NamedQuery]:
+    return dict(_QUERIES)
+
+
+def _summarize_bind_vars(bind_vars: dict) -> dict[str, Any]:
+    """
+    Sizes of collection values, other values as they are. Keeps the log small.
+    """
+    return {
+        key: f"<{type(value).__name__} of {len(value)}>"
+        if isinstance(value, (list, dict))
+        else value
+        for key, value in bind_vars.items()
+    }
+
+
+class QueryGateway(object):
+    """
+    QueryGateway class. This class is a singleton.
+    Executes the registered AQL queries.
+    """
+
+    _instance = None
+
+    _stats: dict[str, QueryStats]
+    _slow_queries: Deque[SlowQuery]
+    _last_explain: dict[str, float]
+    _lock: threading.Lock
+    _explainer: ThreadPoolExecutor
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(QueryGateway, cls).__new__(cls)
+            cls._instance._stats = {}
+            cls._instance._slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+            cls._instance._last_explain = {}
+            cls._instance._lock = threading.Lock()
+            # Explains run in the background, the slow request doesn't wait for them
+            cls._instance._explainer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="aql-explain"
+            )
+        return cls._instance
+
+    def execute(
+        self,
+        name: str,
+        bind_vars: Optional[dict] = None,
+        db: Optional[Database] = None,
+        query: Optional[str] = None,
+    ) -> list:
+        """
+        Execute a registered query and fetch every row.
+
+        Args:
+            name (str): Name of the query.
+            bind_vars (dict, optional): The bind variables.
+            db (Database, optional): Database to run the query in (e.g. a transaction).
+                Defaults to the database of the project of the request.
+            query (str, optional): Text of a dynamic query.
+
+        Raises:
+            QueryNotRegisteredError: If the query is not registered.
+            ValueError: If the text of a dynamic query is missing or given for a static one.
+
+        Returns:
+            list: The rows.
+        """
+        named_query = _QUERIES.get(name)
+        if named_query is None:
+            raise QueryNotRegisteredError(f"Query {name} is not registered.")
+        if named_query.dynamic != (query is not None):
+            raise ValueError(f"The text of query {name} must be passed if and only if it is dynamic.")
+        if query is not None:
+            named_query = named_query.model_copy(update={"query": query})
+        bind_vars = bind_vars or {}
+        if db is not None:
+            database = db
+        elif named_query.read_only:
+            database = ArangoDB().read_database()
+        else:
+            database = ArangoDB().database()
+        start = time.perf_counter()
+        try:
+            with span("arango.aql", query=name) as attributes:
+                cursor = database.aql.execute(
+                    named_query.query,
+                    bind_vars=bind_vars,
+                    batch_size=named_query.batch_size,
+                    memory_limit=named_query.memory_limit,
+                    max_runtime=named_query.max_runtime or None,
+                    profile=named_query.profile or None,
+                )
+                rows = list(cursor)  # type: ignore
+                attributes["rows"] = len(rows)
+        except Exception:
+            with self._lock:
+                self._stats.setdefault(name, QueryStats()).errors += 1
+            raise
+        seconds = time.perf_counter() - start
+        statistics = dict(cursor.statistics() or {})  # type: ignore
+        self._record(name, seconds, len(rows), statistics)
+        if seconds >= SLOW_QUERY_SECONDS:
+            self._capture_slow_query(
+                named_query, database, bind_vars, seconds, statistics, cursor.profile(), cursor.warnings()  # type: ignore
+            )
+        return rows
+
+    def _record(self, name: str, seconds: float, rows: int, statistics: dict) -> None:
+        server_seconds = statistics.get("execution_time") or 0.0
+        AQL_EXECUTION.observe(server_seconds, name)
+        AQL_ROWS.inc(name, amount=rows)
+        record_query(server_seconds)
+        with self._lock:
+            stats = self._stats.setdefault(name, QueryStats())
+            stats.calls += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.server_seconds += server_seconds
+            stats.rows += rows
+            stats.scanned_full += statistics.get("scanned_full", 0)
+            stats.scanned_index += statistics.get("scanned_index", 0)
+            stats.filtered += statistics.get("filtered", 0)
+            stats.peak_memory_usage = max(
+                stats.peak_memory_usage, statistics.get("peak_memory_usage", 0)
+            )
+            stats.slow += seconds >= SLOW_QUERY_SECONDS
+
+    def _capture_slow_query(
+        self,
+        named_query: NamedQuery,
+        database: Database,
+        bind_vars: dict,
+        seconds: float,
+        statistics: dict,
+        profile: Optional[dict],
+        warnings: Optional[list],
+    ) -> None:
+        logger.warning(
+            "Slow query %s took %.3f s (%s)", named_query.name, seconds, statistics
+        )
+        entry = SlowQuery(
+            name=named_query.name,
+            timestamp=datetime.now(),
+            seconds=seconds,
+            bind_vars=_summarize_bind_vars(bind_vars),
+            statistics=statistics,
+            profile=profile,
+            warnings=warnings or [],
+        )
+        with self._lock:
+            self._slow_queries.append(entry)
+            last_explain = self._last_explain.get(named_query.name, 0.0)
+            if time.monotonic() - last_explain < EXPLAIN_COOLDOWN_SECONDS:
+                return
+            self._last_explain[named_query.name] = time.monotonic()
+        # In the context of the request, the requests of the explain count for its project
+        self._explainer.submit(copy_context().run, self._explain, named_query, database, bind_vars, entry)
+
+    def _explain(
+        self, named_query: NamedQuery, database: Database, bind_vars: dict, entry: SlowQuery
+    ) -> None:
+        """
+        Explain a slow query and attach the plan to its log entry.
+        """
+        try:
+            plan: dict = database.aql.explain(named_query.query, bind_vars=bind_vars)  # type: ignore
+        except AQLQueryExplainError as error:
+            logger.warning("Explaining query %s failed: %s", named_query.name, error)
+            return
+        full_scans = []
+        indexes = []
+        for node in plan.get("nodes", []):
+            if node.get("type") == "EnumerateCollectionNode":
+                full_scans.append(node.get("collection", "?"))
+            for index in node.get("indexes", []):
+                indexes.append(
+                    {
+                        "collection": node.get("collection"),
+                        "type": index.get("type"),
+                        "fields": index.get("fields"),
+                        "name": index.get("name"),
+                    }
+                )
+        entry.full_scans = full_scans
+        entry.indexes = indexes
+        entry.estimated_cost = plan.get("estimatedCost")
+        entry.rules = plan.get("rules", [])
+        entry.plan = plan
+
+    def get_stats(self) -> dict[str, QueryStats]:
+        with self._lock:
+            return {name: stats.model_copy() for name, stats in self._stats.items()}
+
+    def get_slow_queries(self, name: Optional[str] = None, limit: int = SLOW_QUERY_LOG_SIZE) -> list[SlowQuery]:
+        """
+        Get the logged slow queries, newest first.
+
+        Args:
+            name (str, optional): Only the executions of this query.
+            limit (int, optional): Maximum number of entries.
+
+        Returns:
+            list[SlowQuery]: The slow queries.
+        """
+        with self._lock:
+            entries = [entry for entry in reversed(self._slow_queries) if name in (None, entry.name)]
+        return entries[:limit]
+
+    def clear_slow_queries(self) -> None:
+        with self._lock:
+            self._slow_queries.clear()
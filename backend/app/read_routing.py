@@ -0,0 +1,367 @@
+"""
+read_routing.py
+
+This module contains the routing of the reads to the read replicas of ArangoDB.
+
+Writes always go to the leader (`GRAPH_DB_HOSTS`). The hosts of
+`GRAPH_DB_READ_HOSTS` (the followers of an active failover deployment, or
+coordinators of a cluster reading from the shard followers) serve the queries
+registered as `read_only`, with the `X-Arango-Allow-Dirty-Read` header. Every
+worker runs a monitor thread that writes a heartbeat to the leader every
+`GRAPH_DB_REPLICATION_CHECK_INTERVAL` seconds and reads it back from every
+replica: the age of the copy of a replica is its lag. Replicas lagging more
+than `GRAPH_DB_READ_MAX_STALENESS` seconds, or that can't be reached, don't
+get reads until they catch up, the leader serves them meanwhile.
+
+Read-your-writes: the responses of writes carry the last written revision of
+the session in the `X-GAGM-LAST-WRITE` header and cookie, the clients send it
+back with their next requests (the cookie does it for browsers and
+`requests.Session`). A read of the session only goes to a replica whose copy
+of the heartbeat has a newer revision. `_rev` values are hybrid logical clock
+timestamps of the leader, writes without a known revision (e.g. tags or
+deletes) use the revision of the current time. Comparing the revisions relies
+on one leader (active failover) or synchronized clocks (cluster).
+"""
+
+import functools
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from http.cookies import CookieError, SimpleCookie
+from typing import Callable, Optional
+
+from arango.client import ArangoClient
+from arango.database import Database
+
+logger = logging.getLogger("uvicorn")
+
+# Header and cookie with the last written revision of the session
+LAST_WRITE_HEADER = "X-GAGM-LAST-WRITE"
+LAST_WRITE_COOKIE = "gagm_last_write"
+HEARTBEAT_COLLECTION = "ReplicationHeartbeat"
+HEARTBEAT_KEY = "heartbeat"
+# POST endpoints that only read, their responses don't carry a revision
+READ_ONLY_POSTS = re.compile(r"^/data/(filtered|[^/]+/query)$|^/export/bundle/filtered$")
+
+# Digits of the encoded hybrid logical clock timestamps of ArangoDB
+_REVISION_ALPHABET = "-_ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+_REVISION_DIGITS = {digit: value for value, digit in enumerate(_REVISION_ALPHABET)}
+# The lower bits of a timestamp are a logical counter, the upper bits milliseconds
+_LOGICAL_BITS = 20
+
+
+def decode_revision(rev: str) -> int:
+    """
+    Decode a `_rev` into its hybrid logical clock timestamp, revisions compare by it.
+
+    Returns:
+        int: The timestamp, 0 if the revision isn't a timestamp (e.g. of an old server).
+    """
+    value = 0
+    for digit in rev:
+        if digit not in _REVISION_DIGITS:
+            return 0
+        value = value * 64 + _REVISION_DIGITS[digit]
+    return value
+
+
+def encode_revision(value: int) -> str:
+    digits = []
+    while value > 0:
+        value, digit = divmod(value, 64)
+        digits.append(_REVISION_ALPHABET[digit])
+    return "".join(reversed(digits)) or _REVISION_ALPHABET[0]
+
+
+def revision_at(seconds: float) -> int:
+    """
+    The timestamp of the revisions written at a time.
+    """
+    return int(seconds * 1000) << _LOGICAL_BITS
+
+
+class ReadSession(object):
+    """
+    The revisions of the session of a request.
+    """
+
+    __slots__ = ("min_revision", "written")
+
+    def __init__(self, min_revision: int = 0):
+        # Last revision the client wrote before the request
+        self.min_revision = min_revision
+        # Last revision written by the request
+        self.written = 0
+
+
+_current_session: ContextVar[Optional[ReadSession]] = ContextVar("read_session", default=None)
+
+
+def session_min_revision() -> int:
+    """
+    The revision a replica must have replicated to serve the reads of the request.
+    """
+    session = _current_session.get()
+    if session is None:
+        return 0
+    return max(session.min_revision, session.written)
+
+
+def note_write(rev: Optional[str] = None) -> None:
+    """
+    Record a written revision in the session of the request.
+    Writes without a `_rev` (e.g. deletes) record the revision of the current time.
+    """
+    session = _current_session.get()
+    if session is not None:
+        written = decode_revision(rev) if rev else revision_at(time.time())
+        session.written = max(session.written, written)
+
+
+def records_write(method):
+    """
+    Records the revision of the result of a write in the session of the request,
+    the `rev` of the result if it has one.
+    """
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        result = method(*args, **kwargs)
+        note_write(getattr(result, "rev", None))
+        return result
+
+    return wrapper
+
+
+class ReadReplica(object):
+    """
+    A read host with its client and its replication state.
+    """
+
+    def __init__(self, host: str, client: ArangoClient, user: str, password: str):
+        self.host = host
+        self.client = client
+        self._user = user
+        self._password = password
+        self._databases: dict[str, Database] = {}
+        # Seconds since the replica last caught up with the leader, None if unknown
+        self.lag: Optional[float] = None
+        # Timestamp of the revision of its copy of the heartbeat
+        self.revision = 0
+        self.error: Optional[str] = None
+        self.reads = 0
+
+    def database(self, name: str) -> Database:
+        database = self._databases.get(name)
+        if database is None:
+            # Uses the sessions of the client, no new connections are opened
+            database = self._databases[name] = self.client.db(
+                name=name, username=self._user, password=self._password
+            )
+        return database
+
+    def read_heartbeat(self, name: str) -> Optional[dict]:
+        """
+        Read the copy of the heartbeat of the replica.
+
+        Args:
+            name (str): The database of the heartbeat.
+
+        Returns:
+            Optional[dict]: The heartbeat, None if it wasn't replicated yet.
+        """
+        database = self.database(name)
+        if not database.has_collection(HEARTBEAT_COLLECTION):
+            return None
+        return database.collection(HEARTBEAT_COLLECTION).get(HEARTBEAT_KEY)  # type: ignore
+
+    def stats(self) -> dict:
+        return {
+            "host": self.host,
+            "lag": self.lag,
+            "revision": encode_revision(self.revision) if self.revision else None,
+            "reads": self.reads,
+            "error": self.error,
+        }
+
+
+class ReadRouter(object):
+    """
+    Selects the replica of the reads and monitors the replication.
+    The monitor thread of a process starts with its first read.
+    """
+
+    def __init__(
+        self,
+        replicas: list[ReadReplica],
+        leader: Callable[[], Database],
+        heartbeat_database: str,
+        max_staleness: float,
+        check_interval: float,
+    ):
+        self.replicas = replicas
+        self.max_staleness = max_staleness
+        self.check_interval = check_interval
+        self.leader_reads = 0
+        self._leader = leader
+        self._heartbeat_database = heartbeat_database
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._monitor_pid: Optional[int] = None
+        self._heartbeat_ready = False
+
+    def select(self) -> Optional[ReadReplica]:
+        """
+        Select the replica of a read of the request, round-robin between the replicas
+        within the staleness that replicated the last write of the session.
+
+        Returns:
+            Optional[ReadReplica]: The replica, None if the read must go to the leader.
+        """
+        self._ensure_monitor()
+        min_revision = session_min_revision()
+        candidates = [
+            replica
+            for replica in self.replicas
+            if replica.lag is not None
+            and replica.lag <= self.max_staleness
+            and replica.revision >= min_revision
+        ]
+        with self._lock:
+            if not candidates:
+                self.leader_reads += 1
+                return None
+            replica = candidates[next(self._counter) % len(candidates)]
+            replica.reads += 1
+        return replica
+
+    def _ensure_monitor(self) -> None:
+        # Threads don't survive forking, every worker starts its own monitor
+        if self._monitor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._monitor_pid == os.getpid():
+                return
+            self._monitor_pid = os.getpid()
+            threading.Thread(target=self._monitor, name="replication-monitor", daemon=True).start()
+
+    def _monitor(self) -> None:
+        pid = os.getpid()
+        while self._monitor_pid == pid:
+            self.check()
+            time.sleep(self.check_interval)
+
+    def check(self) -> None:
+        """
+        Write the heartbeat to the leader and measure the lag of every replica.
+        """
+        try:
+            leader = self._leader()
+            if not self._heartbeat_ready:
+                if not leader.has_collection(HEARTBEAT_COLLECTION):
+                    leader.create_collection(HEARTBEAT_COLLECTION)
+                self._heartbeat_ready = True
+            leader.collection(HEARTBEAT_COLLECTION).insert(
+                {"_key": HEARTBEAT_KEY, "time": time.time()}, overwrite=True, silent=True
+            )
+        except Exception as error:
+            # Without the heartbeat the lag of the replicas can't be told
+            logger.warning("Writing the replication heartbeat failed: %s", error)
+            for replica in self.replicas:
+                replica.lag = None
+            return
+        for replica in self.replicas:
+            try:
+                copy = replica.read_heartbeat(self._heartbeat_database)
+            except Exception as error:
+                if replica.error is None:
+                    logger.warning("Read replica %s is unavailable: %s", replica.host, error)
+                replica.lag = None
+                replica.error = str(error)
+                continue
+            if replica.error is not None:
+                logger.info("Read replica %s is available again", replica.host)
+            replica.error = None
+            if copy is None:
+                # The heartbeat wasn't replicated yet
+                replica.lag = None
+                continue
+            replica.lag = max(0.0, time.time() - copy["time"])  # type: ignore
+            replica.revision = decode_revision(copy["_rev"])  # type: ignore
+
+    def close(self) -> None:
+        for replica in self.replicas:
+            replica.client.close()
+
+    def stats(self) -> dict:
+        return {
+            "max_staleness": self.max_staleness,
+            "leader_reads": self.leader_reads,
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+
+def _session_token(scope: dict) -> int:
+    header = LAST_WRITE_HEADER.lower().encode("latin-1")
+    cookies = None
+    for key, value in scope["headers"]:
+        if key == header:
+            return decode_revision(value.decode("latin-1").strip())
+        if key == b"cookie":
+            cookies = value.decode("latin-1")
+    if cookies:
+        try:
+            morsel = SimpleCookie(cookies).get(LAST_WRITE_COOKIE)
+        except CookieError:
+            return 0
+        if morsel is not None:
+            return decode_revision(morsel.value)
+    return 0
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware that keeps the last written revision of the sessions.
+    Reads the revision of the client from the header or the cookie, and sends the
+    revision written by a successful write back in both. Writes without a known
+    revision send the revision of the time of the response.
+    """
+
+    def __init__(self, app, enabled: bool = True):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        session = ReadSession(_session_token(scope))
+        writes = scope["method"] not in ("GET", "HEAD", "OPTIONS") and not (
+            scope["method"] == "POST" and READ_ONLY_POSTS.match(scope["path"])
+        )
+
+        async def send_with_revision(message):
+            if message["type"] == "http.response.start" and writes and message["status"] < 400:
+                revision = encode_revision(
+                    max(session.min_revision, session.written or revision_at(time.time()))
+                )
+                headers = list(message.get("headers", []))
+                headers.append((LAST_WRITE_HEADER.lower().encode("latin-1"), revision.encode("latin-1")))
+                headers.append(
+                    (
+                        b"set-cookie",
+                        f"{LAST_WRITE_COOKIE}={revision}; Path=/; HttpOnly; SameSite=Lax".encode("latin-1"),
+                    )
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_session.set(session)
+        try:
+            await self.app(scope, receive, send_with_revision)
+        finally:
+            _current_session.reset(token)
@@ -0,0 +1,319 @@
+"""
+revision_store.py
+
+This module contains the revision history of the assets.
+
+Every write of the DataManager appends a revision of the asset to the
+`AssetRevisions` collection in the same AQL query as the write, so the
+history can't miss or reorder writes. A revision stores either a full
+snapshot of the document or a JSON Patch from the previous revision:
+creations and every `REVISION_SNAPSHOT_INTERVAL`th revision are snapshots,
+the others only hold the changed top level attributes. Deletions store
+neither. The first update of a document that was written without a revision
+is a snapshot too.
+
+Reading revision K fetches the closest snapshot before it and the patches
+after the snapshot, never more than `REVISION_SNAPSHOT_INTERVAL` documents.
+The revision number of an asset is kept in its `gagm_revision` attribute and
+continues after a deletion if the asset is created again.
+
+Compaction drops the revisions older than the retention policy, the oldest
+kept revision is turned into a snapshot first.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Optional
+
+from arango.database import Database
+from pydantic import BaseModel
+
+import json_patch
+from index_manager import IndexDefinition, IndexSyncReport, sync_indexes
+
+REVISIONS_COLLECTION = "AssetRevisions"
+REVISION_FIELD = "gagm_revision"
+REVISION_SNAPSHOT_INTERVAL = max(1, int(os.environ.get("REVISION_SNAPSHOT_INTERVAL", 20)))
+# 0 keeps the revisions forever
+REVISION_RETENTION_DAYS = int(os.environ.get("REVISION_RETENTION_DAYS", 0))
+# 0 keeps every revision of an asset
+REVISION_MAX_PER_ASSET = int(os.environ.get("REVISION_MAX_PER_ASSET", 0))
+
+REVISION_INDEXES = [
+    IndexDefinition(type="persistent", fields=["asset_id", "revision"], unique=True),
+    IndexDefinition(type="persistent", fields=["timestamp"]),
+]
+
+
+def _last_revision(asset_id: str) -> str:
+    return f"""
+        LET last = FIRST(
+            FOR r IN {REVISIONS_COLLECTION}
+                FILTER r.asset_id == {asset_id}
+                SORT r.asset_id DESC, r.revision DESC
+                LIMIT 1
+                RETURN r.revision
+        ) || 0
+    """
+
+
+# Inserts the documents of @documents into a collection of the type @type_name
+REVISION_CREATE_QUERY = f"""
+    FOR document IN @documents
+        LET asset_id = CONCAT(@type_name, "/", document._key)
+        {_last_revision("asset_id")}
+        INSERT MERGE(document, {{{REVISION_FIELD}: last + 1}}) INTO @@collection OPTIONS {{keepNull: true}}
+        LET created = NEW
+        INSERT {{
+            asset_id: created._id,
+            revision: last + 1,
+            timestamp: DATE_ISO8601(DATE_NOW()),
+            operation: "create",
+            snapshot: UNSET(created, "_rev"),
+            patch: null
+        }} INTO {REVISIONS_COLLECTION}
+        RETURN created
+    """
+REVISION_UPDATE_QUERY = f"""
+    FOR doc IN @@collection
+        FILTER doc._key == @key
+        LET revision = (doc.{REVISION_FIELD} || 0) + 1
+        // With @rev the update fails with a conflict if the document changed since it was read
+        UPDATE (@rev == null ? doc : {{_key: doc._key, _rev: @rev}})
+            WITH MERGE(@document, {{{REVISION_FIELD}: revision}}) IN @@collection
+            OPTIONS {{mergeObjects: @merge_objects, keepNull: true, ignoreRevs: false}}
+        LET updated = NEW
+        LET changes = (
+            FOR attribute IN ATTRIBUTES(UNSET(@document, "_id", "_key", "_rev"))
+                FILTER !HAS(doc, attribute) OR doc[attribute] != updated[attribute]
+                RETURN {{
+                    op: HAS(doc, attribute) ? "replace" : "add",
+                    path: CONCAT("/", SUBSTITUTE(SUBSTITUTE(attribute, "~", "~0"), "/", "~1")),
+                    value: updated[attribute]
+                }}
+        )
+        // Documents written without a revision (e.g. seeded) have no snapshot yet
+        LET snapshot = !HAS(doc, "{REVISION_FIELD}") OR revision % @snapshot_interval == 0
+        INSERT {{
+            asset_id: doc._id,
+            revision: revision,
+            timestamp: DATE_ISO8601(DATE_NOW()),
+            operation: "update",
+            snapshot: snapshot ? UNSET(updated, "_rev") : null,
+            patch: snapshot ? null : PUSH(changes, {{
+                op: HAS(doc, "{REVISION_FIELD}") ? "replace" : "add",
+                path: "/{REVISION_FIELD}",
+                value: revision
+            }})
+        }} INTO {REVISIONS_COLLECTION}
+        RETURN updated
+    """
+REVISION_DELETE_QUERY = f"""
+    FOR asset_id IN @asset_ids
+        {_last_revision("asset_id")}
+        INSERT {{
+            asset_id: asset_id,
+            revision: last + 1,
+            timestamp: DATE_ISO8601(DATE_NOW()),
+            operation: "delete",
+            snapshot: null,
+            patch: null
+        }} INTO {REVISIONS_COLLECTION}
+        RETURN NEW.revision
+    """
+REVISION_LIST_QUERY = f"""
+    FOR r IN {REVISIONS_COLLECTION}
+        FILTER r.asset_id == @asset_id
+        FILTER @before == null OR r.revision < @before
+        SORT r.asset_id DESC, r.revision DESC
+        LIMIT @limit
+        RETURN KEEP(r, "asset_id", "revision", "timestamp", "operation")
+    """
+REVISION_CHAIN_QUERY = f"""
+    LET target = FIRST(
+        FOR r IN {REVISIONS_COLLECTION}
+            FILTER r.asset_id == @asset_id
+            FILTER @revision == null OR r.revision <= @revision
+            FILTER @timestamp == null OR r.timestamp <= @timestamp
+            SORT r.asset_id DESC, r.revision DESC
+            LIMIT 1
+            RETURN r
+    )
+    LET base = target == null OR target.operation == "delete" ? null : FIRST(
+        FOR r IN {REVISIONS_COLLECTION}
+            FILTER r.asset_id == @asset_id AND r.revision <= target.revision AND r.snapshot != null
+            SORT r.asset_id DESC, r.revision DESC
+            LIMIT 1
+            RETURN r
+    )
+    LET patches = base == null ? [] : (
+        FOR r IN {REVISIONS_COLLECTION}
+            FILTER r.asset_id == @asset_id AND r.revision > base.revision AND r.revision <= target.revision
+            SORT r.asset_id, r.revision
+            RETURN r.patch
+    )
+    RETURN {{
+        target: target == null ? null : KEEP(target, "asset_id", "revision", "timestamp", "operation"),
+        snapshot: base.snapshot,
+        patches: patches
+    }}
+    """
+REVISIONS_AT_QUERY = f"""
+    FOR r IN {REVISIONS_COLLECTION}
+        FILTER r.timestamp <= @timestamp
+        COLLECT asset_id = r.asset_id AGGREGATE revision = MAX(r.revision)
+        LET chain = (
+            FOR c IN {REVISIONS_COLLECTION}
+                FILTER c.asset_id == asset_id AND c.revision <= revision
+                SORT c.asset_id DESC, c.revision DESC
+                LIMIT @chain_length
+                RETURN KEEP(c, "revision", "operation", "snapshot", "patch")
+        )
+        FILTER chain[0].operation != "delete"
+        RETURN {{asset_id: asset_id, chain: chain}}
+    """
+# IDs of the assets written since a point in time, deletions included
+REVISION_CHANGES_QUERY = f"""
+    FOR r IN {REVISIONS_COLLECTION}
+        FILTER r.timestamp >= @since
+        COLLECT asset_id = r.asset_id
+        RETURN asset_id
+    """
+REVISION_COMPACTION_CANDIDATES_QUERY = f"""
+    FOR r IN {REVISIONS_COLLECTION}
+        COLLECT asset_id = r.asset_id AGGREGATE oldest = MIN(r.revision), latest = MAX(r.revision)
+        LET by_count = @keep > 0 ? latest - @keep + 1 : oldest
+        LET by_age = @before == null ? oldest : FIRST(
+            FOR k IN {REVISIONS_COLLECTION}
+                FILTER k.asset_id == asset_id AND k.timestamp >= @before
+                SORT k.asset_id, k.revision
+                LIMIT 1
+                RETURN k.revision
+        ) || latest
+        LET cutoff = MAX([by_count, by_age])
+        FILTER cutoff > oldest
+        RETURN {{asset_id: asset_id, cutoff: cutoff}}
+    """
+REVISION_COMPACT_QUERY = f"""
+    FOR r IN {REVISIONS_COLLECTION}
+        FILTER r.asset_id == @asset_id AND r.revision < @cutoff
+        REMOVE r IN {REVISIONS_COLLECTION}
+        COLLECT WITH COUNT INTO removed
+        RETURN removed
+    """
+REVISION_SET_SNAPSHOT_QUERY = f"""
+    FOR r IN {REVISIONS_COLLECTION}
+        FILTER r.asset_id == @asset_id AND r.revision == @revision
+        UPDATE r WITH {{snapshot: @snapshot, patch: null}} IN {REVISIONS_COLLECTION}
+            OPTIONS {{mergeObjects: false}}
+    """
+
+
+class RevisionOperationEnum(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class RevisionInfo(BaseModel):
+    asset_id: str
+    revision: int
+    timestamp: str
+    operation: RevisionOperationEnum
+
+
+class AssetRevision(RevisionInfo):
+    # None for deletions
+    document: Optional[dict] = None
+
+
+class CompactionReport(BaseModel):
+    assets: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+
+
+def format_timestamp(moment: datetime) -> str:
+    """
+    Format a point in time like `DATE_ISO8601()` of AQL (UTC, milliseconds),
+    the stored timestamps are compared as strings.
+    Naive datetimes are taken as UTC.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def ensure_revision_collection(db: Database) -> IndexSyncReport:
+    """
+    Create the revision collection and its indexes.
+
+    Args:
+        db (Database): The database.
+
+    Returns:
+        IndexSyncReport: The changes of the indexes.
+    """
+    if not db.has_collection(REVISIONS_COLLECTION):
+        db.create_collection(REVISIONS_COLLECTION)
+    return sync_indexes(db.collection(REVISIONS_COLLECTION), REVISION_INDEXES)
+
+
+def rebuild(snapshot: dict, patches: list[list[dict]]) -> dict:
+    """
+    Rebuild a revision from the closest snapshot before it.
+
+    Args:
+        snapshot (dict): The document of the snapshot.
+        patches (list[list[dict]]): The patches of the revisions after the snapshot, oldest first.
+
+    Returns:
+        dict: The document.
+    """
+    document = snapshot
+    for patch in patches:
+        document = json_patch.apply(document, patch)
+    return document
+
+
+def rebuild_chain(chain: list[dict]) -> Optional[dict]:
+    """
+    Rebuild the newest revision of a chain of revisions.
+
+    Args:
+        chain (list[dict]): The revisions, newest first, ending at a snapshot.
+
+    Returns:
+        Optional[dict]: The document, None if the chain has no snapshot.
+    """
+    patches: list[list[dict]] = []
+    for revision in chain:
+        if revision["snapshot"] is not None:
+            return rebuild(revision["snapshot"], patches[::-1])
+        patches.append(revision["patch"])
+    return None
+
+
+def retention_policy(
+    before: Optional[datetime] = None, keep: Optional[int] = None
+) -> tuple[Optional[str], int]:
+    """
+    Resolve the retention policy of a compaction, the settings are the defaults.
+
+    Args:
+        before (datetime, optional): Drop the revisions older than this. Defaults to
+            REVISION_RETENTION_DAYS ago, nothing is dropped by age if that is 0.
+        keep (int, optional): Revisions to keep per asset. Defaults to
+            REVISION_MAX_PER_ASSET, no limit if that is 0.
+
+    Returns:
+        tuple[Optional[str], int]: The formatted timestamp and the number of revisions to keep.
+    """
+    if before is None and REVISION_RETENTION_DAYS > 0:
+        before = datetime.now(timezone.utc) - timedelta(days=REVISION_RETENTION_DAYS)
+    return (
+        format_timestamp(before) if before is not None else None,
+        REVISION_MAX_PER_ASSET if keep is None else keep,
+    )
@@ -0,0 +1,201 @@
+"""
+admin.py
+
+This module contains the administrative endpoints of the backend.
+"""
+
+import logging
+from datetime import datetime
+from enum import Enum
+from pathlib import Path as OSPath
+from typing import List, Optional
+
+import anyio.to_thread
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+import auth_methods
+from arango_connector import ArangoDB
+from attachment_store import AttachmentCollectionReport
+from data_manager import DataManager
+from db_executor import run_db
+from instrumentation import SamplingProfiler
+from model_manager import ModelManager
+from project_context import ProjectReport, get_current_project, get_usage, list_projects
+from query_gateway import (
+    SLOW_QUERY_LOG_SIZE,
+    QueryGateway,
+    SlowQuery,
+    get_registered_queries,
+)
+from revision_store import CompactionReport
+
+logger = logging.getLogger("uvicorn")
+
+DOCS_BASE_PATH = OSPath("docs/endpoints/admin")
+
+router = APIRouter(dependencies=[Depends(auth_methods.authenticate_admin)])
+
+
+class ProfileFormat(str, Enum):
+    COLLAPSED = "collapsed"
+    TOP = "top"
+
+
+@router.get(
+    "/profile",
+    response_class=PlainTextResponse,
+    summary="Profile the worker with a sampling profiler.",
+    description=(DOCS_BASE_PATH / "profile.md").read_text(encoding="utf-8"),
+    responses={409: {"description": "A profile is already running."}},
+)
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=120, description="Duration of the profile"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="Time between the samples"),
+    output_format: ProfileFormat = Query(ProfileFormat.COLLAPSED, alias="format"),
+):
+    if SamplingProfiler.is_running():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+    try:
+        stacks = await anyio.to_thread.run_sync(
+            SamplingProfiler.profile, seconds, interval_ms / 1000
+        )
+    except RuntimeError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error)) from error
+    if output_format == ProfileFormat.TOP:
+        return PlainTextResponse(SamplingProfiler.top(stacks))
+    return PlainTextResponse(SamplingProfiler.collapsed(stacks))
+
+
+@router.get(
+    "/queries",
+    summary="List the registered AQL queries and their statistics.",
+    description=(DOCS_BASE_PATH / "queries.md").read_text(encoding="utf-8"),
+)
+def get_queries() -> dict[str, dict]:
+    stats = QueryGateway().get_stats()
+    return {
+        name: {
+            **query.model_dump(),
+            "stats": stats[name].model_dump() if name in stats else None,
+        }
+        for name, query in get_registered_queries().items()
+    }
+
+
+@router.get(
+    "/slow-queries",
+    summary="Get the slow query log.",
+    description=(DOCS_BASE_PATH / "slow_queries.md").read_text(encoding="utf-8"),
+)
+def get_slow_queries(
+    name: Optional[str] = Query(None, description="Only the executions of this query"),
+    limit: int = Query(SLOW_QUERY_LOG_SIZE, ge=1, le=SLOW_QUERY_LOG_SIZE),
+) -> list[SlowQuery]:
+    return QueryGateway().get_slow_queries(name, limit)
+
+
+@router.delete(
+    "/slow-queries",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Clear the slow query log.",
+)
+def clear_slow_queries():
+    QueryGateway().clear_slow_queries()
+
+
+@router.get(
+    "/indexes",
+    summary="Get the indexes of the collections with their build progress and usage.",
+    description=(DOCS_BASE_PATH / "indexes.md").read_text(encoding="utf-8"),
+)
+def get_indexes() -> dict[str, dict]:
+    models = ModelManager().get_all_models()
+    collection_names = [*models["node"], *models["edge"], "AssetTag", "TagEdge"]  # type: ignore
+    stats = ArangoDB().get_index_stats(collection_names)
+    # Indexes the plans of the logged slow queries used
+    used_by: dict[str, set[str]] = {}
+    for entry in QueryGateway().get_slow_queries():
+        for index in entry.indexes:
+            used_by.setdefault(str(index.get("name")), set()).add(entry.name)
+    return {
+        name: {
+            "indexes": [
+                {**index, "used_by_slow_queries": sorted(used_by.get(str(index["name"]), []))}
+                for index in indexes
+            ],
+            "last_sync": report.model_dump()
+            if (report := ArangoDB.index_reports.get(get_current_project(), {}).get(name))
+            else None,
+        }
+        for name, indexes in stats.items()
+    }
+
+
+@router.post(
+    "/revisions/compact",
+    summary="Remove the revisions outside of the retention policy.",
+    description=(DOCS_BASE_PATH / "compact_revisions.md").read_text(encoding="utf-8"),
+)
+async def compact_revisions(
+    before: Optional[datetime] = Query(None, description="Remove the revisions older than this"),
+    keep: Optional[int] = Query(None, ge=1, description="Revisions to keep per asset"),
+) -> CompactionReport:
+    return await run_db(DataManager().compact_revisions, before, keep)
+
+
+@router.post(
+    "/attachments/collect",
+    summary="Remove the attachment blobs that no asset references.",
+    description=(DOCS_BASE_PATH / "collect_attachments.md").read_text(encoding="utf-8"),
+)
+async def collect_attachments(
+    dry_run: bool = Query(False, description="Only count the blobs that would be removed"),
+) -> AttachmentCollectionReport:
+    return await run_db(DataManager().collect_attachments, dry_run)
+
+
+def project_figures(project: str) -> tuple[int, int]:
+    """
+    Count the documents and the bytes of the collections of a project.
+
+    Returns:
+        tuple[int, int]: The number of documents and the size of the documents and the indexes.
+    """
+    database = ArangoDB().database(project)
+    documents = 0
+    size = 0
+    for collection in database.collections():  # type: ignore
+        if collection["system"]:
+            continue
+        collection_api = database.collection(collection["name"])
+        statistics: dict = collection_api.statistics()  # type: ignore
+        documents += collection_api.count()  # type: ignore
+        size += statistics.get("documents_size", 0) + statistics.get("indexes", {}).get("size", 0)
+    return documents, size
+
+
+@router.get(
+    "/projects",
+    summary="Get the projects with their resource usage in the worker.",
+    description=(DOCS_BASE_PATH / "projects.md").read_text(encoding="utf-8"),
+)
+def get_projects(
+    figures: bool = Query(False, description="Count the documents and the bytes of the active projects"),
+) -> List[ProjectReport]:
+    model_manager = ModelManager()
+    active = set(model_manager.loaded_projects())
+    usage = get_usage()
+    reports = []
+    for project in list_projects():
+        report = ProjectReport(
+            project=project,
+            active=project in active,
+            models=model_manager.count_models(project),
+        )
+        if project in usage:
+            report.usage = usage[project]
+        if figures and report.active:
+            report.documents, report.size = project_figures(project)
+        reports.append(report)
+    return reports
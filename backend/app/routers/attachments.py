@@ -0,0 +1,234 @@
+"""
+attachments.py
+
+This module contains the endpoints of the binary attachments of the assets.
+"""
+
+import logging
+from datetime import datetime, timezone
+from pathlib import Path as OSPath
+from typing import Annotated, List, Optional
+
+import anyio
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request, status
+from fastapi.responses import Response
+from starlette.types import Receive, Scope, Send
+
+import auth_methods
+from attachment_store import (
+    ATTACHMENT_CHUNK_SIZE,
+    ATTACHMENT_MAX_SIZE,
+    ATTACHMENT_NAME_PATTERN,
+    Attachment,
+    AttachmentStore,
+    AttachmentTooLargeError,
+    DigestMismatchError,
+    is_digest,
+)
+from data_manager import DataManager
+from db_executor import run_db
+from exceptions.data_exceptions import AssetNotFoundError
+from gagm_base.asset_model import AssetModel
+from notes_store import RangeNotSatisfiableError, parse_range
+from revision_store import format_timestamp
+from routers.data import get_asset_by_type_and_key
+
+logger = logging.getLogger("uvicorn")
+
+DOCS_BASE_PATH = OSPath("docs/endpoints/attachments")
+
+DATA_MANAGER = DataManager()
+STORE = AttachmentStore()
+
+router = APIRouter(dependencies=[Depends(auth_methods.authenticate_user)])
+
+AttachmentName = Annotated[
+    str, Path(description="The name of the attachment, e.g. a file name.", pattern=ATTACHMENT_NAME_PATTERN)
+]
+
+
+class BlobResponse(Response):
+    """
+    Sends a byte range of a stored blob without reading it into memory.
+
+    If the server supports the zero-copy send extension of ASGI the file is handed
+    to the server (e.g. for `sendfile`), otherwise it's sent in chunks of
+    `ATTACHMENT_CHUNK_SIZE` read in the thread pool. The body is always streamed,
+    so the responses aren't compressed.
+    """
+
+    def __init__(
+        self, path: OSPath, start: int, length: int, status_code: int, headers: dict, media_type: str
+    ) -> None:
+        super().__init__(
+            status_code=status_code,
+            headers={**headers, "Content-Length": str(length)},
+            media_type=media_type,
+        )
+        self.path = path
+        self.start = start
+        self.length = length
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file.wrapped,
+                        "offset": self.start,
+                        "count": self.length,
+                    }
+                )
+                return
+            await file.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(ATTACHMENT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+@router.get(
+    "/{asset_type}/{asset_key}",
+    summary="List the attachments of an asset.",
+    description=(DOCS_BASE_PATH / "list_attachments.md").read_text(encoding="utf-8"),
+)
+async def list_attachments(asset: AssetModel = Depends(get_asset_by_type_and_key)) -> List[Attachment]:
+    return await run_db(DATA_MANAGER.get_attachments, asset.db_id)
+
+
+@router.put(
+    "/{asset_type}/{asset_key}/{name}",
+    summary="Upload an attachment of an asset.",
+    description=(DOCS_BASE_PATH / "put_attachment.md").read_text(encoding="utf-8"),
+    responses={
+        400: {"description": "The content doesn't have the given digest."},
+        404: {"description": "The asset doesn't exist."},
+        413: {"description": "The content is larger than the limit of the attachments."},
+    },
+)
+async def upload_attachment(
+    request: Request,
+    response: Response,
+    name: AttachmentName,
+    asset: AssetModel = Depends(get_asset_by_type_and_key),
+    sha256: Optional[str] = Query(None, description="Digest the content must have, hex"),
+    content_length: Optional[int] = Header(None),
+) -> Attachment:
+    if sha256 is not None and not is_digest(sha256.lower()):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid SHA-256 digest")
+    if ATTACHMENT_MAX_SIZE and content_length is not None and content_length > ATTACHMENT_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Attachments are limited to {ATTACHMENT_MAX_SIZE} bytes",
+        )
+    try:
+        blob = await STORE.receive(request.stream(), sha256.lower() if sha256 else None)
+    except AttachmentTooLargeError as error:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(error)
+        ) from error
+    except DigestMismatchError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)) from error
+    attachment = Attachment(
+        name=name,
+        digest=blob.digest,
+        size=blob.size,
+        media_type=request.headers.get("content-type") or "application/octet-stream",
+        uploaded=format_timestamp(datetime.now(timezone.utc)),
+    )
+    try:
+        await run_db(DATA_MANAGER.set_attachment, asset.db_id, attachment)
+    except AssetNotFoundError as error:
+        # The blob is left to the garbage collection, another asset may reference it
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error)) from error
+    logger.debug("Attached %s (%s, %d bytes) to %s", name, blob.digest, blob.size, asset.db_id)
+    response.headers["ETag"] = f'"{blob.digest}"'
+    return attachment
+
+
+@router.api_route(
+    "/{asset_type}/{asset_key}/{name}",
+    methods=["GET", "HEAD"],
+    response_class=Response,
+    summary="Download an attachment of an asset.",
+    description=(DOCS_BASE_PATH / "get_attachment.md").read_text(encoding="utf-8"),
+    responses={
+        206: {"description": "The requested byte range of the attachment."},
+        304: {"description": "The attachment didn't change since the given ETag."},
+        404: {"description": "The asset or the attachment doesn't exist."},
+        416: {"description": "The requested range is outside of the attachment."},
+    },
+)
+async def download_attachment(
+    request: Request,
+    name: AttachmentName,
+    asset: AssetModel = Depends(get_asset_by_type_and_key),
+):
+    attachment = await run_db(DATA_MANAGER.get_attachment, asset.db_id, name)
+    if attachment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'No attachment "{name}"')
+    path = STORE.blob_path(attachment.digest)
+    if not await anyio.Path(path).exists():
+        logger.error(
+            "The blob %s of the attachment %s of %s is missing", attachment.digest, name, asset.db_id
+        )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f'No content for attachment "{name}"'
+        )
+
+    # The content of a digest never changes, the ETag is strong
+    etag = f'"{attachment.digest}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{name}"',
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    range_header = request.headers.get("range")
+    # A range is only served if the attachment didn't change since the client read the other parts
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, attachment.size)
+        except RangeNotSatisfiableError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{attachment.size}"},
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            return BlobResponse(
+                path,
+                start,
+                end - start + 1,
+                status.HTTP_206_PARTIAL_CONTENT,
+                {**headers, "Content-Range": f"bytes {start}-{end}/{attachment.size}"},
+                attachment.media_type,
+            )
+    return BlobResponse(path, 0, attachment.size, status.HTTP_200_OK, headers, attachment.media_type)
+
+
+@router.delete(
+    "/{asset_type}/{asset_key}/{name}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Remove an attachment of an asset.",
+    responses={404: {"description": "The asset or the attachment doesn't exist."}},
+)
+async def delete_attachment(name: AttachmentName, asset: AssetModel = Depends(get_asset_by_type_and_key)):
+    if await run_db(DATA_MANAGER.remove_attachment, asset.db_id, name) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'No attachment "{name}"')
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
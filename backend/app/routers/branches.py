@@ -0,0 +1,128 @@
+"""
+branches.py
+
+This module contains the endpoints of the content branches of the graph.
+"""
+
+import logging
+from pathlib import Path as OSPath
+from typing import Annotated, List
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from fastapi.responses import JSONResponse, Response
+
+import auth_methods
+from batch_writes import BatchConflictError
+from branch_store import (
+    BRANCH_NAME_PATTERN,
+    Branch,
+    BranchDiff,
+    BranchExistsError,
+    BranchInput,
+    BranchNotFoundError,
+    MergeConflictError,
+    MergeReport,
+    MergeStrategyEnum,
+)
+from data_manager import DataManager
+from db_executor import run_db
+
+logger = logging.getLogger("uvicorn")
+
+DOCS_BASE_PATH = OSPath("docs/endpoints/branches")
+
+DATA_MANAGER = DataManager()
+
+router = APIRouter(dependencies=[Depends(auth_methods.authenticate_user)])
+
+BranchName = Annotated[str, Path(description="The name of the branch.", pattern=BRANCH_NAME_PATTERN)]
+
+
+@router.get("/", summary="List the branches.")
+async def list_branches() -> List[Branch]:
+    return await run_db(DATA_MANAGER.list_branches)
+
+
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    summary="Create a branch.",
+    description=(DOCS_BASE_PATH / "create_branch.md").read_text(encoding="utf-8"),
+    responses={409: {"description": "A branch with the name exists."}},
+)
+async def create_branch(branch: BranchInput) -> Branch:
+    try:
+        return await run_db(DATA_MANAGER.create_branch, branch)
+    except BranchExistsError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error)) from error
+
+
+@router.get(
+    "/{name}",
+    summary="Get a branch.",
+    responses={404: {"description": "The branch doesn't exist."}},
+)
+async def get_branch(name: BranchName) -> Branch:
+    try:
+        return await run_db(DATA_MANAGER.get_branch, name)
+    except BranchNotFoundError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error)) from error
+
+
+@router.delete(
+    "/{name}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Delete a branch and its changes.",
+    responses={404: {"description": "The branch doesn't exist."}},
+)
+async def delete_branch(name: BranchName):
+    try:
+        dropped = await run_db(DATA_MANAGER.delete_branch, name)
+    except BranchNotFoundError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error)) from error
+    logger.info("Deleted branch %s with %d changed assets", name, dropped)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get(
+    "/{name}/diff",
+    summary="Compare a branch to main.",
+    description=(DOCS_BASE_PATH / "diff_branch.md").read_text(encoding="utf-8"),
+    responses={404: {"description": "The branch doesn't exist."}},
+)
+async def diff_branch(name: BranchName) -> BranchDiff:
+    try:
+        return await run_db(DATA_MANAGER.diff_branch, name)
+    except BranchNotFoundError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error)) from error
+
+
+@router.post(
+    "/{name}/merge",
+    summary="Merge a branch into main.",
+    description=(DOCS_BASE_PATH / "merge_branch.md").read_text(encoding="utf-8"),
+    responses={
+        404: {"description": "The branch doesn't exist."},
+        409: {"description": "Changes conflict with main, or main was written during the merge."},
+    },
+)
+async def merge_branch(
+    name: BranchName,
+    strategy: MergeStrategyEnum = Query(
+        MergeStrategyEnum.FAIL, description="What to do with the changes that conflict with main"
+    ),
+) -> MergeReport:
+    try:
+        return await run_db(DATA_MANAGER.merge_branch, name, strategy)
+    except BranchNotFoundError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error)) from error
+    except MergeConflictError as error:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"detail": str(error), "diff": error.diff.model_dump(mode="json")},
+        )
+    except BatchConflictError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Main changed during the merge, nothing was merged: {error}",
+        ) from error
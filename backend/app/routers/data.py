@@ -6,27 +6,50 @@ This module contains the endpoints for managing the data.
 
 import enum
 import inspect
-import json
 import logging
 import os
 import traceback
+from datetime import datetime
 from enum import Enum
 from pathlib import Path as OSPath
 from types import FunctionType
-from typing import Annotated, Dict, List, Type
+from typing import Annotated, Dict, List, Optional, Type
 
 import auth_methods as auth_methods
+from asset_query import AssetPage, AssetQuery, InvalidQueryError
+from branch_store import BRANCH_HEADER, current_branch
+from batch_writes import (
+    BatchConflictError,
+    BatchRequest,
+    BatchResult,
+    InvalidBatchError,
+    prepare_batch,
+)
+from bulk_deletes import BulkDeleteReport, BulkDeleteRequest, InvalidBulkDeleteError
+from content_negotiation import NegotiatedResponse
 from data_manager import DataManager
-from exceptions.data_exceptions import UniqueConstraintViolatedException
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Request, status
-from fastapi.responses import JSONResponse, PlainTextResponse
+from db_executor import run_db
+from exceptions.data_exceptions import (
+    AssetNotFoundError,
+    InvalidPatchError,
+    PreconditionFailedError,
+    UniqueConstraintViolatedException,
+    WriteConflictError,
+)
+from instrumentation import span
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Path, Query, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 
-# from models.base.asset_log_record import AssetLogRecord
 from gagm_base.asset_model import AssetModel
 from gagm_base.node_model import NodeModel
 from gagm_base.edge_model import EdgeModel
 from model_manager import ModelManager, ModelNotFoundError
+from notes_store import RangeNotSatisfiableError, parse_range
+from partial_updates import parse_changes
 from pydantic import BaseModel, ValidationError
+from revision_store import AssetRevision, RevisionInfo
+from search_manager import MAX_SEARCH_LIMIT, SearchResults
+from trusted_reads import serialize_document
 
 logger = logging.getLogger("uvicorn")
 
@@ -38,17 +61,70 @@ MODEL_MANAGER = ModelManager()
 DATA_MANAGER = DataManager()
 
 
-router = APIRouter(dependencies=[Depends(auth_methods.authenticate_user)])
+def supports_branches(endpoint):
+    """
+    Mark an endpoint that works in the branch selected by the `X-GAGM-BRANCH`
+    header, see branch_store.py. The other endpoints only work on main.
+    """
+    endpoint.supports_branches = True
+    return endpoint
+
+
+async def select_branch(
+    request: Request,
+    branch: Optional[str] = Header(
+        None, alias=BRANCH_HEADER, description="Branch of the graph, main if not set"
+    ),
+) -> Optional[str]:
+    """
+    Select the branch of the request. The dependency is async so the branch is set
+    in the context the endpoint runs in.
+    """
+    if branch is None:
+        return None
+    if not getattr(request.scope.get("endpoint"), "supports_branches", False):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This endpoint only works on main, not in a branch.",
+        )
+    if not await run_db(DATA_MANAGER.has_branch, branch):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Branch {branch} doesn't exist."
+        )
+    current_branch.set(branch)
+    return branch
+
+
+router = APIRouter(
+    dependencies=[Depends(auth_methods.authenticate_user), Depends(select_branch)]
+)
+
+
+def format_etag(rev: str) -> str:
+    return f'"{rev}"'
+
 
+def parse_if_match(if_match: Optional[str]) -> Optional[str]:
+    """
+    Get the `_rev` of an If-Match header, None for `*` or no header.
+    ArangoDB checks a single revision, only the first ETag is used.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    etag = if_match.split(",")[0].strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"')
 
-def get_asset_by_id(
+
+async def get_asset_by_id(
     asset_id: Annotated[
         str, Path(description="The ID of the asset. Example format: *Type/Key*.")
     ],
 ) -> AssetModel:
     asset_type_str: str = asset_id.split("/")[0]
     asset_key: str = asset_id.split("/")[1]
-    return get_asset_by_type_and_key(asset_type_str, asset_key)
+    return await get_asset_by_type_and_key(asset_type_str, asset_key)
     # try:
     #     asset_type: type[AssetModel] = MODEL_MANAGER.get_model(asset_type_str)
     #     # if not asset_type:
@@ -62,13 +138,13 @@ def get_asset_by_id(
     #     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid asset type \"{asset_type_str}\"")
 
 
-def get_asset_by_type_and_key(
+async def get_asset_by_type_and_key(
     asset_type: Annotated[str, Path(description="The type of the asset")],
     asset_key: Annotated[str, Path(description="The key of the asset")],
 ):
     try:
-        asset = DATA_MANAGER.get_asset(
-            asset_key=asset_key, asset_type=MODEL_MANAGER.get_model(asset_type)
+        asset = await run_db(
+            DATA_MANAGER.get_asset, asset_key=asset_key, asset_type=MODEL_MANAGER.get_model(asset_type)
         )
         if not asset:
             raise HTTPException(
@@ -138,11 +214,8 @@ class TypedNodes(BaseModel):
 
     def get_ids(self) -> list[str]:
         ids: list[str] = list()
-        logger.info(self.nodes.values())
         for node_type in self.nodes.values():
-            logger.info(node_type.keys())
             for node in node_type.values():
-                logger.info(node)
                 ids.append(node["db_id"])
             # ids.extend(node_type.values())
         return ids
@@ -152,7 +225,6 @@ class TypedEdges(BaseModel):
     edges: dict[str, dict[str, EdgeModel]] = dict()
 
     def add_edge(self, edge: EdgeModel):
-        logger.info(edge)
         if not edge.db_id.split("/")[0] in self.edges.keys():
             self.edges.update({edge.db_id.split("/")[0]: {}})
         self.edges[edge.db_id.split("/")[0]].update({edge.db_key: edge.model_dump()})
@@ -181,23 +253,24 @@ class BackendGraph(BaseModel):
         for node in nodes:
             self.add_node(node)
 
+    def add_serialized_nodes(self, nodes: List[dict]):
+        for node in nodes:
+            node_type, node_key = node["db_id"].split("/", 1)
+            self.nodes.setdefault(node_type, {})[node_key] = node
+
     def remove_node_by_type(self, node_type: type[NodeModel]):
         if node_type.__name__ in self.nodes.keys():
             self.nodes.pop(node_type.__name__)
 
     def get_node_ids(self) -> list[str]:
         ids: list[str] = list()
-        logger.info(self.nodes.values())
         for node_type in self.nodes.values():
-            logger.info(node_type.keys())
             for node in node_type.values():
-                logger.info(node)
                 ids.append(node["db_id"])
             # ids.extend(node_type.values())
         return ids
 
     def add_edge(self, edge: EdgeModel):
-        logger.info(edge)
         if not edge.db_id.split("/")[0] in self.edges.keys():
             self.edges.update({edge.db_id.split("/")[0]: {}})
         self.edges[edge.db_id.split("/")[0]].update({edge.db_key: edge.model_dump()})
@@ -206,56 +279,70 @@ class BackendGraph(BaseModel):
         for edge in edges:
             self.add_edge(edge)
 
+    def add_serialized_edges(self, edges: List[dict]):
+        for edge in edges:
+            edge_type, edge_key = edge["db_id"].split("/", 1)
+            self.edges.setdefault(edge_type, {})[edge_key] = edge
+
     def remove_edge_by_type(self, edge_type: type[EdgeModel]):
         if edge_type.__name__ in self.edges.keys():
             self.edges.pop(edge_type.__name__)
 
 
-@router.get("/", summary="Get the whole graph.")
-async def get_all_data():
+def build_full_graph() -> BackendGraph:
+    """
+    Collects the whole graph. Blocking, runs in the database thread pool.
+
+    Returns:
+        BackendGraph: The graph.
+    """
     data = BackendGraph()
     for name in MODEL_MANAGER.get_all_model_names():
         model: Type[AssetModel] = MODEL_MANAGER.get_model(name)
         if issubclass(model, NodeModel):
-            nodes: List[NodeModel] = [
-                asset for asset in DATA_MANAGER.get_assets_by_type(model)
-            ]
-            data.add_nodes(nodes)
+            data.add_serialized_nodes(DATA_MANAGER.get_serialized_assets_by_type(model))
         else:
-            edges: List[EdgeModel] = [
-                asset for asset in DATA_MANAGER.get_assets_by_type(model)
-            ]
-            data.add_edges(edges)
+            data.add_serialized_edges(DATA_MANAGER.get_serialized_assets_by_type(model))
 
     return data
 
 
-@router.post("/filtered", summary="Get filtered data.")
-async def get_filtered_data(query: GraphViewFilter, request: Request):
+@router.get("/", summary="Get the whole graph.")
+@supports_branches
+async def get_all_data():
+    return await run_db(build_full_graph)
+
+
+def build_filtered_graph(query: GraphViewFilter) -> BackendGraph:
+    """
+    Collects the filtered graph. Blocking, runs in the database thread pool.
+
+    Args:
+        query (GraphViewFilter): The filter.
+
+    Returns:
+        BackendGraph: The filtered graph.
+    """
     data = BackendGraph()
-    logger.info("GETTING TAGGED DATA")
     tags: list[str] = []
-    tagged_data: set[AssetModel] = set()
+    tagged_data: dict[str, dict] = {}
     if len(query.tags) == 0 and query.tag_filter_type == InclusionEnum.EXCLUDE:
         for name in MODEL_MANAGER.get_all_model_names():
             model: Type[AssetModel] = MODEL_MANAGER.get_model(name)
             if issubclass(model, NodeModel):
-                nodes: List[NodeModel] = [
-                    asset for asset in DATA_MANAGER.get_assets_by_type(model)
-                ] # type: ignore
-                tagged_data = tagged_data.union(nodes)
+                for node in DATA_MANAGER.get_serialized_assets_by_type(model):
+                    tagged_data[node["db_id"]] = node
     elif query.tag_filter_type == InclusionEnum.INCLUDE:
         tags = query.tags
     else:
         tags = DATA_MANAGER.get_tags()
         [tags.remove(tag) for tag in query.tags]
-    tagged_data = tagged_data.union(DATA_MANAGER.get_assets_by_tags(tags))
+    tagged_data.update(DATA_MANAGER.get_assets_by_tags(tags))
     # logger.info(tagged_data)
     # data.nodes.add_nodes(list(tagged_data))
 
-    logger.info("GETTING TYPED DATA")
     node_model_names = set(MODEL_MANAGER.get_node_models().keys())
-    typed_data: set[AssetModel] = set()
+    typed_data: dict[str, dict] = {}
     type_names: list[str] = list()
     if query.type_filter_type == InclusionEnum.INCLUDE:
         type_names = list(node_model_names.intersection(query.types))
@@ -264,20 +351,20 @@ async def get_filtered_data(query: GraphViewFilter, request: Request):
     for type_name in type_names:
         model: Type[AssetModel] = MODEL_MANAGER.get_model(type_name)
         # typed_data.add(DATA_MANAGER.get_assets_by_type(model))
-        typed_data = typed_data.union(DATA_MANAGER.get_assets_by_type(model))
+        for node in DATA_MANAGER.get_serialized_assets_by_type(model):
+            typed_data[node["db_id"]] = node
 
     # logger.info(type_names)
     # logger.info(typed_data)
 
     # logger.info(typed_data)
-    intersection = set.intersection(typed_data, tagged_data)
-    logger.info("INTERSECTION")
-    logger.info(intersection)
+    intersection = [
+        node for node_id, node in typed_data.items() if node_id in tagged_data
+    ]
     # logger.info(intersection)
-    data.add_nodes(list(intersection))
+    data.add_serialized_nodes(intersection)
     # type_filtered_data: dict[str, dict[str, NodeModel]] = dict()
     node_ids = data.get_node_ids()
-    logger.info(f"{node_ids=}")
     # logger.info(f"{node_ids=}")
     # for asset in tagged_data:
     #     asset_type = asset.db_id.split("/")[0]
@@ -288,21 +375,127 @@ async def get_filtered_data(query: GraphViewFilter, request: Request):
     # node_ids = set(node.db_id for node in type_filtered_data)
     edges = DATA_MANAGER.get_edges_between_nodes(node_ids)
     # edges = set()
-    logger.info(f"{edges=}")
     # typed_edges = dict[str, dict[str, EdgeModel]]
     # for edge in edges:
     #     edge_type = edge.db_id.split("/")[0]
     #     if not edge_type in typed_edges.keys():
     #         typed_edges.update({edge_type: {}})
     #     typed_edges[edge_type].update({edge.db_key: edge.model_dump()})
-    data.add_edges(list(edges))  # {"nodes": type_filtered_data, "edges": edges}
+    data.add_serialized_edges(list(edges.values()))  # {"nodes": type_filtered_data, "edges": edges}
     # logger.info(data)
     return data
 
 
+@router.post("/filtered", summary="Get filtered data.")
+@supports_branches
+async def get_filtered_data(query: GraphViewFilter, request: Request):
+    return await run_db(build_filtered_graph, query)
+
+
+def build_graph_at(at: datetime) -> BackendGraph:
+    """
+    Rebuilds the graph at a point in time from the revisions.
+    Blocking, runs in the database thread pool.
+
+    Args:
+        at (datetime): The point in time.
+
+    Returns:
+        BackendGraph: The graph, without the assets of models that aren't loaded anymore.
+    """
+    data = BackendGraph()
+    nodes: list[dict] = []
+    edges: list[dict] = []
+    for asset_id, document in DATA_MANAGER.get_documents_at(at).items():
+        try:
+            model: Type[AssetModel] = MODEL_MANAGER.get_model(asset_id.split("/")[0])
+            serialized = serialize_document(model, document)
+        except (ModelNotFoundError, ValidationError) as error:
+            logger.debug("Skipping revision of %s: %s", asset_id, error)
+            continue
+        (nodes if issubclass(model, NodeModel) else edges).append(serialized)
+    data.add_serialized_nodes(nodes)
+    data.add_serialized_edges(edges)
+    return data
+
+
+@router.get(
+    "/history",
+    summary="Get the whole graph at a point in time.",
+    description=(DOCS_BASE_PATH / "get_history.md").read_text(encoding="utf-8"),
+)
+async def get_graph_at(
+    at: datetime = Query(description="The point in time, ISO 8601, UTC if no offset is given"),
+):
+    return await run_db(build_graph_at, at)
+
+
+@router.post(
+    "/batch",
+    summary="Write several assets in one transaction.",
+    description=(DOCS_BASE_PATH / "post_batch.md").read_text(encoding="utf-8"),
+    responses={
+        400: {"description": "Operations are invalid, nothing was written."},
+        409: {"description": "An operation conflicts with the stored data, nothing was written."},
+    },
+)
+async def post_batch(batch: BatchRequest) -> BatchResult:
+    try:
+        with span("pydantic.validate", model="batch"):
+            writes = prepare_batch(batch, MODEL_MANAGER.get_model)
+        return await run_db(DATA_MANAGER.apply_batch, writes)
+    except InvalidBatchError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=error.errors
+        ) from error
+    except BatchConflictError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"index": error.index, "detail": str(error)},
+        ) from error
+
+
+@router.post(
+    "/delete",
+    summary="Delete the assets of a selection.",
+    description=(DOCS_BASE_PATH / "post_delete.md").read_text(encoding="utf-8"),
+    responses={400: {"description": "The selection is invalid, nothing was deleted."}},
+)
+async def post_bulk_delete(request: BulkDeleteRequest) -> BulkDeleteReport:
+    try:
+        return await run_db(DATA_MANAGER.bulk_delete, request)
+    except (InvalidBulkDeleteError, InvalidQueryError) as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+        ) from error
+
+
 @router.get("/tags")
-def get_tags():
-    return DATA_MANAGER.get_tags()
+async def get_tags():
+    return await run_db(DATA_MANAGER.get_tags)
+
+
+@router.get(
+    "/search",
+    summary="Search the assets.",
+    description=(DOCS_BASE_PATH / "search.md").read_text(encoding="utf-8"),
+    responses={400: {"description": "User type does not exist."}},
+)
+async def search(
+    q: str = Query(min_length=1, max_length=256, description="The search"),
+    types: list[str] = Query([], description="Node types to search in, all by default"),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    fuzzy: bool = Query(True, description="Also match words with one typo"),
+) -> SearchResults:
+    node_models = MODEL_MANAGER.get_node_models()
+    unknown = [name for name in types if name not in node_models]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"User type {unknown[0]} does not exist.",
+        )
+    asset_types = [node_models[name] for name in types or node_models]
+    return await run_db(DATA_MANAGER.search, q, asset_types, limit, fuzzy)
 
 
 class TagInput(BaseModel):
@@ -310,19 +503,22 @@ class TagInput(BaseModel):
 
 
 @router.post("/tags")
-def add_tag(tag: TagInput):
-    return DATA_MANAGER.create_tag(tag.name)
+async def add_tag(tag: TagInput):
+    return await run_db(DATA_MANAGER.create_tag, tag.name)
 
 
 @router.delete("/tags/{tag_name}")
-def delete_tag(tag_name: str):
-    return DATA_MANAGER.delete_tag(tag_name)
+async def delete_tag(tag_name: str):
+    return await run_db(DATA_MANAGER.delete_tag, tag_name)
 
 
 @router.get(
     "/tagged/{tag}",
     summary="Get data tagged with the provided tag.",
     description=(DOCS_BASE_PATH / "get_tagged_data.md").read_text(encoding="utf-8"),
+    # The assets are already serialized by the trusted reads, the schema is only documented
+    response_model=None,
+    responses={200: {"description": "Data retrieved successfully.", "model": List[AssetModel]}},
 )
 async def get_tagged_data(
     tag: str = Path(
@@ -331,33 +527,36 @@ async def get_tagged_data(
         example="example_tag",
         type="string",
     ),
-) -> List[AssetModel]:
+):
     logger.debug('Getting data with tag "%s"', tag)
-    return DATA_MANAGER.get_connected_nodes(f"AssetTag/{tag}")
+    data = await run_db(DATA_MANAGER.get_connected_nodes, f"AssetTag/{tag}")
+    return NegotiatedResponse(content=data)
 
 
 @router.get(
     "/typed/{user_type}",
     summary="Get data with the provided user type.",
     description=(DOCS_BASE_PATH / "get_data_with_type.md").read_text(encoding="utf-8"),
-    response_model=Dict[str, AssetModel],
+    # The assets are already serialized by the trusted reads, the schema is only documented
+    response_model=None,
     responses={
         200: {
             "description": "Data retrieved successfully.",
+            "model": Dict[str, AssetModel],
         },
         400: {
             "description": "User type does not exist.",
         },
     },
 )
-def get_data_with_type(
+@supports_branches
+async def get_data_with_type(
     requested_type: str,
 ):
     try:
         model: Type[AssetModel] = MODEL_MANAGER.get_model(requested_type)
-        data = DATA_MANAGER.get_assets_by_type(model)
-        logger.info({asset.db_key: asset.model_dump() for asset in data})
-        return {asset.db_key: asset.model_dump() for asset in data}
+        data = await run_db(DATA_MANAGER.get_serialized_assets_by_type, model)
+        return NegotiatedResponse(content={asset["db_key"]: asset for asset in data})
     except ModelNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -365,14 +564,13 @@ def get_data_with_type(
         )
 
 
-def list_endpoint_skeleton(requested_type: str):
+async def list_endpoint_skeleton(requested_type: str):
     try:
         asset_type: Type[AssetModel] = MODEL_MANAGER.get_model(requested_type)
-        ModelType = Type[asset_type]
-        data: List[ModelType] = DATA_MANAGER.get_assets_by_type(asset_type)  # type: ignore
-        # returned: Dict[str, ModelType] = {asset.db_key: asset for asset in data}
-        # logger.info({asset.db_key: asset for asset in data})
-        return {asset.db_key: asset for asset in data} or {}
+        data: List[dict] = await run_db(
+            DATA_MANAGER.get_serialized_assets_by_type, asset_type, by_alias=True
+        )
+        return NegotiatedResponse(content={asset["_key"]: asset for asset in data})
     except ModelNotFoundError as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -380,14 +578,14 @@ def list_endpoint_skeleton(requested_type: str):
         ) from exc
 
 
-def get_endpoint_skeleton(requested_type: str, asset_key: str):
+async def get_endpoint_skeleton(requested_type: str, asset_key: str):
     asset_type: Type[AssetModel] = MODEL_MANAGER.get_model(requested_type)
     if not asset_type:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid type {requested_type}",
         )
-    data = DATA_MANAGER.get_asset(asset_key, asset_type)
+    data = await run_db(DATA_MANAGER.get_asset, asset_key, asset_type)
     if not data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -396,11 +594,23 @@ def get_endpoint_skeleton(requested_type: str, asset_key: str):
     return data
 
 
-def post_endpoint_skeleton(request_body: AssetModel):
-    try:
-        new_object = DATA_MANAGER.add_asset(request_body)
+def ensure_project_model(model: Type[AssetModel]) -> None:
+    """
+    The pregenerated routes are built from the models of the default project,
+    the project of the request must have the same model.
+    """
+    name = model.__name__
+    if not MODEL_MANAGER.is_model_present(name) or MODEL_MANAGER.get_model(name) is not model:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"User type {name} does not exist.",
+        )
+
 
-        return new_object
+async def post_endpoint_skeleton(request_body: AssetModel):
+    ensure_project_model(type(request_body))
+    try:
+        return (await run_db(DATA_MANAGER.add_asset, request_body)).asset
     except ValidationError as exc:
         logger.info(traceback.format_exception(exc))
         raise HTTPException(
@@ -413,28 +623,35 @@ def post_endpoint_skeleton(request_body: AssetModel):
         ) from exc
 
 
-def put_endpoint_skeletion(asset_key: str, request_body: AssetModel):
+async def put_endpoint_skeletion(asset_key: str, request_body: AssetModel, if_match: Optional[str] = None):
+    ensure_project_model(type(request_body))
     try:
-        logger.info(request_body)
         asset_type: Type = type(request_body)
-        if not DATA_MANAGER.is_asset_present(f"{asset_type}/{asset_key}"):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Asset with id {asset_type}/{asset_key} not found.",
-            )
-        if request_body.db_id is None or request_body.db_key is None:
+        if request_body.db_key is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="The provided data doesn't contain all necessary fields.",
             )
-        new_object = DATA_MANAGER.update_asset(request_body)
-
-        return new_object
+        stored = await run_db(
+            DATA_MANAGER.update_asset,
+            request_body.model_copy(update={"db_key": asset_key}),
+            parse_if_match(if_match),
+        )
+        return stored.asset
     except ValidationError as exc:
         logger.info(traceback.format_exception(exc))
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail=exc.errors()
         ) from exc
+    except AssetNotFoundError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Asset with id {asset_type.__name__}/{asset_key} not found.",
+        ) from exc
+    except PreconditionFailedError as exc:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(exc)) from exc
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
 
 
 class PregeneratedRoute:
@@ -495,7 +712,7 @@ class PregeneratedRoute:
         code = post_endpoint_skeleton.__code__
         new_func = FunctionType(code, globals(), "new_func", None, None)
         new_func.__signature__ = new_sig
-        self.post_endpoint = new_func
+        self.post_endpoint = supports_branches(new_func)
 
         # Add PUT endpoint for the type
         # TODO: add PUT endpoint
@@ -514,20 +731,27 @@ class PregeneratedRoute:
         code = put_endpoint_skeletion.__code__
         new_func = FunctionType(code, globals(), "new_func", None, None)
         new_func.__signature__ = new_sig
-        self.put_endpoint = new_func
+        self.put_endpoint = supports_branches(new_func)
 
-    def list_endpoint(self):
-        return list_endpoint_skeleton(requested_type=self.requested_type)
+    @supports_branches
+    async def list_endpoint(self):
+        return await list_endpoint_skeleton(requested_type=self.requested_type)
 
-    def get_endpoint(self, asset_key: str):
-        return get_endpoint_skeleton(
+    @supports_branches
+    async def get_endpoint(self, asset_key: str):
+        return await get_endpoint_skeleton(
             requested_type=self.requested_type, asset_key=asset_key
         )
 
-    def post_endpoint(self, request_body):
+    async def post_endpoint(self, request_body):
         pass
 
-    def put_endpoint(self, asset_key: str, request_body):
+    async def put_endpoint(
+        self,
+        asset_key: str,
+        request_body,
+        if_match: Optional[str] = Header(None, description="ETag of the asset that was read"),
+    ):
         pass
 
 
@@ -550,7 +774,9 @@ def init_typed_endpoints():
         router.add_api_route(
             typed_endpoint.route_path,
             typed_routes[name].list_endpoint,
-            response_model=typed_endpoint.response_model,
+            # Returns the serialization of the trusted reads, the schema is only documented
+            response_model=None,
+            responses={200: {"model": typed_endpoint.response_model}},
             summary=typed_endpoint.summaries["list"],
             methods=["GET"],
         )
@@ -593,30 +819,28 @@ init_typed_endpoints()
         400: {
             "description": "User type does not exist.",
         },
+        409: {
+            "description": "An asset with the key exists.",
+        },
     },
 )
+@supports_branches
 async def post_data_with_type(
-    request_data: dict, requested_type: str = Path(description="User type")
+    request_data: dict, response: Response, requested_type: str = Path(description="User type")
 ):
     try:
         asset_type: Type[AssetModel] = MODEL_MANAGER.get_model(requested_type)
         # asset_data = json.loads(request_data)
-        logger.debug("Validating JSON")
-        logger.info(request_data)
-
-        logger.debug("Creating object from\n%s", json.dumps(request_data))
-
-        created_object = asset_type(**request_data)
-        logger.info(f"{type(created_object)=}")
-        logger.debug("Object created\n%s ", str(created_object))
-        if hasattr(created_object, "db_key") and DATA_MANAGER.is_asset_present(
-            created_object.db_id
-        ):
-            raise HTTPException(
-                status_code=409,
-                detail="Asset already exists, use the PUT endpoint to update it.",
-            )
-        return DATA_MANAGER.add_asset(created_object)
+        with span("pydantic.validate", model=requested_type):
+            created_object = asset_type(**request_data)
+        stored = await run_db(DATA_MANAGER.add_asset, created_object)
+        response.headers["ETag"] = format_etag(stored.rev)
+        return stored.asset
+    except (UniqueConstraintViolatedException, WriteConflictError) as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Asset already exists, use the PUT endpoint to update it.",
+        ) from error
     except ValidationError as error:
         logger.info(traceback.format_exception(error))
         raise HTTPException(
@@ -640,53 +864,91 @@ async def post_data_with_type(
         ) from error
 
 
+@router.post(
+    "/{requested_type}/query",
+    summary="Query the assets of a type.",
+    description=(DOCS_BASE_PATH / "query_data.md").read_text(encoding="utf-8"),
+    responses={
+        400: {
+            "description": "User type does not exist or the query doesn't match the model.",
+        },
+    },
+)
+async def query_data(
+    query: AssetQuery, requested_type: str = Path(description="User type")
+) -> AssetPage:
+    try:
+        model: Type[AssetModel] = MODEL_MANAGER.get_model(requested_type)
+        return await run_db(DATA_MANAGER.query_assets, model, query)
+    except ModelNotFoundError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"User type {requested_type} does not exist.",
+        ) from error
+    except InvalidQueryError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+        ) from error
+
+
 @router.get(
     "/{asset_type}/{asset_key}",
     response_class=JSONResponse,
     summary="Get an asset with the specified type.",
+    responses={304: {"description": "The asset didn't change since the given ETag."}},
 )
-async def get_asset(asset: AssetModel = Depends(get_asset_by_type_and_key)):
-    return asset
-    # try:
-    #     AssetType: Type = MODEL_MANAGER.get_model(asset_type)
-    #     asset = DATA_MANAGER.get_asset(asset_key=asset_id, asset_type=AssetType)
-    #     if not asset:
-    #         raise HTTPException(
-    #             status_code=404, detail=f"{asset_type} with ID '{asset_id}' not found!"
-    #         )
-    #     return asset
-    # except ModelNotFoundError as error:
-    #     raise HTTPException(
-    #         status_code=400, detail=f"Model {asset_type} not found!"
-    #     ) from error
+@supports_branches
+async def get_asset(
+    asset_type: Annotated[str, Path(description="The type of the asset")],
+    asset_key: Annotated[str, Path(description="The key of the asset")],
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        model: Type[AssetModel] = MODEL_MANAGER.get_model(asset_type)
+    except ModelNotFoundError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid asset type \"{asset_type}\"",
+        ) from error
+    stored = await run_db(DATA_MANAGER.get_stored_asset, asset_key, model)
+    if stored is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No asset found with the given ID",
+        )
+    etag = format_etag(stored.rev)
+    if if_none_match and (if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return stored.asset
 
 
-@router.put("/{asset_type}/{asset_key}")
+@router.put(
+    "/{asset_type}/{asset_key}",
+    responses={
+        404: {"description": "The asset doesn't exist."},
+        409: {"description": "The asset was written concurrently."},
+        412: {"description": "The asset changed since the ETag of If-Match was read."},
+    },
+)
+@supports_branches
 async def full_update_asset(
     updated_asset: dict,
-    request: Request,
-    asset: AssetModel = Depends(get_asset_by_type_and_key),
+    response: Response,
+    asset_type: Annotated[str, Path(description="The type of the asset")],
+    asset_key: Annotated[str, Path(description="The key of the asset")],
+    if_match: Optional[str] = Header(None, description="ETag of the asset that was read"),
 ):
-    logger.info(updated_asset)
     try:
-        asset_key = asset.db_key
-        requested_type = asset.db_id.split("/")[0]
-        logger.info(f"{type(asset)=}")
-        model_type: Type[AssetModel] = MODEL_MANAGER.get_model(requested_type)
-        logger.info(f"{model_type=}")
-        logger.info("updated_asset")
-        new_object = model_type(
-            _id=updated_asset["db_id"], _key=asset_key, **updated_asset
-        )
-        if not issubclass(new_object.__class__, NodeModel):
-            new_object = model_type(
-                _id=updated_asset["db_id"],
-                _key=asset_key,
-                **updated_asset,
-            )
-
-        DATA_MANAGER.update_asset(new_object)
-
+        model_type: Type[AssetModel] = MODEL_MANAGER.get_model(asset_type)
+        updated_asset.pop("db_key", None)
+        updated_asset.pop("_key", None)
+        new_object = model_type(_key=asset_key, **updated_asset)
+        stored = await run_db(DATA_MANAGER.update_asset, new_object, parse_if_match(if_match))
+        response.headers["ETag"] = format_etag(stored.rev)
         return {"message": "Asset updated"}
     except ValidationError as error:
         logger.info(traceback.format_exception(error))
@@ -696,7 +958,7 @@ async def full_update_asset(
     except ModelNotFoundError as error:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Asset type {requested_type} does not exist.",
+            detail=f"Asset type {asset_type} does not exist.",
         ) from error
     except TypeError as error:
         logger.info(traceback.format_exception(error))
@@ -704,11 +966,78 @@ async def full_update_asset(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Couldn't construct model: {error}",
         ) from error
+    except AssetNotFoundError as error:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Asset {asset_type}/{asset_key} not found",
+        ) from error
+    except PreconditionFailedError as error:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error)
+        ) from error
+    except WriteConflictError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error)) from error
 
 
-@router.patch("/{requested_type}/{asset_id}")
-async def partial_update_asset(requested_type: str, asset_id: str, request_data: dict):
-    raise Exception("Unimplemented")
+@router.patch(
+    "/{asset_type}/{asset_key}",
+    summary="Update some fields of an asset.",
+    description=(DOCS_BASE_PATH / "patch_asset.md").read_text(encoding="utf-8"),
+    responses={
+        404: {"description": "The asset doesn't exist."},
+        409: {"description": "The asset was written concurrently."},
+        412: {"description": "The asset changed since the ETag of If-Match was read."},
+        422: {"description": "The changes are invalid, e.g. they change the key or clear a required field."},
+    },
+)
+@supports_branches
+async def partial_update_asset(
+    changed_fields: dict,
+    response: Response,
+    asset_type: Annotated[str, Path(description="The type of the asset")],
+    asset_key: Annotated[str, Path(description="The key of the asset")],
+    if_match: Optional[str] = Header(None, description="ETag of the asset that was read"),
+):
+    try:
+        model_type: Type[AssetModel] = MODEL_MANAGER.get_model(asset_type)
+        changed_fields.pop("db_key", None)
+        changed_fields.pop("_key", None)
+        with span("pydantic.validate", model=asset_type, fields=len(changed_fields)):
+            changes = parse_changes(MODEL_MANAGER.get_all_optional_model(asset_type), changed_fields)
+        stored = await run_db(
+            DATA_MANAGER.patch_asset, model_type, asset_key, changes, parse_if_match(if_match)
+        )
+        response.headers["ETag"] = format_etag(stored.rev)
+        return {"message": "Asset updated"}
+    except ValidationError as error:
+        logger.info(traceback.format_exception(error))
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=error.errors()
+        ) from error
+    except ModelNotFoundError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Asset type {asset_type} does not exist.",
+        ) from error
+    except InvalidPatchError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error)
+        ) from error
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+        ) from error
+    except AssetNotFoundError as error:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Asset {asset_type}/{asset_key} not found",
+        ) from error
+    except PreconditionFailedError as error:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error)
+        ) from error
+    except WriteConflictError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error)) from error
 
 
 @router.delete(
@@ -725,8 +1054,9 @@ async def partial_update_asset(requested_type: str, asset_id: str, request_data:
         }
     },
 )
+@supports_branches
 async def delete_asset_by_id(asset: AssetModel = Depends(get_asset_by_id)):
-    DATA_MANAGER.delete_asset_by_id(asset.db_id)
+    await run_db(DATA_MANAGER.delete_asset_by_id, asset.db_id)
     return JSONResponse(status_code=status.HTTP_200_OK, content=asset.model_dump_json())
 
 
@@ -752,10 +1082,11 @@ async def delete_asset_by_id(asset: AssetModel = Depends(get_asset_by_id)):
 #         ) from error
 
 
+@supports_branches
 async def delete_asset_v2(
     asset: AssetModel = Depends(get_asset_by_type_and_key),
 ) -> AssetModel:
-    DATA_MANAGER.delete_asset_by_id(asset.db_id)
+    await run_db(DATA_MANAGER.delete_asset_by_id, asset.db_id)
     return asset
 
 
@@ -764,46 +1095,78 @@ class Order(str, Enum):
     DESC = "desc"
 
 
-# @router.get("/{asset_id}/logs", response_model=List[AssetLogRecord])
-# async def get_asset_logs(
-#     asset_id: str,
-#     asset_type: str,
-#     limit: int = 10,
-#     offset: int = 0,
-#     order: Order = Order.DESC,
-# ):
-#     if order not in ["ASC", "DESC"]:
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail='Order must be "ASC" or "DESC"',
-#         )
-#     if limit < 1:
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail="Limit must be greater than 0",
-#         )
-#     if offset < 0:
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail="Offset must be greater than or equal to 0",
-#         )
-#     if limit > 100:
-#         raise HTTPException(
-#             status_code=status.HTTP_400_BAD_REQUEST,
-#             detail="Limit must be less than or equal to 100",
-#         )
-#     if not DATA_MANAGER.is_asset_present(asset_id, MODEL_MANAGER.get_model(asset_type)):
-#         raise HTTPException(
-#             status_code=status.HTTP_404_NOT_FOUND,
-#             detail=f'Asset with id "{asset_id}" not found',
-#         )
-#     if order == Order.DESC:
-#         pass
-#     else:
-#         pass
-#     asset_logs = []
+def get_asset_id(
+    asset_id: Annotated[
+        str, Path(description="The ID of the asset. Example format: *Type/Key*.")
+    ],
+) -> str:
+    """
+    Validate the ID of an asset that may have been deleted.
+    """
+    asset_type, _, asset_key = asset_id.partition("/")
+    if not asset_key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid asset ID {asset_id}",
+        )
+    try:
+        MODEL_MANAGER.get_model(asset_type)
+    except ModelNotFoundError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Asset type {asset_type} does not exist.",
+        ) from error
+    return asset_id
 
-#     return asset_logs
+
+@router.get(
+    "/{asset_id:path}/revisions",
+    summary="List the revisions of an asset.",
+    description=(DOCS_BASE_PATH / "get_revisions.md").read_text(encoding="utf-8"),
+)
+async def get_asset_revisions(
+    asset_id: str = Depends(get_asset_id),
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[int] = Query(None, ge=1, description="Only revisions before this one"),
+) -> List[RevisionInfo]:
+    return await run_db(DATA_MANAGER.list_asset_revisions, asset_id, limit, before)
+
+
+@router.get(
+    "/{asset_id:path}/revisions/{revision}",
+    summary="Get a revision of an asset.",
+    description=(DOCS_BASE_PATH / "get_revisions.md").read_text(encoding="utf-8"),
+    responses={404: {"description": "The revision doesn't exist or was compacted."}},
+)
+async def get_asset_revision(
+    revision: int = Path(ge=1), asset_id: str = Depends(get_asset_id)
+) -> AssetRevision:
+    result = await run_db(DATA_MANAGER.get_asset_revision, asset_id, revision)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Revision {revision} of {asset_id} not found",
+        )
+    return result
+
+
+@router.get(
+    "/{asset_id:path}/history",
+    summary="Get an asset at a point in time.",
+    description=(DOCS_BASE_PATH / "get_revisions.md").read_text(encoding="utf-8"),
+    responses={404: {"description": "The asset has no revision before the point in time."}},
+)
+async def get_asset_at(
+    at: datetime = Query(description="The point in time, ISO 8601, UTC if no offset is given"),
+    asset_id: str = Depends(get_asset_id),
+) -> AssetRevision:
+    result = await run_db(DATA_MANAGER.get_asset_revision, asset_id, None, at)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No revision of {asset_id} before {at.isoformat()}",
+        )
+    return result
 
 
 @router.get(
@@ -824,6 +1187,8 @@ class Order(str, Enum):
                 }
             },
         },
+        206: {"description": "The requested byte range of the notes."},
+        304: {"description": "The notes didn't change since the given ETag."},
         404: {
             "description": "Asset with the provided id not found.",
             "content": {
@@ -832,13 +1197,39 @@ class Order(str, Enum):
                 }
             },
         },
+        416: {"description": "The requested range is outside of the notes."},
     },
     summary="Get the notes of an asset.",
     description=(DOCS_BASE_PATH / "get_notes.md").read_text(encoding="utf-8"),
 )
-async def get_asset_notes(asset: AssetModel = Depends(get_asset_by_id)):
-    notes: str = DATA_MANAGER.get_asset_notes(asset.db_id)
-    return PlainTextResponse(content=notes, media_type="text/markdown")
+async def get_asset_notes(request: Request, asset: AssetModel = Depends(get_asset_by_id)):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = f'"{await run_db(DATA_MANAGER.get_asset_notes_etag, asset.db_id)}"'
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match == "*":
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    notes = await run_db(DATA_MANAGER.get_asset_notes, asset.db_id)
+    headers = {"ETag": f'"{notes.etag}"', "Accept-Ranges": "bytes"}
+    content = notes.content.encode("utf-8")
+    range_header = request.headers.get("range")
+    # A range is only served if the notes didn't change since the client read the other parts
+    if range_header and request.headers.get("if-range", headers["ETag"]) == headers["ETag"]:
+        try:
+            byte_range = parse_range(range_header, len(content))
+        except RangeNotSatisfiableError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{len(content)}"},
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            return Response(
+                content=content[start : end + 1],
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type="text/markdown",
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(content)}"},
+            )
+    return Response(content=content, media_type="text/markdown", headers=headers)
 
 
 @router.post("/{asset_id:path}/notes")
@@ -846,20 +1237,27 @@ async def set_notes(
     asset: AssetModel = Depends(get_asset_by_id),
     notes: str = Body(default="", media_type="text/plain"),
 ):
-    updated_notes = DATA_MANAGER.set_asset_notes(asset.db_id, notes)
-    return PlainTextResponse(updated_notes, media_type="text/markdown")
+    stored = await run_db(DATA_MANAGER.set_asset_notes, asset.db_id, notes)
+    return PlainTextResponse(
+        stored.content, media_type="text/markdown", headers={"ETag": f'"{stored.etag}"'}
+    )
 
 
-@router.get("/{asset_id:path}/connected_nodes")
+@router.get(
+    "/{asset_id:path}/connected_nodes",
+    response_model=None,
+    responses={200: {"model": List[AssetModel]}},
+)
 async def get_connected_nodes(asset: AssetModel = Depends(get_asset_by_id)):
-    return DATA_MANAGER.get_connected_nodes(asset_id=asset.db_id)
+    data = await run_db(DATA_MANAGER.get_connected_nodes, asset_id=asset.db_id)
+    return NegotiatedResponse(content=data)
 
 
 @router.get("/{asset_id:path}/tags")
 async def get_tags_for_nodes(asset: AssetModel = Depends(get_asset_by_id)) -> List[str]:
-    return DATA_MANAGER.get_tags_for_node(asset_id=asset.db_id)
+    return await run_db(DATA_MANAGER.get_tags_for_node, asset_id=asset.db_id)
 
 @router.post("/{asset_id:path}/tags/{tag}")
 async def toggle_tag_for_node(tag: str, asset: AssetModel = Depends(get_asset_by_id)) -> List[str]:
-    DATA_MANAGER.toggle_tag(asset_id=asset.db_id, tag_name=tag)
-    return DATA_MANAGER.get_tags_for_node(asset_id=asset.db_id)
+    await run_db(DATA_MANAGER.toggle_tag, asset_id=asset.db_id, tag_name=tag)
+    return await run_db(DATA_MANAGER.get_tags_for_node, asset_id=asset.db_id)
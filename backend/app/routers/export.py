@@ -0,0 +1,83 @@
+"""
+export.py
+
+This module contains the endpoints of the export bundles for the game.
+"""
+
+import logging
+from pathlib import Path as OSPath
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query, status
+from fastapi.responses import FileResponse, Response
+
+import auth_methods
+from bundle_exporter import BundleExporter, ExportReport
+from db_executor import run_db
+from export_bundle import BUNDLE_MEDIA_TYPE, BundleStats, read_watermark
+from routers.data import GraphViewFilter, build_filtered_graph
+
+logger = logging.getLogger("uvicorn")
+
+DOCS_BASE_PATH = OSPath("docs/endpoints/export")
+
+EXPORTER = BundleExporter()
+
+router = APIRouter(dependencies=[Depends(auth_methods.authenticate_user)])
+
+
+def build_filtered_bundle(query: GraphViewFilter) -> tuple[bytes, BundleStats]:
+    """
+    Builds the bundle of the filtered graph. Blocking, runs in the database thread pool.
+
+    Args:
+        query (GraphViewFilter): The filter.
+
+    Returns:
+        tuple[bytes, BundleStats]: The bundle and its statistics.
+    """
+    graph = build_filtered_graph(query)
+    nodes = [node for nodes_with_type in graph.nodes.values() for node in nodes_with_type.values()]
+    edges = [edge for edges_with_type in graph.edges.values() for edge in edges_with_type.values()]
+    return EXPORTER.build_subgraph(nodes, edges)  # type: ignore
+
+
+@router.get(
+    "/bundle",
+    response_class=FileResponse,
+    summary="Download the export bundle of the whole graph.",
+    description=(DOCS_BASE_PATH / "get_bundle.md").read_text(encoding="utf-8"),
+    responses={304: {"description": "The bundle didn't change since the given ETag."}},
+)
+async def get_bundle(if_none_match: Optional[str] = Header(None)):
+    path = await run_db(EXPORTER.ensure_bundle)
+    watermark = read_watermark(path)
+    etag = f'"{watermark}"'
+    headers = {"ETag": etag, "X-GAGM-Watermark": str(watermark)}
+    if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=BUNDLE_MEDIA_TYPE, filename=path.name, headers=headers)
+
+
+@router.post(
+    "/bundle",
+    summary="Rebuild the export bundle of the whole graph.",
+    description=(DOCS_BASE_PATH / "post_bundle.md").read_text(encoding="utf-8"),
+)
+async def rebuild_bundle(
+    full: bool = Query(False, description="Read every collection instead of the changes"),
+) -> ExportReport:
+    return await run_db(EXPORTER.rebuild, full)
+
+
+@router.post(
+    "/bundle/filtered",
+    response_class=Response,
+    summary="Build the export bundle of a filtered graph.",
+    description=(DOCS_BASE_PATH / "post_filtered_bundle.md").read_text(encoding="utf-8"),
+)
+async def get_filtered_bundle(query: GraphViewFilter):
+    bundle, stats = await run_db(build_filtered_bundle, query)
+    return Response(
+        content=bundle, media_type=BUNDLE_MEDIA_TYPE, headers={"X-GAGM-Watermark": str(stats.watermark)}
+    )
@@ -7,6 +7,7 @@ This module contains the endpoints for the models.
 from enum import Enum
 import logging
 import os
+import signal
 from pathlib import Path as OSPath
 from typing import Dict, Union
 
@@ -23,6 +24,8 @@ from responses.reduced_models_response import ReducedModelsResponse
 
 MODEL_MANAGER = ModelManager()
 
+SERVER_MODE = os.environ.get("SERVER_MODE", "uvicorn")
+
 DOCS_BASE_PATH = OSPath("docs/endpoints/models/")
 
 logger = logging.getLogger("uvicorn")
@@ -176,7 +179,10 @@ async def post_model(file: UploadFile, response: JSONResponse):
                 MODEL_MANAGER.models_directory_path / str(file.filename), "wb"
             ) as buffer:
                 buffer.write(file.file.read())
+            # Fails on an invalid model before the other workers see it
             MODEL_MANAGER.reload_models()
+            if SERVER_MODE == "prefork":
+                reload_worker_models()
             message = "Model uploaded successfully"
             response.status_code = status.HTTP_201_CREATED
     except Exception as exception:
@@ -212,13 +218,24 @@ async def reload_models():
     ## Reload models
     Tries to reload all models in the API.
     """
-    MODEL_MANAGER.reload_models()
+    if SERVER_MODE == "prefork":
+        reload_worker_models()
+    else:
+        MODEL_MANAGER.reload_models()
     return JSONResponse(
         status_code=status.HTTP_202_ACCEPTED,
         content={"message": "Models reloaded successfully"},
     )
 
 
+def reload_worker_models() -> None:
+    """
+    Reload the models of every worker of the pre-fork server: the master process
+    reloads the models and replaces the workers gracefully, see gunicorn_conf.py.
+    """
+    os.kill(os.getppid(), signal.SIGHUP)
+
+
 def get_field_descriptions(model_name: str):
     model = MODEL_MANAGER.get_model(model_name)
     descriptions: dict = {}
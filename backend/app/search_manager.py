@@ -0,0 +1,309 @@
+"""
+search_manager.py
+
+This module contains the full-text search over the assets.
+
+The string fields of the node models and the notes of the assets (stored in
+their own collection) are indexed by an ArangoSearch view. ArangoDB updates
+the view on every write to a linked collection, so the writes of the
+DataManager need no extra work, new documents are searchable after the next
+commit of the view (about a second). A hit in the notes is returned as a hit
+of their asset.
+
+Every field is indexed with two analyzers: `gagm_words` (lower case words
+without accents) for exact and fuzzy matches and `gagm_prefix` (edge n-grams
+of the words) for prefix matches. All words of a search have to match, the
+results are ranked by BM25, exact matches weigh more than prefix and fuzzy
+matches. Highlights are computed on the returned page only.
+"""
+
+import logging
+import os
+import re
+import types
+import unicodedata
+from typing import Any, Optional, Type, Union, get_args, get_origin
+
+from arango.database import Database
+from pydantic import BaseModel
+
+from gagm_base.asset_model import AssetModel
+from notes_store import NOTES_COLLECTION
+
+logger = logging.getLogger("uvicorn")
+
+SEARCH_VIEW = "gagm_search"
+WORDS_ANALYZER = "gagm_words"
+PREFIX_ANALYZER = "gagm_prefix"
+SEARCH_COMMIT_INTERVAL_MS = int(os.environ.get("SEARCH_COMMIT_INTERVAL_MS", 1000))
+MAX_SEARCH_TOKENS = 8
+# Words shorter than this are only matched exactly
+MIN_FUZZY_LENGTH = 4
+MAX_SEARCH_LIMIT = 100
+HIGHLIGHT_CONTEXT = 60
+# Attribute of the uncompressed notes in their documents
+NOTES_PATH = ("content",)
+
+_TEXT_PROPERTIES = {
+    "locale": "en",
+    "case": "lower",
+    "accent": False,
+    "stemming": False,
+    "stopwords": [],
+}
+ANALYZERS: dict[str, dict] = {
+    WORDS_ANALYZER: {
+        "analyzer_type": "text",
+        "properties": _TEXT_PROPERTIES,
+        "features": ["frequency", "norm", "position"],
+    },
+    PREFIX_ANALYZER: {
+        "analyzer_type": "text",
+        "properties": {
+            **_TEXT_PROPERTIES,
+            "edgeNgram": {"min": 2, "max": 16, "preserveOriginal": True},
+        },
+        "features": ["frequency", "norm"],
+    },
+}
+
+
+class SearchHit(BaseModel):
+    id: str
+    type: str
+    score: float
+    highlights: dict[str, dict]
+    asset: dict
+
+
+class SearchResults(BaseModel):
+    hits: list[SearchHit]
+    tokens: list[str]
+
+
+def _is_text(annotation: Any) -> bool:
+    if annotation is str:
+        return True
+    if get_origin(annotation) in (Union, types.UnionType, list, set, tuple, frozenset):
+        return any(_is_text(arg) for arg in get_args(annotation) if arg is not type(None))
+    return False
+
+
+def searchable_fields(model: Type[BaseModel], prefix: tuple[str, ...] = ()) -> list[tuple[str, ...]]:
+    """
+    Get the stored attribute paths of the string fields of a model, including
+    the ones of nested models. The keys, IDs and notes (stored out of line)
+    are not searchable here.
+
+    Args:
+        model (Type[BaseModel]): The model.
+        prefix (tuple[str, ...], optional): Path of the model in the document.
+
+    Returns:
+        list[tuple[str, ...]]: The attribute paths.
+    """
+    paths: list[tuple[str, ...]] = []
+    for name, field in model.model_fields.items():
+        attribute = field.alias or name
+        if attribute in ("_key", "_id", "_from", "_to", "notes"):
+            continue
+        annotation = field.annotation
+        nested = [
+            arg
+            for arg in (annotation, *get_args(annotation))
+            if isinstance(arg, type) and issubclass(arg, BaseModel)
+        ]
+        if nested:
+            paths.extend(searchable_fields(nested[0], (*prefix, attribute)))
+        elif _is_text(annotation):
+            paths.append((*prefix, attribute))
+    return paths
+
+
+def _link_fields(paths: list[tuple[str, ...]]) -> dict:
+    fields: dict = {}
+    for path in paths:
+        level = fields
+        for attribute in path[:-1]:
+            level = level.setdefault(attribute, {"fields": {}})["fields"]
+        level[path[-1]] = {}
+    return fields
+
+
+def _field_tree(fields: dict) -> dict:
+    """
+    The nested attribute names of link fields, to compare the links without their options.
+    """
+    return {name: _field_tree(options.get("fields", {})) for name, options in fields.items()}
+
+
+def ensure_search_view(db: Database, models: dict[str, Type[AssetModel]]) -> None:
+    """
+    Create the analyzers and the search view, link the collections of the
+    models and unlink the collections of removed models. Links are only
+    updated if their fields changed, updating a link reindexes the collection.
+
+    Args:
+        db (Database): The database.
+        models (dict[str, Type[AssetModel]]): The node models by name.
+    """
+    existing_analyzers = {analyzer["name"].split("::")[-1] for analyzer in db.analyzers()}  # type: ignore
+    for name, definition in ANALYZERS.items():
+        if name not in existing_analyzers:
+            db.create_analyzer(name, **definition)
+
+    links = {
+        name: {
+            "analyzers": [WORDS_ANALYZER, PREFIX_ANALYZER],
+            "fields": _link_fields(searchable_fields(model)),
+            "includeAllFields": False,
+            "storeValues": "none",
+        }
+        for name, model in models.items()
+    }
+    links[NOTES_COLLECTION] = {
+        "analyzers": [WORDS_ANALYZER, PREFIX_ANALYZER],
+        "fields": _link_fields([NOTES_PATH]),
+        "includeAllFields": False,
+        "storeValues": "none",
+    }
+    if not any(view["name"] == SEARCH_VIEW for view in db.views()):  # type: ignore
+        logger.info("Creating search view %s", SEARCH_VIEW)
+        db.create_arangosearch_view(
+            SEARCH_VIEW,
+            properties={"links": links, "commitIntervalMsec": SEARCH_COMMIT_INTERVAL_MS},
+        )
+        return
+
+    current_links: dict = db.view(SEARCH_VIEW).get("links", {})  # type: ignore
+    changed: dict[str, Optional[dict]] = {
+        name: link
+        for name, link in links.items()
+        if name not in current_links
+        or _field_tree(current_links[name].get("fields", {})) != _field_tree(link["fields"])
+    }
+    changed.update({name: None for name in current_links if name not in links})
+    if changed:
+        logger.info("Updating the links of search view %s: %s", SEARCH_VIEW, list(changed))
+        db.update_arangosearch_view(SEARCH_VIEW, {"links": changed})
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split a search into words the way the analyzers do: lower case, without accents.
+
+    Args:
+        text (str): The search.
+
+    Returns:
+        list[str]: The words, at most MAX_SEARCH_TOKENS.
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(char for char in normalized if not unicodedata.combining(char))
+    return re.findall(r"\w+", stripped)[:MAX_SEARCH_TOKENS]
+
+
+def compile_search(
+    tokens: list[str],
+    paths: list[tuple[str, ...]],
+    collections: list[str],
+    limit: int,
+    fuzzy: bool = True,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Compile a search to AQL.
+
+    Args:
+        tokens (list[str]): The words, all of them have to match.
+        paths (list[tuple[str, ...]]): The attribute paths to search in.
+        collections (list[str]): The collections to search in, the notes of
+            their assets are searched too.
+        limit (int): Maximum number of results.
+        fuzzy (bool, optional): Also match words with one typo. Defaults to True.
+
+    Returns:
+        tuple[str, dict[str, Any]]: The query and its bind variables.
+    """
+    bind_vars: dict[str, Any] = {
+        "collections": [*collections, NOTES_COLLECTION],
+        "types": collections,
+        "limit": limit,
+    }
+    paths = [*paths, NOTES_PATH] if NOTES_PATH not in paths else paths
+    fields = []
+    for index, path in enumerate(paths):
+        bind_vars[f"f{index}"] = list(path)
+        fields.append(f"doc.@f{index}")
+
+    conditions = []
+    for index, token in enumerate(tokens):
+        bind_vars[f"t{index}"] = token
+        alternatives = []
+        for field in fields:
+            alternatives.append(f'BOOST(ANALYZER({field} == @t{index}, "{WORDS_ANALYZER}"), 2)')
+            if len(token) >= 2:
+                alternatives.append(f'ANALYZER({field} == @t{index}, "{PREFIX_ANALYZER}")')
+            if fuzzy and len(token) >= MIN_FUZZY_LENGTH:
+                alternatives.append(
+                    f'BOOST(ANALYZER(LEVENSHTEIN_MATCH({field}, @t{index}, 1, true), "{WORDS_ANALYZER}"), 0.5)'
+                )
+        conditions.append("(" + " OR ".join(alternatives) + ")")
+
+    query = "\n".join(
+        [
+            f"FOR doc IN {SEARCH_VIEW}",
+            "    SEARCH " + " AND ".join(conditions),
+            "    OPTIONS {collections: @collections}",
+            "    LET notes = doc.asset_id != null",
+            "    FILTER !notes OR PARSE_IDENTIFIER(doc.asset_id).collection IN @types",
+            "    LET score = BM25(doc)",
+            "    SORT score DESC",
+            "    LIMIT @limit",
+            "    RETURN {doc: notes ? DOCUMENT(doc.asset_id) : doc, notes: notes ? doc : null, score: score}",
+        ]
+    )
+    return query, bind_vars
+
+
+def highlight(document: dict, paths: list[tuple[str, ...]], tokens: list[str]) -> dict[str, dict]:
+    """
+    Find the words of a search in the fields of a document.
+    Words match if they start with a searched word, fuzzy matches aren't highlighted.
+
+    Args:
+        document (dict): The stored document.
+        paths (list[tuple[str, ...]]): The attribute paths that were searched.
+        tokens (list[str]): The searched words.
+
+    Returns:
+        dict[str, dict]: By dotted path, a fragment of the field around the
+            first match and the [start, end) offsets of the matches in the fragment.
+    """
+    highlights: dict[str, dict] = {}
+    for path in paths:
+        value: Any = document
+        for attribute in path:
+            value = value.get(attribute) if isinstance(value, dict) else None
+        values = value if isinstance(value, list) else [value]
+        for text in values:
+            if not isinstance(text, str):
+                continue
+            matches = []
+            for match in re.finditer(r"\w+", text):
+                words = tokenize(match.group())
+                if words and any(words[0].startswith(token) for token in tokens):
+                    matches.append((match.start(), match.end()))
+            if not matches:
+                continue
+            start = max(0, matches[0][0] - HIGHLIGHT_CONTEXT)
+            end = min(len(text), matches[0][1] + HIGHLIGHT_CONTEXT)
+            highlights[".".join(path)] = {
+                "fragment": text[start:end],
+                "matches": [
+                    [match_start - start, match_end - start]
+                    for match_start, match_end in matches
+                    if match_end <= end
+                ],
+            }
+            break
+    return highlights
@@ -0,0 +1,165 @@
+"""
+trusted_reads.py
+
+This module contains the helpers of the trusted read mode.
+
+Every document is validated by pydantic before it is written to ArangoDB,
+so documents that were written with the currently loaded version of a model
+don't have to be validated again when they are only read to be serialized.
+Documents are tagged with the hash of the model schema on write, documents
+with the current hash are projected straight into the serialized form of the
+model, documents with a different (or missing) hash are fully validated.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Optional, Type, get_args
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("uvicorn")
+
+TRUSTED_READS_ENABLED = os.environ.get("TRUSTED_READS", "true") == "true"
+
+SCHEMA_HASH_FIELD = "gagm_schema"
+
+_schema_hashes: dict[Type[BaseModel], str] = {}
+_projection_plans: dict[Type[BaseModel], Optional[list[tuple[str, str]]]] = {}
+
+
+def schema_hash(model: Type[BaseModel]) -> str:
+    """
+    Get the hash of the JSON schema of a model.
+    The result is cached, the schema of a loaded model class never changes.
+
+    Args:
+        model (Type[BaseModel]): The model.
+
+    Returns:
+        str: Hex digest identifying the schema version of the model.
+    """
+    if model not in _schema_hashes:
+        schema = json.dumps(model.model_json_schema(), sort_keys=True)
+        _schema_hashes[model] = hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+    return _schema_hashes[model]
+
+
+def _has_custom_serialization(model: Type[BaseModel]) -> bool:
+    decorators = model.__pydantic_decorators__
+    return bool(decorators.model_serializers or decorators.computed_fields)
+
+
+def _is_stored_as_dumped(annotation: Any) -> bool:
+    """
+    Check if values of a field are stored exactly as `model_dump()` returns them.
+    Documents are written with `by_alias=True`, so nested models with aliases
+    or excluded fields are stored differently than they are serialized.
+
+    Args:
+        annotation (Any): The type annotation of the field.
+
+    Returns:
+        bool: True if the stored value can be returned as is.
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        if _has_custom_serialization(annotation):
+            return False
+        for field in annotation.model_fields.values():
+            if field.alias or field.exclude:
+                return False
+            if not _is_stored_as_dumped(field.annotation):
+                return False
+        return True
+    return all(_is_stored_as_dumped(arg) for arg in get_args(annotation))
+
+
+def _projection_plan(model: Type[BaseModel]) -> Optional[list[tuple[str, str]]]:
+    """
+    Get the (field name, stored attribute name) pairs used to project stored
+    documents of a model into its serialized form.
+
+    Args:
+        model (Type[BaseModel]): The model.
+
+    Returns:
+        Optional[list[tuple[str, str]]]: The pairs, None if the model can't be projected.
+    """
+    if model not in _projection_plans:
+        _projection_plans[model] = None
+        if not _has_custom_serialization(model) and all(
+            _is_stored_as_dumped(field.annotation)
+            for field in model.model_fields.values()
+        ):
+            _projection_plans[model] = [
+                (name, field.alias or name)
+                for name, field in model.model_fields.items()
+                if not field.exclude
+            ]
+    return _projection_plans[model]
+
+
+def _project(model: Type[BaseModel], data: dict, by_alias: bool) -> Optional[dict]:
+    plan = _projection_plan(model)
+    if plan is None:
+        return None
+    projected: dict = {}
+    for name, stored_name in plan:
+        if stored_name not in data:
+            return None
+        projected[stored_name if by_alias else name] = data[stored_name]
+    return projected
+
+
+def parse_document(model: Type[BaseModel], data: dict) -> BaseModel:
+    """
+    Turn a stored document into a validated model instance.
+
+    Args:
+        model (Type[BaseModel]): The model of the document.
+        data (dict): The stored document.
+
+    Returns:
+        BaseModel: The model instance.
+    """
+    return model.model_validate(data, from_attributes=True)
+
+
+def serialize_document(
+    model: Type[BaseModel], data: dict, by_alias: bool = False
+) -> dict:
+    """
+    Turn a stored document into the form `model.model_dump(mode="json")` would return.
+    Validation is skipped if the document was written with the current schema
+    of the model, otherwise the document is validated and dumped.
+
+    Args:
+        model (Type[BaseModel]): The model of the document.
+        data (dict): The stored document.
+        by_alias (bool, optional): Use the field aliases as keys. Defaults to False.
+
+    Returns:
+        dict: The serialized asset.
+    """
+    if TRUSTED_READS_ENABLED and data.get(SCHEMA_HASH_FIELD) == schema_hash(model):
+        projected = _project(model, data, by_alias)
+        if projected is not None:
+            return projected
+    # JSON values like the stored documents, the result is sent without a response model
+    return parse_document(model, data).model_dump(mode="json", by_alias=by_alias)
+
+
+def tag_document(model: Type[BaseModel], document: dict) -> dict:
+    """
+    Tag a document with the schema hash of its model before writing it.
+
+    Args:
+        model (Type[BaseModel]): The model the document was validated with.
+        document (dict): The serialized document.
+
+    Returns:
+        dict: The tagged document.
+    """
+    document[SCHEMA_HASH_FIELD] = schema_hash(model)
+    return document
@@ -2,4 +2,13 @@
 
 #find /opt/app/models -name "*.whl" -exec pip install {} \;
 
+if [ "$SERVER_MODE" = "prefork" ]; then
+    exec gunicorn main:app --config gunicorn_conf.py
+fi
+
+if [ -z "$WORKERS" ] || [ "$WORKERS" = "auto" ]; then
+    # One worker per core of the CPU quota of the container, like the pre-fork server
+    WORKERS=$(python -c "from gunicorn_conf import available_cpus; print(available_cpus())")
+fi
+
 exec uvicorn main:app --host 0.0.0.0 --port $APP_PORT --workers $WORKERS
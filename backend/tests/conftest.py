@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules of the backend are imported from the app directory, like the server does
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import time
+import tracemalloc
+
+import anyio
+import pytest
+
+import attachment_store
+from attachment_store import AttachmentStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachment_store, "ATTACHMENTS_DIRECTORY", tmp_path)
+    return AttachmentStore()
+
+
+async def _chunks(data: bytes, chunk_size: int):
+    for start in range(0, len(data), chunk_size):
+        yield data[start : start + chunk_size]
+
+
+def _receive(store: AttachmentStore, data: bytes, chunk_size: int = 4096):
+    async def receive():
+        return await store.receive(_chunks(data, chunk_size))
+
+    return anyio.run(receive)
+
+
+def _age(path, seconds: float) -> None:
+    moment = time.time() - seconds
+    os.utime(path, (moment, moment))
+
+
+def test_same_content_is_stored_once(store):
+    data = os.urandom(100_000)
+
+    first = _receive(store, data)
+    second = _receive(store, data)
+
+    assert first.digest == second.digest == hashlib.sha256(data).hexdigest()
+    assert first.created and not second.created
+    assert second.size == len(data)
+    blobs = [path for path in store.blob_directory.rglob("*") if path.is_file()]
+    assert blobs == [store.blob_path(first.digest)]
+    assert blobs[0].read_bytes() == data
+    # The temporary file of the duplicate upload is dropped
+    assert list(store.temporary_directory.iterdir()) == []
+
+
+def test_digest_mismatch_keeps_nothing(store):
+    async def receive():
+        return await store.receive(_chunks(b"content", 4), expected_digest="0" * 64)
+
+    with pytest.raises(attachment_store.DigestMismatchError):
+        anyio.run(receive)
+    assert not store.blob_directory.exists() or not any(store.blob_directory.rglob("*"))
+    assert list(store.temporary_directory.iterdir()) == []
+
+
+def test_garbage_collection_dry_run_and_collection(store):
+    grace = attachment_store.ATTACHMENT_GC_GRACE_SECONDS
+    referenced = _receive(store, b"referenced")
+    orphan = _receive(store, b"orphan")
+    recent = _receive(store, b"recent orphan")
+    _age(store.blob_path(referenced.digest), grace + 60)
+    _age(store.blob_path(orphan.digest), grace + 60)
+    aborted = store.temporary_directory / "aborted.part"
+    aborted.write_bytes(b"partial")
+    _age(aborted, grace + 60)
+
+    dry_run = store.collect_garbage({referenced.digest}, dry_run=True)
+
+    assert (dry_run.blobs, dry_run.referenced, dry_run.removed, dry_run.kept_recent) == (3, 1, 1, 1)
+    assert dry_run.removed_bytes == len(b"orphan")
+    assert dry_run.removed_temporary == 1
+    assert store.blob_path(orphan.digest).exists()
+    assert aborted.exists()
+
+    report = store.collect_garbage({referenced.digest})
+
+    assert (report.removed, report.removed_bytes, report.removed_temporary) == (1, len(b"orphan"), 1)
+    assert not store.blob_path(orphan.digest).exists()
+    assert not aborted.exists()
+    assert store.blob_path(referenced.digest).exists()
+    # Younger than the grace period, its reference may not be written yet
+    assert store.blob_path(recent.digest).exists()
+    assert store.collect_garbage({referenced.digest}).removed == 0
+
+
+def test_upload_again_protects_blob_from_collection(store):
+    grace = attachment_store.ATTACHMENT_GC_GRACE_SECONDS
+    blob = _receive(store, b"uploaded twice")
+    _age(store.blob_path(blob.digest), grace + 60)
+
+    _receive(store, b"uploaded twice")
+
+    assert store.collect_garbage(set()).kept_recent == 1
+    assert store.blob_path(blob.digest).exists()
+
+
+def test_chunked_upload_never_holds_the_whole_body(store, monkeypatch):
+    chunk_size = 64 * 1024
+    request_chunk_size = 4096
+    monkeypatch.setattr(attachment_store, "ATTACHMENT_CHUNK_SIZE", chunk_size)
+    data = os.urandom(8 * 1024 * 1024)
+    writes: list[int] = []
+    write = attachment_store.BlobUpload.write
+
+    def recording_write(self, chunk: bytes) -> None:
+        writes.append(len(chunk))
+        write(self, chunk)
+
+    monkeypatch.setattr(attachment_store.BlobUpload, "write", recording_write)
+
+    tracemalloc.start()
+    try:
+        blob = _receive(store, data, request_chunk_size)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert blob.size == len(data)
+    assert peak < len(data) // 8
+    assert sum(writes) == len(data)
+    # The body is buffered up to a chunk at a time, never as a whole
+    assert len(writes) >= len(data) // (chunk_size + request_chunk_size)
+    assert max(writes) < chunk_size + request_chunk_size
+    assert store.blob_path(blob.digest).read_bytes() == data
+
+
+def test_upload_over_the_size_limit_is_dropped(store, monkeypatch):
+    monkeypatch.setattr(attachment_store, "ATTACHMENT_CHUNK_SIZE", 1024)
+    monkeypatch.setattr(attachment_store, "ATTACHMENT_MAX_SIZE", 10_000)
+
+    with pytest.raises(attachment_store.AttachmentTooLargeError):
+        _receive(store, os.urandom(20_000), 1024)
+    assert list(store.temporary_directory.iterdir()) == []
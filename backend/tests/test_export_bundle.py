@@ -0,0 +1,180 @@
+import pytest
+
+from export_bundle import (
+    FROM_COLUMN,
+    KEY_COLUMN,
+    TO_COLUMN,
+    BundleReader,
+    InvalidBundleError,
+    build_bundle,
+    update_bundle,
+)
+
+
+def _node(type_name: str, key: str, **fields) -> dict:
+    return {"db_id": f"{type_name}/{key}", "db_key": key, **fields}
+
+
+def _edge(type_name: str, key: str, origin: str, target: str, **fields) -> dict:
+    return {"db_id": f"{type_name}/{key}", "db_key": key, "origin_id": origin, "target_id": target, **fields}
+
+
+NODES = {
+    "NPC": [
+        _node("NPC", "c", npc_name="Carol", level=3, position={"x": 1.5, "y": 2.0}),
+        _node("NPC", "a", npc_name="Alice", level=1, position={"x": 0.0, "y": 0.5}),
+        _node("NPC", "b", npc_name="Bob", level=None, position=None),
+    ],
+    "Location": [
+        _node("Location", "town", location_name="Town", tags=["safe", "shop"]),
+        _node("Location", "cave", location_name="Cave", tags=[]),
+    ],
+}
+EDGES = {
+    "LivesIn": [
+        _edge("LivesIn", "e3", "NPC/c", "Location/cave", since=2),
+        _edge("LivesIn", "e1", "NPC/a", "Location/town", since=1),
+        _edge("LivesIn", "e2", "NPC/b", "Location/town", since=1),
+        # The target isn't in the bundle
+        _edge("LivesIn", "e4", "NPC/a", "Location/castle", since=5),
+    ],
+}
+
+
+def _by_id(rows: list[dict]) -> dict[str, dict]:
+    return {row["db_id"]: row for row in rows}
+
+
+def _outgoing(reader: BundleReader, table: str) -> dict[str, list[str]]:
+    node_ids = reader.node_ids()
+    offsets = reader.adjacency(table).tolist()
+    targets = reader.column(table, TO_COLUMN).tolist()
+    return {
+        node_ids[node]: [node_ids[target] for target in targets[offsets[node] : offsets[node + 1]]]
+        for node in range(len(node_ids))
+        if offsets[node] != offsets[node + 1]
+    }
+
+
+def test_round_trip_of_the_rows():
+    bundle, stats = build_bundle(NODES, EDGES, watermark_ms=1234, models_hash="hash")
+    reader = BundleReader(bundle)
+
+    assert (reader.node_count, reader.edge_count, reader.watermark_ms) == (5, 3, 1234)
+    assert reader.models_hash == "hash"
+    assert (stats.nodes, stats.edges, stats.bytes) == (5, 3, len(bundle))
+    assert _by_id(reader.rows("NPC")) == _by_id(NODES["NPC"])
+    assert _by_id(reader.rows("Location")) == _by_id(NODES["Location"])
+    # Node tables are sorted by key, keys are found by binary search
+    assert [row["db_key"] for row in reader.rows("NPC")] == ["a", "b", "c"]
+    assert reader.find("NPC", "c") == 2
+    assert reader.find("NPC", "d") is None
+
+
+def test_adjacency_is_compressed_sparse_rows():
+    reader = BundleReader(build_bundle(NODES, EDGES)[0])
+
+    node_ids = reader.node_ids()
+    assert node_ids == ["Location/cave", "Location/town", "NPC/a", "NPC/b", "NPC/c"]
+    offsets = reader.adjacency("LivesIn").tolist()
+    assert len(offsets) == len(node_ids) + 1
+    assert offsets[0] == 0 and offsets[-1] == reader.tables["LivesIn"].rows
+    assert _outgoing(reader, "LivesIn") == {
+        "NPC/a": ["Location/town"],
+        "NPC/b": ["Location/town"],
+        "NPC/c": ["Location/cave"],
+    }
+    # The edge rows are sorted by origin
+    origins = reader.column("LivesIn", FROM_COLUMN).tolist()
+    assert origins == sorted(origins)
+
+
+def test_edges_to_missing_nodes_are_dropped():
+    bundle, stats = build_bundle(NODES, EDGES)
+    reader = BundleReader(bundle)
+
+    assert stats.dropped_edges == 1
+    assert "LivesIn/e4" not in _by_id(reader.rows("LivesIn"))
+    assert _by_id(reader.rows("LivesIn")) == _by_id(EDGES["LivesIn"][:3])
+
+
+def test_strings_are_stored_once():
+    nodes = {"NPC": [_node("NPC", f"npc{index}", faction="guild", title="guild") for index in range(50)]}
+    reader = BundleReader(build_bundle(nodes, {})[0])
+
+    strings = reader.strings()
+    assert len(strings) == len(set(strings))
+    assert strings.count("guild") == 1
+    faction = reader.column("NPC", "faction").tolist()
+    assert set(faction) == set(reader.column("NPC", "title").tolist()) == {strings.index("guild")}
+    assert len(reader.column("NPC", KEY_COLUMN)) == 50
+
+
+def test_incremental_update_equals_a_full_rebuild():
+    connected = {"LivesIn": EDGES["LivesIn"][:3]}
+    reader = BundleReader(build_bundle(NODES, connected, watermark_ms=1)[0])
+    changed_npc = _node("NPC", "a", npc_name="Alice", level=2, position={"x": 4.0, "y": 0.5})
+    new_location = _node("Location", "castle", location_name="Castle", tags=["royal"])
+    new_edge = _edge("LivesIn", "e5", "NPC/c", "Location/castle", since=9)
+    node_changes = {
+        "NPC": {"NPC/a": changed_npc, "NPC/b": None},
+        "Location": {"Location/castle": new_location},
+    }
+    # The edge of the deleted NPC is deleted with it
+    edge_changes = {"LivesIn": {"LivesIn/e2": None, "LivesIn/e5": new_edge}}
+
+    updated, stats = update_bundle(reader, node_changes, edge_changes, watermark_ms=2, models_hash="hash")
+
+    nodes = {
+        "NPC": [changed_npc, NODES["NPC"][0]],
+        "Location": NODES["Location"] + [new_location],
+    }
+    edges = {"LivesIn": [EDGES["LivesIn"][0], EDGES["LivesIn"][1], new_edge]}
+    rebuilt, rebuilt_stats = build_bundle(nodes, edges, watermark_ms=2, models_hash="hash")
+    updated_reader = BundleReader(updated)
+    rebuilt_reader = BundleReader(rebuilt)
+    assert updated_reader.node_ids() == rebuilt_reader.node_ids()
+    assert updated_reader.tables.keys() == rebuilt_reader.tables.keys()
+    for table in rebuilt_reader.tables:
+        assert _by_id(updated_reader.rows(table)) == _by_id(rebuilt_reader.rows(table))
+    # The node numbering changed, the adjacency follows it
+    assert _outgoing(updated_reader, "LivesIn") == _outgoing(rebuilt_reader, "LivesIn") == {
+        "NPC/a": ["Location/town"],
+        "NPC/c": ["Location/castle", "Location/cave"],
+    }
+    assert (stats.nodes, stats.edges) == (rebuilt_stats.nodes, rebuilt_stats.edges) == (5, 3)
+    assert updated_reader.watermark_ms == 2
+
+
+def test_update_without_node_changes_copies_the_tables():
+    reader = BundleReader(build_bundle(NODES, EDGES)[0])
+    changed_edge = _edge("LivesIn", "e1", "NPC/a", "Location/town", since=7)
+
+    updated = BundleReader(update_bundle(reader, {}, {"LivesIn": {"LivesIn/e1": changed_edge}})[0])
+
+    assert _by_id(updated.rows("NPC")) == _by_id(reader.rows("NPC"))
+    assert _by_id(updated.rows("LivesIn"))["LivesIn/e1"]["since"] == 7
+    assert _outgoing(updated, "LivesIn") == _outgoing(reader, "LivesIn")
+
+
+def test_open_maps_the_file(tmp_path):
+    path = tmp_path / "graph.gagm"
+    path.write_bytes(build_bundle(NODES, EDGES)[0])
+
+    with BundleReader.open(path) as reader:
+        assert _by_id(reader.rows("NPC")) == _by_id(NODES["NPC"])
+
+
+@pytest.mark.parametrize("length", [0, 10, 64, 100, -1])
+def test_truncated_bundle_is_rejected(length):
+    bundle = build_bundle(NODES, EDGES)[0]
+
+    with pytest.raises(InvalidBundleError):
+        BundleReader(bundle[:length])
+
+
+def test_bad_magic_is_rejected():
+    bundle = build_bundle(NODES, EDGES)[0]
+
+    with pytest.raises(InvalidBundleError):
+        BundleReader(b"NOTABNDL" + bundle[8:])
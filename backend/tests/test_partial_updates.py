@@ -0,0 +1,57 @@
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+
+from exceptions.data_exceptions import InvalidPatchError
+from partial_updates import validate_merge
+
+
+class Dungeon(BaseModel):
+    name: str
+    min_players: int
+    max_players: int
+    boss: Optional[str] = None
+    key: str = Field(default="", alias="_key")
+
+    @field_validator("name")
+    @classmethod
+    def name_not_blank(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("name can't be blank")
+        return value
+
+    @model_validator(mode="after")
+    def players_in_order(self) -> "Dungeon":
+        if self.min_players > self.max_players:
+            raise ValueError("min_players can't be above max_players")
+        return self
+
+
+STORED = {"_key": "crypt", "_rev": "_abc", "name": "Crypt", "min_players": 2, "max_players": 4}
+
+
+def test_merge_is_validated_as_a_whole():
+    merged = validate_merge(Dungeon, STORED, {"max_players": 6})
+
+    assert merged.max_players == 6
+    assert merged.name == "Crypt"
+
+
+def test_cross_field_invariant_sees_unchanged_fields():
+    with pytest.raises(ValidationError, match="min_players can't be above max_players"):
+        validate_merge(Dungeon, STORED, {"max_players": 1})
+
+
+def test_invalid_stored_field_is_rejected():
+    with pytest.raises(ValidationError, match="name can't be blank"):
+        validate_merge(Dungeon, {**STORED, "name": " "}, {"max_players": 6})
+
+
+def test_required_field_cant_be_null():
+    with pytest.raises(InvalidPatchError, match="name can't be null"):
+        validate_merge(Dungeon, STORED, {"name": None})
+
+
+def test_optional_field_can_be_null():
+    assert validate_merge(Dungeon, {**STORED, "boss": "Lich"}, {"boss": None}).boss is None
@@ -0,0 +1,108 @@
+"""
+attachments.py
+
+Upload throughput and memory of the attachment store with large files, and
+its deduplication and garbage collection. Runs without a backend, the files
+are generated and streamed into the store like the body of a request.
+
+- upload: streams `--size-mb` of random data in chunks of `--request-chunk-kb`
+  (the size of the body chunks of the server) and reports the throughput and
+  the peak of the Python allocations during the upload, which should stay
+  around `ATTACHMENT_CHUNK_SIZE` whatever the size.
+- dedup: uploads the same content again, nothing new is stored.
+- gc: collects with only one of two blobs referenced, the other one is
+  removed once it's older than `ATTACHMENT_GC_GRACE_SECONDS`.
+
+Usage:
+    python benchmarks/attachments.py --size-mb 4096
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import anyio
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend" / "app"))
+
+
+async def generated(size: int, chunk_size: int, seed: bytes):
+    # Cheap pseudo random content, the same for the same seed
+    block = (seed * (1024 * 1024 // len(seed) + 1))[: 1024 * 1024]
+    sent = 0
+    index = 0
+    while sent < size:
+        chunk = block[index % len(block) :][:chunk_size]
+        chunk = chunk[: size - sent]
+        sent += len(chunk)
+        index += 4099
+        yield chunk
+
+
+async def upload(store, size: int, chunk_size: int, seed: bytes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    blob = await store.receive(generated(size, chunk_size, seed))
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return blob, seconds, peak
+
+
+async def run(args: argparse.Namespace) -> None:
+    from attachment_store import ATTACHMENT_CHUNK_SIZE, ATTACHMENT_GC_GRACE_SECONDS, AttachmentStore
+
+    store = AttachmentStore()
+    size = args.size_mb * 1024 * 1024
+    chunk_size = args.request_chunk_kb * 1024
+
+    blob, seconds, peak = await upload(store, size, chunk_size, os.urandom(64))
+    print(
+        f"upload     {size / 1e6:10.1f} MB in {seconds:6.2f} s ({size / 1e6 / seconds:7.1f} MB/s)"
+        f"    peak Python memory {peak / 1e6:6.2f} MB (chunk {ATTACHMENT_CHUNK_SIZE / 1e6:.2f} MB)"
+        f"    max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:6.1f} MB"
+    )
+
+    small = 8 * 1024 * 1024
+    duplicate, _, _ = await upload(store, small, chunk_size, b"duplicate")
+    duplicate_again, _, _ = await upload(store, small, chunk_size, b"duplicate")
+    orphan, _, _ = await upload(store, small, chunk_size, b"orphan")
+    blobs = [path for path in store.blob_directory.rglob("*") if path.is_file()]
+    print(
+        f"dedup      second upload created={duplicate_again.created}, same digest="
+        f"{duplicate.digest == duplicate_again.digest}, {len(blobs)} blobs stored for 4 uploads"
+    )
+
+    # Only the large blob is referenced, the others are kept until they're older than the grace period
+    recent = store.collect_garbage({blob.digest})
+    old = time.time() - ATTACHMENT_GC_GRACE_SECONDS - 60
+    for digest in (duplicate.digest, orphan.digest):
+        os.utime(store.blob_path(digest), (old, old))
+    dry_run = store.collect_garbage({blob.digest}, dry_run=True)
+    report = store.collect_garbage({blob.digest})
+    print(
+        f"gc         recent blobs kept {recent.kept_recent}, dry run would remove {dry_run.removed}, "
+        f"removed {report.removed} ({report.removed_bytes / 1e6:.1f} MB) in {report.seconds * 1000:.1f} ms, "
+        f"large blob still stored: {store.blob_path(blob.digest).exists()}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--request-chunk-kb", type=int, default=64)
+    parser.add_argument("--directory", help="Directory of the store, a temporary one by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        os.environ["ATTACHMENTS_DIRECTORY"] = directory
+        anyio.run(run, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+branches.py
+
+Cost of the content branches on a seeded graph. Creates a branch, which
+shouldn't depend on the size of the graph, changes `--changes` NPCs in it
+and compares the time of the whole graph in the branch to main. Then times
+the diff and the merge of the branch into main.
+
+Usage:
+    python benchmarks/branches.py --url http://127.0.0.1:8000 --api-key KEY --changes 1000
+"""
+
+import argparse
+import statistics
+import time
+
+import requests
+
+BRANCH = "benchmark"
+
+
+def median_ms(session: requests.Session, method: str, url: str, repeat: int, **kwargs) -> float:
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = session.request(method, url, timeout=600, **kwargs)
+        response.raise_for_status()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--changes", type=int, default=1000, help="NPCs changed in the branch")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    session.headers.update({"X-API-KEY": args.api_key})
+    session.delete(f"{args.url}/branches/{BRANCH}", timeout=600)
+
+    start = time.perf_counter()
+    session.post(f"{args.url}/branches/", json={"name": BRANCH}, timeout=60).raise_for_status()
+    print(f"create     {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    npcs = session.get(f"{args.url}/data/typed/NPC", timeout=600).json()
+    keys = sorted(npcs)[: args.changes]
+    branch_headers = {"X-GAGM-BRANCH": BRANCH}
+    start = time.perf_counter()
+    for key in keys:
+        session.patch(
+            f"{args.url}/data/NPC/{key}",
+            json={"npc_name": f"{npcs[key]['npc_name']} (branch)"},
+            headers=branch_headers,
+            timeout=60,
+        ).raise_for_status()
+    seconds = time.perf_counter() - start
+    print(f"change     {len(keys)} NPCs in {seconds:.1f} s ({seconds / max(len(keys), 1) * 1000:.1f} ms each)")
+
+    main_ms = median_ms(session, "GET", f"{args.url}/data/", args.repeat)
+    branch_ms = median_ms(session, "GET", f"{args.url}/data/", args.repeat, headers=branch_headers)
+    print(f"graph      main {main_ms:8.1f} ms    branch {branch_ms:8.1f} ms ({len(npcs)} NPCs)")
+
+    diff_ms = median_ms(session, "GET", f"{args.url}/branches/{BRANCH}/diff", args.repeat)
+    print(f"diff       {diff_ms:8.1f} ms")
+
+    start = time.perf_counter()
+    response = session.post(f"{args.url}/branches/{BRANCH}/merge", timeout=600)
+    response.raise_for_status()
+    report = response.json()
+    print(
+        f"merge      {report['updated']} updated in {(time.perf_counter() - start) * 1000:.1f} ms"
+        f" (server {report['seconds'] * 1000:.1f} ms)"
+    )
+    session.delete(f"{args.url}/branches/{BRANCH}", timeout=600).raise_for_status()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+bulk_delete.py
+
+Time of a bulk delete. Creates `--count` NPC assets with the batch endpoint,
+tags a fraction of them and connects them with dialogue edges, then deletes
+them with a single bulk delete selecting their key prefix. The edges and
+tags are removed by the cascade of the delete, the dialogue lines by a
+second bulk delete.
+
+Usage:
+    python benchmarks/bulk_delete.py --url http://127.0.0.1:8000 --api-key KEY --count 100000
+"""
+
+import argparse
+import time
+
+import requests
+
+KEY_PREFIX = "bulk-delete-"
+BATCH_SIZE = 1000
+
+
+def create_assets(session: requests.Session, url: str, count: int, tagged_every: int) -> None:
+    operations: list[dict] = []
+
+    def flush() -> None:
+        if operations:
+            response = session.post(f"{url}/data/batch", json={"operations": operations}, timeout=300)
+            response.raise_for_status()
+            operations.clear()
+
+    for index in range(count):
+        key = f"{KEY_PREFIX}{index}"
+        operations.append({"op": "create", "type": "NPC", "data": {"_key": key, "npc_name": key}})
+        operations.append(
+            {"op": "create", "type": "DialogueElement", "data": {"_key": key, "dialogue_line": key}}
+        )
+        operations.append(
+            {
+                "op": "create",
+                "type": "DialogueOfNPC",
+                "data": {"_key": key, "_from": f"NPC/{key}", "_to": f"DialogueElement/{key}"},
+            }
+        )
+        if tagged_every and index % tagged_every == 0:
+            operations.append({"op": "tag", "type": "NPC", "key": key, "tag": "bulk-delete"})
+        if len(operations) >= BATCH_SIZE - 4:
+            flush()
+    flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--tagged-every", type=int, default=10, help="Tag every nth NPC, 0 for none")
+    parser.add_argument("--dry-run", action="store_true", help="Count without deleting")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    session.headers.update({"X-API-KEY": args.api_key})
+    start = time.perf_counter()
+    create_assets(session, args.url, args.count, args.tagged_every)
+    print(f"created {args.count} NPCs with their dialogues in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    response = session.post(
+        f"{args.url}/data/delete",
+        json={
+            "type": "NPC",
+            "where": [{"field": "_key", "op": "prefix", "value": KEY_PREFIX}],
+            "dry_run": args.dry_run,
+        },
+        timeout=600,
+    )
+    response.raise_for_status()
+    seconds = time.perf_counter() - start
+    report = response.json()
+    print(
+        f"deleted {sum(report['assets'].values())} assets and {sum(report['edges'].values())} edges"
+        f" in {seconds:.1f} s (server {report['seconds']:.1f} s)"
+    )
+    for collection, removed in report["edges"].items():
+        print(f"  {collection}: {removed} edges")
+
+    # The dialogue lines are left without edges, remove them for the next run
+    response = session.post(
+        f"{args.url}/data/delete",
+        json={
+            "type": "DialogueElement",
+            "where": [{"field": "_key", "op": "prefix", "value": KEY_PREFIX}],
+            "dry_run": args.dry_run,
+        },
+        timeout=600,
+    )
+    response.raise_for_status()
+
+
+if __name__ == "__main__":
+    main()
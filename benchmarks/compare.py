@@ -0,0 +1,74 @@
+"""
+compare.py
+
+Compares two result files of loadtest.py, usually of two commits. Runs are
+matched by scenario, mode and load. The exit code is 1 if any matched run got
+slower than the threshold at p95 or lost more throughput than the threshold,
+or if a run failed (most of its requests got errors) in either file.
+
+Usage:
+    python benchmarks/compare.py benchmarks/results/abc1234.json benchmarks/results/def5678.json \\
+        --threshold 10
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+
+def load_runs(path: str) -> tuple[dict, dict]:
+    report = json.loads(Path(path).read_text(encoding="utf-8"))
+    runs = {
+        (run["scenario"], run["mode"], run["load"]): run for run in report["results"]
+    }
+    return report, runs
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    args = parser.parse_args()
+
+    baseline_report, baseline = load_runs(args.baseline)
+    candidate_report, candidate = load_runs(args.candidate)
+    if baseline_report["dataset"]["documents"] != candidate_report["dataset"]["documents"]:
+        print("Warning: the results were measured on different datasets.")
+
+    print(
+        f"{baseline_report['revision']} -> {candidate_report['revision']}\n"
+        f"{'scenario':12s} {'mode':6s} {'load':>7s} {'req/s':>9s} {'p50':>9s} {'p95':>9s} {'p99':>9s}"
+    )
+    regressions = []
+    for key in sorted(baseline.keys() & candidate.keys(), key=str):
+        before, after = baseline[key], candidate[key]
+        scenario, mode, load = key
+        if before.get("failed") or after.get("failed"):
+            print(f"{scenario:12s} {mode:6s} {load:7.1f} failed, most requests got errors")
+            regressions.append(key)
+            continue
+        deltas = {
+            metric: change(before.get(metric, 0.0), after.get(metric, 0.0))
+            for metric in ("throughput", "p50_ms", "p95_ms", "p99_ms")
+        }
+        print(
+            f"{scenario:12s} {mode:6s} {load:7.1f}"
+            + "".join(f" {deltas[metric]:+8.1f}%" for metric in deltas)
+        )
+        if deltas["p95_ms"] > args.threshold or -deltas["throughput"] > args.threshold:
+            regressions.append(key)
+
+    for key in sorted(baseline.keys() ^ candidate.keys(), key=str):
+        print(f"Only in one of the files: {key}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold}% or failed run(s)")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+concurrency.py
+
+Load test that checks whether the throughput of the backend scales with the
+number of concurrent clients. Every client sends requests back to back for a
+fixed time, the throughput and latency percentiles are printed per concurrency
+level. A backend whose workers block on database calls shows a flat throughput
+and a latency growing linearly with the concurrency.
+
+Usage:
+    python benchmarks/concurrency.py --url http://127.0.0.1:8000 --api-key KEY \\
+        --path /data/ --concurrency 1 2 4 8 16 32
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+
+def client(
+    url: str, headers: dict, body: str | None, deadline: float, latencies: list
+) -> None:
+    session = requests.Session()
+    session.headers.update(headers)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if body is None:
+            response = session.get(url, timeout=60)
+        else:
+            response = session.post(url, data=body, timeout=60)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+def run_level(
+    url: str, headers: dict, body: str | None, concurrency: int, duration: float
+) -> dict:
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(url, headers, body, deadline, latencies))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput": len(latencies) / duration,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--path", default="/data/")
+    parser.add_argument("--body", default=None, help="JSON body, sends a POST if set")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    headers = {"X-API-KEY": args.api_key, "Content-Type": "application/json"}
+    for concurrency in args.concurrency:
+        result = run_level(
+            args.url + args.path, headers, args.body, concurrency, args.duration
+        )
+        print(
+            f"concurrency {result['concurrency']:3d}: {result['throughput']:8.1f} req/s"
+            f"  p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+contention.py
+
+Write latency under contention. Every client updates assets of a small hot
+set back to back with optimistic concurrency: it reads the asset with its
+ETag and sends the update with If-Match, a 412 response means another client
+wrote the asset in between and the client reads and retries. The latency of
+a write includes its retries. With `--blind` the updates are sent without
+If-Match, the last write wins.
+
+Usage:
+    python benchmarks/contention.py --url http://127.0.0.1:8000 --api-key KEY \\
+        --hot 1 8 64 --concurrency 1 8 32
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+
+import requests
+
+ASSET_TYPE = "NPC"
+KEY_PREFIX = "contention-"
+
+
+def create_hot_set(session: requests.Session, url: str, hot: int) -> list[str]:
+    keys = [f"{KEY_PREFIX}{index}" for index in range(hot)]
+    for key in keys:
+        response = session.post(
+            f"{url}/data/{ASSET_TYPE}", json={"_key": key, "npc_name": key}, timeout=60
+        )
+        # 409: created by a previous run
+        if response.status_code not in (200, 409):
+            response.raise_for_status()
+    return keys
+
+
+def client(
+    url: str,
+    headers: dict,
+    keys: list[str],
+    blind: bool,
+    deadline: float,
+    stats: dict,
+    lock: threading.Lock,
+) -> None:
+    session = requests.Session()
+    session.headers.update(headers)
+    latencies: list[float] = []
+    retries = 0
+    while time.perf_counter() < deadline:
+        key = random.choice(keys)
+        asset_url = f"{url}/data/{ASSET_TYPE}/{key}"
+        start = time.perf_counter()
+        while True:
+            write_headers = {}
+            if not blind:
+                response = session.get(asset_url, timeout=60)
+                response.raise_for_status()
+                write_headers["If-Match"] = response.headers["ETag"]
+            response = session.put(
+                asset_url,
+                json={"npc_name": f"{key}-{threading.get_ident()}-{len(latencies)}"},
+                headers=write_headers,
+                timeout=60,
+            )
+            if response.status_code in (409, 412):
+                retries += 1
+                continue
+            response.raise_for_status()
+            break
+        latencies.append(time.perf_counter() - start)
+    with lock:
+        stats["latencies"].extend(latencies)
+        stats["retries"] += retries
+
+
+def run_level(
+    url: str, headers: dict, keys: list[str], blind: bool, concurrency: int, duration: float
+) -> dict:
+    stats: dict = {"latencies": [], "retries": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(url, headers, keys, blind, deadline, stats, lock))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = stats["latencies"]
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "hot": len(keys),
+        "concurrency": concurrency,
+        "writes": len(latencies),
+        "throughput": len(latencies) / duration,
+        "retries_per_write": stats["retries"] / len(latencies),
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--hot", type=int, nargs="+", default=[1, 8, 64], help="Sizes of the hot set")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--blind", action="store_true", help="Update without If-Match")
+    args = parser.parse_args()
+
+    headers = {"X-API-KEY": args.api_key}
+    session = requests.Session()
+    session.headers.update(headers)
+    for hot in args.hot:
+        keys = create_hot_set(session, args.url, hot)
+        for concurrency in args.concurrency:
+            result = run_level(args.url, headers, keys, args.blind, concurrency, args.duration)
+            print(
+                f"hot {result['hot']:4d}  concurrency {result['concurrency']:3d}:"
+                f" {result['throughput']:8.1f} writes/s"
+                f"  retries/write {result['retries_per_write']:5.2f}"
+                f"  p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms"
+                f"  p99 {result['p99_ms']:8.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+encodings.py
+
+Bytes on the wire and end-to-end latency of the graph endpoints for every
+content encoding. Every combination of media type (JSON, MessagePack) and
+compression (none, gzip, br, zstd) fetches the graph `--repeat` times, the
+latency includes the download, the decompression and the decoding into
+Python objects, like the frontend does it.
+
+Seed a graph of about 100k elements first, e.g.
+    python benchmarks/seed.py --nodes 50000 --edges-per-node 1 --reset
+
+Usage:
+    python benchmarks/encodings.py --url http://127.0.0.1:8000 --api-key KEY --endpoint full_graph
+"""
+
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+import brotli
+import msgpack
+import requests
+import zstandard
+
+MEDIA_TYPES = {"json": "application/json", "msgpack": "application/msgpack"}
+DECOMPRESSORS = {
+    "identity": lambda body: body,
+    "gzip": gzip.decompress,
+    "br": brotli.decompress,
+    "zstd": lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body),
+}
+DECODERS = {"json": json.loads, "msgpack": msgpack.unpackb}
+
+
+def fetch(session: requests.Session, url: str, endpoint: str, headers: dict) -> requests.Response:
+    if endpoint == "full_graph":
+        return session.get(f"{url}/data/", headers=headers, stream=True, timeout=300)
+    return session.post(
+        f"{url}/data/filtered",
+        json={"tag_filter_type": "exclude", "type_filter_type": "exclude"},
+        headers=headers,
+        stream=True,
+        timeout=300,
+    )
+
+
+def measure(
+    session: requests.Session, url: str, endpoint: str, media: str, encoding: str, repeat: int
+) -> dict:
+    headers = {"Accept": MEDIA_TYPES[media], "Accept-Encoding": encoding}
+    latencies: list[float] = []
+    wire_bytes = body_bytes = elements = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = fetch(session, url, endpoint, headers)
+        response.raise_for_status()
+        # The body as sent, requests would decompress it otherwise
+        wire = response.raw.read(decode_content=False)
+        sent_encoding = response.headers.get("content-encoding", "identity")
+        body = DECOMPRESSORS[sent_encoding](wire)
+        graph = DECODERS[media](body)
+        latencies.append(time.perf_counter() - start)
+        wire_bytes, body_bytes = len(wire), len(body)
+        elements = sum(len(assets) for part in ("nodes", "edges") for assets in graph[part].values())
+    return {
+        "media": media,
+        "encoding": encoding,
+        "elements": elements,
+        "wire_bytes": wire_bytes,
+        "body_bytes": body_bytes,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "min_ms": min(latencies) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--endpoint", choices=["full_graph", "filtered"], default="full_graph")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    session.headers.update({"X-API-KEY": args.api_key})
+    for media in MEDIA_TYPES:
+        for encoding in DECOMPRESSORS:
+            result = measure(session, args.url, args.endpoint, media, encoding, args.repeat)
+            print(
+                f"{result['media']:8s} {result['encoding']:9s} {result['elements']:7d} elements:"
+                f" {result['wire_bytes'] / 1e6:8.2f} MB on the wire"
+                f" ({result['body_bytes'] / 1e6:8.2f} MB decoded)"
+                f"  p50 {result['p50_ms']:8.1f} ms  min {result['min_ms']:8.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
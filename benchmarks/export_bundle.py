@@ -0,0 +1,148 @@
+"""
+export_bundle.py
+
+Build time and load time of the export bundle compared to the JSON of
+`GET /data/`. Runs without a database, the graph is synthesized in the
+serialized form of the assets.
+
+- build: full build of the bundle, and an incremental rebuild that applies
+  `--changed` percent of changed nodes to the previous bundle.
+- load: `json.loads` of the JSON graph, against mapping the bundle, and
+  against mapping it and walking the outgoing edges of every node.
+
+Usage:
+    python benchmarks/export_bundle.py --nodes 50000 --edges-per-node 2
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend" / "app"))
+
+from export_bundle import BundleReader, TableFlag, build_bundle, update_bundle  # noqa: E402
+
+NODE_TYPES = ["Dungeon", "Enemy", "NPC", "DialogueElement"]
+EDGE_TYPES = ["DialogueOfNPC", "EnemyInDungeon", "NextDialogue"]
+
+
+def make_graph(
+    node_count: int, edges_per_node: int, seed: int
+) -> tuple[dict[str, list[dict]], dict[str, list[dict]]]:
+    rng = random.Random(seed)
+    nodes: dict[str, list[dict]] = {node_type: [] for node_type in NODE_TYPES}
+    node_ids: list[str] = []
+    for i in range(node_count):
+        node_type = NODE_TYPES[i % len(NODE_TYPES)]
+        key = f"{node_type.lower()}-{i}"
+        node_ids.append(f"{node_type}/{key}")
+        nodes[node_type].append(
+            {
+                "db_id": f"{node_type}/{key}",
+                "db_key": key,
+                "name": f"{node_type} {i}",
+                "level": rng.randint(1, 60),
+                "hostile": rng.random() < 0.3,
+                "description": rng.choice(["A dungeon.", "An enemy.", "Someone.", "A line of dialogue."]),
+                "position": {"x": rng.random(), "y": rng.random(), "z": rng.random()},
+                "loot": rng.sample(["gold", "sword", "potion", "key", "map"], rng.randint(0, 3)),
+            }
+        )
+    edges: dict[str, list[dict]] = {edge_type: [] for edge_type in EDGE_TYPES}
+    for i in range(node_count * edges_per_node):
+        edge_type = EDGE_TYPES[i % len(EDGE_TYPES)]
+        key = f"{edge_type.lower()}-{i}"
+        edges[edge_type].append(
+            {
+                "db_id": f"{edge_type}/{key}",
+                "db_key": key,
+                "origin_id": node_ids[i % node_count],
+                "target_id": rng.choice(node_ids),
+                "repeatable": bool(i % 2),
+            }
+        )
+    return nodes, edges
+
+
+def median_ms(function, repeat: int) -> float:
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def rebuild_incrementally(path: Path, changed: dict[str, dict[str, dict]]) -> bytes:
+    # What the BundleExporter does once it has read the changed assets
+    with BundleReader.open(path) as reader:
+        return update_bundle(reader, changed, {}, 1)[0]
+
+
+def walk(path: Path) -> int:
+    # Every outgoing edge of every node, like a game loading the graph
+    visited = 0
+    with BundleReader.open(path) as reader:
+        for name, table in reader.tables.items():
+            if table.flags != TableFlag.EDGE:
+                continue
+            offsets = reader.adjacency(name)
+            targets = reader.column(name, "_to")
+            for node in range(len(offsets) - 1):
+                for row in range(offsets[node], offsets[node + 1]):
+                    visited += targets[row] >= 0
+            del offsets, targets
+    return visited
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--edges-per-node", type=int, default=2)
+    parser.add_argument("--changed", type=float, default=1.0, help="Percent of nodes changed")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=466)
+    args = parser.parse_args()
+
+    nodes, edges = make_graph(args.nodes, args.edges_per_node, args.seed)
+    rng = random.Random(args.seed)
+    changed: dict[str, dict[str, dict]] = {}
+    all_nodes = [row for rows in nodes.values() for row in rows]
+    for row in rng.sample(all_nodes, int(args.nodes * args.changed / 100)):
+        changed_row = {**row, "level": row["level"] + 1}
+        changed.setdefault(row["db_id"].split("/", 1)[0], {})[row["db_id"]] = changed_row
+    graph_json = json.dumps(
+        {
+            "nodes": {name: {row["db_key"]: row for row in rows} for name, rows in nodes.items()},
+            "edges": {name: {row["db_key"]: row for row in rows} for name, rows in edges.items()},
+        }
+    ).encode("utf-8")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "graph.gagm"
+        json_path = Path(directory) / "graph.json"
+        bundle, stats = build_bundle(nodes, edges, 0)
+        path.write_bytes(bundle)
+        json_path.write_bytes(graph_json)
+
+        build_ms = median_ms(lambda: build_bundle(nodes, edges, 0), args.repeat)
+        incremental_ms = median_ms(lambda: rebuild_incrementally(path, changed), args.repeat)
+        json_load_ms = median_ms(lambda: json.loads(json_path.read_bytes()), args.repeat)
+        open_ms = median_ms(lambda: BundleReader.open(path).close(), args.repeat)
+        walk_ms = median_ms(lambda: walk(path), args.repeat)
+
+    print(f"{stats.nodes} nodes, {stats.edges} edges, {stats.strings} strings")
+    print(f"size       bundle {len(bundle) / 1e6:8.2f} MB    JSON {len(graph_json) / 1e6:8.2f} MB")
+    changed_count = sum(map(len, changed.values()))
+    print(f"build      full   {build_ms:8.1f} ms    incremental {incremental_ms:8.1f} ms ({changed_count} changed)")
+    print(f"load       JSON   {json_load_ms:8.1f} ms    bundle open {open_ms:8.2f} ms")
+    print(f"walk       every outgoing edge of the mapped bundle {walk_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+"""
+generator.py
+
+Synthetic game-world graph generator for scale testing. The generator reads
+the models of a models directory (the same way the ModelManager finds them),
+walks the pydantic field types and constraints of every model and builds a
+value factory for each field. Field validators can't be inspected, so every
+factory is calibrated against the model first: fields whose generated values
+are rejected fall back to narrower candidates and finally to their default.
+The calibrated plans then build documents without validation, a sample of the
+output is still validated to catch drift.
+
+Edges respect the `origin_type` and `target_type` of the edge models, the
+degree of the origins can follow a power law. Tags are assigned with a power
+law popularity. The output is a stream of (collection, document) pairs, written
+to JSON lines files by this script or imported into ArangoDB by `seed.py`.
+
+Usage:
+    python benchmarks/generator.py --nodes 1000000 --edges-per-node 1.5 \\
+        --degree-exponent 1.2 --tags 100 --out-dir /tmp/gagm-dataset
+"""
+
+import argparse
+import base64
+import datetime
+import enum
+import itertools
+import json
+import random
+import sys
+import time
+import types
+import uuid
+from importlib import import_module
+from pathlib import Path
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    Type,
+    Union,
+    get_args,
+    get_origin,
+)
+
+BACKEND_PATH = Path(__file__).resolve().parent.parent / "backend" / "app"
+sys.path.insert(0, str(BACKEND_PATH))
+
+from pydantic import BaseModel, ValidationError  # noqa: E402
+from pydantic.fields import FieldInfo  # noqa: E402
+from pydantic_core import PydanticUndefined  # noqa: E402
+
+from gagm_base.asset_model import AssetModel  # noqa: E402
+from gagm_base.edge_model import EdgeModel  # noqa: E402
+from gagm_base.node_model import NodeModel  # noqa: E402
+from notes_store import NOTES_COLLECTION, notes_document  # noqa: E402
+from trusted_reads import SCHEMA_HASH_FIELD, schema_hash  # noqa: E402
+
+ValueFactory = Callable[[random.Random], Any]
+Document = tuple[str, dict]
+
+WORDS = (
+    "ancient bleak crimson dark ember frozen gilded hollow iron jade lost molten "
+    "obsidian pale quiet rusted silent sunken twisted wild keep tower crypt forge "
+    "marsh vale spire gate hall shrine"
+).split()
+
+# Fields managed by the database or excluded from the stored documents
+RESERVED_ALIASES = {"_id", "_key", "_from", "_to", "notes"}
+
+CALIBRATION_SAMPLES = 64
+
+
+class GeneratorError(Exception):
+    """
+    Raised when no valid values can be generated for a field.
+    """
+
+    pass
+
+
+def discover_models(model_path: Path = BACKEND_PATH / "models") -> dict[str, dict[str, Type[AssetModel]]]:
+    """
+    Find the models of a directory without connecting to the database.
+    Uses the same rules as `ModelManager.load_models`.
+
+    Args:
+        model_path (Path): The models directory, its parent has to be importable.
+
+    Returns:
+        dict[str, dict[str, Type[AssetModel]]]: Node and edge models keyed by name.
+    """
+    if str(model_path.parent) not in sys.path:
+        sys.path.insert(0, str(model_path.parent))
+    models: dict[str, dict[str, Type[AssetModel]]] = {"node": {}, "edge": {}}
+    for file_path in sorted(model_path.glob("*.py")):
+        if file_path.name == "__init__.py":
+            continue
+        module = import_module(f"{model_path.name}.{file_path.stem}")
+        for attribute in vars(module).values():
+            if not isinstance(attribute, type) or attribute in (AssetModel, EdgeModel, NodeModel):
+                continue
+            if issubclass(attribute, NodeModel):
+                models["node"][attribute.__name__] = attribute
+            elif issubclass(attribute, EdgeModel):
+                models["edge"][attribute.__name__] = attribute
+    return models
+
+
+def _flatten_metadata(metadata: list) -> list:
+    flat = []
+    for item in metadata:
+        if isinstance(item, FieldInfo):
+            flat.extend(item.metadata)
+        else:
+            flat.append(item)
+    return flat
+
+
+def _constraint(metadata: list, name: str) -> Any:
+    for item in metadata:
+        value = getattr(item, name, None)
+        if value is not None:
+            return value
+    return None
+
+
+def _int_range(metadata: list) -> Optional[tuple[int, int]]:
+    low = _constraint(metadata, "ge")
+    if low is None and _constraint(metadata, "gt") is not None:
+        low = _constraint(metadata, "gt") + 1
+    high = _constraint(metadata, "le")
+    if high is None and _constraint(metadata, "lt") is not None:
+        high = _constraint(metadata, "lt") - 1
+    if low is None and high is None:
+        return None
+    low = high - 1000 if low is None else low
+    return int(low), int(low + 1000 if high is None else high)
+
+
+def _float_range(metadata: list) -> Optional[tuple[float, float]]:
+    low = _constraint(metadata, "ge")
+    if low is None and _constraint(metadata, "gt") is not None:
+        low = _constraint(metadata, "gt") + 1e-6
+    high = _constraint(metadata, "le")
+    if high is None and _constraint(metadata, "lt") is not None:
+        high = _constraint(metadata, "lt") - 1e-6
+    if low is None and high is None:
+        return None
+    low = high - 1000.0 if low is None else low
+    return float(low), float(low + 1000.0 if high is None else high)
+
+
+def _ints(low: int, high: int, multiple_of: Optional[int]) -> ValueFactory:
+    if multiple_of:
+        return lambda rng: rng.randint(low // multiple_of + 1, high // multiple_of) * multiple_of
+    return lambda rng: rng.randint(low, high)
+
+
+def _floats(low: float, high: float) -> ValueFactory:
+    span = high - low
+    return lambda rng: low + span * rng.random()
+
+
+def _strings(words: int, min_length: int, max_length: Optional[int]) -> ValueFactory:
+    def factory(rng: random.Random) -> str:
+        value = " ".join(rng.choices(WORDS, k=words)).ljust(min_length, "x")
+        return value if max_length is None else value[:max_length]
+
+    return factory
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(by_alias=True, mode="json")
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime.date, datetime.time, uuid.UUID)):
+        return str(value) if isinstance(value, uuid.UUID) else value.isoformat()
+    return value
+
+
+def candidate_factories(annotation: Any, metadata: list) -> list[ValueFactory]:
+    """
+    Get the value factories of a type, the most varied candidate first.
+
+    Args:
+        annotation (Any): The type annotation.
+        metadata (list): The constraints of the field.
+
+    Returns:
+        list[ValueFactory]: The candidates, empty if the type is not supported.
+    """
+    metadata = _flatten_metadata(metadata)
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+
+    if origin is Annotated:
+        return candidate_factories(args[0], metadata + list(args[1:]))
+    if origin in (Union, types.UnionType):
+        candidates = [
+            factory
+            for arg in args
+            if arg is not type(None)
+            for factory in candidate_factories(arg, metadata)
+        ]
+        return candidates + ([lambda rng: None] if type(None) in args else [])
+    if origin is Literal:
+        values = [_json_value(arg) for arg in args]
+        return [lambda rng: rng.choice(values)] + [lambda rng, value=value: value for value in values]
+    if origin in (list, set, frozenset, tuple) or annotation in (list, set, tuple):
+        if origin is tuple and args and args[-1] is not Ellipsis:
+            items = [candidate_factories(arg, [])[0] for arg in args]
+            return [lambda rng: [item(rng) for item in items]]
+        item = candidate_factories(args[0] if args else str, [])[0]
+        min_length = _constraint(metadata, "min_length") or 0
+        max_length = _constraint(metadata, "max_length") or max(min_length, 4)
+        if origin in (set, frozenset):
+            return [lambda rng: list({item(rng) for _ in range(rng.randint(min_length, max_length))})]
+        return [
+            lambda rng: [item(rng) for _ in range(rng.randint(min_length, max_length))],
+            lambda rng: [item(rng) for _ in range(min_length)],
+        ]
+    if origin is dict or annotation is dict:
+        value = candidate_factories(args[1] if args else str, [])[0]
+        return [lambda rng: {f"key{index}": value(rng) for index in range(rng.randint(0, 4))}]
+    if annotation is bool:
+        return [lambda rng: rng.random() < 0.5]
+    if annotation is int:
+        multiple_of = _constraint(metadata, "multiple_of")
+        bounds = _int_range(metadata)
+        if bounds is not None:
+            return [_ints(*bounds, multiple_of), lambda rng: bounds[0]]
+        ranges = [(0, 1000), (0, 100), (1, 10), (1, 5), (1, 1), (0, 0)]
+        return [_ints(low, high, multiple_of) for low, high in ranges]
+    if annotation is float:
+        bounds = _float_range(metadata)
+        if bounds is not None:
+            return [_floats(*bounds), lambda rng: bounds[0]]
+        ranges = [(-1000.0, 1000.0), (0.0, 100.0), (0.0, 1.0), (0.0, 0.0)]
+        return [_floats(low, high) for low, high in ranges]
+    if annotation is str:
+        if _constraint(metadata, "pattern") is not None:
+            return []
+        min_length = _constraint(metadata, "min_length") or 0
+        max_length = _constraint(metadata, "max_length")
+        return [
+            _strings(8, min_length, max_length),
+            _strings(1, min_length, max_length),
+            lambda rng: "x" * max(min_length, 1),
+        ]
+    if annotation is bytes:
+        return [lambda rng: rng.randbytes(16).hex()]
+    if annotation is uuid.UUID:
+        return [lambda rng: str(uuid.UUID(int=rng.getrandbits(128), version=4))]
+    if annotation is datetime.datetime:
+        epoch = datetime.datetime(2020, 1, 1)
+        return [lambda rng: (epoch + datetime.timedelta(seconds=rng.randrange(10**8))).isoformat()]
+    if annotation is datetime.date:
+        epoch = datetime.date(2020, 1, 1)
+        return [lambda rng: (epoch + datetime.timedelta(days=rng.randrange(3650))).isoformat()]
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        values = [member.value for member in annotation]
+        return [lambda rng: rng.choice(values)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        plan = DocumentPlan(annotation)
+        return [plan.build_fields]
+    if annotation is Any or annotation is object:
+        return [_strings(2, 0, None)]
+    return []
+
+
+class DocumentPlan:
+    """
+    The calibrated value factories of the fields of a model.
+    """
+
+    def __init__(self, model: Type[BaseModel], calibration_seed: int = 0):
+        self.model = model
+        self.fields: list[tuple[str, list[ValueFactory]]] = []
+        for name, field in model.model_fields.items():
+            alias = field.alias or name
+            if alias in RESERVED_ALIASES:
+                continue
+            candidates = candidate_factories(field.annotation, list(field.metadata))
+            if field.default is not PydanticUndefined:
+                default = _json_value(field.default)
+                candidates.append(lambda rng, default=default: default)
+            elif field.default_factory is not None:
+                factory = field.default_factory
+                candidates.append(lambda rng, factory=factory: _json_value(factory()))
+            if not candidates:
+                raise GeneratorError(f"No values can be generated for {model.__name__}.{name}")
+            self.fields.append((alias, candidates))
+        self._choice = [0] * len(self.fields)
+        self._factories = [candidates[0] for _, candidates in self.fields]
+        self._aliases = [alias for alias, _ in self.fields]
+        self.calibrate(random.Random(calibration_seed))
+
+    def build_fields(self, rng: random.Random) -> dict:
+        return {alias: factory(rng) for alias, factory in zip(self._aliases, self._factories)}
+
+    def _sample(self, rng: random.Random, extra: dict) -> dict:
+        return {**extra, **self.build_fields(rng)}
+
+    def rejected_fields(self, rng: random.Random, extra: dict) -> set[str]:
+        """
+        Validate sample documents and collect the fields with rejected values.
+
+        Args:
+            rng (random.Random): Random generator of the samples.
+            extra (dict): Values of the reserved fields.
+
+        Returns:
+            set[str]: Aliases of the rejected fields, "" for whole-model errors.
+        """
+        rejected: set[str] = set()
+        for _ in range(CALIBRATION_SAMPLES):
+            try:
+                self.model.model_validate(self._sample(rng, extra))
+            except ValidationError as error:
+                for detail in error.errors():
+                    rejected.add(str(detail["loc"][0]) if detail["loc"] else "")
+        return rejected
+
+    def calibrate(self, rng: random.Random) -> None:
+        """
+        Move every field with rejected values to its next candidate until the
+        samples validate.
+
+        Raises:
+            GeneratorError: If a field runs out of candidates.
+        """
+        extra: dict = {}
+        if issubclass(self.model, AssetModel):
+            extra["_key"] = "calibration"
+        if issubclass(self.model, EdgeModel):
+            extra |= {"_from": "Origin/calibration", "_to": "Target/calibration"}
+        while rejected := self.rejected_fields(rng, extra):
+            # Errors of model validators have no field, every field is suspect
+            suspects = [
+                index for index, (alias, _) in enumerate(self.fields) if alias in rejected
+            ] or list(range(len(self.fields)))
+            advanced = False
+            for index in suspects:
+                if self._choice[index] + 1 < len(self.fields[index][1]):
+                    self._choice[index] += 1
+                    self._factories[index] = self.fields[index][1][self._choice[index]]
+                    advanced = True
+            if not advanced:
+                raise GeneratorError(
+                    f"No valid values found for {self.model.__name__}: {', '.join(sorted(rejected))}"
+                )
+
+
+def _power_law_weights(count: int, exponent: float) -> Optional[list[float]]:
+    """
+    Cumulative weights of ranks with a power law distribution (rank^-exponent).
+    """
+    if exponent <= 0:
+        return None
+    return list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def _tag_key(tag_name: str) -> str:
+    return base64.urlsafe_b64encode(tag_name.encode("utf-8")).decode("utf-8")
+
+
+class GraphGenerator:
+    """
+    Generates the documents of a synthetic graph.
+
+    Args:
+        models (dict): Node and edge models, as returned by `discover_models`.
+        nodes (int): Total number of nodes.
+        mix (dict[str, float], optional): Relative node count of the node models. Defaults to equal.
+        edges_per_node (float): Edges of every edge model per target node.
+        degree_exponent (float): Power law exponent of the origin degrees, 0 for uniform.
+        tags (int): Number of tags.
+        tagged_fraction (float): Fraction of the nodes that get tags.
+        tag_exponent (float): Power law exponent of the tag popularity, 0 for uniform.
+        notes_size (int): Length of the notes of every node.
+        key_prefix (str): Prefix of the generated keys.
+        seed (int): Seed of the random generator.
+    """
+
+    CHUNK_SIZE = 10000
+
+    def __init__(
+        self,
+        models: dict[str, dict[str, Type[AssetModel]]],
+        nodes: int,
+        mix: Optional[dict[str, float]] = None,
+        edges_per_node: float = 1.0,
+        degree_exponent: float = 0.0,
+        tags: int = 0,
+        tagged_fraction: float = 0.1,
+        tag_exponent: float = 1.0,
+        notes_size: int = 0,
+        key_prefix: str = "gen",
+        seed: int = 42,
+    ):
+        self.models = models
+        self.edges_per_node = edges_per_node
+        self.degree_exponent = degree_exponent
+        self.tag_names = [f"{key_prefix}-tag-{index}" for index in range(tags)]
+        self.tagged_fraction = tagged_fraction
+        self.tag_exponent = tag_exponent
+        self.notes = ("# Notes\n" + "lorem ipsum " * notes_size)[:notes_size]
+        self.key_prefix = key_prefix
+        self.seed = seed
+        mix = mix or {name: 1.0 for name in models["node"]}
+        unknown = set(mix) - set(models["node"])
+        if unknown:
+            raise GeneratorError(f"Unknown node models: {', '.join(sorted(unknown))}")
+        total = sum(mix.values())
+        self.counts = {name: max(1, round(nodes * weight / total)) for name, weight in mix.items()}
+        self.plans = {
+            name: DocumentPlan(model, seed)
+            for kind in ("node", "edge")
+            for name, model in models[kind].items()
+        }
+        self.hashes = {name: schema_hash(plan.model) for name, plan in self.plans.items()}
+
+    def _ids(self, types: list[str]) -> list[str]:
+        types = types or list(self.counts)
+        return [
+            f"{type_name}/{self.key_prefix}-{index}"
+            for type_name in types
+            for index in range(self.counts.get(type_name, 0))
+        ]
+
+    def nodes(self) -> Iterator[Document]:
+        rng = random.Random(self.seed)
+        for name, count in self.counts.items():
+            build = self.plans[name].build_fields
+            schema = self.hashes[name]
+            prefix = self.key_prefix
+            for index in range(count):
+                document = build(rng)
+                document["_key"] = f"{prefix}-{index}"
+                document[SCHEMA_HASH_FIELD] = schema
+                yield name, document
+                if self.notes:
+                    yield NOTES_COLLECTION, notes_document(f"{name}/{document['_key']}", self.notes)
+
+    def edges(self) -> Iterator[Document]:
+        rng = random.Random(self.seed + 1)
+        for name, model in self.models["edge"].items():
+            origins = self._ids(model.origin_type)
+            targets = self._ids(model.target_type)
+            if not origins or not targets:
+                continue
+            # Shuffled, so the hubs are spread over the types and keys
+            rng.shuffle(origins)
+            weights = _power_law_weights(len(origins), self.degree_exponent)
+            build = self.plans[name].build_fields
+            schema = self.hashes[name]
+            total = int(len(targets) * self.edges_per_node)
+            for start in range(0, total, self.CHUNK_SIZE):
+                size = min(self.CHUNK_SIZE, total - start)
+                chosen_origins = rng.choices(origins, cum_weights=weights, k=size)
+                chosen_targets = rng.choices(targets, k=size)
+                for offset in range(size):
+                    document = build(rng)
+                    document["_key"] = f"{self.key_prefix}-{start + offset}"
+                    document["_from"] = chosen_origins[offset]
+                    document["_to"] = chosen_targets[offset]
+                    document[SCHEMA_HASH_FIELD] = schema
+                    yield name, document
+
+    def tags(self) -> Iterator[Document]:
+        rng = random.Random(self.seed + 2)
+        for tag_name in self.tag_names:
+            yield "AssetTag", {"_key": _tag_key(tag_name), "name": tag_name}
+        if not self.tag_names:
+            return
+        weights = _power_law_weights(len(self.tag_names), self.tag_exponent)
+        for asset_id in self._ids([]):
+            if rng.random() >= self.tagged_fraction:
+                continue
+            # One tag, sometimes more
+            count = 1 + int(rng.expovariate(1.5))
+            for tag_name in set(rng.choices(self.tag_names, cum_weights=weights, k=count)):
+                yield "TagEdge", {
+                    "_key": _tag_key(f"{tag_name}-{asset_id}"),
+                    "_from": f"AssetTag/{_tag_key(tag_name)}",
+                    "_to": asset_id,
+                    "tag_name": tag_name,
+                }
+
+    def documents(self) -> Iterator[Document]:
+        """
+        All documents of the graph, nodes first so the edges never dangle.
+        """
+        return itertools.chain(self.nodes(), self.edges(), self.tags())
+
+    def validate_sample(self, documents: Iterator[Document], every: int) -> Iterator[Document]:
+        """
+        Pass the documents through, validating every n-th node and edge.
+
+        Raises:
+            GeneratorError: If a sampled document is rejected by its model.
+        """
+        for index, (collection, document) in enumerate(documents):
+            if every and index % every == 0 and collection in self.plans:
+                try:
+                    self.plans[collection].model.model_validate(document)
+                except ValidationError as error:
+                    raise GeneratorError(f"Invalid {collection} generated: {error}") from error
+            yield collection, document
+
+
+def write_files(documents: Iterator[Document], out_dir: Path) -> dict[str, int]:
+    """
+    Write the documents to one JSON lines file per collection, the format of
+    `arangoimport --type jsonl`.
+
+    Returns:
+        dict[str, int]: Number of written documents per collection.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files: dict[str, Any] = {}
+    written: dict[str, int] = {}
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    try:
+        for collection, document in documents:
+            if collection not in files:
+                files[collection] = (out_dir / f"{collection}.jsonl").open("w", encoding="utf-8")
+                written[collection] = 0
+            files[collection].write(dumps(document) + "\n")
+            written[collection] += 1
+    finally:
+        for file in files.values():
+            file.close()
+    return written
+
+
+def parse_mix(mix: Optional[str]) -> Optional[dict[str, float]]:
+    if not mix:
+        return None
+    return {name: float(weight) for name, weight in (part.split("=") for part in mix.split(","))}
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Arguments of the generator, shared with seed.py.
+    """
+    parser.add_argument("--models", default=str(BACKEND_PATH / "models"), help="Models directory")
+    parser.add_argument("--nodes", type=int, default=10000, help="Total number of nodes")
+    parser.add_argument("--mix", default=None, help="Relative node counts, e.g. Dungeon=1,NPC=5")
+    parser.add_argument("--edges-per-node", type=float, default=1.0, help="Edges per target node")
+    parser.add_argument("--degree-exponent", type=float, default=0.0, help="0 for uniform degrees")
+    parser.add_argument("--tags", type=int, default=20)
+    parser.add_argument("--tagged-fraction", type=float, default=0.1)
+    parser.add_argument("--tag-exponent", type=float, default=1.0)
+    parser.add_argument("--notes-size", type=int, default=0, help="Characters of notes per node")
+    parser.add_argument("--validate-every", type=int, default=1000, help="0 disables the sampling")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def from_arguments(args: argparse.Namespace, key_prefix: str) -> GraphGenerator:
+    return GraphGenerator(
+        discover_models(Path(args.models).resolve()),
+        nodes=args.nodes,
+        mix=parse_mix(args.mix),
+        edges_per_node=args.edges_per_node,
+        degree_exponent=args.degree_exponent,
+        tags=args.tags,
+        tagged_fraction=args.tagged_fraction,
+        tag_exponent=args.tag_exponent,
+        notes_size=args.notes_size,
+        key_prefix=key_prefix,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    add_arguments(parser)
+    parser.add_argument("--key-prefix", default="gen")
+    parser.add_argument("--out-dir", required=True)
+    args = parser.parse_args()
+
+    generator = from_arguments(args, args.key_prefix)
+    start = time.perf_counter()
+    written = write_files(
+        generator.validate_sample(generator.documents(), args.validate_every), Path(args.out_dir)
+    )
+    elapsed = time.perf_counter() - start
+    total = sum(written.values())
+    print(json.dumps(written, indent=2))
+    print(f"{total} documents in {elapsed:.1f} s ({total / elapsed:,.0f} documents/s)")
+
+
+if __name__ == "__main__":
+    main()
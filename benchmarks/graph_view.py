@@ -0,0 +1,168 @@
+"""
+graph_view.py
+
+Payload size and parse time of the graph of the graph view, in the vis.js
+elements encoded twice as JSON strings it used to send and in the compact
+format of `backend_to_graph_view`. Runs without a backend, the graph is
+synthesized in the format of `GET /data/`.
+
+The server time is the conversion and the JSON encoding of the response of
+`POST /get_graph`. The parse time is what the browser does with the body,
+`JSON.parse` and building the vis.js elements, measured with Node.js (the
+V8 engine of Chrome) if it's installed.
+
+Usage:
+    python benchmarks/graph_view.py --nodes 50000 --edges-per-node 1
+"""
+
+import argparse
+import gzip
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FRONTEND_PATH = Path(__file__).parent.parent / "frontend" / "app"
+sys.path.insert(0, str(FRONTEND_PATH))
+
+from utils import BackendGraph, backend_to_graph_view, backend_to_visjs  # noqa: E402
+
+NODE_TYPES = ["Dungeon", "Enemy", "NPC", "DialogueElement"]
+EDGE_TYPES = ["DialogueOfNPC", "EnemyInDungeon", "NextDialogue"]
+
+# Parses the bodies like filtering.js, prints the median milliseconds of both formats
+PARSE_SCRIPT = """
+const fs = require("fs");
+const vm = require("vm");
+const [graphViewJs, legacyPath, compactPath, repeat] = process.argv.slice(1);
+vm.runInThisContext(fs.readFileSync(graphViewJs, "utf8"));
+const legacyBody = fs.readFileSync(legacyPath, "utf8");
+const compactBody = fs.readFileSync(compactPath, "utf8");
+function median(parse) {
+    const times = [];
+    for (let i = 0; i < Number(repeat); i++) {
+        const start = process.hrtime.bigint();
+        parse();
+        times.push(Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    times.sort((a, b) => a - b);
+    return times[Math.floor(times.length / 2)];
+}
+const legacy = median(() => {
+    const graphData = JSON.parse(legacyBody);
+    return [JSON.parse(graphData.nodes), JSON.parse(graphData.edges)];
+});
+const compact = median(() => decodeGraphView(JSON.parse(compactBody).graph));
+console.log(JSON.stringify({ legacy: legacy, compact: compact }));
+"""
+
+
+def make_graph(node_count: int, edges_per_node: int, seed: int) -> BackendGraph:
+    rng = random.Random(seed)
+    nodes: dict[str, dict[str, dict]] = {node_type: {} for node_type in NODE_TYPES}
+    node_ids: list[str] = []
+    for i in range(node_count):
+        node_type = NODE_TYPES[i % len(NODE_TYPES)]
+        key = f"{node_type.lower()}-{i}"
+        node_ids.append(f"{node_type}/{key}")
+        nodes[node_type][key] = {
+            "db_id": f"{node_type}/{key}",
+            "db_key": key,
+            "name": f"{node_type} {i}",
+            "description": "An asset generated for the benchmark.",
+            "position": {"x": rng.random(), "y": rng.random(), "z": rng.random()},
+        }
+    edges: dict[str, dict[str, dict]] = {edge_type: {} for edge_type in EDGE_TYPES}
+    for i in range(node_count * edges_per_node):
+        edge_type = EDGE_TYPES[i % len(EDGE_TYPES)]
+        key = f"{edge_type.lower()}-{i}"
+        edges[edge_type][key] = {
+            "db_id": f"{edge_type}/{key}",
+            "db_key": key,
+            "origin_id": node_ids[i % node_count],
+            "target_id": rng.choice(node_ids),
+            "repeatable": bool(i % 2),
+        }
+    return BackendGraph(edges=edges, nodes=nodes)
+
+
+def dumps(content: dict) -> bytes:
+    # Same settings as the JSONResponse of the frontend
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_legacy(graph: BackendGraph) -> bytes:
+    visjs_graph = backend_to_visjs(backend_graph=graph)
+    return dumps({"edges": json.dumps(visjs_graph["edges"]), "nodes": json.dumps(visjs_graph["nodes"])})
+
+
+def encode_compact(graph: BackendGraph) -> bytes:
+    return dumps({"graph": backend_to_graph_view(backend_graph=graph)})
+
+
+def server_time(encode, graph: BackendGraph, repeat: int) -> tuple[bytes, float]:
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode(graph)
+        times.append(time.perf_counter() - start)
+    return body, statistics.median(times) * 1000
+
+
+def parse_times(legacy: bytes, compact: bytes, repeat: int) -> dict | None:
+    node = shutil.which("node")
+    if node is None:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = Path(directory) / "legacy.json"
+        compact_path = Path(directory) / "compact.json"
+        legacy_path.write_bytes(legacy)
+        compact_path.write_bytes(compact)
+        output = subprocess.run(
+            [
+                node,
+                "-e",
+                PARSE_SCRIPT,
+                str(FRONTEND_PATH / "static" / "scripts" / "graphView.js"),
+                str(legacy_path),
+                str(compact_path),
+                str(repeat),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    return json.loads(output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--edges-per-node", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=466)
+    args = parser.parse_args()
+
+    graph = make_graph(args.nodes, args.edges_per_node, args.seed)
+    legacy, legacy_ms = server_time(encode_legacy, graph, args.repeat)
+    compact, compact_ms = server_time(encode_compact, graph, args.repeat)
+    parsing = parse_times(legacy, compact, args.repeat)
+    for name, body, encode_ms in (("legacy", legacy, legacy_ms), ("compact", compact, compact_ms)):
+        line = (
+            f"{name:8s} {len(body) / 1e6:7.2f} MB ({len(gzip.compress(body, compresslevel=5)) / 1e6:6.2f} MB gzip)"
+            f"  server {encode_ms:7.1f} ms"
+        )
+        if parsing is not None:
+            line += f"  parse {parsing[name]:7.1f} ms"
+        print(line)
+    if parsing is None:
+        print("node not found, the parse time wasn't measured")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+loadtest.py
+
+Load test of the main backend endpoints against a seeded deployment. Every
+scenario is run closed-loop (a fixed number of clients sending requests back to
+back) and/or open-loop (requests sent at a fixed arrival rate, latency measured
+from the scheduled send time so a stalled server can't hide its queueing).
+Latency percentiles and throughput of every run are written to a JSON file that
+`compare.py` diffs against the results of another commit. A run where most
+requests failed is marked as failed, its latencies don't measure the endpoint,
+and the exit code is 1.
+
+Usage:
+    python benchmarks/seed.py --nodes 20000 --reset --output benchmarks/results/dataset.json
+    python benchmarks/loadtest.py --api-key bench-key --mode closed --concurrency 1 8 32 \\
+        --scenarios full_graph filtered typed_list get_asset --output benchmarks/results/HEAD.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import requests
+
+import generator
+
+# Runs with more failed requests than this are marked as failed
+MAX_ERROR_RATE = 0.5
+
+RequestFactory = Callable[[random.Random], tuple[str, str, Optional[dict]]]
+
+
+@dataclass
+class Scenario:
+    """
+    An endpoint under test, the factory returns (method, path, json body).
+    """
+
+    name: str
+    description: str
+    factory: RequestFactory
+
+
+def build_scenarios(dataset: dict) -> dict[str, Scenario]:
+    """
+    Build the scenarios for the seeded dataset.
+
+    Args:
+        dataset (dict): The dataset description written by seed.py.
+
+    Returns:
+        dict[str, Scenario]: Scenarios keyed by name.
+    """
+    counts: dict[str, int] = dataset["node_counts"]
+    prefix: str = dataset["key_prefix"]
+    tags = [f"{prefix}-tag-{index}" for index in range(dataset["args"]["tags"])]
+    types = list(counts)
+
+    def random_asset(rng: random.Random) -> str:
+        asset_type = rng.choice(types)
+        return f"{asset_type}/{prefix}-{rng.randrange(counts[asset_type])}"
+
+    def filtered(rng: random.Random):
+        return (
+            "POST",
+            "/data/filtered",
+            {
+                "tags": rng.sample(tags, min(3, len(tags))),
+                "tag_filter_type": "include",
+                "types": rng.sample(types, 2),
+                "type_filter_type": "include",
+            },
+        )
+
+    models = generator.discover_models(Path(dataset["args"]["models"]))
+    write_plans = {name: generator.DocumentPlan(models["node"][name]) for name in types}
+
+    def bulk_write(rng: random.Random):
+        asset_type = rng.choice(types)
+        return (
+            "POST",
+            f"/data/{asset_type}",
+            {"_key": f"{prefix}-w-{uuid.uuid4().hex}", **write_plans[asset_type].build_fields(rng)},
+        )
+
+    def search(rng: random.Random):
+        words = rng.sample(generator.WORDS, rng.randint(1, 2))
+        # Every other search ends with a prefix, like a search box while typing
+        if rng.random() < 0.5:
+            words[-1] = words[-1][: max(2, len(words[-1]) // 2)]
+        return ("GET", f"/data/search?q={'+'.join(words)}&limit=20", None)
+
+    scenarios = [
+        Scenario("full_graph", "GET /data/", lambda rng: ("GET", "/data/", None)),
+        Scenario("filtered", "POST /data/filtered", filtered),
+        Scenario(
+            "typed_list",
+            "GET /data/typed/{type}",
+            lambda rng: ("GET", f"/data/typed/{rng.choice(types)}", None),
+        ),
+        Scenario(
+            "get_asset",
+            "GET /data/{type}/{key}",
+            lambda rng: ("GET", f"/data/{random_asset(rng)}", None),
+        ),
+        Scenario(
+            "notes",
+            "GET /data/{id}/notes",
+            lambda rng: ("GET", f"/data/{random_asset(rng)}/notes", None),
+        ),
+        Scenario(
+            "tags",
+            "GET /data/{id}/tags",
+            lambda rng: ("GET", f"/data/{random_asset(rng)}/tags", None),
+        ),
+        Scenario("tag_list", "GET /data/tags", lambda rng: ("GET", "/data/tags", None)),
+        Scenario("search", "GET /data/search", search),
+        Scenario("bulk_writes", "POST /data/{type} with new assets", bulk_write),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+class Recorder:
+    """
+    Collects the latencies and errors of a run from many threads.
+    """
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, error: Optional[str]) -> None:
+        with self._lock:
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        latencies = sorted(self.latencies)
+        errors = sum(self.errors.values())
+        error_rate = errors / (len(latencies) + errors) if latencies or errors else 0.0
+        result = {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "error_rate": error_rate,
+            "failed": error_rate > MAX_ERROR_RATE,
+            "throughput": len(latencies) / duration,
+        }
+        if len(latencies) >= 2:
+            quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            result.update(
+                {
+                    "mean_ms": statistics.fmean(latencies) * 1000,
+                    "p50_ms": quantiles[49] * 1000,
+                    "p95_ms": quantiles[94] * 1000,
+                    "p99_ms": quantiles[98] * 1000,
+                    "max_ms": latencies[-1] * 1000,
+                }
+            )
+        return result
+
+
+def send(
+    session: requests.Session,
+    base_url: str,
+    scenario: Scenario,
+    rng: random.Random,
+    recorder: Recorder,
+    scheduled: Optional[float] = None,
+) -> None:
+    method, path, body = scenario.factory(rng)
+    start = time.perf_counter() if scheduled is None else scheduled
+    try:
+        response = session.request(method, base_url + path, json=body, timeout=120)
+        error = None if response.ok else f"HTTP {response.status_code}"
+    except requests.RequestException as exception:
+        error = type(exception).__name__
+    recorder.record(time.perf_counter() - start, error)
+
+
+def run_closed(
+    base_url: str, headers: dict, scenario: Scenario, concurrency: int, duration: float, seed: int
+) -> dict:
+    """
+    Every client sends its next request as soon as the previous one finished.
+    """
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def client(index: int) -> None:
+        session = requests.Session()
+        session.headers.update(headers)
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            send(session, base_url, scenario, rng, recorder)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"mode": "closed", "load": concurrency} | recorder.summary(time.perf_counter() - start)
+
+
+def run_open(
+    base_url: str,
+    headers: dict,
+    scenario: Scenario,
+    rate: float,
+    duration: float,
+    seed: int,
+    max_in_flight: int,
+) -> dict:
+    """
+    Requests are sent at a fixed rate regardless of the response times.
+    """
+    recorder = Recorder()
+    local = threading.local()
+    rng = random.Random(seed)
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.headers.update(headers)
+        return local.session
+
+    def request(request_rng: random.Random, scheduled: float) -> None:
+        send(session(), base_url, scenario, request_rng, recorder, scheduled)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for index in range(int(rate * duration)):
+            scheduled = start + index / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(request, random.Random(rng.random()), scheduled)
+    return {"mode": "open", "load": rate} | recorder.summary(time.perf_counter() - start)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(scenario: str, result: dict) -> None:
+    print(
+        f"{scenario:12s} {result['mode']:6s} load {result['load']:7.1f}:"
+        f" {result['throughput']:8.1f} req/s"
+        f"  p50 {result.get('p50_ms', float('nan')):8.1f} ms"
+        f"  p95 {result.get('p95_ms', float('nan')):8.1f} ms"
+        f"  p99 {result.get('p99_ms', float('nan')):8.1f} ms"
+        f"  errors {sum(result['errors'].values())}"
+        + ("  FAILED" if result["failed"] else "")
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--dataset", default="benchmarks/results/dataset.json")
+    parser.add_argument("--scenarios", nargs="+", default=None, help="Defaults to every scenario")
+    parser.add_argument("--mode", choices=["closed", "open", "both"], default="closed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rate", type=float, nargs="+", default=[10, 50, 200], help="Open-loop req/s")
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Defaults to benchmarks/results/<revision>.json")
+    args = parser.parse_args()
+
+    dataset = json.loads(Path(args.dataset).read_text(encoding="utf-8"))
+    scenarios = build_scenarios(dataset)
+    headers = {"X-API-KEY": args.api_key}
+    results = []
+    for name in args.scenarios or list(scenarios):
+        scenario = scenarios[name]
+        if args.warmup:
+            run_closed(args.url, headers, scenario, 1, args.warmup, args.seed)
+        runs = []
+        if args.mode in ("closed", "both"):
+            runs += [
+                run_closed(args.url, headers, scenario, concurrency, args.duration, args.seed)
+                for concurrency in args.concurrency
+            ]
+        if args.mode in ("open", "both"):
+            runs += [
+                run_open(
+                    args.url, headers, scenario, rate, args.duration, args.seed, args.max_in_flight
+                )
+                for rate in args.rate
+            ]
+        for result in runs:
+            print_result(name, result)
+            results.append({"scenario": name, "description": scenario.description, **result})
+
+    revision = git_revision()
+    output = Path(args.output or f"benchmarks/results/{revision or 'unknown'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "revision": revision,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "url": args.url,
+        "host": platform.node(),
+        "duration": args.duration,
+        "dataset": dataset,
+        "results": results,
+    }
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+    failed = sorted({result["scenario"] for result in results if result["failed"]})
+    if failed:
+        print(f"More than {MAX_ERROR_RATE:.0%} of the requests failed in: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
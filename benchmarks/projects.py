@@ -0,0 +1,95 @@
+"""
+projects.py
+
+Cost of serving many projects from one backend. Creates `--projects` projects
+with the example models in the projects directory of the backend, times the
+first request of every project (loading its models and creating its database)
+and compares the latency of requests spread over all projects to requests of
+the default project. Then prints the connections to ArangoDB, which shouldn't
+grow with the number of projects, and the usage the backend counted per project.
+
+Run it where the backend runs, the projects directory must be the
+`PROJECTS_DIRECTORY` of the backend. The databases of the projects are kept,
+`--cleanup` only removes the directories.
+
+Usage:
+    python benchmarks/projects.py --url http://127.0.0.1:8000 --api-key KEY --projects 20
+"""
+
+import argparse
+import shutil
+import statistics
+import time
+from pathlib import Path
+
+import requests
+
+APP_DIR = Path(__file__).parent.parent / "backend" / "app"
+PREFIX = "benchmark_"
+
+
+def percentiles_ms(times: list[float]) -> str:
+    times = sorted(times)
+    p50 = statistics.median(times) * 1000
+    p95 = times[int(len(times) * 0.95) - 1] * 1000
+    return f"p50 {p50:7.1f} ms    p95 {p95:7.1f} ms"
+
+
+def timed_get(session: requests.Session, url: str, project: str = "") -> float:
+    headers = {"X-GAGM-PROJECT": project} if project else {}
+    start = time.perf_counter()
+    session.get(url, headers=headers, timeout=600).raise_for_status()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True, help="Key of an admin")
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per measurement")
+    parser.add_argument("--directory", type=Path, default=APP_DIR / "projects")
+    parser.add_argument("--cleanup", action="store_true", help="Remove the project directories")
+    args = parser.parse_args()
+
+    projects = [f"{PREFIX}{index:03d}" for index in range(args.projects)]
+    for project in projects:
+        directory = args.directory / project
+        if not directory.exists():
+            shutil.copytree(APP_DIR / "models", directory, ignore=shutil.ignore_patterns("__pycache__"))
+
+    session = requests.Session()
+    session.headers.update({"X-API-KEY": args.api_key})
+    url = f"{args.url}/data/typed/NPC"
+
+    first = [timed_get(session, url, project) for project in projects]
+    print(f"first      {percentiles_ms(first)} (loads the models, creates the database)")
+
+    default = [timed_get(session, url) for _ in range(args.requests)]
+    print(f"default    {percentiles_ms(default)}")
+    spread = [timed_get(session, url, projects[index % len(projects)]) for index in range(args.requests)]
+    print(f"spread     {percentiles_ms(spread)} (over {len(projects)} projects)")
+
+    pools = session.get(f"{args.url}/health/pools", timeout=60).json()["arango"]
+    connections = sum(host["connections_opened"] for host in pools.get("hosts", []))
+    print(f"arango     {len(pools.get('databases', []))} open databases, {connections} connections opened")
+
+    reports = session.get(f"{args.url}/admin/projects", params={"figures": "true"}, timeout=600).json()
+    print(f"{'project':<16} {'requests':>9} {'arango':>8} {'aql s':>8} {'documents':>10} {'MB':>8}")
+    for report in reports:
+        if not report["active"]:
+            continue
+        usage = report["usage"]
+        print(
+            f"{report['project']:<16} {usage['requests']:>9} {usage['arango_requests']:>8}"
+            f" {usage['aql_seconds']:>8.2f} {report['documents'] or 0:>10}"
+            f" {(report['size'] or 0) / 1e6:>8.1f}"
+        )
+
+    if args.cleanup:
+        for project in projects:
+            shutil.rmtree(args.directory / project, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+read_replicas.py
+
+Reads with read replicas. Times the graph and a query of the NPCs from
+`--clients` concurrent clients, on a backend with read replicas and, with
+`--compare-url`, on a backend reading from the leader only. Then checks
+read-your-writes: renames an NPC and queries it right after, with and
+without the revision of the write, and counts the stale reads. Prints the
+lag and the reads of every replica from `GET /health/pools`.
+
+Start the replicas with `docker-compose.replicas.yml`. Without the revision
+a fresh replica may still serve the old name, with it none should.
+
+Usage:
+    python benchmarks/read_replicas.py --url http://127.0.0.1:8000 --api-key KEY --clients 16
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+LAST_WRITE_COOKIE = "gagm_last_write"
+
+
+def percentiles_ms(times: list[float]) -> str:
+    times = sorted(times)
+    p50 = statistics.median(times) * 1000
+    p95 = times[int(len(times) * 0.95) - 1] * 1000
+    return f"p50 {p50:7.1f} ms    p95 {p95:7.1f} ms"
+
+
+def timed_reads(url: str, api_key: str, clients: int, requests_per_client: int) -> tuple[list[float], float]:
+    def client(_) -> list[float]:
+        session = requests.Session()
+        session.headers.update({"X-API-KEY": api_key})
+        times = []
+        for index in range(requests_per_client):
+            start = time.perf_counter()
+            if index % 2:
+                response = session.post(f"{url}/data/NPC/query", json={"limit": 100}, timeout=600)
+            else:
+                response = session.get(f"{url}/data/", timeout=600)
+            response.raise_for_status()
+            times.append(time.perf_counter() - start)
+        return times
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        times = [value for values in executor.map(client, range(clients)) for value in values]
+    return times, len(times) / (time.perf_counter() - start)
+
+
+def stale_reads(session: requests.Session, url: str, key: str, writes: int, send_revision: bool) -> int:
+    stale = 0
+    query = {"where": [{"field": "_key", "op": "eq", "value": key}], "limit": 1}
+    for index in range(writes):
+        name = f"replica check {index} {time.time()}"
+        response = session.patch(f"{url}/data/NPC/{key}", json={"npc_name": name}, timeout=60)
+        response.raise_for_status()
+        if not send_revision:
+            session.cookies.pop(LAST_WRITE_COOKIE, None)
+        response = session.post(f"{url}/data/NPC/query", json=query, timeout=60)
+        response.raise_for_status()
+        items = response.json()["items"]
+        stale += not items or items[0]["npc_name"] != name
+    return stale
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--compare-url", help="A backend without read replicas")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per client")
+    parser.add_argument("--writes", type=int, default=200, help="Writes of the read-your-writes check")
+    args = parser.parse_args()
+
+    targets = [("replicas", args.url)] + ([("leader", args.compare_url)] if args.compare_url else [])
+    for label, url in targets:
+        times, throughput = timed_reads(url, args.api_key, args.clients, args.requests)
+        print(f"{label:<10} {percentiles_ms(times)}    {throughput:7.1f} req/s")
+
+    session = requests.Session()
+    session.headers.update({"X-API-KEY": args.api_key})
+    key = sorted(session.get(f"{args.url}/data/typed/NPC", timeout=600).json())[0]
+    for send_revision in (False, True):
+        stale = stale_reads(session, args.url, key, args.writes, send_revision)
+        label = "with" if send_revision else "without"
+        print(f"stale      {stale} of {args.writes} reads {label} the revision of the write")
+
+    reads = session.get(f"{args.url}/health/pools", timeout=60).json()["arango"].get("reads")
+    if reads is None:
+        print("the backend has no read replicas")
+        return
+    print(f"leader     {reads['leader_reads']} reads")
+    for replica in reads["replicas"]:
+        lag = "unknown" if replica["lag"] is None else f"{replica['lag'] * 1000:.0f} ms"
+        print(f"{replica['host']:<30} lag {lag}    {replica['reads']} reads    {replica['error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
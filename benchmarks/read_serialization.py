@@ -0,0 +1,97 @@
+"""
+read_serialization.py
+
+Measures the CPU time the read endpoints spend turning stored ArangoDB
+documents into responses, with and without the trusted read mode.
+Runs without a database, the documents are synthesized from the example models.
+
+Usage:
+    python benchmarks/read_serialization.py --documents 100000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend" / "app"))
+
+import trusted_reads  # noqa: E402
+from models.ex_dialogue_of_npc import DialogueOfNPC  # noqa: E402
+from models.ex_dungeon import Dungeon  # noqa: E402
+from models.ex_enemy import Enemy  # noqa: E402
+
+
+def make_documents(count: int) -> dict:
+    documents = {Dungeon: [], Enemy: [], DialogueOfNPC: []}
+    for i in range(count):
+        documents[Dungeon].append(
+            {
+                "_id": f"Dungeon/d{i}",
+                "_key": f"d{i}",
+                "_rev": "_h1",
+                "name": f"Dungeon {i}",
+                "max_players": i % 5 + 1,
+                "starting_point": {"x": float(i), "y": 1.0, "z": 2.0},
+                "description": "A dungeon generated for the benchmark.",
+            }
+        )
+        documents[Enemy].append(
+            {
+                "_id": f"Enemy/e{i}",
+                "_key": f"e{i}",
+                "_rev": "_h1",
+                "enemy_type": "goblin",
+                "spawn": {"x": 0.0, "y": 0.0, "z": 0.0, "yaw": 45.0, "pitch": 45.0},
+            }
+        )
+        documents[DialogueOfNPC].append(
+            {
+                "_id": f"DialogueOfNPC/l{i}",
+                "_key": f"l{i}",
+                "_rev": "_h1",
+                "_from": f"NPC/n{i}",
+                "_to": f"DialogueElement/t{i}",
+                "repeatable": bool(i % 2),
+            }
+        )
+    for model, model_documents in documents.items():
+        for document in model_documents:
+            trusted_reads.tag_document(model, document)
+    return documents
+
+
+def run(label: str, documents: dict, by_alias: bool) -> None:
+    for model, model_documents in documents.items():
+        trusted_reads.TRUSTED_READS_ENABLED = False
+        start = time.process_time()
+        for document in model_documents:
+            trusted_reads.serialize_document(model, document, by_alias)
+        validated = time.process_time() - start
+
+        trusted_reads.TRUSTED_READS_ENABLED = True
+        start = time.process_time()
+        for document in model_documents:
+            trusted_reads.serialize_document(model, document, by_alias)
+        trusted = time.process_time() - start
+
+        print(
+            f"{label:<28} {model.__name__:<14} validated: {validated * 1000:9.1f} ms"
+            f"  trusted: {trusted * 1000:9.1f} ms  speedup: {validated / trusted:5.1f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--documents", type=int, default=100_000)
+    args = parser.parse_args()
+
+    documents = make_documents(args.documents)
+    # GET /data/ and POST /data/filtered serialize by field name
+    run("GET /data/, /data/filtered", documents, by_alias=False)
+    # The typed list and connected nodes endpoints serialize by alias
+    run("GET /data/typed/...", documents, by_alias=True)
+
+
+if __name__ == "__main__":
+    main()
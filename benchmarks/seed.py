@@ -0,0 +1,143 @@
+"""
+seed.py
+
+Seeds the databases of a local deployment with a synthetic graph and creates
+the API key used by the load tests. The documents come from `generator.py`,
+which builds them from the models in `backend/app/models` (or --models) and
+streams them into the bulk importer.
+
+The collections have to exist, so start the backend once before seeding.
+Existing documents of the seeded collections are only removed with --reset.
+
+Usage:
+    python benchmarks/seed.py --nodes 20000 --edges-per-node 2 --degree-exponent 1.2 \\
+        --tags 50 --tagged-fraction 0.2 --notes-size 2048 --reset
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+
+from arango import ArangoClient
+
+import generator
+
+BENCH_USER = "bench@gagm.local"
+KEY_PREFIX = "bench"
+BATCH_SIZE = 5000
+
+
+def import_documents(db, documents: Iterator[generator.Document]) -> dict[str, int]:
+    """
+    Write the documents with the bulk importer in batches.
+
+    Returns:
+        dict: Number of written documents per collection.
+    """
+    batches: dict[str, list[dict]] = {}
+    written: dict[str, int] = {}
+
+    def flush(collection: str) -> None:
+        result = db.collection(collection).import_bulk(
+            batches[collection], on_duplicate="error", halt_on_error=True
+        )
+        written[collection] = written.get(collection, 0) + result["created"]
+        batches[collection] = []
+
+    for collection, document in documents:
+        batches.setdefault(collection, []).append(document)
+        if len(batches[collection]) >= BATCH_SIZE:
+            flush(collection)
+    for collection in batches:
+        if batches[collection]:
+            flush(collection)
+    return written
+
+
+def create_api_key(key: str) -> None:
+    """
+    Create the benchmark user and its API key in Postgres.
+    """
+    from auth_models import APIKey, User
+    from rel_db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter_by(email=BENCH_USER).first()
+        if user is None:
+            user = User(
+                email=BENCH_USER,
+                hashed_password=hashlib.sha512(os.urandom(32)).hexdigest(),
+                is_active=True,
+                is_admin=True,
+            )
+            db.add(user)
+            db.flush()
+        key_hash = hashlib.sha512(key.encode("utf-8")).hexdigest()
+        if db.query(APIKey).filter_by(key_hash=key_hash).first() is None:
+            db.add(
+                APIKey(
+                    user_id=user.id,
+                    key_hash=key_hash,
+                    creation_date=datetime.now(),
+                    expiration_date=datetime.now() + timedelta(days=365),
+                    active=True,
+                )
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    generator.add_arguments(parser)
+    parser.add_argument("--api-key", default="bench-key", help="API key to create for the load tests")
+    parser.add_argument("--reset", action="store_true", help="Empty the seeded collections first")
+    parser.add_argument("--output", default=None, help="Write the dataset description to this JSON file")
+    args = parser.parse_args()
+
+    client = ArangoClient(
+        hosts=f"http://{os.environ.get('GRAPH_DB_HOST', 'localhost')}:{os.environ.get('GRAPH_DB_PORT', 8529)}"
+    )
+    db = client.db(
+        "gagm",
+        username=os.environ.get("GRAPH_DB_USER", "root"),
+        password=os.environ.get("GRAPH_DB_PASS", "secret"),
+    )
+    graph = generator.from_arguments(args, KEY_PREFIX)
+
+    collections = [*graph.plans, "AssetTag", "TagEdge", "AssetNotes", "AssetRevisions"]
+    for collection in collections:
+        if not db.has_collection(collection):
+            sys.exit(f"Collection {collection} is missing, start the backend once before seeding.")
+        if db.collection(collection).count():
+            if not args.reset:
+                sys.exit(f"Collection {collection} is not empty, use --reset to empty it.")
+            db.collection(collection).truncate()
+
+    start = time.perf_counter()
+    written = import_documents(db, graph.validate_sample(graph.documents(), args.validate_every))
+    elapsed = time.perf_counter() - start
+    create_api_key(args.api_key)
+
+    dataset = {
+        "args": vars(args) | {"api_key": None},
+        "documents": written,
+        "node_counts": graph.counts,
+        "key_prefix": KEY_PREFIX,
+        "seconds": elapsed,
+    }
+    print(json.dumps(dataset, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(dataset, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
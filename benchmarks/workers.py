@@ -0,0 +1,120 @@
+"""
+workers.py
+
+Reports the startup time and the memory use per worker of the backend server
+at different worker counts. Run it where the backend runs (inside the backend
+container, or locally with ArangoDB and Postgres reachable), it starts and
+stops the server itself.
+
+RSS counts the pages shared with the master process in every worker, PSS
+splits shared pages between the processes, so the sum of the PSS values is
+the real memory use of the server.
+
+Usage:
+    python benchmarks/workers.py --mode prefork --workers 1 4 16
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+import requests
+
+APP_DIR = Path(__file__).parent.parent / "backend" / "app"
+
+
+def read_memory_kb(pid: int) -> tuple[int, int]:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = int(parts[1])
+    return values["Rss:"], values["Pss:"]
+
+
+def child_pids(pid: int) -> list[int]:
+    children: list[int] = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        children.extend(
+            int(child) for child in (task / "children").read_text().split()
+        )
+    return children
+
+
+def command(mode: str, workers: int, port: int) -> list[str]:
+    if mode == "prefork":
+        return ["gunicorn", "main:app", "--config", "gunicorn_conf.py"]
+    return [
+        "uvicorn", "main:app", "--host", "127.0.0.1",
+        "--port", str(port), "--workers", str(workers),
+    ]
+
+
+def measure(mode: str, workers: int, port: int) -> dict:
+    env = dict(os.environ, WORKERS=str(workers), APP_PORT=str(port))
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        command(mode, workers, port),
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("The server exited during startup")
+            time.sleep(0.05)
+        first_response = time.perf_counter() - start
+
+        # Wait until every worker is up
+        while len(child_pids(server.pid)) < workers:
+            time.sleep(0.05)
+        time.sleep(2)
+        all_ready = time.perf_counter() - start
+
+        memory = [read_memory_kb(pid) for pid in child_pids(server.pid)]
+        master_rss, master_pss = read_memory_kb(server.pid)
+        return {
+            "workers": workers,
+            "first_response_s": first_response,
+            "all_workers_s": all_ready - 2,
+            "worker_rss_mb": sum(rss for rss, _ in memory) / len(memory) / 1024,
+            "worker_pss_mb": sum(pss for _, pss in memory) / len(memory) / 1024,
+            "total_pss_mb": (master_pss + sum(pss for _, pss in memory)) / 1024,
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--mode", choices=["prefork", "uvicorn"], default="prefork")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        result = measure(args.mode, workers, args.port)
+        print(
+            f"{args.mode} {result['workers']:3d} workers:"
+            f" first response {result['first_response_s']:6.2f} s,"
+            f" all workers {result['all_workers_s']:6.2f} s,"
+            f" RSS/worker {result['worker_rss_mb']:7.1f} MB,"
+            f" PSS/worker {result['worker_pss_mb']:7.1f} MB,"
+            f" total PSS {result['total_pss_mb']:8.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
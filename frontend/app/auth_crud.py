@@ -2,18 +2,24 @@ import hashlib
 from typing import List
 from datetime import datetime
 
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
 from auth_models import User, APIKey
 import auth_schemas
 
+# Statements of the session checks, built once and cached by the SQLAlchemy compiled cache
+USER_BY_ID = select(User).where(User.id == bindparam("user_id")).limit(1)
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email")).limit(1)
+
+
 # User functions
 def get_user(db: Session, user_id: int) -> User:
-    return db.query(User).filter(User.id == user_id).first()
+    return db.scalars(USER_BY_ID, {"user_id": user_id}).first()
 
 
 def get_user_by_email(db: Session, email: str) -> User:
-    return db.query(User).filter(User.email == email).first()
+    return db.scalars(USER_BY_EMAIL, {"email": email}).first()
 
 
 def check_password(db: Session, email: str, password_hash: str) -> bool:
@@ -2,7 +2,8 @@ import logging
 from fastapi import Depends, HTTPException, Request, status
 from auth_models import User
 from sqlalchemy.orm import Session
-from database import SessionLocal
+import auth_crud
+from database import get_db
 
 
 logger = logging.getLogger("uvicorn")
@@ -12,20 +13,6 @@ class AuthException(Exception):
     ...
 
 
-def get_db():
-    """
-    Provides the database connection.
-
-    Yields:
-        Session: The database connection.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 def authenticate_user():
     ...
 
@@ -46,8 +33,10 @@ def is_authenticated(request: Request, db: Session = Depends(get_db)) -> User:
     user_email = request.session.get("user")
     # logger.info(f"Login check\n{request.session=}")
     # logger.info(f"{user_email=}")
-    user: User = db.query(User).filter_by(email=user_email).first()
-    if not user_email or not user:
+    if not user_email:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    user: User = auth_crud.get_user_by_email(db, user_email)
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     return user
 
@@ -15,6 +15,17 @@ CONFIG = {
     "port": os.environ.get("REL_DB_PORT") or 5432,
 }
 
+# Connection pool of the worker process
+POOL_CONFIG = {
+    "pool_size": int(os.environ.get("REL_DB_POOL_SIZE") or 10),
+    "max_overflow": int(os.environ.get("REL_DB_MAX_OVERFLOW") or 10),
+    "pool_timeout": float(os.environ.get("REL_DB_POOL_TIMEOUT") or 30),
+    "pool_recycle": int(os.environ.get("REL_DB_POOL_RECYCLE") or 1800),
+    "pool_pre_ping": (os.environ.get("REL_DB_POOL_PRE_PING") or "true") == "true",
+    # Size of the compiled statement cache
+    "query_cache_size": int(os.environ.get("REL_DB_QUERY_CACHE_SIZE") or 500),
+}
+
 
 SQLALCHEMY_DATABASE_URL = (
     f"postgresql://{CONFIG['user']}:{CONFIG['pass']}"
@@ -22,7 +33,40 @@ SQLALCHEMY_DATABASE_URL = (
     + "/gagm"
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **POOL_CONFIG)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def get_db():
+    """
+    Provides the database session of a request.
+    FastAPI caches dependencies per request, so the authentication and the
+    endpoint of a request share one session (and one pooled connection).
+
+    Yields:
+        Session: The database session.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def pool_stats() -> dict:
+    """
+    Usage of the connection pool.
+
+    Returns:
+        dict: Checked out, idle and overflow connections of the pool.
+    """
+    pool = engine.pool
+    return {
+        "size": pool.size(),  # type: ignore
+        "checked_out": pool.checkedout(),  # type: ignore
+        "idle": pool.checkedin(),  # type: ignore
+        "overflow": pool.overflow(),  # type: ignore
+        "max_overflow": POOL_CONFIG["max_overflow"],
+    }
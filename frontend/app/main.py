@@ -1,6 +1,5 @@
 import enum
 import hashlib
-import json
 import logging
 import os
 import sys
@@ -21,15 +20,23 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 import auth_crud
 from auth_models import User
 import auth_schemas
-from database import SessionLocal
+from authentication import is_authenticated
+from database import SessionLocal, get_db, pool_stats
 from responses.health_check import HealthCheck
 from routers import auth, forward, dashboard
-from utils import BackendGraph, backend_to_visjs
+from utils import (
+    BACKEND_GRAPH_HEADERS,
+    BackendGraph,
+    backend_to_graph_view,
+    backend_to_visjs,
+    decode_backend_response,
+)
 from configuration import CONFIG
 
 app = FastAPI(title="Game Asset Graph Manager - Frontend")
@@ -95,20 +102,6 @@ async def auth_failed(request: Request, exc: AuthException):
     )
 
 
-def get_db():
-    """
-    Provides the database connection.
-
-    Yields:
-        Session: The database connection.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 if CONFIG.debug_mode:
     db = SessionLocal()
     admin = auth_crud.create_user(
@@ -140,29 +133,6 @@ if CONFIG.debug_mode:
 BACKEND_SESSIONS: dict[str, requests.Session] = {}
 
 
-def is_authenticated(request: Request, db: Session = Depends(get_db)) -> User:
-    """
-    Checks if the request contains a valid session cookie.
-
-    Args:
-        request (Request): The request object.
-
-    Raises:
-        HTTPException: 401 if the user is not authenticated.
-
-    Returns:
-        User: The authenticated user.
-    """
-    user_email = request.session.get("user")
-    # logger.info(f"Login check\n{request.session=}")
-    # logger.info(f"{user_email=}")
-    user: User = db.query(User).filter_by(email=user_email).first()
-    # logger.info(f"{BACKEND_SESSIONS.get(str(user.id))=}") # type: ignore
-    if not user_email or not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-    return user
-
-
 def is_admin(user: User = Depends(is_authenticated)) -> User:
     """
     Checks if the user is an admin.
@@ -252,6 +222,22 @@ async def health_check() -> HealthCheck:
     return HealthCheck(start_time=START_TIME)
 
 
+@app.get(
+    "/health/pools",
+    tags=["health_check"],
+    summary="Get the usage of the database connection pool",
+    status_code=status.HTTP_200_OK,
+)
+async def pool_usage() -> dict:
+    """
+    Endpoint to inspect the saturation of the connection pool of the worker.
+
+    Returns:
+        dict: Usage of the pool.
+    """
+    return {"postgres": pool_stats()}
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index_get(request: Request):
     return RedirectResponse("/main", status_code=status.HTTP_302_FOUND)
@@ -368,18 +354,17 @@ async def graph_view_get(
     logger.info(tags)
     # mock_tags = []
     # response = RedirectResponse(url=)
-    graph = requests.get(
+    graph = decode_backend_response(requests.get(
         url=f"http://{CONFIG.backend_ip}:{CONFIG.backend_port}/data/",
         headers={
             "X-FRONTEND-API-KEY": CONFIG.backend_secret,
             "X-FRONTEND-USER-ID": str(user.id),
+            **BACKEND_GRAPH_HEADERS,
         },
-    ).json()
-
-    logger.error(json.dumps(graph))
+    ))
 
     graph = BackendGraph(edges=graph.get("edges"), nodes=graph.get("nodes"))
-    visjs_graph = backend_to_visjs(backend_graph=graph)
+    graph_view = backend_to_graph_view(backend_graph=graph)
 
     model_names: list[str] = requests.get(
         url=f"http://{CONFIG.backend_ip}:{CONFIG.backend_port}/models/",
@@ -410,8 +395,7 @@ async def graph_view_get(
         {
             "request": request,
             "tags": tags,
-            "edges": json.dumps(visjs_graph["edges"]),
-            "nodes": json.dumps(visjs_graph["nodes"]),
+            "graph": graph_view,
             "model_names": model_names,
             "node_model_names": node_model_names,
             "edge_model_names": edge_model_names,
@@ -431,17 +415,18 @@ async def get_graph(
 ):
     logger.info(graph_filter.model_dump_json())
     tags = get_tags(user)
-    graph = requests.post(
+    graph = decode_backend_response(requests.post(
         url=f"http://{CONFIG.backend_ip}:{CONFIG.backend_port}/data/filtered",
         headers={
             "X-FRONTEND-API-KEY": CONFIG.backend_secret,
             "X-FRONTEND-USER-ID": str(user.id),
+            **BACKEND_GRAPH_HEADERS,
         },
         data=graph_filter.model_dump_json()
-    ).json()
+    ))
 
     graph = BackendGraph(**graph)
-    visjs_graph = backend_to_visjs(backend_graph=graph)
+    graph_view = backend_to_graph_view(backend_graph=graph)
 
     model_names: list[str] = requests.get(
         url=f"http://{CONFIG.backend_ip}:{CONFIG.backend_port}/models/",
@@ -469,9 +454,8 @@ async def get_graph(
 
     # tags: list[str] = []
     return JSONResponse(content={
-        "edges": json.dumps(visjs_graph["edges"]),
-        "nodes": json.dumps(visjs_graph["nodes"]),
-        "current_filter": graph_filter.model_dump_json(),
+        "graph": graph_view,
+        "current_filter": graph_filter.model_dump(mode="json"),
     })
 
     return templates.TemplateResponse(
@@ -479,8 +463,7 @@ async def get_graph(
         {
             "request": request,
             "tags": tags,
-            "edges": json.dumps(visjs_graph["edges"]),
-            "nodes": json.dumps(visjs_graph["nodes"]),
+            "graph": graph_view,
             "model_names": model_names,
             "node_model_names": node_model_names,
             "edge_model_names": edge_model_names,
@@ -503,9 +486,10 @@ async def graph_view_post(request: GraphViewQuery):
     graph = None
     if request.full_graph:
         graph = (
-            requests.get(
-                f"http://{CONFIG.backend_ip}:{CONFIG.backend_port}/data/"
-            ).json()
+            decode_backend_response(requests.get(
+                f"http://{CONFIG.backend_ip}:{CONFIG.backend_port}/data/",
+                headers=BACKEND_GRAPH_HEADERS,
+            ))
             or {}
         )
         graph = BackendGraph(**graph)
@@ -690,6 +674,8 @@ def change_password(
 
 
 app.add_middleware(SessionMiddleware, secret_key=secret_key)
+# The graph views are large, the static files are served compressed too
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@ from sqlalchemy.orm import Session
 
 import auth_crud
 from auth_schemas import User, UserCreate
-from database import SessionLocal
+from database import get_db
 
 logger = logging.getLogger("uvicorn")
 
@@ -17,15 +17,6 @@ templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # class User(Base):
 #     """
 #     Represents the users table in the database.
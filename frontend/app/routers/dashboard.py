@@ -5,7 +5,7 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
 import auth_models
-from database import SessionLocal
+from database import get_db
 
 logger = logging.getLogger("uvicorn")
 
@@ -16,15 +16,6 @@ templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("/users")
 async def get_users(db: Session = Depends(get_db)):
     return db.query(auth_models.User).all()
@@ -9,8 +9,15 @@ from pydantic import BaseModel
 import json
 
 from configuration import CONFIG
-from database import SessionLocal
-from utils import AuthenticatedRequest, RequestTypeEnum, backend_to_visjs, BackendGraph
+from utils import (
+    BACKEND_GRAPH_HEADERS,
+    AuthenticatedRequest,
+    ReadYourWritesSession,
+    RequestTypeEnum,
+    backend_to_visjs,
+    BackendGraph,
+    decode_backend_response,
+)
 from authentication import is_authenticated
 from auth_models import User
 
@@ -20,24 +27,10 @@ router = APIRouter()
 
 templates = Jinja2Templates(directory="templates/forwarding")
 
-FORWARD_SESSION: requests.Session = requests.Session()
+FORWARD_SESSION: requests.Session = ReadYourWritesSession()
 FORWARD_SESSION.headers.update({"X-FRONTEND-API-KEY": CONFIG.backend_secret})  # type: ignore
 
 
-def get_db():
-    """
-    Provides the database connection.
-
-    Yields:
-        Session: The database connection.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class GraphFilter(BaseModel):
     full_graph: bool = False
     types: List[str] = []
@@ -48,11 +41,11 @@ class GraphFilter(BaseModel):
 async def get_filtered_graph(
     graph_filter: GraphFilter, user: User = Depends(is_authenticated)
 ):
-    graph_dict: dict = FORWARD_SESSION.post(
+    graph_dict: dict = decode_backend_response(FORWARD_SESSION.post(
         url=f"{CONFIG.backend_url()}/data/filtered",
         json=graph_filter,
-        headers={"X-FRONTEND-USER-ID": str(user.id)},
-    ).json()
+        headers={"X-FRONTEND-USER-ID": str(user.id), **BACKEND_GRAPH_HEADERS},
+    ))
     graph = BackendGraph(**graph_dict)
     return backend_to_visjs(graph)
 
@@ -85,6 +78,29 @@ async def update_asset(
     return JSONResponse(content=update_request.json())
 
 
+@router.post("/patch_asset/{asset_type}/{asset_key}")
+async def patch_asset(
+    asset_type: str,
+    asset_key: str,
+    changed_fields: dict,
+    request: Request,
+    user: User = Depends(is_authenticated),
+):
+    patch_request = FORWARD_SESSION.patch(
+        url=f"{CONFIG.backend_url()}/data/{asset_type}/{asset_key}",
+        json=changed_fields,
+        timeout=5,
+        headers={"X-FRONTEND-USER-ID": str(user.id)},
+    )
+    if patch_request.status_code != 200:
+        return templates.TemplateResponse(
+            name="error.html",
+            status_code=patch_request.status_code,
+            context={"errors": [patch_request.status_code], "request": request},
+        )
+    return JSONResponse(content=patch_request.json())
+
+
 @router.post("/create_asset/{asset_type}")
 async def add_asset(
     asset_type: str,
@@ -118,6 +134,27 @@ async def add_asset(
         logger.info(e)
 
 
+@router.post("/delete_assets")
+async def delete_assets(
+    selection: dict,
+    request: Request,
+    user: User = Depends(is_authenticated),
+):
+    delete_request = FORWARD_SESSION.post(
+        url=f"{CONFIG.backend_url()}/data/delete",
+        json=selection,
+        timeout=60,
+        headers={"X-FRONTEND-USER-ID": str(user.id)},
+    )
+    if delete_request.status_code != 200:
+        return templates.TemplateResponse(
+            name="error.html",
+            status_code=delete_request.status_code,
+            context={"errors": [delete_request.status_code], "request": request},
+        )
+    return JSONResponse(content=delete_request.json())
+
+
 @router.post("/delete_asset/{asset_type}/{asset_key}")
 async def delete_asset(
     asset_type: str,
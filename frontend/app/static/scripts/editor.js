@@ -216,6 +216,8 @@ let selection;
 let nodeOrEdge;
 let selectionType;
 let selectionKey;
+// Value of the editor when the asset was loaded or last saved
+let savedAsset;
 
 network.on('deselectNode', event => {
     resetEditor();
@@ -247,29 +249,38 @@ const assetSavedHtml = `<i class="bi bi-check me-2"></i>Saved!`;
 const assetNotSavedHtml = `<i class="bi bi-floppy me-2"></i>Save`;
 const assetSaveFailedHtml = `<i class="bi bi-x me-2"></i>Failed to save`;
 
-const replaceMap = {
-    "_id": "db_id",
-    "_key": "db_key"
-};
+// Fields that are never sent on save: the vis.js attributes and the IDs
+const unsavedFields = ["id", "label", "type", "_id", "_key"];
 
-function saveAsset() {
-    let asset = editor.getValue();
-    delete asset.id;
-    delete asset.label;
-    for (let key in replaceMap) {
-        if (replaceMap.hasOwnProperty(key) && asset.hasOwnProperty(key)) {
-            asset[replaceMap[key]] = asset[key];
-            delete asset[key];
+function changedFields(asset) {
+    let changes = {};
+    for (let key in asset) {
+        if (unsavedFields.includes(key)) {
+            continue;
+        }
+        if (JSON.stringify(asset[key]) !== JSON.stringify(savedAsset[key])) {
+            changes[key] = asset[key];
         }
     }
-    console.log(asset);
+    return changes;
+}
+
+function saveAsset() {
+    let asset = editor.getValue();
+    let changes = changedFields(asset);
+    console.log(changes);
     saveBtn = document.getElementById("save-btn");
-    fetch('/forward/update_asset/' + selectionType, {
+    if (Object.keys(changes).length === 0) {
+        saveBtn.innerHTML = assetSavedHtml;
+        setTimeout(() => { saveBtn.innerHTML = assetNotSavedHtml; }, 2000);
+        return;
+    }
+    fetch('/forward/patch_asset/' + selectionType + "/" + selectionKey, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify(asset)
+        body: JSON.stringify(changes)
     })
         .then(resp => {
             if (resp.status !== 200) {
@@ -277,6 +288,7 @@ function saveAsset() {
                 saveBtn.classList.toggle('btn-danger');
                 saveBtn.classList.toggle('btn-success');
             } else {
+                savedAsset = asset;
                 saveBtn.innerHTML = assetSavedHtml;
             }
             setTimeout(() => {
@@ -403,6 +415,7 @@ async function refreshEditor(networkElement) {
         { schema: schema, startval: asset, disable_properties: true, show_errors: "always", theme: "bootstrap5", iconlib: "bootstrap" }
     );
     editor.on('ready', () => {
+        savedAsset = editor.getValue();
         hiddenEditors.forEach((value) => {
             let editorToHide = editor.getEditor(value);
             if (editorToHide !== undefined) {
@@ -36,10 +36,7 @@ function refreshGraph() {
     })
         .then(response => response.json())
         .then(graphData => {
-            const nodes = JSON.parse(graphData.nodes);
-            const edges = JSON.parse(graphData.edges);
-            console.log(JSON.parse(graphData.nodes));
-            console.log(JSON.parse(graphData.edges));
+            const { nodes, edges } = decodeGraphView(graphData.graph);
             const newData = {nodes: new vis.DataSet(nodes), edges: new vis.DataSet(edges)};
             console.log(newData);
             network.setData(newData);
@@ -0,0 +1,31 @@
+// Decodes the compact graph of the graph view (see `backend_to_graph_view`)
+// into the nodes and edges of vis.js. The data of the assets isn't part of
+// the graph, the editor loads it on selection.
+function decodeGraphView(graph) {
+    const types = graph.types;
+    const nodeTypes = graph.nodes.type;
+    const nodeKeys = graph.nodes.key;
+    const nodeIds = new Array(nodeKeys.length);
+    const nodes = new Array(nodeKeys.length);
+    for (let i = 0; i < nodeKeys.length; i++) {
+        const type = types[nodeTypes[i]];
+        nodeIds[i] = type + "/" + nodeKeys[i];
+        nodes[i] = { id: nodeIds[i], label: "[" + type + "]\n*" + nodeKeys[i] + "*" };
+    }
+
+    const edgeTypes = graph.edges.type;
+    const edgeKeys = graph.edges.key;
+    const edgeOrigins = graph.edges.from;
+    const edgeTargets = graph.edges.to;
+    const edges = new Array(edgeKeys.length);
+    for (let i = 0; i < edgeKeys.length; i++) {
+        const type = types[edgeTypes[i]];
+        edges[i] = {
+            id: type + "/" + edgeKeys[i],
+            label: "[" + type + "]\n*" + edgeKeys[i] + "*",
+            from: nodeIds[edgeOrigins[i]],
+            to: nodeIds[edgeTargets[i]]
+        };
+    }
+    return { nodes: nodes, edges: edges };
+}
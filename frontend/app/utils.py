@@ -1,5 +1,8 @@
 import enum
 import logging
+from typing import Any
+
+import msgpack
 from pydantic import BaseModel, Field
 import requests
 
@@ -7,6 +10,56 @@ from configuration import CONFIG
 
 logger = logging.getLogger("uvicorn")
 
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Headers of the requests of large responses (graphs), MessagePack is smaller
+# and faster to decode than JSON. The compressions requests can decode are
+# accepted by default (gzip, and br and zstd with brotli and zstandard installed).
+BACKEND_GRAPH_HEADERS = {"Accept": f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.9"}
+# Last revision written by a user, the backend only reads from replicas that have it
+LAST_WRITE_HEADER = "X-GAGM-LAST-WRITE"
+LAST_WRITE_COOKIE = "gagm_last_write"
+USER_ID_HEADER = "X-FRONTEND-USER-ID"
+
+
+def decode_backend_response(response: requests.Response) -> Any:
+    """
+    Decode the body of a backend response, JSON or MessagePack.
+
+    Args:
+        response (requests.Response): The response, already decompressed by requests.
+
+    Returns:
+        Any: The decoded body.
+    """
+    if response.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+        return msgpack.unpackb(response.content)
+    return response.json()
+
+
+class ReadYourWritesSession(requests.Session):
+    """
+    A session to the backend shared by the users. Keeps the last written revision of
+    every user and sends it with their requests, so users read their own writes when
+    the backend reads from replicas. The cookie of the backend would mix the users.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._last_writes: dict[str, str] = {}
+
+    def request(self, method, url, *args, headers=None, **kwargs) -> requests.Response:
+        headers = dict(headers or {})
+        user_id = headers.get(USER_ID_HEADER) or self.headers.get(USER_ID_HEADER)
+        last_write = self._last_writes.get(user_id) if user_id else None
+        if last_write is not None:
+            headers.setdefault(LAST_WRITE_HEADER, last_write)
+        response = super().request(method, url, *args, headers=headers, **kwargs)
+        self.cookies.pop(LAST_WRITE_COOKIE, None)
+        revision = response.headers.get(LAST_WRITE_HEADER)
+        if revision and user_id:
+            self._last_writes[user_id] = revision
+        return response
+
 
 class BackendGraph(BaseModel):
     """
@@ -27,7 +80,6 @@ def backend_to_visjs(backend_graph: BackendGraph) -> dict:
     Returns:
         dict: The graph in a VisJS compatible format.
     """
-    logger.info(backend_graph)
     visjs_graph = {"edges": [], "nodes": []}
     typed_edges: dict[str, dict[str, dict]] = backend_graph.edges
     for edge_type, edges_with_type in typed_edges.items():
@@ -65,6 +117,66 @@ def backend_to_visjs(backend_graph: BackendGraph) -> dict:
     return visjs_graph
 
 
+def backend_to_graph_view(backend_graph: BackendGraph) -> dict:
+    """
+    Converts a graph returned by the GAGM backend into the compact format of the graph view.
+
+    Only what the graph renders is kept, the data of an asset is loaded when
+    it's selected. The type names are sent once in `types`, the elements
+    reference them by index, and the endpoints of the edges are the indexes
+    of their nodes:
+
+        {
+            "types": ["NPC", "DialogueOfNPC", ...],
+            "nodes": {"type": [0, ...], "key": ["npc1", ...]},
+            "edges": {"type": [1, ...], "key": ["e1", ...], "from": [0, ...], "to": [3, ...]},
+        }
+
+    The ID of an element is `types[type[i]] + "/" + key[i]`. Edges to nodes
+    that aren't in the graph can't be drawn and are left out.
+
+    Args:
+        backend_graph (BackendGraph): The graph from the GAGM backend.
+
+    Returns:
+        dict: The graph in the format of the graph view.
+    """
+    types: list[str] = []
+    type_indexes: dict[str, int] = {}
+
+    def type_index(type_name: str) -> int:
+        index = type_indexes.get(type_name)
+        if index is None:
+            index = type_indexes[type_name] = len(types)
+            types.append(type_name)
+        return index
+
+    nodes = {"type": [], "key": []}
+    node_indexes: dict[str, int] = {}
+    for nodes_with_type in backend_graph.nodes.values():
+        for node_data in nodes_with_type.values():
+            db_id: str = node_data["db_id"]
+            type_name, _, key = db_id.partition("/")
+            node_indexes[db_id] = len(nodes["key"])
+            nodes["type"].append(type_index(type_name))
+            nodes["key"].append(key)
+
+    edges = {"type": [], "key": [], "from": [], "to": []}
+    for edges_with_type in backend_graph.edges.values():
+        for edge_data in edges_with_type.values():
+            origin = node_indexes.get(edge_data["origin_id"])
+            target = node_indexes.get(edge_data["target_id"])
+            if origin is None or target is None:
+                continue
+            type_name, _, key = edge_data["db_id"].partition("/")
+            edges["type"].append(type_index(type_name))
+            edges["key"].append(key)
+            edges["from"].append(origin)
+            edges["to"].append(target)
+
+    return {"types": types, "nodes": nodes, "edges": edges}
+
+
 class RequestTypeEnum(enum.Enum):
     GET = requests.get
     POST = requests.post